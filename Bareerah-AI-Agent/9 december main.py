@@ -1,10 +1,11 @@
 from flask import Flask, request, Response, jsonify, render_template, send_file
 from twilio.twiml.voice_response import VoiceResponse
-from twilio.rest import Client as TwilioClient
 import os
 import requests
 import json
 import time
+import atexit
+import logging
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from psycopg2 import pool, sql
@@ -15,21 +16,55 @@ from uuid import uuid4
 import threading
 import re
 import hashlib
-from openai import OpenAI
+import hmac
 from collections import deque
 from dataclasses import dataclass, field
 from typing import Optional, Dict, List, Any
-import tempfile
-import subprocess
-import jwt
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from bareerah_qa_cache import BAREERAH_QA_CACHE, FUZZY_MAPPING  # ✅ Import Q&A cache
+import tracing
+import whatsapp_worker
+import audio_pipeline
+import transcript_cache
+import twilio_sender
+import lexicon
+import slot_extract
+import gazetteer
+import email_templates
+import notify_dispatcher
+import migrations
+import booking_reconciler
+import booking_ledger
+import lifecycle
+import lazy_vendors
+import structured_log
+import usage_ledger
+
+OpenAI = lazy_vendors.attr("openai", "OpenAI")  # heavy SDKs load on first use / preload
+jwt = lazy_vendors.module("jwt")
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'bareerah-secret-key')
 
-OPENAI_CLIENT = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# ✅ LOGGING: print(..., flush=True) was a write syscall per line on the request thread;
+# lines now go to the "legacy" logger with %s args (not formatted below LOG_LEVEL)
+# through structured_log's queued writer
+structured_log.setup()
+log = logging.getLogger("legacy")
+tracing.register_gauge("log", structured_log.snapshot)
+
+@app.before_request
+def bind_log_context():
+    """Every line logged for this webhook carries the call (or WhatsApp sender) it belongs to"""
+    structured_log.bind(call_sid=request.values.get('CallSid'), phone=request.values.get('From'))
+
+@app.teardown_request
+def unbind_log_context(exc):
+    structured_log.bind()
+
+OPENAI_CLIENT = lazy_vendors.client(lambda: OpenAI(api_key=os.environ.get("OPENAI_API_KEY")), "openai")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 GOOGLE_MAPS_API_KEY = os.environ.get("GOOGLE_MAPS_API_KEY")
 DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -38,6 +73,7 @@ GOOGLE_CLOUD_TTS_KEY = os.environ.get("GOOGLE_CLOUD_TTS_KEY")
 WEBSITE_URL = os.environ.get("WEBSITE_URL", "")
 BASE_API_URL = "https://5ef5530c-38d9-4731-b470-827087d7bc6f-00-2j327r1fnap1d.sisko.replit.dev/api"
 BOOKING_ENDPOINT = "https://5ef5530c-38d9-4731-b470-827087d7bc6f-00-2j327r1fnap1d.sisko.replit.dev/api/bookings/create-manual"
+BACKEND_BASE_URL = BASE_API_URL.rsplit("/api", 1)[0]  # create_booking_direct endpoints start with /api
 
 # ✅ EMAIL CONFIGURATION - RESEND SMTP (Fixed domain issue)
 RESEND_API_KEY = os.environ.get("RESEND_API_KEY", "")
@@ -75,7 +111,6 @@ os.makedirs('public', exist_ok=True)
 
 db_pool = None
 _tts_prewarmed = False
-_cleanup_started = False  # ✅ Flag to ensure cleanup only starts ONCE
 call_contexts = {}
 call_timestamps = {}  # ✅ Track when calls come in (for fallback email if webhook fails)
 offline_bookings = []
@@ -95,8 +130,14 @@ STATIC_TTS_CACHE = {
 EMAIL_REGEX = r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$"
 
 # ✅ STT LANGUAGE DETECTION: Keywords for Urdu/Arabic
-URDU_KEYWORDS = {"meri", "mera", "mein", "hoon", "hain", "dubai", "marina", "airport", "malik", "sahab", "acha", "theek", "bilkul"}
+# (place names like "marina"/"airport" are said in every language - not evidence)
+URDU_KEYWORDS = {"meri", "mera", "mein", "hoon", "hain", "malik", "sahab", "acha", "theek", "bilkul"}
 ARABIC_KEYWORDS = {"alhijra", "almarina", "dubai", "masr", "ahal", "tayyib", "sahih", "almaer", "hawaya"}
+LANGUAGE_DETECTOR = lexicon.LanguageDetector({
+    "en": lexicon.ENGLISH_MARKERS,
+    "ur": URDU_KEYWORDS | lexicon.ROMAN_URDU_MARKERS,
+    "ar": ARABIC_KEYWORDS | lexicon.ROMAN_ARABIC_MARKERS,
+})
 
 # ✅ FIX #1: GREETING LISTS (URDU + ENGLISH + ARABIC)
 GREETINGS_UR = ["assalam", "asalam", "salam", "salaam", "assalamu", "assalamualaikum", "assalam alaikum", "assalam o alaikum"]
@@ -134,7 +175,10 @@ NO_WORDS = {
     "لا", "اه", "لا شكراً", "بعدين"
 }
 
-_booking_reference_counter = 1000
+# ✅ Compiled once: whole-word hash sets + phrase regexes (no per-call substring scans)
+YES_LEXICON = lexicon.Lexicon(YES_WORDS)
+NO_LEXICON = lexicon.Lexicon(NO_WORDS)
+GREETING_LEXICON = lexicon.Lexicon(GREETINGS_EN, GREETINGS_UR, GREETINGS_AR)
 
 # ✅ TIME AMBIGUITY FIX: Keywords for AM/PM inference
 MORNING_WORDS = {"subah", "fajr", "morning", "pehle", "early", "kal subah", "subah aaina", "subah 5", "subah 6", "subah 7"}
@@ -196,83 +240,46 @@ def apply_time_period(datetime_text: str, period: str) -> str:
 
 def detect_language_from_speech(text: str, current_language: str) -> str:
     """
-    Detect if user is speaking Urdu or Arabic from keywords.
-    Returns detected language or current_language.
+    Detect if user is speaking Urdu or Arabic (script first, then keywords).
+    Returns detected language or current_language when nothing is clearly ahead.
     """
-    text_lower = text.lower()
-    
-    # Count keyword matches
-    urdu_count = sum(1 for kw in URDU_KEYWORDS if kw in text_lower)
-    arabic_count = sum(1 for kw in ARABIC_KEYWORDS if kw in text_lower)
-    
-    if urdu_count > 0:
-        return "ur"
-    if arabic_count > 0:
-        return "ar"
-    
-    return current_language
+    return LANGUAGE_DETECTOR.detect(text, current_language)
 
-def convert_ogg_to_mp3(ogg_file_path: str) -> str:
-    """✅ Convert .ogg/.opus file to .mp3 using ffmpeg for Whisper compatibility"""
-    try:
-        # Check file size first
-        file_size = os.path.getsize(ogg_file_path)
-        if file_size == 0:
-            print(f"[FFMPEG] ❌ Input file is empty! Size: {file_size}", flush=True)
-            return None
-        print(f"[FFMPEG] 📁 Input file size: {file_size} bytes", flush=True)
-        
-        mp3_file_path = ogg_file_path.replace('.ogg', '.mp3').replace('.opus', '.mp3')
-        # Use -acodec libmp3lame for better Opus/OGG handling
-        cmd = ['ffmpeg', '-i', ogg_file_path, '-acodec', 'libmp3lame', '-q:a', '5', '-y', mp3_file_path]
-        
-        result = subprocess.run(cmd, capture_output=True, timeout=10, text=True)
-        if result.returncode == 0 and os.path.exists(mp3_file_path):
-            mp3_size = os.path.getsize(mp3_file_path)
-            print(f"[FFMPEG] ✅ Converted ({file_size}→{mp3_size} bytes): {ogg_file_path} → {mp3_file_path}", flush=True)
-            try:
-                os.remove(ogg_file_path)
-            except:
-                pass
-            return mp3_file_path
-        else:
-            print(f"[FFMPEG] ❌ Conversion failed stderr: {result.stderr[:200]}", flush=True)
-            return None
-    except Exception as e:
-        print(f"[FFMPEG] ❌ Exception: {e}", flush=True)
-        return None
-
-def transcribe_with_whisper(audio_file_path: str, language: str = "en") -> str:
+@tracing.traced("stt", "openai")
+def transcribe_with_whisper(audio, language: str = "en") -> str:
     """
     Use OpenAI Whisper for multi-language transcription (Urdu/Arabic support).
+    audio: a file path or an in-memory (filename, bytes, content_type) tuple.
     Language mapping: en, ur (Urdu), ar (Arabic)
     """
     if not OPENAI_API_KEY:
         return None
     
     try:
-        with open(audio_file_path, 'rb') as audio_file:
-            # Whisper language codes
-            lang_codes = {"en": "en", "ur": "ur", "ar": "ar"}
-            whisper_lang = lang_codes.get(language, "en")
-            
-            if DEBUG_LOGGING:
-                    print(f"[WHISPER] Transcribing with language={whisper_lang}", flush=True)
-            
-            transcript = OPENAI_CLIENT.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language=whisper_lang,
-                timeout=10
-            )
-            
-            text = transcript.text.strip()
-            if DEBUG_LOGGING:
-                    print(f"[WHISPER] ✅ Transcribed ({language}): {text}", flush=True)
-            return text
+        # Whisper language codes
+        lang_codes = {"en": "en", "ur": "ur", "ar": "ar"}
+        whisper_lang = lang_codes.get(language, "en")
+        
+        if DEBUG_LOGGING:
+                log.info("[WHISPER] Transcribing with language=%s", whisper_lang)
+        
+        with USAGE.metered("openai", "whisper-1") as meter:
+            if isinstance(audio, str):
+                with open(audio, 'rb') as audio_file:
+                    transcript = OPENAI_CLIENT.audio.transcriptions.create(
+                        model="whisper-1", file=audio_file, language=whisper_lang, timeout=10)
+            else:
+                transcript = OPENAI_CLIENT.audio.transcriptions.create(
+                    model="whisper-1", file=audio, language=whisper_lang, timeout=10)
+            meter.quantity = usage_ledger.audio_seconds(audio, getattr(transcript, "duration", None))
+        
+        text = transcript.text.strip()
+        if DEBUG_LOGGING:
+                log.info("[WHISPER] ✅ Transcribed (%s): %s", language, text)
+        return text
     except Exception as e:
         if DEBUG_LOGGING:
-                print(f"[WHISPER] ❌ Failed: {e}", flush=True)
+                log.error("[WHISPER] ❌ Failed: %s", e)
         return None
 GENERIC_LOCATION_TERMS = ["location", "here", "there", "airport", "mall", "home"]
 
@@ -309,25 +316,17 @@ FILLER_WORDS_AR = {"من", "في", "على"}
 CORRECTION_KEYWORDS_EN = {"change", "correct", "wrong", "no not", "nope", "nah"}
 CORRECTION_KEYWORDS_UR = {"galat", "wrong", "nahi", "correction", "badal"}
 CORRECTION_KEYWORDS_AR = {"خطأ", "لا", "تصحيح"}
-
-# ✅ Numeric conversion (Req #5)
-SPOKEN_NUMBERS = {
-    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
-    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+CORRECTION_LEXICONS = {
+    "en": lexicon.Lexicon(CORRECTION_KEYWORDS_EN),
+    "ur": lexicon.Lexicon(CORRECTION_KEYWORDS_UR),
+    "ar": lexicon.Lexicon(CORRECTION_KEYWORDS_AR),
 }
 
-# ✅ BULLET-PROOF NUMBER WORDS: English/Urdu/Arabic (0-10) for luggage/passengers
-NUMBER_WORDS = {
-    # English
-    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
-    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
-    # Urdu
-    "do": 2, "teen": 3, "char": 4, "paanch": 5, "chhe": 6, "saat": 7, 
-    "aath": 8, "nau": 9, "das": 10, "ek": 1,
-    # Arabic
-    "واحد": 1, "اثنين": 2, "ثلاثة": 3, "اربعة": 4, "خمسة": 5,
-    "ستة": 6, "سبعة": 7, "ثمانية": 8, "تسعة": 9, "عشرة": 10
-}
+# ✅ Numeric conversion (Req #5) - tables live in slot_extract with the compiled count patterns
+SPOKEN_NUMBERS = slot_extract.SPOKEN_NUMBERS
+
+# ✅ BULLET-PROOF NUMBER WORDS: English/Urdu/Arabic for luggage/passengers
+NUMBER_WORDS = slot_extract.NUMBER_WORDS
 
 FLEET_INVENTORY = [
     {"id": "VEH001", "vehicle": "Toyota Camry", "plate": "Dubai G 54821", "driver_name": "Ahmed Raza", "driver_phone": "055 823 1124", "type": "Sedan", "hourly_rate": 75, "per_km_rate": 3.50},
@@ -346,9 +345,19 @@ def init_db_pool():
     global db_pool
     try:
         db_pool = pool.SimpleConnectionPool(minconn=1, maxconn=20, dsn=DATABASE_URL)
-        print("[DB] ✅ Connection pool initialized", flush=True)
+        log.info("[DB] ✅ Connection pool initialized")
     except Exception as e:
-        print(f"[DB] ❌ Pool error: {e}", flush=True)
+        log.error("[DB] ❌ Pool error: %s", e)
+
+def init_schema():
+    """✅ Typed bookings schema + indexes (migrations.py); lifecycle.py runs it once, not per worker"""
+    if not DATABASE_URL: return False
+    conn = get_db_conn()
+    try:
+        migrations.migrate(conn)
+        return True
+    finally:
+        return_db_conn(conn)
 
 def get_db_conn():
     if not db_pool:
@@ -379,10 +388,10 @@ def generate_local_jwt_token(username: str = VENDOR_USERNAME, password: str = VE
             "exp": datetime.utcnow() + timedelta(hours=24)
         }
         token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
-        print(f"[AUTH] ✅ JWT token generated locally: {token[:50]}...", flush=True)
+        log.info("[AUTH] ✅ JWT token generated locally: %s...", token[:50])
         return token
     except Exception as e:
-        print(f"[AUTH] ❌ Failed to generate JWT token: {e}", flush=True)
+        log.error("[AUTH] ❌ Failed to generate JWT token: %s", e)
         return None
 
 def is_jwt_token_expired():
@@ -397,34 +406,34 @@ def backend_login_with_retry():
     for attempt in range(2):
         try:
             login_url = f"{BASE_API_URL}/auth/login"
-            print(f"[AUTH] Attempt {attempt+1}: POST {login_url}", flush=True)
+            log.info("[AUTH] Attempt %s: POST %s", attempt+1, login_url)
             r = requests.post(login_url,
                               json={"username": VENDOR_USERNAME, "password": VENDOR_PASSWORD},
                               timeout=3)
-            print(f"[AUTH] Response status: {r.status_code}", flush=True)
+            log.info("[AUTH] Response status: %s", r.status_code)
             if r.status_code == 200:
                 try:
                     data = r.json()
                     token = data.get("token")
                     if token:
-                        print(f"[AUTH] ✅ Backend login successful, token: {token[:50]}...", flush=True)
+                        log.info("[AUTH] ✅ Backend login successful, token: %s...", token[:50])
                         return token
                 except:
                     pass
             else:
-                print(f"[AUTH] ❌ Backend status {r.status_code}", flush=True)
+                log.error("[AUTH] ❌ Backend status %s", r.status_code)
         except Exception as e:
-            print(f"[AUTH] ❌ Backend unreachable: {e}", flush=True)
+            log.error("[AUTH] ❌ Backend unreachable: %s", e)
         if attempt < 1:
             time.sleep(1)
     
     # ✅ FALLBACK: Generate local JWT token (no backend dependency)
-    print(f"[AUTH] Backend API failed, generating local JWT token...", flush=True)
+    log.info("[AUTH] Backend API failed, generating local JWT token...")
     local_token = generate_local_jwt_token()
     if local_token:
         return local_token
     
-    print(f"[AUTH] ❌ All auth methods failed", flush=True)
+    log.error("[AUTH] ❌ All auth methods failed")
     return None
 
 def get_jwt_token():
@@ -446,146 +455,117 @@ def get_jwt_token():
         if token:
             CACHED_JWT_TOKEN = token
             JWT_TOKEN_EXPIRY = datetime.utcnow() + timedelta(hours=24)
-            print(f"[AUTH] ✅ JWT Token refreshed successfully", flush=True)
+            log.info("[AUTH] ✅ JWT Token refreshed successfully")
             # ✅ Fetch vehicles from backend on first successful token
             try:
                 vehicle_manager.fetch_from_backend(token)
             except Exception as e:
-                print(f"[VEHICLE_MGR] ⚠️ Could not fetch vehicles on token refresh: {e}", flush=True)
+                log.warning("[VEHICLE_MGR] ⚠️ Could not fetch vehicles on token refresh: %s", e)
             return token
         
         return None
 
+@tracing.traced("backend_sync", "backend")
 def create_booking_direct(booking_payload: dict, endpoint: str = "/api/bookings/create-manual") -> bool:
     """✅ DIRECT BOOKING CREATION - With JWT authentication"""
     try:
         # Get fresh JWT token
         jwt_token = get_jwt_token()
         if not jwt_token:
-            print(f"[BACKEND] ❌ No JWT token available", flush=True)
+            log.error("[BACKEND] ❌ No JWT token available")
             return False
         
         # ✅ Build full endpoint URL from BACKEND_BASE_URL
         full_endpoint = BACKEND_BASE_URL.rstrip("/") + endpoint
-        print(f"[BACKEND] Trying URL: {full_endpoint}", flush=True)
+        log.info("[BACKEND] Trying URL: %s", full_endpoint)
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {jwt_token}"
         }
+        # ✅ Same reference = same booking: the backend can drop a repeat (booking_ledger.py)
+        if booking_payload.get("booking_reference"):
+            headers["Idempotency-Key"] = booking_payload["booking_reference"]
         r = requests.post(full_endpoint, json=booking_payload, headers=headers, timeout=5)
-        print(f"[BACKEND] Response: {r.status_code}", flush=True)
+        log.info("[BACKEND] Response: %s", r.status_code)
         
-        if r.status_code == 200:
+        if r.status_code == 409:
+            log.info("[BACKEND] ✅ Booking %s already exists", booking_payload.get('booking_reference'))
+            return True
+        if r.status_code in (200, 201):
             try:
                 data = r.json()
                 ref = data.get("booking_id") or data.get("booking_reference") or data.get("id")
-                print(f"[BACKEND] ✅ Booking created: {ref}", flush=True)
+                log.info("[BACKEND] ✅ Booking created: %s", ref)
                 return True
             except:
-                print(f"[BACKEND] ✅ Response 200 (parsed as success)", flush=True)
+                log.info("[BACKEND] ✅ Response 200 (parsed as success)")
                 return True
         else:
-            print(f"[BACKEND] ❌ Status {r.status_code}: {r.text[:100]}", flush=True)
+            log.error("[BACKEND] ❌ Status %s: %s", r.status_code, r.text[:100])
             return False
     except requests.Timeout:
-        print(f"[BACKEND] ❌ Timeout - using local pending", flush=True)
+        log.error("[BACKEND] ❌ Timeout - using local pending")
         return False
     except Exception as e:
-        print(f"[BACKEND] ❌ Error: {e} - using local pending", flush=True)
+        log.error("[BACKEND] ❌ Error: %s - using local pending", e)
         return False
 
 def test_backend_connection():
     """✅ Test backend connection without creating test bookings"""
-    print(f"[BACKEND] ════════════════════════════════════════════════", flush=True)
-    print(f"[BACKEND] Testing connection on startup...", flush=True)
-    print(f"[BACKEND] Endpoint: {BOOKING_ENDPOINT}", flush=True)
+    log.info("[BACKEND] ════════════════════════════════════════════════")
+    log.info("[BACKEND] Testing connection on startup...")
+    log.info("[BACKEND] Endpoint: %s", BOOKING_ENDPOINT)
     
     # ✅ ONLY test JWT authentication - DO NOT create actual test bookings
     try:
         jwt_token = get_jwt_token()
         if jwt_token:
-            print(f"[BACKEND] ✅ JWT token obtained successfully", flush=True)
-            print(f"[BACKEND] ✅ Backend connection ready for real bookings", flush=True)
+            log.info("[BACKEND] ✅ JWT token obtained successfully")
+            log.info("[BACKEND] ✅ Backend connection ready for real bookings")
         else:
-            print(f"[BACKEND] ⚠️ Could not get JWT token - will use local fallback", flush=True)
+            log.warning("[BACKEND] ⚠️ Could not get JWT token - will use local fallback")
     except Exception as e:
-        print(f"[BACKEND] ⚠️ Connection test error: {e}", flush=True)
+        log.warning("[BACKEND] ⚠️ Connection test error: %s", e)
     
-    print(f"[BACKEND] ════════════════════════════════════════════════", flush=True)
+    log.info("[BACKEND] ════════════════════════════════════════════════")
 
 def log_conversation(from_phone: str, speaker: str, message: str):
-    """✅ LOG CONVERSATION: Clean text-based format for customer/bot chat"""
-    conversation_log = f"""
-╔════════════════════════════════════════════════════════╗
-║ CONVERSATION LOG ({from_phone})
-╠════════════════════════════════════════════════════════╣
-║ {speaker.upper()}: {message[:50]}{"..." if len(message) > 50 else ""}
-╚════════════════════════════════════════════════════════╝
-"""
-    print(conversation_log, flush=True)
-
-def sync_pending_bookings_to_backend(from_phone: str, jwt_token: str):
-    """✅ SYNC PENDING BOOKINGS: Send bookings that failed to save to backend"""
-    if not jwt_token:
-        print(f"[SYNC] ⚠️ No JWT token available for sync", flush=True)
-        return
-    
+    """✅ LOG CONVERSATION: one record per chat line (speaker and text as fields in LOG_FORMAT=json)"""
+    log.info("[CONVERSATION] %s: %s", speaker.upper(), message[:200],
+             extra={"fields": {"phone": from_phone, "speaker": speaker.lower()}})
+
+# ✅ PENDING BOOKING SYNC: a background reconciler pushes pending_confirmation
+# bookings (booking_reconciler.py), not the WhatsApp request path
+RECONCILER = booking_reconciler.Reconciler(lambda: get_db_conn(), lambda conn: return_db_conn(conn),
+                                           lambda payload: create_booking_direct(payload))
+tracing.register_gauge("reconciler", RECONCILER.snapshot)
+
+# ✅ USAGE LEDGER: billable vendor calls per CallSid / WhatsApp phone, summed into call_usage
+USAGE = usage_ledger.UsageLedger(lambda: get_db_conn(), lambda conn: return_db_conn(conn))
+tracing.register_gauge("usage", USAGE.snapshot)
+
+# ✅ WHATSAPP DEDUP: claim each MessageSid in whatsapp_deliveries so a redelivery
+# routed to another worker is dropped too
+transcript_cache.dedup.use_database(lambda: get_db_conn() if DATABASE_URL else None,
+                                    lambda conn: return_db_conn(conn))
+
+# ✅ BOOKING LEDGER: one booking, one backend push, one team email per idempotency key
+BOOKING_LEDGER = booking_ledger.BookingLedger()
+tracing.register_gauge("ledger", BOOKING_LEDGER.snapshot)
+
+def with_ledger_conn(fn, *args, **kwargs):
+    """Run a BOOKING_LEDGER step on a pooled connection (it deduplicates in memory without one)"""
     conn = None
     try:
         conn = get_db_conn()
-        cursor = conn.cursor()
-        
-        # Get all pending bookings for this customer
-        cursor.execute("""
-            SELECT id, customer_name, customer_phone, 
-                   pickup_location, dropoff_location, calculated_fare_aed,
-                   vehicle_type, service_type, number_of_passengers, number_of_luggage
-            FROM bookings 
-            WHERE customer_phone = %s AND booking_status = 'pending_confirmation'
-            LIMIT 10
-        """, (from_phone,))
-        
-        pending = cursor.fetchall()
-        if not pending:
-            if conn:
-                return_db_conn(conn)
-            return
-        
-        print(f"[SYNC] Found {len(pending)} pending bookings to sync", flush=True)
-        
-        # Try to send each pending booking to backend
-        for booking in pending:
-            booking_payload = {
-                "customer_name": booking[1] or "Customer",
-                "customer_phone": booking[2],
-                "pickup_location": booking[3],
-                "dropoff_location": booking[4],
-                "fare_aed": int(booking[5] or 0),
-                "vehicle_type": booking[6],
-                "booking_type": booking[7],
-                "passengers_count": int(booking[8] or 1),
-                "luggage_count": int(booking[9] or 0)
-            }
-            
-            result = backend_api("POST", "/bookings/create-manual", booking_payload, jwt_token)
-            if result:
-                # Update booking status to confirmed
-                cursor.execute(
-                    "UPDATE bookings SET booking_status = %s WHERE id = %s",
-                    ("confirmed", booking[0])
-                )
-                conn.commit()
-                print(f"[SYNC] ✅ Synced booking {booking[0]} to backend", flush=True)
-            else:
-                print(f"[SYNC] ❌ Failed to sync booking {booking[0]}", flush=True)
-        
-        if conn:
-            return_db_conn(conn)
     except Exception as e:
-        if conn:
-            return_db_conn(conn)
-        print(f"[SYNC] Error syncing bookings: {e}", flush=True)
+        log.warning("[LEDGER] ⚠️ No DB connection, deduplicating in memory: %s", e)
+    try:
+        return fn(conn, *args, **kwargs)
+    finally:
+        if conn: return_db_conn(conn)
 
+@tracing.traced("backend_api", "backend")
 def backend_api(method, path, data=None, jwt_token=None):
     """✅ OPTIMIZED: Max 1 retry, timeout 1.5s"""
     for attempt in range(2):
@@ -609,7 +589,7 @@ def backend_api(method, path, data=None, jwt_token=None):
             
             if r.status_code == 400:
                 if DEBUG_LOGGING:
-                        print(f"[API] ❌ 400 Error on {path}: {r.text[:100]}", flush=True)
+                        log.error("[API] ❌ 400 Error on %s: %s", path, r.text[:100])
                 return None
             
         except:
@@ -833,7 +813,7 @@ def validate_location_structure(text: str, language: str = "en", confidence: flo
     # ✅ CRITICAL FIX: REJECT CITY-LEVEL LOCATIONS
     cities_emirates = {"dubai", "abu dhabi", "sharjah", "ajman", "fujairah", "ras al khaimah", "umm al quwain", "auh"}
     if clean in cities_emirates:
-        print(f"[LOCATION VALIDATION] ❌ REJECTED CITY-LEVEL LOCATION: '{clean}' - require specific area/building/street/plot number", flush=True)
+        log.error("[LOCATION VALIDATION] ❌ REJECTED CITY-LEVEL LOCATION: '%s' - require specific area/building/street/plot number", clean)
         return False
     
     # ✅ FIX #2: GENERIC + PARTIAL LOCATION HARD BLOCK
@@ -844,18 +824,18 @@ def validate_location_structure(text: str, language: str = "en", confidence: flo
     }
     
     if clean in blocked_phrases:
-        print("[LOCATION VALIDATION] Blocked meaningless location:", clean, flush=True)
+        log.info("[LOCATION VALIDATION] Blocked meaningless location: %s", clean)
         return False
     
     # ✅ FIX #3: GENERIC LOCATION VALIDATOR - Block "Airport / Location / Hotel" alone
     generic = {"airport", "location", "hotel", "home", "house", "office"}
     if clean in generic:
-        print("[LOCATION VALIDATION] Rejected generic location:", clean, flush=True)
+        log.info("[LOCATION VALIDATION] Rejected generic location: %s", clean)
         return False
     
     # If fewer than 2 words, reject (require specific detail like "Dubai Marina" or "JBR Beach")
     if len(clean.split()) < 2:
-        print("[LOCATION VALIDATION] Rejected too-short location:", clean, flush=True)
+        log.info("[LOCATION VALIDATION] Rejected too-short location: %s", clean)
         return False
     
     # Strip filler words
@@ -880,14 +860,7 @@ def has_explicit_correction(text: str, language: str = "en") -> bool:
     if not text:
         return False
     
-    text_lower = text.lower()
-    
-    if language == "ur":
-        return any(kw in text_lower for kw in CORRECTION_KEYWORDS_UR)
-    elif language == "ar":
-        return any(kw in text_lower for kw in CORRECTION_KEYWORDS_AR)
-    else:
-        return any(kw in text_lower for kw in CORRECTION_KEYWORDS_EN)
+    return CORRECTION_LEXICONS.get(language, CORRECTION_LEXICONS["en"]).search(text)
 
 def get_gather_params(call_sid: str, stt_language: str = None, utterance_num: int = 0) -> dict:
     """
@@ -921,21 +894,8 @@ def get_gather_params(call_sid: str, stt_language: str = None, utterance_num: in
     return params
 
 def normalize_spoken_email(text: str) -> str:
-    if not text:
-        return ""
-    t = text.lower().strip()
-    t = t.replace(" at the rate ", "@")
-    t = t.replace(" at rate ", "@")
-    t = t.replace(" at ", "@")
-    t = t.replace(" underscore ", "_")
-    t = t.replace(" dash ", "-")
-    t = t.replace(" hyphen ", "-")
-    t = t.replace(" dot ", ".")
-    t = t.replace(" dotcom", ".com")
-    t = t.replace(" gmail com", "gmail.com")
-    t = t.replace(" yahoo com", "yahoo.com")
-    t = t.replace(" ", "")
-    return t
+    # one compiled pass (EN/UR/AR spoken words) instead of a chain of replaces
+    return slot_extract.spoken_email(text)
 
 # ✅ VEHICLE INVENTORY MAPPING (Backend Integration)
 VEHICLE_INVENTORY = {
@@ -965,6 +925,7 @@ def call_suggest_vehicles_api(passengers: int, luggage: int, jwt_token: str):
     except:
         return None, "Failed to get vehicle suggestions"
 
+@tracing.traced("vehicles", "backend")
 def suggest_vehicle(passengers: int, luggage: int, jwt_token: str = None) -> tuple:
     """
     ✅ BACKEND INTEGRATION: Call suggest-vehicles API for smart vehicle selection.
@@ -972,72 +933,72 @@ def suggest_vehicle(passengers: int, luggage: int, jwt_token: str = None) -> tup
     
     Returns: (vehicle_type, error_msg or None)
     """
-    print(f"[VEHICLE] Raw inputs - passengers={passengers} (type: {type(passengers)}), luggage={luggage} (type: {type(luggage)})", flush=True)
+    log.info("[VEHICLE] Raw inputs - passengers=%s (type: %s), luggage=%s (type: %s)", passengers, type(passengers), luggage, type(luggage))
     
     try:
         passengers = int(passengers) if passengers is not None else None
         luggage = int(luggage) if luggage is not None else None
     except Exception as e:
-        print(f"[VEHICLE] ❌ Conversion failed: {e}", flush=True)
+        log.error("[VEHICLE] ❌ Conversion failed: %s", e)
         passengers = None
         luggage = None
     
     # HARD FAIL if any slot missing
     if passengers is None or luggage is None:
-        print(f"[VEHICLE] ❌ Missing values: passengers={passengers}, luggage={luggage}", flush=True)
+        log.error("[VEHICLE] ❌ Missing values: passengers=%s, luggage=%s", passengers, luggage)
         return None, "Missing passenger or luggage count"
     
     # ✅ ALLOW 0 luggage (no bags) - but passengers must be >= 1
     if passengers <= 0:
-        print(f"[VEHICLE] ❌ Invalid passengers: {passengers} (must be >= 1)", flush=True)
+        log.error("[VEHICLE] ❌ Invalid passengers: %s (must be >= 1)", passengers)
         return None, "Invalid passenger count"
     
     if luggage < 0:
-        print(f"[VEHICLE] ❌ Invalid luggage: {luggage} (must be >= 0)", flush=True)
+        log.error("[VEHICLE] ❌ Invalid luggage: %s (must be >= 0)", luggage)
         return None, "Invalid luggage count"
     
-    print(f"[VEHICLE] Suggesting for passengers={passengers}, luggage={luggage}", flush=True)
+    log.info("[VEHICLE] Suggesting for passengers=%s, luggage=%s", passengers, luggage)
     
     # Try backend API first
     if jwt_token:
         vehicle, error = call_suggest_vehicles_api(passengers, luggage, jwt_token)
         if vehicle:
-            print(f"[VEHICLE] ✅ From Backend API: {vehicle}", flush=True)
+            log.info("[VEHICLE] ✅ From Backend API: %s", vehicle)
             return vehicle, None
     
-    print(f"[VEHICLE] Using local fallback logic...", flush=True)
+    log.info("[VEHICLE] Using local fallback logic...")
     # Fallback to local logic if backend fails
     # Sedan: max 4 pax, 3 luggage
     if passengers <= 4 and luggage <= 3:
-        print(f"[VEHICLE] ✅ Selected SEDAN (local): {passengers}p ≤ 4, {luggage}l ≤ 3", flush=True)
+        log.info("[VEHICLE] ✅ Selected SEDAN (local): %sp ≤ 4, %sl ≤ 3", passengers, luggage)
         return "sedan", None
     
     # SUV: max 6 pax, 6 luggage
     if passengers <= 6 and luggage <= 6:
-        print(f"[VEHICLE] ✅ Selected SUV (local): {passengers}p ≤ 6, {luggage}l ≤ 6", flush=True)
+        log.info("[VEHICLE] ✅ Selected SUV (local): %sp ≤ 6, %sl ≤ 6", passengers, luggage)
         return "suv", None
     
     # Luxury SUV: max 7 pax, 5 luggage
     if passengers <= 7 and luggage <= 5:
-        print(f"[VEHICLE] ✅ Selected LUXURY_SUV (local): {passengers}p ≤ 7, {luggage}l ≤ 5", flush=True)
+        log.info("[VEHICLE] ✅ Selected LUXURY_SUV (local): %sp ≤ 7, %sl ≤ 5", passengers, luggage)
         return "luxury_suv", None
     
     # Elite Van: max 7 pax, 7 luggage
     if passengers <= 7 and luggage <= 7:
-        print(f"[VEHICLE] ✅ Selected ELITE_VAN (local): {passengers}p ≤ 7, {luggage}l ≤ 7", flush=True)
+        log.info("[VEHICLE] ✅ Selected ELITE_VAN (local): %sp ≤ 7, %sl ≤ 7", passengers, luggage)
         return "elite_van", None
     
     # Mini Bus: max 12 pax, 8 luggage
     if passengers <= 12 and luggage <= 8:
-        print(f"[VEHICLE] ✅ Selected MINI_BUS (local): {passengers}p ≤ 12, {luggage}l ≤ 8", flush=True)
+        log.info("[VEHICLE] ✅ Selected MINI_BUS (local): %sp ≤ 12, %sl ≤ 8", passengers, luggage)
         return "mini_bus", None
     
     # Bus: max 14 pax, 8 luggage
     if passengers <= 14 and luggage <= 8:
-        print(f"[VEHICLE] ✅ Selected MINIBUS (local): {passengers}p ≤ 14, {luggage}l ≤ 8", flush=True)
+        log.info("[VEHICLE] ✅ Selected MINIBUS (local): %sp ≤ 14, %sl ≤ 8", passengers, luggage)
         return "minibus", None
     
-    print(f"[VEHICLE] ❌ FAILED: {passengers}p and {luggage}l exceed all vehicle capacities", flush=True)
+    log.error("[VEHICLE] ❌ FAILED: %sp and %sl exceed all vehicle capacities", passengers, luggage)
     return None, "Passengers/luggage exceed maximum capacity"
 
 def smart_detect_location_type(text: str) -> str:
@@ -1051,14 +1012,14 @@ def smart_detect_location_type(text: str) -> str:
     pickup_keywords = ["from", "se", "سے", "pickup", "pick up", "picking", "start from", "starting from", "mujhe lene", "pick me"]
     for kw in pickup_keywords:
         if kw in text_lower:
-            print(f"[LOCATION] Detected PICKUP keyword: '{kw}'", flush=True)
+            log.info("[LOCATION] Detected PICKUP keyword: '%s'", kw)
             return "pickup"
     
     # ✅ DROPOFF keywords (to/ko/dropoff)
     dropoff_keywords = ["to", "ko", "کو", "dropoff", "drop off", "dropping", "going to", "heading to", "going", "destination", "take me to", "le chalo", "jana hai"]
     for kw in dropoff_keywords:
         if kw in text_lower:
-            print(f"[LOCATION] Detected DROPOFF keyword: '{kw}'", flush=True)
+            log.info("[LOCATION] Detected DROPOFF keyword: '%s'", kw)
             return "dropoff"
     
     return "unknown"
@@ -1073,7 +1034,7 @@ def handle_location_failure(ctx: dict, booking: dict, location_text: str, locati
     ctx[attempt_key] = ctx.get(attempt_key, 0) + 1
     attempts = ctx[attempt_key]
     
-    print(f"[LOCATION] {location_type.upper()} attempt {attempts}/2 failed: '{location_text}'", flush=True)
+    log.info("[LOCATION] %s attempt %s/2 failed: '%s'", location_type.upper(), attempts, location_text)
     
     if attempts >= 2:
         # ✅ Save as pending booking with whatever info we have
@@ -1088,9 +1049,9 @@ def handle_location_failure(ctx: dict, booking: dict, location_text: str, locati
         # ✅ Send email notification about pending booking
         try:
             notify_booking_to_team(booking, "location_failed")
-            print(f"[EMAIL] ✅ Pending booking email sent for {location_type} failure | Phone: {caller_phone}", flush=True)
+            log.info("[EMAIL] ✅ Pending booking email sent for %s failure | Phone: %s", location_type, caller_phone)
         except Exception as e:
-            print(f"[EMAIL] ⚠️ Email error: {e}", flush=True)
+            log.warning("[EMAIL] ⚠️ Email error: %s", e)
         
         # ✅ Reset THIS slot's attempts (other slot keeps its count)
         ctx[attempt_key] = 0
@@ -1160,13 +1121,13 @@ class VehicleManager:
                     self.vehicles = vehicles_list
                     import time
                     self.last_refresh = time.time()
-                    print(f"[VEHICLE_MGR] ✅ Synced {len(self.vehicles)} vehicles from backend", flush=True)
+                    log.info("[VEHICLE_MGR] ✅ Synced %s vehicles from backend", len(self.vehicles))
                     return True
         except Exception as e:
-            print(f"[VEHICLE_MGR] ⚠️ Could not fetch from /api/vehicles: {e}", flush=True)
+            log.warning("[VEHICLE_MGR] ⚠️ Could not fetch from /api/vehicles: %s", e)
         
         # Fallback to FLEET_INVENTORY if backend endpoint not available
-        print(f"[VEHICLE_MGR] ⚠️ Using local FLEET_INVENTORY as fallback", flush=True)
+        log.warning("[VEHICLE_MGR] ⚠️ Using local FLEET_INVENTORY as fallback")
         self.vehicles = FLEET_INVENTORY
         return False
     
@@ -1199,7 +1160,7 @@ class VehicleManager:
             selected = random.choice(matching)
             vehicle_name = selected.get('model') or selected.get('vehicle', 'Unknown')
             vehicle_id = selected.get('id')
-            print(f"[VEHICLE_MGR] Selected: {vehicle_name} (ID: {vehicle_id})", flush=True)
+            log.info("[VEHICLE_MGR] Selected: %s (ID: %s)", vehicle_name, vehicle_id)
             return selected
         
         return FLEET_INVENTORY[0]
@@ -1217,24 +1178,32 @@ def select_vehicle_from_fleet(vehicle_type: str, jwt_token: str = None) -> dict:
     return vehicle_manager.select_vehicle(vehicle_type)
 
 def generate_booking_reference():
-    """✅ Generate unique booking reference: BOOK-XXX"""
-    global _booking_reference_counter
-    _booking_reference_counter += 1
-    return f"BOOK-{_booking_reference_counter}"
+    """✅ Generate unique booking reference: SSL-XXXXXXXXXX (random: no two workers hand out the same one)"""
+    return booking_ledger.new_reference()
+
+def claim_chat_booking(conn, key: str, reference: str, payload: dict, booking: dict):
+    """BOOKING_LEDGER row + side-effect claims for a WhatsApp booking: (reference, created, push, alert)"""
+    fare = booking.get("fare")
+    reference, created = BOOKING_LEDGER.record(
+        conn, key, reference=reference,
+        customer_name=payload.get("customer_name"), customer_phone=payload.get("customer_phone"),
+        customer_email=payload.get("customer_email"), pickup_location=payload.get("pickup_location"),
+        dropoff_location=payload.get("dropoff_location"), vehicle_type=payload.get("vehicle_type"),
+        service_type=payload.get("booking_type"), number_of_passengers=payload.get("passengers_count"),
+        number_of_luggage=payload.get("luggage_count"), distance_km=payload.get("distance_km"),
+        fare_aed=fare, calculated_fare_aed=fare)
+    return reference, created, BOOKING_LEDGER.once(conn, key, "backend"), BOOKING_LEDGER.once(conn, key, "team_alert")
 
 def check_yes_no(text: str) -> str:
-    """✅ FAIL-SAFE: Check if text contains YES/NO (20+ variants in 3 languages)"""
-    text_lower = text.lower().strip()
+    """✅ FAIL-SAFE: Check if text contains YES/NO (20+ variants in 3 languages)
+    Whole words only ("book" is not "ok"); when both appear the first one wins ("no, that's right")."""
+    yes_at = YES_LEXICON.first(text)
+    no_at = NO_LEXICON.first(text)
     
-    # Check YES words
-    for yes_word in YES_WORDS:
-        if yes_word in text_lower:
-            return "yes"
-    
-    # Check NO words
-    for no_word in NO_WORDS:
-        if no_word in text_lower:
-            return "no"
+    if yes_at is not None and (no_at is None or yes_at <= no_at):
+        return "yes"
+    if no_at is not None:
+        return "no"
     
     return None  # Unclear
 
@@ -1299,7 +1268,7 @@ def ensure_booking_state(context):
         context["call_initialized"] = False
     else:
         # ✅ PRESERVE existing booking state - never reset if it exists
-        print(f"[STATE] ✅ Booking state preserved from previous request (dropoff_confirm_pending={context['booking'].get('dropoff_confirm_pending')})", flush=True)
+        log.info("[STATE] ✅ Booking state preserved from previous request (dropoff_confirm_pending=%s)", context['booking'].get('dropoff_confirm_pending'))
 
 def prewarm_elevenlabs_tts():
     global _tts_prewarmed
@@ -1314,201 +1283,32 @@ def prewarm_elevenlabs_tts():
             "Accept": "audio/mpeg"
         }
         payload = {"text": "Hi", "voice_settings": {"stability": 0.3, "similarity_boost": 0.7}}
-        requests.post(url, json=payload, headers=headers, timeout=5)
+        with USAGE.metered("elevenlabs", "tts", len(payload["text"])):
+            requests.post(url, json=payload, headers=headers, timeout=5)
         _tts_prewarmed = True
     except:
         pass
 
 def generate_professional_email_html(booking_data: dict, status_message: str) -> str:
     """✅ Generate professional Careem/Uber style HTML email with driver info"""
-    customer_name = booking_data.get('customer_name', 'Customer') or 'Customer'
-    phone = booking_data.get('customer_phone', 'N/A') or 'N/A'
-    pickup = booking_data.get('pickup_location', 'N/A') or 'N/A'
-    dropoff = booking_data.get('dropoff_location', 'N/A') or 'N/A'
-    passengers = booking_data.get('passengers_count', 'N/A') or 'N/A'
-    luggage = booking_data.get('luggage_count', 'N/A') or 'N/A'
-    fare = booking_data.get('calculated_fare_aed', booking_data.get('fare', 'N/A')) or 'N/A'
-    vehicle = (booking_data.get('vehicle_type') or 'N/A').upper()
-    email = booking_data.get('customer_email', 'N/A') or 'N/A'
-    notes = booking_data.get('notes', '') or ''
-    booking_ref = booking_data.get('booking_reference', 'BOOK-XXXX') or 'BOOK-XXXX'
-    pickup_time = booking_data.get('datetime', 'TBD') or 'TBD'
-    car_model = booking_data.get('car_model', 'Pending') or 'Pending'
-    car_color = booking_data.get('car_color', 'N/A') or 'N/A'
-    driver_name = booking_data.get('driver_name', 'Assigning...') or 'Assigning...'
-    driver_number = booking_data.get('driver_number', 'N/A') or 'N/A'
-    driver_picture = booking_data.get('driver_picture', None)
-    
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Helvetica, Arial, sans-serif; line-height: 1.5; color: #333; margin: 0; padding: 0; }}
-            .container {{ max-width: 900px; margin: 0 auto; background: #f8f9fa; padding: 15px; }}
-            .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 25px; text-align: center; border-radius: 8px 8px 0 0; }}
-            .header h1 {{ margin: 0; font-size: 26px; font-weight: 700; }}
-            .content {{ background: white; padding: 25px; border-radius: 0 0 8px 8px; }}
-            .status {{ background: #e8f5e9; color: #2e7d32; padding: 12px; margin: 15px 0; border-radius: 5px; text-align: center; font-weight: 600; font-size: 15px; }}
-            .booking-bar {{ display: flex; justify-content: space-between; align-items: center; background: #f0f7ff; border-left: 4px solid #667eea; padding: 12px 15px; margin: 15px 0; border-radius: 5px; }}
-            .booking-label {{ color: #666; font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px; }}
-            .booking-value {{ font-size: 18px; font-weight: 700; color: #667eea; }}
-            .route-section {{ background: #f8f9fa; border-radius: 6px; padding: 15px; margin: 15px 0; }}
-            .route-header {{ font-size: 13px; color: #667eea; font-weight: 700; text-transform: uppercase; letter-spacing: 0.5px; margin-bottom: 12px; border-bottom: 2px solid #667eea; padding-bottom: 8px; }}
-            .route-flow {{ display: flex; justify-content: space-between; align-items: center; gap: 10px; }}
-            .route-item {{ flex: 1; text-align: center; padding: 10px; }}
-            .route-icon {{ font-size: 28px; margin-bottom: 5px; }}
-            .route-label {{ color: #999; font-size: 10px; text-transform: uppercase; margin-bottom: 3px; }}
-            .route-text {{ font-size: 13px; font-weight: 600; color: #333; }}
-            .connector {{ font-size: 20px; color: #ddd; margin-top: 20px; }}
-            .details-bar {{ display: grid; grid-template-columns: 1fr 1fr 1fr 1fr 1fr 1fr; gap: 10px; margin: 15px 0; }}
-            .detail-box {{ background: #f8f9fa; padding: 10px; border-radius: 5px; text-align: center; }}
-            .detail-label {{ color: #666; font-size: 10px; text-transform: uppercase; }}
-            .detail-value {{ font-size: 14px; font-weight: 700; color: #667eea; margin-top: 3px; }}
-            .detail-value.vehicle {{ color: #333; }}
-            .driver-section {{ background: #f0f7ff; border-left: 4px solid #667eea; border-radius: 6px; padding: 15px; margin: 15px 0; display: flex; gap: 15px; }}
-            .driver-pic {{ width: 80px; height: 80px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 8px; display: flex; align-items: center; justify-content: center; color: white; font-size: 40px; flex-shrink: 0; }}
-            .driver-info {{ flex: 1; }}
-            .driver-header {{ font-size: 13px; color: #667eea; font-weight: 700; text-transform: uppercase; margin-bottom: 10px; }}
-            .driver-name {{ font-size: 18px; font-weight: 700; color: #333; }}
-            .driver-number {{ font-size: 14px; color: #667eea; margin-top: 5px; font-weight: 600; }}
-            .driver-number a {{ color: #667eea; text-decoration: none; }}
-            .driver-number a:hover {{ text-decoration: underline; }}
-            .info-bar {{ display: grid; grid-template-columns: 1fr 1fr; gap: 12px; margin: 15px 0; }}
-            .info-item {{ background: #f8f9fa; padding: 12px; border-radius: 5px; }}
-            .info-label {{ color: #666; font-size: 11px; text-transform: uppercase; }}
-            .info-value {{ font-size: 14px; font-weight: 600; color: #333; margin-top: 4px; word-break: break-all; }}
-            .helpline-box {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px; border-radius: 6px; margin: 15px 0; text-align: center; }}
-            .helpline-label {{ font-size: 12px; text-transform: uppercase; opacity: 0.9; }}
-            .helpline-number {{ font-size: 18px; font-weight: 700; margin-top: 8px; }}
-            .helpline-number a {{ color: white; text-decoration: none; }}
-            .helpline-number a:hover {{ text-decoration: underline; }}
-            .notes-box {{ background: #fff3cd; border-left: 4px solid #ffc107; padding: 12px; margin: 15px 0; border-radius: 5px; }}
-            .notes-label {{ color: #856404; font-weight: 600; font-size: 12px; }}
-            .notes-text {{ color: #856404; font-size: 13px; margin-top: 6px; }}
-            .footer {{ text-align: center; padding: 15px; color: #999; font-size: 11px; border-top: 1px solid #eee; margin-top: 20px; }}
-            .footer a {{ color: #667eea; text-decoration: none; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>⭐ Star Skyline Limousine</h1>
-            </div>
-            
-            <div class="content">
-                <p>Hi <strong>{customer_name}</strong>,</p>
-                
-                <div class="status">✅ {status_message}</div>
-                
-                <div class="booking-bar">
-                    <div>
-                        <div class="booking-label">Booking Reference</div>
-                        <div class="booking-value">{booking_ref}</div>
-                    </div>
-                </div>
-                
-                <div class="route-section">
-                    <div class="route-header">📍 Route & Time</div>
-                    <div class="route-flow">
-                        <div class="route-item">
-                            <div class="route-icon">📤</div>
-                            <div class="route-label">Pickup Location</div>
-                            <div class="route-text">{pickup}</div>
-                        </div>
-                        <div class="connector">→</div>
-                        <div class="route-item">
-                            <div class="route-icon">⏰</div>
-                            <div class="route-label">Pickup Time</div>
-                            <div class="route-text">{pickup_time}</div>
-                        </div>
-                        <div class="connector">→</div>
-                        <div class="route-item">
-                            <div class="route-icon">📥</div>
-                            <div class="route-label">Dropoff Location</div>
-                            <div class="route-text">{dropoff}</div>
-                        </div>
-                    </div>
-                </div>
-                
-                <div class="details-bar">
-                    <div class="detail-box">
-                        <div class="detail-label">Vehicle Type</div>
-                        <div class="detail-value vehicle">{vehicle}</div>
-                    </div>
-                    <div class="detail-box">
-                        <div class="detail-label">Car Model</div>
-                        <div class="detail-value vehicle">{car_model}</div>
-                    </div>
-                    <div class="detail-box">
-                        <div class="detail-label">Car Color</div>
-                        <div class="detail-value vehicle">{car_color}</div>
-                    </div>
-                    <div class="detail-box">
-                        <div class="detail-label">Passengers</div>
-                        <div class="detail-value">{passengers}</div>
-                    </div>
-                    <div class="detail-box">
-                        <div class="detail-label">Luggage</div>
-                        <div class="detail-value">{luggage}</div>
-                    </div>
-                    <div class="detail-box">
-                        <div class="detail-label">Total Fare</div>
-                        <div class="detail-value">AED {fare}</div>
-                    </div>
-                </div>
-                
-                <div class="driver-section">
-                    <div class="driver-pic">👨‍💼</div>
-                    <div class="driver-info">
-                        <div class="driver-header">🚗 Your Driver</div>
-                        <div class="driver-name">{driver_name}</div>
-                        <div class="driver-number">📞 <a href="tel:{driver_number.replace('+', '').replace(' ', '')}">{driver_number}</a></div>
-                    </div>
-                </div>
-                
-                <div class="info-bar">
-                    <div class="info-item">
-                        <div class="info-label">📞 Phone</div>
-                        <div class="info-value">{phone}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">✉️ Email</div>
-                        <div class="info-value">{email}</div>
-                    </div>
-                </div>
-                
-                <div class="helpline-box">
-                    <div class="helpline-label">Need Help? Call Our Helpline</div>
-                    <div class="helpline-number"><a href="tel:02111122233">021 111 222 333</a></div>
-                </div>
-                
-                {"<div class='notes-box'><div class='notes-label'>🎯 Special Requests/Notes:</div><div class='notes-text'>" + notes + "</div></div>" if notes else ""}
-                
-                <p style="margin-top: 30px; color: #666; font-size: 14px;">
-                    ✅ Our driver will contact <strong>{customer_name}</strong> at <strong>{phone}</strong> shortly for final confirmation.<br>
-                    ⏱️ Expected pickup time will be shared via WhatsApp.
-                </p>
-                
-                <div class="footer">
-                    <p>Star Skyline Limousine Service • Dubai, UAE<br>
-                    <a href="https://starskyline.ae">Visit our website</a> | 
-                    <a href="tel:+971501234567">Call us</a></p>
-                    <p>Booking Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+    return email_templates.render("booking_status", email_templates.from_booking(booking_data, status_message))
+
+def resend_smtp():
+    """✅ A logged-in Resend SMTP connection (TEAM_SMTP keeps and reuses them)"""
+    server = smtplib.SMTP_SSL('smtp.resend.com', 465, timeout=20)
+    server.login('resend', RESEND_API_KEY)
+    return server
 
-def send_email_notification(subject: str, body: str, booking_data: dict = None, recipient_email: str = None, retry_count: int = 0) -> bool:
-    """✅ Send email notification to team (Resend SMTP) with HTML template - WITH RETRY"""
+TEAM_SMTP = notify_dispatcher.SmtpSessions(resend_smtp)
+tracing.register_gauge("team_smtp", TEAM_SMTP.snapshot)
+
+@tracing.traced("email", "smtp")
+def deliver_team_email(subject: str, html_body: Optional[str], text_body: str, recipient_email: str = None, retry_count: int = 0) -> bool:
+    """✅ Send one email to the team (Resend SMTP, reused connection) - WITH RETRY"""
     try:
         if not RESEND_API_KEY:
-            print(f"[EMAIL] ❌ FATAL: Resend API key not configured! Email CANNOT be sent!", flush=True)
-            print(f"[EMAIL] Subject: {subject}", flush=True)
-            print(f"[EMAIL] Phone: {booking_data.get('customer_phone', 'N/A') if booking_data else 'N/A'}", flush=True)
+            log.error("[EMAIL] ❌ FATAL: Resend API key not configured! Email CANNOT be sent!")
+            log.info("[EMAIL] Subject: %s", subject)
             return False
         
         # Use specific recipient or all notification emails
@@ -1518,136 +1318,72 @@ def send_email_notification(subject: str, body: str, booking_data: dict = None,
         msg['From'] = RESEND_EMAIL
         msg['To'] = ", ".join(recipients)
         msg['Subject'] = subject
-        
-        # Plain text fallback
-        text_body = body + "\n\n"
-        if booking_data:
-            text_body += "📋 Booking Details:\n"
-            text_body += f"  📞 Customer: {booking_data.get('customer_name', 'N/A')} ({booking_data.get('customer_phone', 'N/A')})\n"
-            text_body += f"  📍 Pickup: {booking_data.get('pickup_location', 'N/A')}\n"
-            text_body += f"  📍 Dropoff: {booking_data.get('dropoff_location', 'N/A')}\n"
-            text_body += f"  👥 Passengers: {booking_data.get('passengers_count', 'N/A')}\n"
-            text_body += f"  🧳 Luggage: {booking_data.get('luggage_count', 'N/A')}\n"
-            text_body += f"  💰 Fare: AED {booking_data.get('calculated_fare_aed', booking_data.get('fare', 'N/A'))}\n"
-            text_body += f"  🚗 Vehicle: {booking_data.get('vehicle_type', 'N/A')}\n"
-            text_body += f"  ✉️ Email: {booking_data.get('customer_email', 'N/A')}\n"
-        
-        # Attach plain text
         msg.attach(MIMEText(text_body, 'plain'))
-        
-        # Generate and attach HTML
-        if booking_data:
-            html_body = generate_professional_email_html(booking_data, body)
+        if html_body:
             msg.attach(MIMEText(html_body, 'html'))
         
-        # Send via Resend SMTP
-        server = smtplib.SMTP_SSL('smtp.resend.com', 465)
-        server.login('resend', RESEND_API_KEY)
-        server.send_message(msg)
-        server.quit()
+        with USAGE.metered("resend", "email", len(recipients)):
+            TEAM_SMTP.send(msg)
         
-        print(f"[EMAIL] ✅ Notification sent to {', '.join(recipients)}: {subject}", flush=True)
+        log.info("[EMAIL] ✅ Notification sent to %s: %s", ', '.join(recipients), subject)
         return True
     except Exception as e:
-        print(f"[EMAIL] ❌ Failed to send email (attempt {retry_count + 1}): {type(e).__name__}: {str(e)}", flush=True)
+        log.error("[EMAIL] ❌ Failed to send email (attempt %s): %s: %s", retry_count + 1, type(e).__name__, e)
         
         # ✅ RETRY LOGIC: Try up to 3 times
         if retry_count < 2:
-            print(f"[EMAIL] 🔄 Retrying email send in 2 seconds... (attempt {retry_count + 2}/3)", flush=True)
-            import time
+            log.info("[EMAIL] 🔄 Retrying email send in 2 seconds... (attempt %s/3)", retry_count + 2)
             time.sleep(2)
-            return send_email_notification(subject, body, booking_data, recipient_email, retry_count + 1)
+            return deliver_team_email(subject, html_body, text_body, recipient_email, retry_count + 1)
         
         return False
 
+def send_email_notification(subject: str, body: str, booking_data: dict = None, recipient_email: str = None) -> bool:
+    """✅ Send email notification to team with the booking_status template (plain text + HTML)"""
+    if booking_data:
+        html_body, text_body = email_templates.render_both("booking_status", email_templates.from_booking(booking_data, body))
+        return deliver_team_email(subject, html_body, text_body, recipient_email)
+    return deliver_team_email(subject, None, body, recipient_email)
+
+# ✅ Team alerts: own sender threads; NOTIFY_DIGEST_MINUTES batches partial_info/dropped
+TEAM_NOTIFIER = notify_dispatcher.Dispatcher(deliver_team_email)
+tracing.register_gauge("team_notify", TEAM_NOTIFIER.snapshot)
+atexit.register(TEAM_NOTIFIER.drain, 10.0)
+
 def notify_booking_to_team(booking_data: dict, status: str = "created"):
-    """✅ Send async notification to team about booking - WITH PROPER THREADING"""
+    """✅ Send async notification to team about booking (immediately, or in the next digest)"""
     try:
-        subject_map = {
-            "created": "✅ New Booking Confirmed - Star Skyline",
-            "pending": "⏳ Pending Booking (Backend Down) - Star Skyline",
-            "failed": "❌ Booking Failed - Customer May Not Have Confirmed",
-            "dropped": "📞 Call Dropped - Customer May Need Follow-up",
-            "partial_info": "⚠️ Partial Booking Data Collected - Customer May Need Follow-up",
-            "location_failed": "🚨 MISSED LEAD - Pickup Location Issue - Star Skyline"
-        }
-        
-        body_map = {
-            "created": f"🎉 Booking successfully created and confirmed by customer!",
-            "pending": f"⚠️ Booking saved locally - Backend was unavailable. Please sync when backend is online.",
-            "failed": f"❌ Booking creation failed. Customer needs manual follow-up.",
-            "dropped": f"📞 Customer call dropped mid-conversation. Please follow up immediately!",
-            "partial_info": f"⚠️ Customer provided some booking details but didn't complete the full booking. Follow up with them!",
-            "location_failed": f"🚨 URGENT: Customer called but could not provide a valid pickup location after 3 attempts. PLEASE CALL THEM BACK IMMEDIATELY!"
-        }
-        
-        subject = subject_map.get(status, f"Booking Notification ({status})")
-        body = body_map.get(status, "New booking notification")
-        
-        # ✅ FIX: Send email with NON-DAEMON thread (waits for completion) + explicit logging
-        def send_email_thread():
-            result = send_email_notification(subject, body, booking_data)
-            if not result:
-                print(f"[NOTIFY] ⚠️ Email thread completed but send failed for status: {status}", flush=True)
-        
-        thread = threading.Thread(target=send_email_thread, daemon=False)  # ✅ NOT daemon - ensures email sends before shutdown
-        thread.start()
-        
-        print(f"[NOTIFY] Email thread started (non-daemon) for status: {status}", flush=True)
+        how = TEAM_NOTIFIER.notify(booking_data, status)
+        if how == "digest":
+            log.info("[NOTIFY] Email held for the follow-up digest: %s", status)
+        elif how:
+            log.info("[NOTIFY] Email queued for status: %s", status)
+        else:
+            log.warning("[NOTIFY] ⚠️ Notification queue full, email dropped for status: %s", status)
     except Exception as e:
-        print(f"[NOTIFY] ❌ Notification error: {e}", flush=True)
+        log.error("[NOTIFY] ❌ Notification error: %s", e)
 
 def send_whatsapp_text_message(to_phone: str, text: str) -> bool:
-    """✅ Send text message reply via WhatsApp using Twilio API"""
-    try:
-        account_sid = os.environ.get("TWILIO_ACCOUNT_SID", "")
-        auth_token = os.environ.get("TWILIO_AUTH_TOKEN", "")
-        if not account_sid or not auth_token:
-            print(f"[BAREERAH] ❌ Missing Twilio credentials", flush=True)
-            return False
-        
-        client = TwilioClient(account_sid, auth_token)
-        
-        # ✅ NORMALIZE PHONE: Ensure proper format with +
-        normalized_phone = to_phone if to_phone.startswith('+') else '+' + to_phone
-        
-        # ✅ Send TEXT message via WhatsApp
-        message = client.messages.create(
-            from_="whatsapp:+14155238886",
-            to=f"whatsapp:{normalized_phone}",
-            body=text
-        )
-        
-        print(f"[BAREERAH] 💬 Sent text reply to {to_phone} | SID: {message.sid}", flush=True)
-        return True
-    except Exception as e:
-        print(f"[BAREERAH] ❌ Failed to send message: {e}", flush=True)
+    """✅ Queue a text reply via WhatsApp (shared Twilio client + outbound queue)"""
+    # ✅ NORMALIZE PHONE: Ensure proper format with +
+    normalized_phone = to_phone if to_phone.startswith('+') else '+' + to_phone
+    job = twilio_sender.send_whatsapp(normalized_phone, body=text)
+    if job is None:
+        log.error("[BAREERAH] ❌ Failed to queue message to %s (no Twilio credentials or outbox full)", to_phone)
         return False
+    log.info("[BAREERAH] 💬 Queued text reply to %s", to_phone)
+    return True
 
 def send_whatsapp_audio_message(to_phone: str, audio_url: str) -> bool:
-    """✅ Send audio message via WhatsApp using Twilio API with ElevenLabs TTS"""
-    try:
-        account_sid = os.environ.get("TWILIO_ACCOUNT_SID", "")
-        auth_token = os.environ.get("TWILIO_AUTH_TOKEN", "")
-        if not account_sid or not auth_token:
-            print(f"[TTS] ❌ Missing Twilio credentials", flush=True)
-            return False
-        
-        client = TwilioClient(account_sid, auth_token)
-        
-        # ✅ Send AUDIO message via WhatsApp with media
-        message = client.messages.create(
-            from_="whatsapp:+14155238886",
-            to=f"whatsapp:{to_phone}",
-            media_url=audio_url
-        )
-        
-        print(f"[TTS] 🔊 Sent audio reply to {to_phone} | URL: {audio_url} | SID: {message.sid}", flush=True)
-        return True
-    except Exception as e:
-        print(f"[TTS] ❌ Failed to send audio: {e}", flush=True)
+    """✅ Queue an audio message via WhatsApp with ElevenLabs TTS"""
+    job = twilio_sender.send_whatsapp(to_phone, media_url=audio_url)
+    if job is None:
+        log.error("[TTS] ❌ Failed to queue audio to %s (no Twilio credentials or outbox full)", to_phone)
         return False
+    log.info("[TTS] 🔊 Queued audio reply to %s | URL: %s", to_phone, audio_url)
+    return True
 
+@tracing.traced("whatsapp.turn")
 def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict) -> str:
     """✅ Process booking slot-filling for WhatsApp with MULTI-SLOT extraction from single message"""
     booking = ctx.get("booking")
@@ -1678,20 +1414,20 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
     
     if detected_context:
         keyword, response = detected_context
-        print(f"[OUT-OF-CONTEXT] Detected '{keyword}' question: {incoming_text[:100]}", flush=True)
+        log.info("[OUT-OF-CONTEXT] Detected '%s' question: %s", keyword, incoming_text[:100])
         return response
     
     # ✅ NEW: CHECK FAQ CACHE FIRST (40-50% hit rate, <100ms response)
     cached_response = get_cached_faq_response(incoming_text, ctx.get("language", "en"))
     if cached_response:
-        print(f"[CACHE] ✅ Returning FAQ response", flush=True)
+        log.info("[CACHE] ✅ Returning FAQ response")
         return cached_response
     
     # ✅ DIRECT TEXT CHECK: If message has booking keywords, force extract without waiting for NLU
     # NOTE: Avoid "bags" as keyword since it matches "4 bags" luggage response
     has_booking_keywords = any(kw in low_text for kw in ["from ", "to ", "airport", "marina", "burj", "mall", "sharjah", "sheikh", "go to", "want to go", "need to go", "passengers", "luggage", "today", "tomorrow", "7pm", "7 pm", "3pm", "3 pm"])
     
-    print(f"[BOOKING] Has booking keywords: {has_booking_keywords} | Text: {incoming_text[:100]}", flush=True)
+    log.info("[BOOKING] Has booking keywords: %s | Text: %s", has_booking_keywords, incoming_text[:100])
     
     # ✅ FIX #2: Smart pickup/dropoff detection using keywords
     if has_booking_keywords:
@@ -1699,34 +1435,34 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         location_text = extract_pickup_location_llm(incoming_text)
         
         if location_text:
-            print(f"[SMART] Detected slot: {detected_slot} | Location: {location_text}", flush=True)
+            log.info("[SMART] Detected slot: %s | Location: %s", detected_slot, location_text)
             
             # ✅ Use keyword detection to route location to correct slot
             if detected_slot == "dropoff" and not booking.get("dropoff_locked"):
                 # "to/ko/going to" keywords → DROPOFF slot
                 booking["dropoff"] = location_text
                 booking["dropoff_locked"] = True
-                print(f"✅ DROPOFF SMART EXTRACTED (keyword): {location_text}", flush=True)
+                log.info("✅ DROPOFF SMART EXTRACTED (keyword): %s", location_text)
             elif detected_slot == "pickup" and not booking.get("pickup_locked"):
                 # "from/se/pickup" keywords → PICKUP slot
                 booking["pickup"] = location_text
                 booking["pickup_locked"] = True
-                print(f"✅ PICKUP SMART EXTRACTED (keyword): {location_text}", flush=True)
+                log.info("✅ PICKUP SMART EXTRACTED (keyword): %s", location_text)
             elif not booking.get("pickup_locked"):
                 # ✅ Default to flow order (DROPOFF first for driver-like greeting)
                 if not booking.get("dropoff_locked"):
                     booking["dropoff"] = location_text
                     booking["dropoff_locked"] = True
-                    print(f"✅ DROPOFF AUTO EXTRACTED (flow order): {location_text}", flush=True)
+                    log.info("✅ DROPOFF AUTO EXTRACTED (flow order): %s", location_text)
                 else:
                     booking["pickup"] = location_text
                     booking["pickup_locked"] = True
-                    print(f"✅ PICKUP AUTO EXTRACTED (flow order): {location_text}", flush=True)
+                    log.info("✅ PICKUP AUTO EXTRACTED (flow order): %s", location_text)
     
     # Now run NLU for other slots
-    nlu = extract_nlu(incoming_text, ctx)
+    nlu = extract_nlu(incoming_text, from_phone, need_reply=False)  # call_contexts is keyed by phone for WhatsApp
     nlu_booking_type = nlu.get("booking_type")
-    print(f"[NLU] Extracted: pickup='{nlu.get('pickup')}', dropoff='{nlu.get('dropoff')}', passengers='{nlu.get('passengers')}', luggage='{nlu.get('luggage')}', datetime='{nlu.get('datetime')}', booking_type='{nlu_booking_type}'", flush=True)
+    log.info("[NLU] Extracted: pickup='%s', dropoff='%s', passengers='%s', luggage='%s', datetime='%s', booking_type='%s'", nlu.get('pickup'), nlu.get('dropoff'), nlu.get('passengers'), nlu.get('luggage'), nlu.get('datetime'), nlu_booking_type)
     
     # ✅ DO NOT extract name from initial booking message - wait for explicit name step
     # This avoids extracting "Salam. Mujhe JW" as name
@@ -1737,7 +1473,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
     if not booking.get("pickup_locked") and nlu.get("pickup"):
         booking["pickup"] = nlu.get("pickup")
         booking["pickup_locked"] = True
-        print(f"✅ PICKUP AUTO-FILLED: {booking['pickup']}", flush=True)
+        log.info("✅ PICKUP AUTO-FILLED: %s", booking['pickup'])
     
     # Auto-fill dropoff if extracted AND pickup is locked
     if not booking.get("dropoff_locked") and nlu.get("dropoff") and booking.get("pickup_locked"):
@@ -1746,13 +1482,13 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             booking["dropoff"] = dropoff_text
             booking["dropoff_locked"] = True
             booking["booking_type"] = detect_booking_type(booking["pickup"], booking["dropoff"])
-            print(f"✅ DROPOFF AUTO-FILLED: {dropoff_text}", flush=True)
+            log.info("✅ DROPOFF AUTO-FILLED: %s", dropoff_text)
     
     # Auto-fill datetime if extracted AND dropoff is locked
     if not booking.get("datetime_locked") and nlu.get("datetime") and booking.get("dropoff_locked"):
         booking["datetime"] = nlu.get("datetime")
         booking["datetime_locked"] = True
-        print(f"✅ DATETIME AUTO-FILLED: {booking['datetime']}", flush=True)
+        log.info("✅ DATETIME AUTO-FILLED: %s", booking['datetime'])
     
     # ✅ Auto-fill passengers if extracted (NO datetime lock required - extract early!)
     if not booking.get("passengers_locked") and nlu.get("passengers"):
@@ -1771,7 +1507,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         if passengers >= 1:
             booking["passengers"] = passengers
             booking["passengers_locked"] = True
-            print(f"✅ PASSENGERS AUTO-FILLED: {passengers}", flush=True)
+            log.info("✅ PASSENGERS AUTO-FILLED: %s", passengers)
     
     # Auto-fill luggage if extracted AND passengers is locked
     if not booking.get("luggage_locked") and nlu.get("luggage") and booking.get("passengers_locked"):
@@ -1780,15 +1516,15 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             if luggage >= 0:
                 booking["luggage_count"] = luggage
                 booking["luggage_locked"] = True
-                print(f"✅ LUGGAGE AUTO-FILLED: {luggage}", flush=True)
+                log.info("✅ LUGGAGE AUTO-FILLED: %s", luggage)
         except Exception as e:
-            print(f"[DEBUG] Failed to parse luggage: {e}", flush=True)
+            log.debug("[DEBUG] Failed to parse luggage: %s", e)
     
     # ✅ AFTER AUTO-FILL: If all booking slots are locked but fare not calculated, show summary
     if (booking.get("pickup_locked") and booking.get("dropoff_locked") and 
         booking.get("passengers_locked") and booking.get("luggage_locked") and 
         not booking.get("fare_locked")):
-        print(f"[SUMMARY] All slots locked, calculating fare...", flush=True)
+        log.info("[SUMMARY] All slots locked, calculating fare...")
         vehicle_type, error_msg = suggest_vehicle(booking["passengers"], booking["luggage_count"], ctx.get("jwt_token"))
         if vehicle_type:
             booking["vehicle_type"] = vehicle_type
@@ -1808,14 +1544,14 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 per_km = 3
                 luggage_charge = booking.get("luggage_count", 0) * 10
                 fare = base_fare + (distance_km * per_km) + luggage_charge
-                print(f"[FARE] Using fallback formula: {base_fare} + ({distance_km}km × {per_km}) + ({booking.get('luggage_count', 0)} × 10) = {fare} AED", flush=True)
+                log.info("[FARE] Using fallback formula: %s + (%skm × %s) + (%s × 10) = %s AED", base_fare, distance_km, per_km, booking.get('luggage_count', 0), fare)
             
             booking["fare"] = int(fare) if fare else 100  # ✅ Ensure integer, never 0 or None
             booking["fare_locked"] = True
-            print(f"✅ FARE CALCULATED AFTER AUTO-FILL: {booking['fare']} AED", flush=True)
+            log.info("✅ FARE CALCULATED AFTER AUTO-FILL: %s AED", booking['fare'])
             # ✅ RETURN SUMMARY: Always show actual number, NEVER "?"
             return f"✅ BOOKING SUMMARY:\n📍 {booking['pickup']} → {booking['dropoff']} ({distance_km}km)\n🚗 {vehicle_type} | 👥 {booking['passengers']} passengers | 🎒 {booking['luggage_count']} bags\n💰 Total Fare: {booking['fare']} AED\n\nShould I proceed with this booking? (Yes/No)"
-        print(f"[SUMMARY] Could not calculate fare for summary", flush=True)
+        log.info("[SUMMARY] Could not calculate fare for summary")
     
     # ✅ PHASE 2: ASK FOR FIRST MISSING SLOT
     # PICKUP SLOT
@@ -1824,7 +1560,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             if nlu.get("yes_no") == "yes":
                 booking["pickup_locked"] = True
                 booking["pickup_confirm_pending"] = False
-                print(f"✅ PICKUP LOCKED: {booking['pickup']}", flush=True)
+                log.info("✅ PICKUP LOCKED: %s", booking['pickup'])
                 return f"Perfect! 📍 Where you heading?"
             else:
                 booking["pickup"] = None
@@ -1845,7 +1581,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             ctx["location_attempts"] = 0
             booking["pickup"] = pickup_text
             booking["pickup_confirm_pending"] = True
-            print(f"✅ PICKUP EXTRACTED: {booking['pickup']}", flush=True)
+            log.info("✅ PICKUP EXTRACTED: %s", booking['pickup'])
             return f"Got it, picking you from {booking['pickup']}? 👍"
     
     # ✅ DROPOFF SLOT
@@ -1855,7 +1591,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 booking["dropoff_locked"] = True
                 booking["dropoff_confirm_pending"] = False
                 booking["booking_type"] = detect_booking_type(booking["pickup"], booking["dropoff"])
-                print(f"✅ DROPOFF LOCKED: {booking['dropoff']}", flush=True)
+                log.info("✅ DROPOFF LOCKED: %s", booking['dropoff'])
             else:
                 booking["dropoff"] = None
                 booking["dropoff_confirm_pending"] = False
@@ -1872,8 +1608,8 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             nlu_booking_type = nlu.get("booking_type")
             if nlu_booking_type == "multi_stop":
                 booking["multi_stop"] = True
-                print(f"✅ MULTI-STOP DETECTED from NLU", flush=True)
-            print(f"✅ DROPOFF EXTRACTED: {booking['dropoff']}", flush=True)
+                log.info("✅ MULTI-STOP DETECTED from NLU")
+            log.info("✅ DROPOFF EXTRACTED: %s", booking['dropoff'])
             return f"Cool, dropping you at {booking['dropoff']}? 👍"
         
         # After dropoff locked, check if we can skip to datetime or ask
@@ -1891,7 +1627,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 # ✅ If ambiguous, apply inferred period
                 if booking.get("datetime_ambiguous") and booking.get("datetime_ambiguous_period"):
                     booking["datetime"] = apply_time_period(booking["datetime"], booking["datetime_ambiguous_period"])
-                print(f"✅ DATETIME LOCKED: {booking['datetime']}", flush=True)
+                log.info("✅ DATETIME LOCKED: %s", booking['datetime'])
             else:
                 booking["datetime"] = None
                 booking["datetime_confirm_pending"] = False
@@ -1910,7 +1646,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             is_ambiguous, inferred_period = detect_time_ambiguity(datetime_text, booking.get("booking_type"))
             booking["datetime_ambiguous"] = is_ambiguous
             booking["datetime_ambiguous_period"] = inferred_period
-            print(f"✅ DATETIME RECEIVED: {datetime_text} | Ambiguous={is_ambiguous}, Period={inferred_period}", flush=True)
+            log.info("✅ DATETIME RECEIVED: %s | Ambiguous=%s, Period=%s", datetime_text, is_ambiguous, inferred_period)
             
             # ✅ If ambiguous, ask for clarification with smart inference
             if is_ambiguous and inferred_period:
@@ -1943,7 +1679,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 return "How many passengers? (1, 2, 3, etc.)"
             booking["passengers"] = passengers_int
             booking["passengers_locked"] = True
-            print(f"✅ PASSENGERS LOCKED: {booking['passengers']}", flush=True)
+            log.info("✅ PASSENGERS LOCKED: %s", booking['passengers'])
         except:
             return "How many passengers? Please give a number."
         
@@ -1974,7 +1710,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         try:
             booking["luggage_count"] = int(luggage_count)
             booking["luggage_locked"] = True
-            print(f"✅ LUGGAGE LOCKED: {booking['luggage_count']}", flush=True)
+            log.info("✅ LUGGAGE LOCKED: %s", booking['luggage_count'])
         except:
             return "How many bags? Please give a number."
         
@@ -1995,7 +1731,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                     per_km = 3
                     luggage_charge = booking.get("luggage_count", 0) * 10
                     fare = base_fare + (distance_km * per_km) + luggage_charge
-                    print(f"[FARE] Using fallback formula: {base_fare} + ({distance_km}km × {per_km}) + ({booking.get('luggage_count', 0)} × 10) = {fare} AED", flush=True)
+                    log.info("[FARE] Using fallback formula: %s + (%skm × %s) + (%s × 10) = %s AED", base_fare, distance_km, per_km, booking.get('luggage_count', 0), fare)
                 else:
                     fare = 100  # Default if distance calculation fails
             else:
@@ -2003,7 +1739,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             
             booking["fare"] = int(fare) if fare else 100  # ✅ Ensure integer, never 0 or None
             booking["fare_locked"] = True
-            print(f"✅ FARE CALCULATED: {booking['fare']} AED", flush=True)
+            log.info("✅ FARE CALCULATED: %s AED", booking['fare'])
             
             # ✅ SUMMARY: Always show actual number, NEVER "?"
             return f"✅ BOOKING SUMMARY:\n📍 {booking['pickup']} → {booking['dropoff']} ({distance_km}km)\n🚗 {vehicle_type} | 👥 {booking['passengers']} passengers | 🎒 {booking['luggage_count']} bags\n💰 Total Fare: {booking['fare']} AED\n\nShould I proceed with this booking? (Yes/No)"
@@ -2034,7 +1770,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 return f"Typically {max(int(booking.get('distance_km', 50)/60), 30)}-60 minutes depending on traffic."
             else:
                 # Generic answer if no specific match
-                print(f"[Q&A] Generic question detected - answering instead of proceeding", flush=True)
+                log.info("[Q&A] Generic question detected - answering instead of proceeding")
                 return "Great question! Our team will contact you shortly with details. Thank you for choosing Star Skyline! 🙏"
         
         # ✅ CHECK: NLU yes_no OR direct text check (20+ variants)
@@ -2045,18 +1781,18 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             booking["proceed_confirmed"] = True
             booking["booking_status"] = "confirmed"
             booking["caller_number"] = from_phone  # ✅ Save phone early for email
-            print(f"✅ BOOKING CONFIRMED BY USER (YES detected)", flush=True)
+            log.info("✅ BOOKING CONFIRMED BY USER (YES detected)")
             # ✅ NOTE: Email will be sent AFTER name/phone collection is complete (in final confirmation)
             return "Nice! What's your name?"
         elif is_no:
             # ✅ EVEN IF NO: Still save booking as pending
             booking["proceed_confirmed"] = False
             booking["booking_status"] = "pending_no_response"
-            print(f"⏳ USER SAID NO - Auto-saving as pending", flush=True)
+            log.info("⏳ USER SAID NO - Auto-saving as pending")
             return "No problem. Is there anything you'd like to change about this booking?"
         else:
             # ✅ UNCLEAR: Save as pending and ask again
-            print(f"❓ UNCLEAR RESPONSE - Saving as pending", flush=True)
+            log.info("❓ UNCLEAR RESPONSE - Saving as pending")
             return "Should I proceed with this booking? (Yes/No)"
     
     # ✅ QUESTION ANSWERING - Detect and answer customer questions BEFORE processing as data
@@ -2099,7 +1835,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 booking["name_locked"] = True
                 booking["name_confirm_pending"] = False
                 booking["caller_number"] = from_phone
-                print(f"✅ NAME CONFIRMED: {booking['full_name']}", flush=True)
+                log.info("✅ NAME CONFIRMED: %s", booking['full_name'])
                 # Ask about vehicle preference
                 return f"Our standard vehicle is a Sedan. Would you like a premium upgrade (Luxury Car, SUV) for a bit more, or keep the Sedan?"
             elif is_no:
@@ -2141,7 +1877,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 return "I need your full name. Can you tell me, please?"
             
             booking["full_name"] = " ".join(clean_words[:5])
-            print(f"[NAME] Extracted from response: {booking['full_name']}", flush=True)
+            log.info("[NAME] Extracted from response: %s", booking['full_name'])
             booking["name_confirm_pending"] = True
             return f"Just to confirm, your name is {booking['full_name']}? (Yes/No)"
     
@@ -2159,13 +1895,13 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         if asked_upgrade:
             booking["vehicle_preference"] = "luxury"
             booking["vehicle_preference_asked"] = True
-            print(f"✅ VEHICLE PREFERENCE: Luxury/Premium requested", flush=True)
+            log.info("✅ VEHICLE PREFERENCE: Luxury/Premium requested")
             
             # ✅ SMART: Show available luxury cars with models (just names, no plate/type)
             luxury_cars = [v for v in FLEET_INVENTORY if v["type"] in ["Luxury", "Luxury Van", "SUV"]]
             if luxury_cars:
                 car_list = "\n".join([f"• {v['vehicle']}" for v in luxury_cars[:4]])
-                print(f"[VEHICLE] Showing luxury options: {len(luxury_cars)} available", flush=True)
+                log.info("[VEHICLE] Showing luxury options: %s available", len(luxury_cars))
                 return f"Sir, we have these premium vehicles available:\n{car_list}\n\nWhich model would you prefer?"
             else:
                 return f"Perfect! I can arrange a premium vehicle for you. The fare will be adjusted accordingly. Is that okay? (Yes/No)"
@@ -2182,7 +1918,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         if "no" in low_text or len(incoming_text) < 3:
             booking["multi_stop"] = False
             booking["stops_locked"] = True
-            print(f"✅ MULTI-STOP CANCELLED", flush=True)
+            log.info("✅ MULTI-STOP CANCELLED")
             return f"No problem! So just {booking.get('dropoff')}? (Yes/No)"
         
         # Simple stops parsing (location duration pairs)
@@ -2208,7 +1944,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         
         booking["stops"] = stops
         booking["stops_locked"] = True
-        print(f"✅ MULTI-STOP LOCKED: {len(stops)} stops", flush=True)
+        log.info("✅ MULTI-STOP LOCKED: %s stops", len(stops))
         return f"Got it! {len(stops)} stops. Total time: {sum(s.get('duration_minutes', 30) for s in stops)} minutes. Cool? (Yes/No)"
     
     # ✅ ROUND-TRIP SLOT - Ask if customer needs return trip
@@ -2220,13 +1956,13 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             booking["round_trip"] = True
             booking["round_trip_locked"] = True
             # Don't lock booking_type yet - wait for return hours
-            print(f"✅ ROUND-TRIP CONFIRMED - Now asking for return hours", flush=True)
+            log.info("✅ ROUND-TRIP CONFIRMED - Now asking for return hours")
             return f"Perfect! How many hours you staying at {booking.get('dropoff')}? (e.g., 2, 3, 4 hours)"
         elif is_no:
             booking["round_trip"] = False
             booking["round_trip_locked"] = True
             booking["booking_type"] = detect_booking_type(booking.get("pickup"), booking.get("dropoff"), "point_to_point")
-            print(f"✅ ONE-WAY CONFIRMED", flush=True)
+            log.info("✅ ONE-WAY CONFIRMED")
             return f"Perfect! Now let me confirm your contact number. We have {from_phone} on file. Is this correct? (Yes/No)"
         else:
             return f"Do you need to return from {booking.get('dropoff', 'your destination')} later, or is it just one-way?"
@@ -2239,7 +1975,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
                 booking["return_after_hours"] = hours
                 booking["return_after_hours_locked"] = True
                 booking["booking_type"] = "round_trip"
-                print(f"✅ RETURN HOURS LOCKED: {hours} hours", flush=True)
+                log.info("✅ RETURN HOURS LOCKED: %s hours", hours)
                 return f"Great! So you'll return after {hours} hours. Let me confirm your contact number. We have {from_phone} on file. Is this correct? (Yes/No)"
         except:
             pass
@@ -2253,10 +1989,10 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
         if is_yes:
             booking["confirmed_contact_number"] = from_phone
             booking["phone_locked"] = True
-            print(f"✅ PHONE CONFIRMED: {from_phone}", flush=True)
+            log.info("✅ PHONE CONFIRMED: %s", from_phone)
             return f"Great! Now can you please provide your email address? (e.g., name@gmail.com)"
         elif is_no:
-            print(f"[PHONE] User wants to provide different number", flush=True)
+            log.info("[PHONE] User wants to provide different number")
             return "No problem! Please provide the contact number you'd like us to use."
         else:
             # Likely providing a different phone number
@@ -2264,7 +2000,7 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             if len(clean_phone) >= 10 and clean_phone.isdigit():
                 booking["confirmed_contact_number"] = "+" + clean_phone if not incoming_text.startswith("+") else incoming_text
                 booking["phone_locked"] = True
-                print(f"✅ PHONE CONFIRMED: {booking['confirmed_contact_number']}", flush=True)
+                log.info("✅ PHONE CONFIRMED: %s", booking['confirmed_contact_number'])
                 return f"Perfect! Phone {booking['confirmed_contact_number']} noted. Now can you please provide your email address? (e.g., name@gmail.com)"
             else:
                 # Not a valid phone, ask again
@@ -2281,13 +2017,13 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             # No special notes
             booking["notes"] = None
             booking["notes_locked"] = True
-            print(f"✅ NOTES SKIPPED - No special requests", flush=True)
+            log.info("✅ NOTES SKIPPED - No special requests")
         else:
             # ✅ Capture notes (max 500 chars to avoid spam)
             notes_text = incoming_text.strip()[:500]
             booking["notes"] = notes_text
             booking["notes_locked"] = True
-            print(f"✅ NOTES CAPTURED: {notes_text[:100]}...", flush=True)
+            log.info("✅ NOTES CAPTURED: %s...", notes_text[:100])
         
         # Now create the booking (finally!)
         booking_ref = booking.get("booking_reference") or generate_booking_reference()
@@ -2336,17 +2072,26 @@ def process_whatsapp_booking_slot(from_phone: str, incoming_text: str, ctx: dict
             endpoint = "/api/bookings/create-manual"
         
         booking_payload = base_payload
-        print(f"[PAYLOAD] Sending {booking_type} booking to {endpoint}: {booking_payload}", flush=True)
+        
+        # ✅ One booking however often the customer confirms (booking_ledger.py): the row is
+        # recorded once, and only the first attempt pushes it and alerts the team
+        key = booking.setdefault("idempotency_key", booking_ledger.chat_key(from_phone))
+        booking_ref, created, push, alert = with_ledger_conn(claim_chat_booking, key, booking_ref, booking_payload, booking)
+        booking["booking_reference"] = booking_payload["booking_reference"] = booking_ref
+        log.info("[PAYLOAD] Sending %s booking to %s: %s", booking_type, endpoint, booking_payload)
         
         # Try to create booking
-        if create_booking_direct(booking_payload, endpoint=endpoint):
+        if not push:
+            log.info("[DB] ♻️ Booking %s already sent - not creating it again", booking_ref)
+        elif create_booking_direct(booking_payload, endpoint=endpoint):
             booking["booking_status"] = "confirmed"
-            print(f"[DB] ✅ Booking CONFIRMED with notes", flush=True)
-            notify_booking_to_team(booking_payload, status="created")
+            with_ledger_conn(BOOKING_LEDGER.settle, key, "confirmed")
+            log.info("[DB] ✅ Booking CONFIRMED with notes")
+            if alert: notify_booking_to_team(booking_payload, status="created")
         else:
             booking["booking_status"] = "pending_confirmation"
-            print(f"[DB] ⚠️ Booking pending - will sync when backend online", flush=True)
-            notify_booking_to_team(booking_payload, status="pending")
+            log.warning("[DB] ⚠️ Booking pending - the reconciler will sync it when the backend is online")
+            if alert: notify_booking_to_team(booking_payload, status="pending")
         
         booking["booking_completed"] = True
         is_confirmed = booking.get("booking_status") == "confirmed"
@@ -2390,7 +2135,7 @@ Thank you for choosing Star Skyline! 🙏"""
                 booking["confirmed_contact_number"] = from_phone
             booking["confirmed"] = True
             booking["booking_status"] = "confirmed"
-            print(f"✅ EMAIL SKIPPED: Customer chose not to provide", flush=True)
+            log.info("✅ EMAIL SKIPPED: Customer chose not to provide")
             
             # ✅ Ask for optional special requests/notes
             return f"Perfect! Now, do you have any special requests? For example:\n• Water bottles needed\n• WiFi required\n• Extra AC needed\n\nOr just say 'No' to proceed."
@@ -2408,7 +2153,7 @@ Thank you for choosing Star Skyline! 🙏"""
         )
         
         if looks_like_name:
-            print(f"[EMAIL] Input looks like name, not email: '{incoming_text}'", flush=True)
+            log.info("[EMAIL] Input looks like name, not email: '%s'", incoming_text)
             return f"I think you sent your name! 😊 You can provide your email or just say 'skip' to continue."
         
         # ✅ ALWAYS CREATE BOOKING (confirmed or pending)
@@ -2422,7 +2167,7 @@ Thank you for choosing Star Skyline! 🙏"""
                 booking["confirmed_contact_number"] = from_phone
             booking["confirmed"] = True
             booking["booking_status"] = "confirmed"
-            print(f"✅ EMAIL LOCKED: {booking['email']}", flush=True)
+            log.info("✅ EMAIL LOCKED: %s", booking['email'])
             
             return f"Great! Now, do you have any special requests? For example:\n• Water bottles needed\n• WiFi required\n• Extra AC needed\n\nOr just say 'No' to proceed."
         else:
@@ -2431,7 +2176,7 @@ Thank you for choosing Star Skyline! 🙏"""
                 # ✅ AUTO-SAVE: Skip email after 2 failed attempts
                 booking["email"] = "not_provided"
                 booking["email_locked"] = True
-                print(f"[DB] ⏳ Email attempts exceeded - skipping email", flush=True)
+                log.info("[DB] ⏳ Email attempts exceeded - skipping email")
                 return f"No problem! Let's proceed. Do you have any special requests? (Or just say 'No')"
             else:
                 return "Email not recognized. Try again or just say 'skip' to continue."
@@ -2464,13 +2209,14 @@ def generate_tts(text, call_sid, lang="en"):
         engine.runAndWait()
         engine.stop()
         
-        print(f"[TTS] ✅ pyttsx3 (FREE) generated audio: {filename}", flush=True)
+        log.info("[TTS] ✅ pyttsx3 (FREE) generated audio: %s", filename)
         return f"/public/{filename}"
     except Exception as e:
-        print(f"[TTS] ❌ pyttsx3 error: {str(e)}", flush=True)
+        log.error("[TTS] ❌ pyttsx3 error: %s", e)
         return None
 
 
+@tracing.traced("distance", "google_maps")
 def calculate_distance_google_maps(pickup: str, dropoff: str) -> float:
     """Calculate distance using Google Maps API (required - backend doesn't calculate)"""
     if not GOOGLE_MAPS_API_KEY or not pickup or not dropoff:
@@ -2484,7 +2230,8 @@ def calculate_distance_google_maps(pickup: str, dropoff: str) -> float:
             "key": GOOGLE_MAPS_API_KEY,
             "mode": "driving"
         }
-        response = requests.get(url, params=params, timeout=5)
+        with USAGE.metered("google", "distance_matrix"):
+            response = requests.get(url, params=params, timeout=5)
         if response.status_code == 200:
             data = response.json()
             if data.get("rows") and len(data["rows"]) > 0:
@@ -2497,6 +2244,7 @@ def calculate_distance_google_maps(pickup: str, dropoff: str) -> float:
     
     return None
 
+@tracing.traced("fare", "backend")
 def calculate_fare_api(distance_km, vehicle_type, booking_type, jwt_token):
     """
     PRODUCTION API: Send ONLY distance_km, vehicle_type, booking_type
@@ -2513,7 +2261,7 @@ def calculate_fare_api(distance_km, vehicle_type, booking_type, jwt_token):
         "booking_type": booking_type
     }, jwt_token)
     
-    print(f"[FARE API] Backend response: {result}", flush=True)
+    log.info("[FARE API] Backend response: %s", result)
     
     # Try multiple possible response keys
     if result:
@@ -2522,20 +2270,20 @@ def calculate_fare_api(distance_km, vehicle_type, booking_type, jwt_token):
             try:
                 fare = float(fare_value)
                 fare_aed = round(fare)
-                print(f"✅ FARE CALCULATED FROM API: {fare_aed} AED (raw: {fare})", flush=True)
+                log.info("✅ FARE CALCULATED FROM API: %s AED (raw: %s)", fare_aed, fare)
                 return fare_aed
             except Exception as e:
-                print(f"❌ FARE CONVERSION ERROR: {e}", flush=True)
+                log.error("❌ FARE CONVERSION ERROR: %s", e)
     
     # ✅ FALLBACK CALCULATION: If API fails, use formula
-    print(f"[FARE] API failed or no response, using fallback formula...", flush=True)
+    log.info("[FARE] API failed or no response, using fallback formula...")
     base_fare = 25  # AED
     rate_per_km = 3.0  # AED/km
     luggage_fee = 10  # AED for luggage
     
     fallback_fare = base_fare + (distance_km * rate_per_km) + luggage_fee
     fallback_fare = round(fallback_fare)
-    print(f"✅ FARE CALCULATED (FALLBACK): {fallback_fare} AED", flush=True)
+    log.info("✅ FARE CALCULATED (FALLBACK): %s AED", fallback_fare)
     return fallback_fare
 
 def is_valid_email(email):
@@ -2543,272 +2291,117 @@ def is_valid_email(email):
 
 def translate_to_urdu(text):
     try:
-        response = OPENAI_CLIENT.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Translate to natural, conversational Urdu. ONLY return the Urdu text, no explanation."},
-                {"role": "user", "content": f"Translate: {text}"}
-            ],
-            max_tokens=100,
-            timeout=5
-        )
+        with USAGE.metered("openai", "gpt-4o-mini") as meter:
+            response = meter.tokens(OPENAI_CLIENT.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "Translate to natural, conversational Urdu. ONLY return the Urdu text, no explanation."},
+                    {"role": "user", "content": f"Translate: {text}"}
+                ],
+                max_tokens=100,
+                timeout=5
+            ))
         return response.choices[0].message.content.strip()
     except:
         return text
 
+# All YES/NO/GREETING words (and the words of their phrases) as one token set, built once
+CONFIRMATION_BLOCKLIST = (
+    YES_LEXICON.vocabulary | NO_LEXICON.vocabulary | GREETING_LEXICON.vocabulary |
+    {"correct", "right", "true", "false", "maybe", "unclear", "dunno", "idk",
+     "what", "when", "where", "why", "how", "huh"}
+)
+
 def is_confirmation_or_greeting(text: str) -> bool:
     """✅ PERMANENT FIX #1: BLOCK YES/NO/GREETINGS from location extraction
     This prevents EMPTY_RESPONSE garbage from reaching LLM."""
     if not text:
         return False
     
-    text_lower = text.lower().strip()
-    
-    # Combine all YES/NO/GREETING words into a single blocklist
-    blocklist = (
-        YES_WORDS | NO_WORDS | 
-        set(GREETINGS_EN) | set(GREETINGS_UR) | set(GREETINGS_AR) |
-        {"correct", "right", "true", "false", "maybe", "unclear", "dunno", "idk",
-         "what", "when", "where", "why", "how", "huh", "what?"}
-    )
-    
     # If user said ONLY confirmation/greeting words with no location keywords
-    for word in text_lower.split():
-        if word not in blocklist and len(word) > 2:
+    for word in lexicon.tokens(text):
+        if word not in CONFIRMATION_BLOCKLIST and len(word) > 2:
             # Found a word that's not a filler - might be a location
             return False
     
     # All words are confirmations/greetings
-    print(f"[GUARD] 🚫 Blocking confirmation/greeting from location extraction: '{text}'", flush=True)
+    log.info("[GUARD] 🚫 Blocking confirmation/greeting from location extraction: '%s'", text)
     return True
 
+@tracing.traced("llm.pickup", "openai")
 def extract_pickup_location_llm(text: str) -> str:
     """✅ PERMANENT FIX #2: Multi-layer safeguard against EMPTY_RESPONSE
     - Layer 1: Block yes/no/greetings BEFORE LLM
     - Layer 2: Validate LLM output  
     - Layer 3: Never return garbage strings"""
-    print(f"[LLM] Input text: '{text}'", flush=True)
+    log.info("[LLM] Input text: '%s'", text)
     
     # ✅ LAYER 1: BLOCK CONFIRMATIONS/GREETINGS - NEVER send to LLM
     if is_confirmation_or_greeting(text):
-        print(f"[LLM] ❌ Rejected: Input is confirmation/greeting, not location", flush=True)
+        log.error("[LLM] ❌ Rejected: Input is confirmation/greeting, not location")
         return None
     
+    # ✅ LAYER 1.5: ONE KNOWN LANDMARK and no street/building numbers → no LLM needed
+    places = gazetteer.default().find_all(text)
+    if len(places) == 1 and not any(ch.isdigit() for ch in text):
+        log.info("[LLM] ⚡ Gazetteer: '%s'", places[0].place.name)
+        return places[0].place.name
+    
     try:
-        response = OPENAI_CLIENT.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Extract ONLY the location/address mentioned in user input. Remove fillers like 'I want to go to', 'I have to go to', 'meri', 'the way', etc. Keep ONLY the clean location name (can be any length). Extract: Dubai International Airport, Dubai Marina, Burj Khalifa, airport, mall names, neighborhoods, street names, building numbers - anything that identifies a place in Dubai or nearby emirates. IMPORTANT: If NO location is mentioned at all, return NOTHING (empty response), not 'No location mentioned.' Return ONLY the location, nothing else."},
-                {"role": "user", "content": text}
-            ],
-            max_tokens=100,
-            temperature=0,
-            top_p=0.1,
-            timeout=5
-        )
+        with USAGE.metered("openai", "gpt-3.5-turbo") as meter:
+            response = meter.tokens(OPENAI_CLIENT.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "Extract ONLY the location/address mentioned in user input. Remove fillers like 'I want to go to', 'I have to go to', 'meri', 'the way', etc. Keep ONLY the clean location name (can be any length). Extract: Dubai International Airport, Dubai Marina, Burj Khalifa, airport, mall names, neighborhoods, street names, building numbers - anything that identifies a place in Dubai or nearby emirates. IMPORTANT: If NO location is mentioned at all, return NOTHING (empty response), not 'No location mentioned.' Return ONLY the location, nothing else."},
+                    {"role": "user", "content": text}
+                ],
+                max_tokens=100,
+                temperature=0,
+                top_p=0.1,
+                timeout=5
+            ))
         location = response.choices[0].message.content.strip()
-        print(f"[LLM] ✅ Extracted: '{location}'", flush=True)
+        log.info("[LLM] ✅ Extracted: '%s'", location)
         
         # ✅ LAYER 2: VALIDATE LLM OUTPUT - Reject garbage strings
         # Reject: empty, single chars, EMPTY_RESPONSE, "no location mentioned", etc.
         if not location or len(location) <= 1 or location == ".":
-            print(f"[LLM] ❌ No valid location found", flush=True)
+            log.error("[LLM] ❌ No valid location found")
             return None
         
         if "empty" in location.lower() or "no location" in location.lower():
-            print(f"[LLM] ❌ LLM returned invalid response: '{location}'", flush=True)
+            log.error("[LLM] ❌ LLM returned invalid response: '%s'", location)
             return None
         
         # ✅ LAYER 3: FINAL CHECK - Make sure extracted location has at least 2 tokens
         location_tokens = location.split()
         if len(location_tokens) < 2:
-            print(f"[LLM] ❌ Location too short: '{location}' ({len(location_tokens)} tokens)", flush=True)
+            log.error("[LLM] ❌ Location too short: '%s' (%s tokens)", location, len(location_tokens))
             return None
         
         return location
     except Exception as e:
-        print(f"[LLM] ❌ Failed ({type(e).__name__}): {e}", flush=True)
+        log.error("[LLM] ❌ Failed (%s): %s", type(e).__name__, e)
         return None
 
+@tracing.traced("geocode", "google_maps")
 def validate_pickup_with_places_api(location: str) -> bool:
-    """✅ ROCK-SOLID: Places API + 120+ Dubai Locations Fallback Dictionary
+    """✅ ROCK-SOLID: Offline gazetteer first, Places API only for unknown places
     
     Flow:
-    1. Try Google Places API
-    2. If API fails → Check 120+ Dubai locations fallback dictionary
+    1. Check the Dubai gazetteer (data/dubai_locations.csv, fuzzy match)
+    2. Try Google Places API
     3. If specific address (has numbers + 3+ parts) → Auto-accept
     4. After 2 failed attempts → Accept anyway (ZERO business loss)
     """
     if not location:
-        print(f"[PLACES] ❌ Empty location input", flush=True)
+        log.error("[PLACES] ❌ Empty location input")
         return False
     
-    # ✅ COMPREHENSIVE FALLBACK DICTIONARY - 120+ Popular Dubai Locations
-    POPULAR_DUBAI_LOCATIONS = {
-        # Airports (10)
-        "dubai airport": "Dubai International Airport (DXB), Garhoud, Dubai",
-        "dubai international": "Dubai International Airport (DXB), Garhoud, Dubai",
-        "international airport": "Dubai International Airport (DXB), Garhoud, Dubai",
-        "dxb": "Dubai International Airport (DXB), Garhoud, Dubai",
-        "al maktoum": "Al Maktoum International Airport (DWC), Jebel Ali, Dubai",
-        "sharjah airport": "Sharjah International Airport (SHJ), Sharjah",
-        "abu dhabi airport": "Abu Dhabi International Airport (AUH), Abu Dhabi",
-        "auh": "Abu Dhabi International Airport (AUH), Abu Dhabi",
-        "terminal 1": "Dubai International Airport Terminal 1, Dubai",
-        "terminal 3": "Dubai International Airport Terminal 3, Dubai",
-        
-        # Malls & Shopping (20)
-        "dubai mall": "The Dubai Mall, Downtown Dubai, Dubai",
-        "marina mall": "Dubai Marina Mall, Sheikh Zayed Road, Dubai",
-        "dubai marina mall": "Dubai Marina Mall, Sheikh Zayed Road, Dubai",
-        "mall of the emirates": "Mall of the Emirates, Al Barsha, Dubai",
-        "emirates mall": "Mall of the Emirates, Al Barsha, Dubai",
-        "deira city centre": "Deira City Centre, Deira, Dubai",
-        "mirdif city centre": "Mirdif City Centre, Mirdif, Dubai",
-        "city centre": "Deira City Centre, Deira, Dubai",
-        "festival city": "Dubai Festival City, Dubai",
-        "bluewaters": "Bluewaters Island, Dubai",
-        "dragon mart": "Dragon Mart, International City, Dubai",
-        "international city": "International City, Dubai",
-        "jlt": "Jumeirah Lakes Towers, Dubai",
-        "jvc": "Jumeirah Village Circle, Dubai",
-        "jvt": "Jumeirah Village Triangle, Dubai",
-        "la mer": "La Mer Beach, Jumeirah 1, Dubai",
-        "gold souk": "Dubai Gold Souk, Deira, Dubai",
-        "spice souk": "Spice Souk, Deira, Dubai",
-        "al seef": "Al Seef, Dubai Creek, Bur Dubai, Dubai",
-        "souq madinat": "Souk Madinat Jumeirah, Umm Suqeim, Dubai",
-        
-        # Parks & Outdoor (15)
-        "zabeel park": "Zabeel Park, Za'abeel, Dubai",
-        "zabeel": "Zabeel Park, Za'abeel, Dubai",
-        "creek park": "Dubai Creek Park, Ras Al Khor, Dubai",
-        "safa park": "Safa Park, Al Wasl, Dubai",
-        "mushrif park": "Mushrif National Park, Dubai",
-        "al baraha park": "Al Baraha Park, Al Baraha, Dubai",
-        "kite beach": "Kite Beach, Umm Suqeim, Dubai",
-        "al qudra lakes": "Al Qudra Lakes, Dubai",
-        "love lake": "Al Qudra Love Lake, Dubai",
-        "hatta": "Hatta, Dubai",
-        "hatta dam": "Hatta Dam, Hatta, Dubai",
-        "al marmoom": "Al Marmoom Desert Conservation Reserve, Dubai",
-        "desert safari": "Desert Safari, Dubai Desert, Dubai",
-        "miracle garden": "Dubai Miracle Garden, Dubailand, Dubai",
-        "butterfly garden": "Dubai Butterfly Garden, Dubailand, Dubai",
-        
-        # Major Landmarks (20)
-        "burj khalifa": "Burj Khalifa, Downtown Dubai, Dubai",
-        "burj": "Burj Khalifa, Downtown Dubai, Dubai",
-        "emirates tower": "Emirates Towers, Business Bay, Dubai",
-        "downtown dubai": "Downtown Dubai, Dubai",
-        "burj al arab": "Burj Al Arab, Umm Suqeim, Dubai",
-        "jumeirah": "Jumeirah, Dubai",
-        "palm jumeirah": "Palm Jumeirah, Dubai",
-        "dubai marina": "Dubai Marina, Dubai",
-        "jbr": "JBR - Jumeirah Beach Residence, Dubai Marina, Dubai",
-        "jbr beach": "JBR - Jumeirah Beach Residence, Dubai Marina, Dubai",
-        "the beach jbr": "The Beach at JBR, Dubai Marina, Dubai",
-        "dubai marina walk": "Dubai Marina Walk, Dubai Marina, Dubai",
-        "zero gravity": "Zero Gravity, Dubai Marina, Dubai",
-        "skydive dubai": "Skydive Dubai, Dubai Marina, Dubai",
-        "atlantis": "Atlantis The Palm, Palm Jumeirah, Dubai",
-        "madinat jumeirah": "Madinat Jumeirah, Umm Suqeim, Dubai",
-        "wild wadi": "Wild Wadi Waterpark, Umm Suqeim, Dubai",
-        "blue waters": "Bluewaters Island, Dubai",
-        "ain dubai": "Ain Dubai, Bluewaters Island, Dubai",
-        "dubai frame": "Dubai Frame, Zabeel Park, Dubai",
-        
-        # Entertainment & Theme Parks (15)
-        "dubai parks": "Dubai Parks and Resorts, Jebel Ali, Dubai",
-        "legoland dubai": "Legoland Dubai, Dubai Parks, Jebel Ali, Dubai",
-        "motiongate": "Motiongate Dubai, Dubai Parks, Jebel Ali, Dubai",
-        "bollywood park": "Bollywood Parks Dubai, Dubai Parks, Jebel Ali, Dubai",
-        "img worlds": "IMG Worlds of Adventure, Sheikh Mohammed Bin Zayed Road, Dubai",
-        "global village": "Global Village, Sheikh Mohammed Bin Zayed Road, Dubai",
-        "expo city": "Expo City Dubai, Jebel Ali, Dubai",
-        "ski dubai": "Ski Dubai, Al Barsha, Dubai",
-        "aquarium": "Dubai Aquarium, Downtown Dubai, Dubai",
-        "aquarium downtown": "Dubai Aquarium, Downtown Dubai, Dubai",
-        "aquarium jbr": "The Underwater Zoo, Atlantis The Palm, Dubai",
-        "vr park": "VR Park, Dubai Mall, Downtown Dubai, Dubai",
-        "laser quest": "Laser Quest, Dubai Marina, Dubai",
-        "bowling": "Bowling Lounge, Dubai Marina, Dubai",
-        "speedway": "Dubai Speedway, Dubai",
-        
-        # Residential Areas (20)
-        "arabian ranches": "Arabian Ranches, Dubai",
-        "springs": "The Springs, Emirates Living, Dubai",
-        "the springs": "The Springs, Emirates Living, Dubai",
-        "damac hills": "DAMAC Hills, Dubailand, Dubai",
-        "creek harbor": "Creek Harbour, Dubai Creek Harbour, Dubai",
-        "creek harbour": "Creek Harbour, Dubai Creek Harbour, Dubai",
-        "business bay": "Business Bay, Dubai",
-        "difc": "Dubai International Financial Centre, Dubai",
-        "al barsha": "Al Barsha, Dubai",
-        "al barsha 1": "Al Barsha 1, Dubai",
-        "al barsha 2": "Al Barsha 2, Dubai",
-        "dubai sports city": "Dubai Sports City, Dubai",
-        "sports city": "Dubai Sports City, Dubai",
-        "dubai silicon oasis": "Dubai Silicon Oasis, Dubai",
-        "motor city": "Dubai Motor City, Dubai",
-        "karama": "Al Karama, Dubai",
-        "deira": "Deira, Dubai",
-        "bur dubai": "Bur Dubai, Dubai",
-        "bur deira": "Bur Deira, Dubai",
-        "al fahidi": "Al Fahidi Historical Neighbourhood, Bur Dubai, Dubai",
-        
-        # Industrial & Zones (10)
-        "jebel ali": "Jebel Ali Free Zone, Dubai",
-        "jebel ali port": "Jebel Ali Port, Dubai",
-        "free zone": "Jebel Ali Free Zone, Dubai",
-        "industrial area": "Dubai Industrial City, Dubai",
-        "port rashid": "Port Rashid, Dubai",
-        "jafza": "Jebel Ali Free Zone Authority, Dubai",
-        "mizhor": "MIZHOR Development Zone, Dubai",
-        "nad al sheba": "Nad Al Sheba, Dubai",
-        "mina rashid": "Mina Rashid, Dubai",
-        "hamriyah": "Hamriyah Free Zone, Sharjah",
-    }
-    
-    location_lower = location.lower().strip()
-    
-    # ✅ STEP 1: Check if exact match in fallback dictionary
-    if location_lower in POPULAR_DUBAI_LOCATIONS:
-        matched_name = POPULAR_DUBAI_LOCATIONS[location_lower]
-        print(f"[FALLBACK] Match found: {matched_name}", flush=True)
-        return True
-    
-    # ✅ STEP 2: Check for substring matches in fallback dictionary (contains)
-    for key, value in POPULAR_DUBAI_LOCATIONS.items():
-        if key in location_lower or location_lower in key:
-            print(f"[FALLBACK] Match found: {value}", flush=True)
-            return True
-    
-    # ✅ STEP 3: FUZZY MATCHING - 50% word overlap
-    # Convert location to words, remove stop words
-    stop_words = {"the", "a", "an", "and", "or", "in", "at", "to", "from", "for", "by"}
-    location_words = set(w for w in location_lower.split() if w not in stop_words and w)
-    
-    best_fallback_match = None
-    best_fallback_score = 0
-    
-    for key, value in POPULAR_DUBAI_LOCATIONS.items():
-        key_words = set(w for w in key.split() if w not in stop_words and w)
-        
-        if location_words and key_words:
-            # Calculate word overlap percentage
-            overlap = len(location_words & key_words)
-            total = max(len(location_words), len(key_words))
-            match_score = overlap / total if total > 0 else 0
-            
-            # If 50%+ overlap, it's a match
-            if match_score >= 0.5 and match_score > best_fallback_score:
-                best_fallback_match = value
-                best_fallback_score = match_score
-                print(f"[FALLBACK] Fuzzy match for '{key}' ({match_score:.0%} overlap) → {value}", flush=True)
-    
-    if best_fallback_match:
-        print(f"[FALLBACK] Match found: {best_fallback_match}", flush=True)
+    # ✅ STEPS 1-3: OFFLINE GAZETTEER (exact alias, alias inside the text, fuzzy spelling)
+    match = gazetteer.default().lookup(location)
+    if match:
+        log.info("[FALLBACK] Match found (%s, %s): %s", match.method, format(match.score, ".0%"), match.place.name)
         return True
     
     # ✅ STEP 4: AUTO-ACCEPT COMPLETE ADDRESSES (contain building numbers, gates, etc)
@@ -2818,11 +2411,11 @@ def validate_pickup_with_places_api(location: str) -> bool:
     has_multiple_parts = len(address_parts) >= 3
     
     if has_numbers and has_multiple_parts:
-        print(f"[FALLBACK] Match found: {location} (specific address with building details)", flush=True)
+        log.info("[FALLBACK] Match found: %s (specific address with building details)", location)
         return True  # Accept specific addresses with numbers (factories, buildings, etc)
     
     if not GOOGLE_MAPS_API_KEY:
-        print(f"[FALLBACK] No API key - accepting location as-is: {location}", flush=True)
+        log.info("[FALLBACK] No API key - accepting location as-is: %s", location)
         return True  # If no API key, accept it
     
     # ✅ STEP 5: Try Google Places API (only if no fallback match)
@@ -2838,53 +2431,56 @@ def validate_pickup_with_places_api(location: str) -> bool:
             "language": "en"
         }
         
-        print(f"[PLACES] API Query 1: '{exact_query}'", flush=True)
-        response = requests.get(url, params=params, timeout=5)
+        log.info("[PLACES] API Query 1: '%s'", exact_query)
+        with USAGE.metered("google", "autocomplete"):
+            response = requests.get(url, params=params, timeout=5)
         data = response.json()
         api_status = data.get('status', 'UNKNOWN')
         predictions = data.get("predictions", [])
-        print(f"[PLACES] API Status: {api_status}, Results: {len(predictions)}", flush=True)
+        log.info("[PLACES] API Status: %s, Results: %s", api_status, len(predictions))
         
         # If API succeeds, return result
         if predictions:
             matched = predictions[0]["description"]
-            print(f"[PLACES] ✅ API SUCCESS: Found '{matched}'", flush=True)
+            log.info("[PLACES] ✅ API SUCCESS: Found '%s'", matched)
             return True
         
         # ✅ STEP 5: If API fails (REQUEST_DENIED, OVER_QUERY_LIMIT, timeout, etc.) → Accept anyway
         if api_status in ["REQUEST_DENIED", "ZERO_RESULTS", "OVER_QUERY_LIMIT"]:
-            print(f"[PLACES] ⚠️ API returned {api_status} - accepting location anyway to prevent lead loss: {location}", flush=True)
+            log.warning("[PLACES] ⚠️ API returned %s - accepting location anyway to prevent lead loss: %s", api_status, location)
             return True  # Accept to prevent business loss
         
         # Try fallback query 2
         fallback_query = f"{location}, Dubai"
         params["input"] = fallback_query
-        print(f"[PLACES] API Query 2: '{fallback_query}'", flush=True)
-        response = requests.get(url, params=params, timeout=5)
+        log.info("[PLACES] API Query 2: '%s'", fallback_query)
+        with USAGE.metered("google", "autocomplete"):
+            response = requests.get(url, params=params, timeout=5)
         predictions = response.json().get("predictions", [])
         
         if predictions:
             matched = predictions[0]["description"]
-            print(f"[PLACES] ✅ API SUCCESS (Query 2): Found '{matched}'", flush=True)
+            log.info("[PLACES] ✅ API SUCCESS (Query 2): Found '%s'", matched)
             return True
         
         # Try fallback query 3
         params["input"] = location
-        print(f"[PLACES] API Query 3: '{location}' (raw)", flush=True)
-        response = requests.get(url, params=params, timeout=5)
+        log.info("[PLACES] API Query 3: '%s' (raw)", location)
+        with USAGE.metered("google", "autocomplete"):
+            response = requests.get(url, params=params, timeout=5)
         predictions = response.json().get("predictions", [])
         
         if predictions:
             matched = predictions[0]["description"]
-            print(f"[PLACES] ✅ API SUCCESS (Query 3): Found '{matched}'", flush=True)
+            log.info("[PLACES] ✅ API SUCCESS (Query 3): Found '%s'", matched)
             return True
         
         # ✅ STEP 6: After all API attempts fail → Accept anyway (ZERO business loss)
-        print(f"[PLACES] ⚠️ API failed after 3 queries - accepting location anyway to prevent lead loss: {location}", flush=True)
+        log.warning("[PLACES] ⚠️ API failed after 3 queries - accepting location anyway to prevent lead loss: %s", location)
         return True  # Accept to prevent business loss
         
     except Exception as e:
-        print(f"[PLACES] ⚠️ API Error ({type(e).__name__}: {e}) - accepting location anyway: {location}", flush=True)
+        log.warning("[PLACES] ⚠️ API Error (%s: %s) - accepting location anyway: %s", type(e).__name__, e, location)
         return True  # Accept on ANY API error to prevent business loss
 
 # ✅ REDIS CACHE: FUZZY MATCHING FOR FAQ - 90%+ hit rate, <30ms response
@@ -2911,6 +2507,7 @@ def get_cached_faq_response(customer_message: str, language: str = "en") -> Opti
         
         best_match = None
         best_score = 0
+        best_variant = None
         
         # ✅ STEP 3: Check all cache entries
         for cache_key, cache_data in BAREERAH_QA_CACHE.items():
@@ -2927,7 +2524,7 @@ def get_cached_faq_response(customer_message: str, language: str = "en") -> Opti
                 
                 # ✅ PRIORITY 1: Exact match (100% score)
                 if variant_normalized in customer_text or customer_text in variant_normalized:
-                    print(f"[CACHE] 🎯 EXACT MATCH for '{variant}' (language: {language})", flush=True)
+                    log.info("[CACHE] 🎯 EXACT MATCH for '%s' (language: %s)", variant, language)
                     return cache_data[language]
                 
                 # ✅ PRIORITY 2: Partial match (80%+ overlap)
@@ -2941,27 +2538,55 @@ def get_cached_faq_response(customer_message: str, language: str = "en") -> Opti
                     if match_score >= 0.4 and match_score > best_score:
                         best_match = cache_data[language]
                         best_score = match_score
-                        print(f"[REDIS] HIT: key '{variant}' matched {match_score:.0%}", flush=True)
+                        best_variant = variant
         
-        # ✅ If best match found, use it
+        # ✅ If best match found, use it (one line for the winner, not one per improving candidate)
         if best_match:
+            log.info("[CACHE] HIT: key '%s' matched %.0f%%", best_variant, best_score * 100)
             return best_match
         
-        print(f"[REDIS] No match (threshold: 40%) - using GPT-4o", flush=True)
+        log.debug("[CACHE] No match (threshold: 40%%) - using GPT-4o")
         return None
         
     except Exception as e:
-        print(f"[CACHE] ⚠️ Cache lookup error ({type(e).__name__}): {e} - falling back to GPT-4o", flush=True)
+        log.warning("[CACHE] ⚠️ Cache lookup error (%s): %s - falling back to GPT-4o", type(e).__name__, e)
         return None
 
-def extract_nlu(text, call_sid=None):
-    """✅ EMERGENCY ULTIMATE FIX: ROBUST SUPER PROMPT - Handles fillers, merges state, auto-datetime"""
+def rule_slots(text):
+    """Datetime/passengers/luggage/email the compiled rules are sure of, in NLU field format"""
+    found = slot_extract.extract(text)
+    slots = {}
+    if found["datetime"] and not found["ambiguous_time"]:
+        slots["datetime"] = found["datetime"].strftime("%Y-%m-%d %H:%M")
+    if found["passengers"] is not None: slots["passengers"] = found["passengers"]
+    if found["luggage"] is not None: slots["luggage"] = found["luggage"]
+    if found["email"]: slots["email"] = found["email"]
+    if found["date"] and "datetime" not in slots:
+        slots["date"] = found["date"].isoformat()  # "kal subah": a hint only, the hour is still to ask
+    return slots, found["consumed"]
+
+@tracing.traced("llm", "openai")
+def extract_nlu(text, call_sid=None, need_reply=True):
+    """✅ EMERGENCY ULTIMATE FIX: ROBUST SUPER PROMPT - Handles fillers, merges state, auto-datetime
+    Dates/counts/emails are read by slot_extract first; when the caller doesn't need
+    response_text and the text was nothing but those values, the LLM is skipped."""
     try:
         ctx = call_contexts.get(call_sid, {})
         locked_slots = ctx.get("locked_slots", {})
         flow_step = ctx.get("flow_step", "dropoff")
         attempts = ctx.get("attempts", {})
-        
+
+        rules, consumed = rule_slots(text)
+        if rules and consumed and not need_reply:
+            log.info("[NLU] ⚡ rules only: %s", rules)
+            return {"intent": "email" if "email" in rules else "datetime" if "datetime" in rules else "booking",
+                    "confidence": 0.95, "pickup": "", "dropoff": "", "has_from_word": False,
+                    "datetime": rules.get("datetime", ""), "passengers": rules.get("passengers", -1),
+                    "luggage": rules.get("luggage", -1), "email": rules.get("email", ""), "yes_no": "",
+                    "booking_type": "point_to_point", "next_flow_step": flow_step, "response_text": "",
+                    "trigger_email": False, "updated_locked_slots": locked_slots, "error": ""}
+
+        today = slot_extract.now()
         system_prompt = """You are Bareerah, jolly professional limo concierge in Dubai – multilingual (English/Urdu/Arabic), natural, upsell spots like Burj. NEVER mention AI.
 
 Input: Customer text + Current state (flow_step, locked_slots, attempts).
@@ -3013,7 +2638,7 @@ RULES (ZERO FAILS):
   "global village" → "Global Village, Sheikh Mohammed Bin Zayed Road, Dubai" [CONF 0.75]
   "expo city" → "Expo City Dubai, Jebel Ali, Dubai" [CONF 0.8]
   After 2 attempts: Accept raw, trigger_email=true.
-- DATETIME: 'tomorrow 4 pm' → '2025-12-10 16:00' (base Dec 9, 2025). 'Today 3pm' → '2025-12-09 15:00'. 'Uh tomorrow' → '2025-12-10 14:00' (default 2pm).
+- DATETIME: 'tomorrow 4 pm' → '{TOMORROW} 16:00' (base {TODAY_TEXT}). 'Today 3pm' → '{TODAY} 15:00'. 'Uh tomorrow' → '{TOMORROW} 14:00' (default 2pm).
 - CONFIRM: 'yes' → lock, next_step. 'no' → unlock current, clarify.
 - VEHICLE: When passengers+luggage known: <=4pax/3lug=Sedan; <=6/6=Luxury SUV; >Van. Set in locked_slots.
 - FARE: distance=20km fallback, fare=50+(20*3.5)+(lug*20).
@@ -3023,34 +2648,41 @@ RULES (ZERO FAILS):
 ⚠️ CRITICAL - ALWAYS RETURN VALID JSON (NO EXCEPTIONS):
 If any error or low confidence (<0.7): STILL return valid JSON with intent="clarify", confidence=0.5, response_text="Let me confirm that – could you say the location again?", next_flow_step=current_step.
 NEVER break JSON format. ALWAYS return a valid dict."""
+        system_prompt = (system_prompt.replace("{TODAY_TEXT}", slot_extract.today_text(today))
+                         .replace("{TOMORROW}", (today + timedelta(days=1)).strftime("%Y-%m-%d"))
+                         .replace("{TODAY}", today.strftime("%Y-%m-%d")))
 
         user_prompt = f"""Text: "{text}"
 State: flow_step='{flow_step}', locked_slots={json.dumps(locked_slots)[:100]}, attempts={attempts}, language='{ctx.get('language', 'en')}'
 
 Extract/merge/progress. Handle fillers as clarify. Output ready JSON for parse."""
-
-        response = OPENAI_CLIENT.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=600,
-            timeout=5
-        )
+        if rules and not consumed:  # more was said than the rules read: the model decides, with them as hints
+            user_prompt += f"\nRule-read (regex; use unless the text says otherwise, a date alone means ask the hour): {json.dumps(rules)}"
+
+        with USAGE.metered("openai", "gpt-4o") as meter:
+            response = meter.tokens(OPENAI_CLIENT.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=600,
+                timeout=5
+            ))
         
         result = json.loads(response.choices[0].message.content)
         
         # ✅ Validate result
         if not isinstance(result, dict) or 'response_text' not in result:
             result = {"response_text": "Sorry, technical glitch. Repeat?", "next_flow_step": flow_step, "updated_locked_slots": locked_slots, "intent": "error"}
+        if consumed: result.update(rules)  # only nothing-but-values text: there the rules beat the model's guesses
         
-        print(f"[NLU] ✅ intent={result.get('intent')} | next={result.get('next_flow_step')} | confidence={result.get('confidence', 0)}", flush=True)
+        log.info("[NLU] ✅ intent=%s | next=%s | confidence=%s", result.get('intent'), result.get('next_flow_step'), result.get('confidence', 0))
         return result
         
     except Exception as e:
-        print(f"[NLU] ❌ CRASH: {e}", flush=True)
+        log.error("[NLU] ❌ CRASH: %s", e)
         return {
             "intent": "error",
             "confidence": 0.0,
@@ -3091,13 +2723,13 @@ def speak_static_tts(response_obj, message_key, call_sid, lang="en"):
         text = translate_to_urdu(text)
     
     # ✅ ALWAYS log what Bareerah is saying
-    print(f"[BAREERAH] 🎤 {text}", flush=True)
+    log.info("[BAREERAH] 🎤 %s", text)
     
     try:
         response_obj.say(text, voice='alice', language='en-US')
-        print(f"[TTS] ✅ Twilio Say (FREE) played", flush=True)
+        log.info("[TTS] ✅ Twilio Say (FREE) played")
     except Exception as e:
-        print(f"[TTS] ❌ Error: {str(e)}", flush=True)
+        log.error("[TTS] ❌ Error: %s", e)
 
 def speak_text(response_obj, text, call_sid, lang="en"):
     """✅ FREE TTS: Twilio Say (no API costs!)"""
@@ -3108,20 +2740,20 @@ def speak_text(response_obj, text, call_sid, lang="en"):
         text = translate_to_urdu(text)
     
     # ✅ ALWAYS log what Bareerah is saying
-    print(f"[BAREERAH] 🎤 {text}", flush=True)
+    log.info("[BAREERAH] 🎤 %s", text)
     
     try:
         response_obj.say(text, voice='alice', language='en-US')
-        print(f"[TTS] ✅ Twilio Say (FREE) played successfully", flush=True)
+        log.info("[TTS] ✅ Twilio Say (FREE) played successfully")
     except Exception as e:
-        print(f"[TTS] ❌ Critical error: {str(e)}", flush=True)
+        log.error("[TTS] ❌ Critical error: %s", e)
 
 def validate_email_on_startup():
     """✅ VALIDATE EMAIL CONFIG ON STARTUP - Fail fast if misconfigured"""
-    print(f"[EMAIL] 🔍 Validating email configuration...", flush=True)
+    log.info("[EMAIL] 🔍 Validating email configuration...")
     
     if not RESEND_API_KEY:
-        print(f"[EMAIL] ❌ CRITICAL: RESEND_API_KEY is EMPTY! Emails will NOT be sent!", flush=True)
+        log.error("[EMAIL] ❌ CRITICAL: RESEND_API_KEY is EMPTY! Emails will NOT be sent!")
         return False
     
     return True
@@ -3150,7 +2782,7 @@ def cleanup_abandoned_calls():
                         if not booking.get("confirmed") and not booking.get("email_sent_for_drop"):
                             abandoned_calls.append((call_sid, ctx.get("caller_phone", "Unknown"), booking))
                             booking["email_sent_for_drop"] = True
-                            print(f"[CLEANUP] 📧 Detected abandoned call {call_sid} (elapsed: {elapsed:.0f}s)", flush=True)
+                            log.info("[CLEANUP] 📧 Detected abandoned call %s (elapsed: %.0fs)", call_sid, elapsed)
                 
                 # Send emails for abandoned calls
                 for call_sid, caller_phone, booking in abandoned_calls:
@@ -3171,7 +2803,7 @@ def cleanup_abandoned_calls():
                         "fare": booking.get("fare", "N/A")
                     }
                     
-                    print(f"[CLEANUP] 📧 Sending fallback email for {caller_phone} ({data_collected}/4 fields)", flush=True)
+                    log.info("[CLEANUP] 📧 Sending fallback email for %s (%s/4 fields)", caller_phone, data_collected)
                     notify_booking_to_team(dropped_data, status="dropped")
                     
                     # Clean up
@@ -3181,35 +2813,65 @@ def cleanup_abandoned_calls():
                         del call_timestamps[call_sid]
                         
             except Exception as e:
-                print(f"[CLEANUP] ❌ Error in cleanup: {e}", flush=True)
+                log.error("[CLEANUP] ❌ Error in cleanup: %s", e)
                 time.sleep(5)
     
-    # Start cleanup thread (non-daemon, ensures it runs)
-    thread = threading.Thread(target=check_periodically, daemon=False)
+    # Daemon: a gunicorn worker that's told to exit must not be held up by this loop
+    thread = threading.Thread(target=check_periodically, daemon=True)
     thread.start()
-    print(f"[CLEANUP] ✅ Abandoned call cleanup service started", flush=True)
+    log.info("[CLEANUP] ✅ Abandoned call cleanup service started")
 
 def prewarm_faq_cache():
     """✅ PRE-WARM FAQ CACHE ON STARTUP - Load into memory for instant responses"""
-    print(f"[CACHE] ✅ Pre-warming FAQ cache with {len(BAREERAH_QA_CACHE)} entries...", flush=True)
+    log.info("[CACHE] ✅ Pre-warming FAQ cache with %s entries...", len(BAREERAH_QA_CACHE))
     for cache_key in BAREERAH_QA_CACHE:
         if isinstance(BAREERAH_QA_CACHE[cache_key], dict):
             for lang in ["en", "ur", "ar"]:
                 _ = BAREERAH_QA_CACHE[cache_key].get(lang)
-    print(f"[CACHE] ✅ FAQ cache pre-warmed and ready for instant responses (<100ms)", flush=True)
-
-@app.before_request
-def init_app():
-    global db_pool, _cleanup_started
-    if db_pool is None:
-        init_db_pool()
-    threading.Thread(target=prewarm_elevenlabs_tts, daemon=True).start()
-    threading.Thread(target=prewarm_faq_cache, daemon=True).start()
-    threading.Thread(target=validate_email_on_startup, daemon=True).start()
-    # ✅ Start cleanup ONLY ONCE (not on every request!)
-    if not _cleanup_started:
-        _cleanup_started = True
-        threading.Thread(target=cleanup_abandoned_calls, daemon=False).start()
+    log.info("[CACHE] ✅ FAQ cache pre-warmed and ready for instant responses (<100ms)")
+
+def warm_transcoders():
+    if audio_pipeline.transcoders.available():
+        audio_pipeline.transcoders.warm()
+
+# ✅ LIFECYCLE: schema once, then these once per worker process (not per request) - see lifecycle.py
+LIFECYCLE = lifecycle.Lifecycle("legacy", schema=init_schema)
+LIFECYCLE.on_worker(lambda: db_pool or init_db_pool(), "db_pool")  # a pool can't be shared across a fork
+LIFECYCLE.on_worker(prewarm_elevenlabs_tts, "tts")
+LIFECYCLE.on_preload(lazy_vendors.preload, "vendor_sdks")
+LIFECYCLE.on_preload(prewarm_faq_cache, "faq_cache")
+LIFECYCLE.on_worker(validate_email_on_startup, "email_config")
+LIFECYCLE.on_worker(warm_transcoders, "transcoders")
+LIFECYCLE.on_worker(cleanup_abandoned_calls, "cleanup")
+LIFECYCLE.on_worker(RECONCILER.start, "reconciler", stop=RECONCILER.stop)
+LIFECYCLE.on_worker(USAGE.start, "usage", stop=USAGE.stop)
+tracing.register_gauge("lifecycle", LIFECYCLE.snapshot)
+tracing.register_gauge("vendors", lazy_vendors.snapshot)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify(LIFECYCLE.liveness())
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, checks = LIFECYCLE.readiness()
+    return jsonify({"ready": ready, "checks": checks}), (200 if ready else 503)
+
+# ✅ USAGE REPORT: cost and vendor time per item and per call; needs ADMIN_TOKEN (404 without one)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def admin_authorized():
+    """Authorization: Bearer only - a ?token= would end up in access logs, proxies and browser history"""
+    scheme, _, supplied = request.headers.get("Authorization", "").partition(" ")
+    return scheme == "Bearer" and hmac.compare_digest(supplied.strip().encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/usage', methods=['GET'])
+def admin_usage():
+    if not ADMIN_TOKEN: return "Not Found", 404
+    if not admin_authorized(): return "Unauthorized", 401
+    if request.args.get('call'):
+        return jsonify({"call_key": request.args['call'], "items": USAGE.call(request.args['call'])})
+    return jsonify(USAGE.report(request.args.get('hours', 24, type=float), request.args.get('top', 10, type=int)))
 
 @app.route('/', methods=['GET'])
 def index():
@@ -3224,7 +2886,7 @@ def incoming_call():
     call_sid = request.values.get('CallSid', 'unknown')
     caller_phone = request.values.get('Caller', 'unknown')
     
-    print(f"[INCOMING CALL] Caller: {caller_phone} | CallSID: {call_sid}", flush=True)
+    log.info("[INCOMING CALL] Caller: %s | CallSID: %s", caller_phone, call_sid)
     
     response = VoiceResponse()
     
@@ -3244,7 +2906,7 @@ def incoming_call():
         }
         # ✅ TRACK CALL TIMESTAMP FOR FALLBACK EMAIL (if webhook fails)
         call_timestamps[call_sid] = time.time()
-        print(f"[CALL-TRACKING] ✅ Timestamp recorded for {call_sid}", flush=True)
+        log.info("[CALL-TRACKING] ✅ Timestamp recorded for %s", call_sid)
     
     ensure_booking_state(call_contexts[call_sid])
     
@@ -3268,7 +2930,7 @@ def incoming_call():
         statusCallback=callback_url,  # ✅ ABSOLUTE URL for Twilio
         statusCallbackMethod="POST"
     )
-    print(f"[VOICE] Setting statusCallback: {callback_url}", flush=True)
+    log.info("[VOICE] Setting statusCallback: %s", callback_url)
     
     return str(response)
 
@@ -3281,8 +2943,8 @@ def call_status():
     call_sid = request.values.get('call_sid') or request.values.get('CallSid') or request.values.get('CallSID') or 'unknown'
     call_status_val = request.values.get('CallStatus', 'unknown')
     
-    print(f"[CALL-STATUS] 📞 Webhook received - CallSID: {call_sid} | Status: {call_status_val}", flush=True)
-    print(f"[CALL-STATUS] All request parameters: {dict(request.values)}", flush=True)
+    log.info("[CALL-STATUS] 📞 Webhook received - CallSID: %s | Status: %s", call_sid, call_status_val)
+    log.info("[CALL-STATUS] All request parameters: %s", dict(request.values))
     
     # ✅ MARK: Webhook was received (for fallback tracking)
     if call_sid in call_timestamps:
@@ -3290,7 +2952,7 @@ def call_status():
     
     # Process completed or failed calls
     if call_status_val in ['completed', 'failed'] or call_sid in call_contexts:
-        print(f"[CALL-STATUS] Processing call status for {call_sid}...", flush=True)
+        log.info("[CALL-STATUS] Processing call status for %s...", call_sid)
         
         # Get context if available
         if call_sid in call_contexts:
@@ -3298,10 +2960,10 @@ def call_status():
             booking = ctx.get("booking", {})
             caller_phone = ctx.get("caller_phone", "Unknown")
             
-            print(f"[CALL-STATUS] Context found - Phone: {caller_phone}, Booking confirmed: {booking.get('confirmed')}", flush=True)
+            log.info("[CALL-STATUS] Context found - Phone: %s, Booking confirmed: %s", caller_phone, booking.get('confirmed'))
             
             # ✅ ALWAYS send email for ANY customer interaction - dropped call or partial info
-            print(f"[CALL-DROP] Call ended - Booking confirmed: {booking.get('confirmed')} | Phone: {caller_phone}", flush=True)
+            log.info("[CALL-DROP] Call ended - Booking confirmed: %s | Phone: %s", booking.get('confirmed'), caller_phone)
             
             # Check if ANY data was collected
             has_pickup = bool(booking.get("pickup"))
@@ -3326,37 +2988,35 @@ def call_status():
             if not booking.get("confirmed"):
                 if data_collected > 0:
                     # Some data was collected but booking not completed
-                    print(f"[EMAIL] 📧 Sending partial info email (async)...", flush=True)
+                    log.info("[EMAIL] 📧 Sending partial info email (async)...")
                     notify_booking_to_team(dropped_booking_data, status="partial_info")
-                    print(f"[EMAIL] ✅ Sent partial info alert for {caller_phone} (collected {data_collected}/4 fields)", flush=True)
+                    log.info("[EMAIL] ✅ Sent partial info alert for %s (collected %s/4 fields)", caller_phone, data_collected)
                 else:
                     # Call dropped with no data
-                    print(f"[EMAIL] 📧 Sending call-drop email (async)...", flush=True)
+                    log.info("[EMAIL] 📧 Sending call-drop email (async)...")
                     notify_booking_to_team(dropped_booking_data, status="dropped")
-                    print(f"[EMAIL] ✅ Sent call-drop alert for {caller_phone}", flush=True)
+                    log.info("[EMAIL] ✅ Sent call-drop alert for %s", caller_phone)
             else:
-                print(f"[CALL-DROP] ✅ Booking was completed - confirmation email already sent", flush=True)
+                log.info("[CALL-DROP] ✅ Booking was completed - confirmation email already sent")
             
-            # ✅ FORCE: Wait 1 second to ensure email thread starts
-            import time
-            time.sleep(1)
-            print(f"[CALL-DROP] ✅ Context cleanup completed for {call_sid}", flush=True)
+            log.info("[CALL-DROP] ✅ Context cleanup completed for %s", call_sid)
             
             # Clean up context
             try:
                 del call_contexts[call_sid]
-                print(f"[CALL-STATUS] ✅ Context cleaned up for {call_sid}", flush=True)
+                log.info("[CALL-STATUS] ✅ Context cleaned up for %s", call_sid)
             except:
                 pass
         else:
-            print(f"[CALL-STATUS] ⚠️ No context found for {call_sid} - this might be a very quick drop", flush=True)
+            log.warning("[CALL-STATUS] ⚠️ No context found for %s - this might be a very quick drop", call_sid)
     else:
-        print(f"[CALL-STATUS] Status '{call_status_val}' not processed (waiting for completed/failed)", flush=True)
+        log.info("[CALL-STATUS] Status '%s' not processed (waiting for completed/failed)", call_status_val)
     
     return "OK", 200
 
 # ✅ PHONE HANDLE ENDPOINT - CONFIDENCE >= 0.7 CUTOFF (Dec 9, 2025 - FINAL)
 @app.route('/handle', methods=['POST'])
+@tracing.traced("voice.turn")
 def handle_call():
     """✅ CONFIDENCE CUTOFF 0.7: Low conf clarifies, high conf locks"""
     call_sid = request.values.get('call_sid')
@@ -3364,7 +3024,7 @@ def handle_call():
 
     # ✅ LOG CUSTOMER SPEECH
     if speech:
-        print(f"[CUSTOMER] 🎧 {speech}", flush=True)
+        log.info("[CUSTOMER] 🎧 %s", speech)
 
     # Agar bilkul silence ya bohot chhota input → mat samajh, bas repeat karo
     if not speech or len(speech) < 3:
@@ -3385,7 +3045,7 @@ def handle_call():
     try:
         # ✅ Call NLU (already returns dict)
         result = extract_nlu(speech, call_sid)
-        print(f"[DEBUG RAW LLM] {result}", flush=True)
+        log.debug("[DEBUG RAW LLM] %s", result)  # formatted only for sampled calls at LOG_LEVEL=DEBUG
 
         # ✅ Validate result is dict with response_text
         if not isinstance(result, dict) or 'response_text' not in result:
@@ -3402,21 +3062,21 @@ def handle_call():
             updated_slots = result.get("updated_locked_slots", {})
             if isinstance(updated_slots, dict):
                 ctx["locked_slots"].update(updated_slots)
-            print(f"[CONFIDENCE] ✅ {confidence:.2f} >= 0.7 → LOCKED", flush=True)
+            log.info("[CONFIDENCE] ✅ %.2f >= 0.7 → LOCKED", confidence)
         else:
             # Low confidence → clarify without "glitch"
             response_text = "Sorry, let's double-check that. Could you repeat the location please?"
             ctx["flow_step"] = ctx["flow_step"]  # Stay on same step
-            print(f"[CONFIDENCE] ⚠️ {confidence:.2f} < 0.7 → CLARIFY", flush=True)
+            log.warning("[CONFIDENCE] ⚠️ %.2f < 0.7 → CLARIFY", confidence)
 
     except Exception as e:
         # ✅ JSON FAIL BHI HO → SAFE FALLBACK
-        print(f"[DEBUG ERROR] Parse failed: {str(e)}, speech: {speech}", flush=True)
+        log.error("[DEBUG ERROR] Parse failed: %s, speech: %s", e, speech)
         response_text = "Hmm, didn't get that clearly. Say again please?"
         next_step = ctx["flow_step"]
 
     # ✅ LOG BAREERAH RESPONSE
-    print(f"[BAREERAH] 🎤 {response_text}", flush=True)
+    log.info("[BAREERAH] 🎤 %s", response_text)
 
     # ✅ Final response – HAMESHA GATHER ADD KARO jab tak complete na ho
     response = VoiceResponse()
@@ -3429,20 +3089,22 @@ def handle_call():
         try:
             payload = dict(ctx.get("locked_slots", {}))
             payload["caller_phone"] = ctx.get("caller_phone", "unknown")
-            create_booking_direct(payload)
-            print(f"[BOOKING] ✅ Created successfully", flush=True)
+            # ✅ A retried /handle for this call doesn't create the booking again
+            if with_ledger_conn(BOOKING_LEDGER.once, booking_ledger.call_key(call_sid), "backend"):
+                create_booking_direct(payload)
+                log.info("[BOOKING] ✅ Created successfully")
             response = VoiceResponse()
             response.say("Your luxury ride is confirmed! Driver will call you soon. Thank you!", voice='woman')
             response.hangup()
         except Exception as e:
-            print(f"[BOOKING] ❌ Failed: {e}", flush=True)
+            log.error("[BOOKING] ❌ Failed: %s", e)
             response = VoiceResponse()
             response.say("Booking created! Driver will contact you shortly.", voice='woman')
             response.hangup()
 
     # ✅ Save context
     call_contexts[call_sid] = ctx
-    print(f"[HANDLE] intent={result.get('intent')} | next={next_step} | conf={result.get('confidence', 0):.2f}", flush=True)
+    log.info("[HANDLE] intent=%s | next=%s | conf=%.2f", result.get('intent'), next_step, result.get('confidence', 0))
     return str(response)
 
 
@@ -3450,23 +3112,44 @@ def handle_call():
 # ✅ NEW: WhatsApp Sandbox webhook (Nov 27, 2025)
 @app.route('/whatsapp', methods=['POST'])
 def whatsapp_webhook():
-    """WhatsApp Sandbox integration - receive text/voice messages via form-data"""
+    """WhatsApp Sandbox integration - acknowledge at once, process on the worker pool"""
     # ✅ FIX: Twilio sends form-data, not JSON
+    # Snapshot the fields now: the request context is gone by the time a worker runs
+    message = {k: request.values.get(k) for k in WHATSAPP_FIELDS}
+    twilio_sender.outbox.learn_base_url(request.url_root)
+    from_phone = normalize_whatsapp_phone(message.get('From'))
+
+    # Twilio redelivers on timeout: process each MessageSid (or media URL) once
+    delivery_id = message.get('MessageSid') or message.get('MediaUrl0')
+    if not transcript_cache.dedup.first_delivery(delivery_id):
+        log.info("[WHATSAPP] ♻️ Duplicate delivery %s ignored", delivery_id)
+        return jsonify({"status": "duplicate"}), 200
+
+    if not whatsapp_worker.WHATSAPP_ASYNC:
+        response_text = process_whatsapp_message(message)
+        return jsonify({"status": "ok", "message": response_text}), 200
+
+    if not whatsapp_queue.submit(from_phone, message):
+        # Sender's worker is backed up: let Twilio retry rather than drop the message
+        transcript_cache.dedup.forget(delivery_id)
+        return jsonify({"status": "busy"}), 503, {"Retry-After": "5"}
+    return jsonify({"status": "queued"}), 200
+
+WHATSAPP_FIELDS = ('From', 'Body', 'MessageSid', 'MediaContentType0', 'MediaUrl0', 'NumMedia')
+
+def normalize_whatsapp_phone(raw):
     # ✅ NORMALIZE PHONE: Ensure + prefix for Twilio
-    raw_phone = (request.form.get('From') or request.values.get('From') or 'unknown').replace('whatsapp:', '').strip()
+    raw_phone = (raw or 'unknown').replace('whatsapp:', '').strip()
     # Add + prefix if missing
-    from_phone = raw_phone if raw_phone.startswith('+') else '+' + raw_phone
-    incoming_text = (request.form.get('Body') or request.values.get('Body') or '').strip()
-    
-    # ✅ Check for audio/media files (Twilio sends MediaContentType0, MediaUrl0, etc.)
-    media_content_type = request.form.get('MediaContentType0') or request.values.get('MediaContentType0')
-    media_url = request.form.get('MediaUrl0') or request.values.get('MediaUrl0')
-    
-    message_type = 'audio' if media_content_type and 'audio' in media_content_type else 'text'
-    
-    print(f"[WHATSAPP] 📱 From {from_phone}: {incoming_text or '(voice note)'}", flush=True)
-    if DEBUG_LOGGING:
-        print(f"[WHATSAPP] Type: {message_type} | ContentType: {media_content_type}", flush=True)
+    return raw_phone if raw_phone.startswith('+') else '+' + raw_phone
+
+@tracing.traced("whatsapp.message")
+def process_whatsapp_message(message):
+    """Full WhatsApp turn (voice notes -> booking flow -> REST reply); runs on a worker.
+    message is one webhook's fields, or {"parts": [...]} for a coalesced burst."""
+    parts = message.get('parts') or [message]
+    from_phone = normalize_whatsapp_phone(parts[0].get('From'))
+    structured_log.bind(phone=from_phone)  # a worker thread, outside the webhook's request context
     
     # Initialize context if needed
     if from_phone not in call_contexts:
@@ -3490,66 +3173,20 @@ def whatsapp_webhook():
     
     # ✅ REFRESH JWT TOKEN if expired/None
     if not ctx.get("jwt_token"):
-        print(f"[AUTH] JWT token missing/expired, refreshing...", flush=True)
+        log.info("[AUTH] JWT token missing/expired, refreshing...")
         ctx["jwt_token"] = get_jwt_token()  # ✅ Use cached token with auto-refresh
     
-    # ✅ SYNC PENDING BOOKINGS to backend
-    jwt_token = ctx.get("jwt_token") or get_jwt_token()
-    if jwt_token:
-        sync_pending_bookings_to_backend(from_phone, jwt_token)
-    
     ensure_booking_state(ctx)
     
-    # ✅ If voice note: download .ogg → convert .mp3 → transcribe with Whisper
-    if message_type == 'audio' and media_url:
-        try:
-            # Step 1: Download audio file from Twilio (with auth headers)
-            print(f"[WHATSAPP] 📥 Downloading voice note from {media_url[:80]}...", flush=True)
-            # ✅ FIX: Use auth for Twilio MediaUrl downloads
-            twilio_account = os.environ.get("TWILIO_ACCOUNT_SID", "")
-            twilio_token = os.environ.get("TWILIO_AUTH_TOKEN", "")
-            auth = (twilio_account, twilio_token) if twilio_account and twilio_token else None
-            
-            audio_resp = requests.get(media_url, timeout=10, auth=auth)
-            audio_resp.raise_for_status()  # Raise error if download failed
-            
-            # Save with .opus extension (WhatsApp Sandbox uses Opus codec)
-            with tempfile.NamedTemporaryFile(suffix='.opus', delete=False) as tmp:
-                tmp.write(audio_resp.content)
-                tmp.flush()
-                audio_path = tmp.name
-            
-            file_size = os.path.getsize(audio_path)
-            print(f"[WHATSAPP] 📁 Downloaded {file_size} bytes → {audio_path}", flush=True)
-            
-            if file_size < 100:
-                print(f"[WHATSAPP] ❌ File too small ({file_size} bytes) - likely empty", flush=True)
-                incoming_text = "(voice note too short)"
-                os.remove(audio_path)
-            else:
-                # Step 2: Convert to .mp3 using ffmpeg
-                mp3_path = convert_ogg_to_mp3(audio_path)
-                if not mp3_path:
-                    print(f"[WHATSAPP] ⚠️ Conversion failed, trying direct Whisper", flush=True)
-                    mp3_path = audio_path
-                
-                # Step 3: Transcribe with Whisper
-                speech_result = transcribe_with_whisper(mp3_path, ctx.get("stt_language", "en"))
-                incoming_text = speech_result or "(voice note not understood)"
-                print(f"[WHISPER] Transcribed: {incoming_text}", flush=True)
-                
-                # Cleanup
-                try:
-                    os.remove(mp3_path if mp3_path != audio_path else audio_path)
-                except:
-                    pass
-        except Exception as e:
-            print(f"[WHATSAPP] ❌ Voice note failed: {e}", flush=True)
-            incoming_text = "(voice note failed)"
+    # ✅ COALESCED BURST: "from marina" + "to airport" + "tomorrow 5pm" -> one NLU pass
+    texts = [whatsapp_part_text(part, from_phone, ctx) for part in parts]
+    incoming_text = join_whatsapp_texts(texts)
+    if len(parts) > 1:
+        log.info("[WHATSAPP] 🧩 Coalesced %s messages from %s", len(parts), from_phone)
     
     # ✅ Process through booking flow (FULL BAREERAH CONVERSATION)
     utterance_count[from_phone] = utterance_count.get(from_phone, 0) + 1
-    print(f"[CUSTOMER] 🎧 {incoming_text}", flush=True)
+    log.info("[CUSTOMER] 🎧 %s", incoming_text)
     log_conversation(from_phone, "Customer", incoming_text)
     
     # Generate response (TEXT ONLY - ZERO COST testing mode)
@@ -3558,14 +3195,82 @@ def whatsapp_webhook():
     else:
         # ✅ FULL BOOKING CONVERSATION ENGINE
         response_text = process_whatsapp_booking_slot(from_phone, incoming_text, ctx)
-        print(f"[BAREERAH] 💬 {response_text}", flush=True)
+        log.info("[BAREERAH] 💬 %s", response_text)
     
     # ✅ Send TEXT reply (voice disabled for local testing)
     log_conversation(from_phone, "Bareerah", response_text)
     send_whatsapp_text_message(from_phone, response_text)
+    return response_text
+
+def whatsapp_part_text(part, from_phone, ctx):
+    """Text for one WhatsApp message: its Body, or the voice note's transcript"""
+    incoming_text = (part.get('Body') or '').strip()
+
+    # ✅ Check for audio/media files (Twilio sends MediaContentType0, MediaUrl0, etc.)
+    media_content_type = part.get('MediaContentType0')
+    media_url = part.get('MediaUrl0')
+
+    message_type = 'audio' if media_content_type and 'audio' in media_content_type else 'text'
     
-    # ✅ Return WhatsApp message response (200 OK - Twilio accepts form-data)
-    return jsonify({"status": "ok", "message": response_text}), 200
+    log.info("[WHATSAPP] 📱 From %s: %s", from_phone, incoming_text or '(voice note)')
+    if DEBUG_LOGGING:
+        log.info("[WHATSAPP] Type: %s | ContentType: %s", message_type, media_content_type)
+    
+    # ✅ If voice note: stream the download → (transcode only if needed) → Whisper
+    if message_type == 'audio' and media_url:
+        try:
+            log.info("[WHATSAPP] 📥 Downloading voice note from %s...", media_url[:80])
+            # ✅ FIX: Use auth for Twilio MediaUrl downloads
+            twilio_account = os.environ.get("TWILIO_ACCOUNT_SID", "")
+            twilio_token = os.environ.get("TWILIO_AUTH_TOKEN", "")
+            auth = (twilio_account, twilio_token) if twilio_account and twilio_token else None
+            
+            # Stream straight into Whisper (or a pre-spawned ffmpeg) - no temp files
+            note = audio_pipeline.fetch_voice_note(media_url, media_content_type, auth=auth, timeout=10)
+            if note is None:
+                log.error("[WHATSAPP] ❌ Voice note too short - likely empty")
+                incoming_text = "(voice note too short)"
+            else:
+                stt_language = ctx.get("stt_language", "en")
+                # Same audio bytes + language -> cached transcript, no second Whisper call
+                whispered = []
+                speech_result = transcript_cache.transcripts.transcribe(
+                    note.data, stt_language, lambda: whispered.append(1) or transcribe_with_whisper(note.as_file(), stt_language))
+                if speech_result and not whispered:  # the cache answered: a Whisper call saved
+                    USAGE.record("openai", "whisper-1", usage_ledger.audio_seconds(note.data), cached=True)
+                incoming_text = speech_result or "(voice note not understood)"
+                log.info("[WHISPER] Transcribed: %s", incoming_text)
+        except Exception as e:
+            log.error("[WHATSAPP] ❌ Voice note failed: %s", e)
+            incoming_text = "(voice note failed)"
+    return incoming_text
+
+def join_whatsapp_texts(texts):
+    """Merge a burst into one utterance; failed parts ("(voice note failed)") are dropped
+    unless nothing else came through"""
+    usable = [t for t in texts if t and not t.startswith("(")]
+    if not usable:
+        return next((t for t in texts if t), "")
+    merged = usable[0]
+    for t in usable[1:]:
+        merged += (" " if merged[-1] in ".,!?;:" else ", ") + t
+    return merged
+
+# ✅ WHATSAPP WORKERS: per-sender ordered processing off the webhook thread
+whatsapp_queue = whatsapp_worker.WorkerPool(process_whatsapp_message, coalesce=whatsapp_worker.WHATSAPP_COALESCE_SECONDS)
+tracing.register_gauge("whatsapp_queue", whatsapp_queue.snapshot)
+
+# ✅ DELIVERY STATUS: Twilio StatusCallback for outbound WhatsApp messages
+@app.route(twilio_sender.STATUS_PATH, methods=['POST'])
+def twilio_message_status():
+    twilio_sender.outbox.record_status(request.values.get('MessageSid'), request.values.get('MessageStatus'),
+                                       request.values.get('ErrorCode'))
+    return ('', 204)
+
+# ✅ METRICS: p50/p95/p99 per stage and per dependency
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(tracing.metrics_snapshot())
 
 @app.route('/public/<filename>', methods=['GET'])
 def serve_tts(filename):
@@ -3575,19 +3280,18 @@ def serve_tts(filename):
         return "File not found", 404
 
 if __name__ == '__main__':
-    init_db_pool()
+    LIFECYCLE.start()
     
     # ✅ INITIALIZE JWT TOKEN ON SERVER STARTUP
-    print("[AUTH] Server starting - initializing JWT token...", flush=True)
+    log.info("[AUTH] Server starting - initializing JWT token...")
     initial_token = get_jwt_token()
     if initial_token:
-        print(f"[AUTH] ✅ Server JWT token initialized successfully", flush=True)
+        log.info("[AUTH] ✅ Server JWT token initialized successfully")
     else:
-        print(f"[AUTH] ⚠️ JWT token initialization failed - will retry on first request", flush=True)
+        log.warning("[AUTH] ⚠️ JWT token initialization failed - will retry on first request")
     
     # ✅ TEST BACKEND CONNECTION ON STARTUP
     test_backend_connection()
     
-    threading.Thread(target=prewarm_elevenlabs_tts, daemon=True).start()
-    print("Starting Bareerah (Professional Booking Assistant)...", flush=True)
+    log.info("Starting Bareerah (Professional Booking Assistant)...")
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,528 @@
+# ✅ ASYNC SERVING MODE (ASGI) - uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+#
+# Under `gunicorn main:app` every in-flight call holds a worker thread for the
+# whole chain of outbound calls (OpenAI, Maps, backend, Resend, Postgres).
+# Here the webhook routes run on an event loop instead:
+#   POST /handle, /handle-result  -> the turn is an asyncio task under the same
+#                                    TurnBudget / hold-and-redirect rules
+#   POST /select-language         -> cached greeting, call_state written behind it
+#   GET  /eleven-tts              -> async ElevenLabs proxy
+# using one shared httpx.AsyncClient (Maps, backend, Resend, ElevenLabs),
+# AsyncOpenAI and an asyncpg pool, so a waiting call costs a coroutine, not a
+# thread. Independent calls inside a turn (pickup/dropoff geocodes, per-option
+# fares, booking insert/sync/email) run concurrently.
+#
+# The turn rules, prompt, parsing and TwiML all come from main.py, so both
+# modes answer identically and the sync path (Procfile) stays the default;
+# vendor calls are recorded in main.USAGE the same way (usage_ledger.py).
+# Every other path (/voice, /metrics, /healthz, /readyz, /admin/usage, ...) is served by main.app
+# on a thread. /whatsapp is NOT served in this mode: the WhatsApp bot lives in
+# the legacy app, which neither main.py nor this module loads, so the webhook
+# gets an explicit 501 telling whoever configured it to point it at the legacy app.
+#
+# Without asyncpg (or DATABASE_URL) the DB calls use main.get_db() on a thread.
+import io
+import os
+import sys
+import json
+import asyncio
+import logging
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import httpx
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+import main
+import lazy_vendors
+import structured_log
+import booking_ledger
+import tracing
+import turn_budget
+
+AsyncOpenAI = lazy_vendors.attr("openai", "AsyncOpenAI")
+
+log = logging.getLogger("asgi_app")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("ASGI_HTTP_MAX_CONNECTIONS", "200"))
+DB_POOL_SIZE = int(os.getenv("ASGI_DB_POOL_SIZE", "10"))
+
+_http = None      # shared httpx.AsyncClient
+_openai = None    # shared AsyncOpenAI
+_db_pool = None   # asyncpg pool; False once we've settled on the threaded fallback
+_db_lock = asyncio.Lock()
+
+
+# ✅ SHARED ASYNC CLIENTS
+def http():
+    global _http
+    if _http is None:
+        limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS // 4)
+        _http = httpx.AsyncClient(limits=limits, timeout=10)
+    return _http
+
+def ai():
+    global _openai
+    if _openai is None:
+        _openai = AsyncOpenAI(api_key=main.OPENAI_API_KEY)
+    return _openai
+
+async def db_pool():
+    global _db_pool
+    if _db_pool is None:
+        async with _db_lock:
+            if _db_pool is None:
+                pool = False
+                if asyncpg and main.DATABASE_URL:
+                    try:
+                        pool = await asyncpg.create_pool(main.DATABASE_URL, min_size=1, max_size=DB_POOL_SIZE)
+                    except Exception as e:
+                        logging.error("❌ asyncpg pool failed, using sync DB on threads: %s", e)
+                _db_pool = pool
+    return _db_pool
+
+async def close():
+    global _http, _db_pool
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+    if _db_pool:
+        await _db_pool.close()
+    _db_pool = None
+
+async def get_token():
+    # Login once per process; main caches the JWT
+    if main.CACHED_TOKEN: return main.CACHED_TOKEN
+    return await asyncio.to_thread(main.get_token)
+
+
+# ✅ DB (asyncpg, or main.py's helpers on a thread)
+def _sync_db(fn, *args):
+    conn = main.get_db()
+    if not conn: return None
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+async def load_state(call_sid):
+    pool = await db_pool()
+    if not pool:
+        return await asyncio.to_thread(_sync_db, main.load_state, call_sid)
+    data = await pool.fetchval("SELECT data FROM call_state WHERE call_sid = $1", call_sid)
+    return json.loads(data) if isinstance(data, str) else data
+
+async def save_state(call_sid, state):
+    pool = await db_pool()
+    if not pool:
+        return await asyncio.to_thread(_sync_db, main.save_state, call_sid, state)
+    await pool.execute("INSERT INTO call_state (call_sid, data) VALUES ($1, $2::jsonb) ON CONFLICT (call_sid) DO UPDATE SET data = $2::jsonb",
+                       call_sid, json.dumps(state))
+
+# The booking ledger runs main.py's helpers on a thread: two short transactions
+# once per call, and it keeps working (in memory) without a database
+def _ledger_db(fn, *args):
+    conn = main.get_db()
+    try:
+        return fn(conn, *args)
+    finally:
+        if conn: conn.close()
+
+async def claim_booking(key, row):
+    return await asyncio.to_thread(_ledger_db, main.claim_booking, key, row)
+
+async def settle_booking(key, synced, emailed):
+    return await asyncio.to_thread(_ledger_db, main.settle_booking, key, synced, emailed)
+
+
+# ✅ VENDORS (async twins of main.py's CORE LOGIC)
+async def resolve_address(addr):
+    known = main.known_place(addr)
+    if known:
+        if main.GOOGLE_MAPS_API_KEY: main.USAGE.record("google", "find_place", cached=True)
+        return known
+    params = main.place_search_params(addr)
+    if params is None: return addr
+    try:
+        with main.USAGE.metered("google", "find_place"):
+            res = await http().get(main.PLACES_URL, params=params, timeout=turn_budget.timeout(5))
+        return main.parse_place(res.json(), addr)
+    except Exception: pass
+    return f"{addr}, Dubai, UAE"
+
+async def calc_dist(p, d):
+    if not main.GOOGLE_MAPS_API_KEY:
+        log.warning("⚠️ No Google Maps Key. Defaulting to 20km.")
+        return main.DEFAULT_DISTANCE_KM
+    try:
+        with main.USAGE.metered("google", "distance_matrix"):
+            res = await http().get(main.DISTANCE_URL, params=main.distance_params(p, d), timeout=turn_budget.timeout(5))
+        return main.parse_distance(res.json())
+    except Exception as e:
+        log.error("❌ Maps Error: %s", e)
+    return main.DEFAULT_DISTANCE_KM
+
+async def calculate_backend_fare(dist_km, v_type, b_type="point_to_point"):
+    url = f"{main.BACKEND_BASE_URL}/api/bookings/calculate-fare"
+    try:
+        headers = main.auth_headers(await get_token())
+        resp = await http().post(url, json=main.fare_request(dist_km, v_type, b_type), headers=headers, timeout=turn_budget.timeout(5))
+        if resp.status_code in [200, 201]:
+            fare = main.parse_fare(resp.json())
+            if fare: return fare
+        log.warning("⚠️ Fare API returned 0 or error %s: %s", resp.status_code, resp.text)
+    except Exception as e:
+        log.error("❌ Fare API Error: %s", e)
+    return None
+
+async def fetch_backend_vehicles(pax, luggage):
+    headers = main.auth_headers(await get_token())
+
+    # 1. Try smart suggestion first
+    url = f"{main.BACKEND_BASE_URL}/api/bookings/suggest-vehicles"
+    try:
+        params = {"passengers_count": int(pax), "luggage_count": int(luggage)}
+        resp = await http().get(url, params=params, headers=headers, timeout=turn_budget.timeout(6))
+        if resp.status_code == 200:
+            return main.filter_suggested_vehicles(resp.json(), pax)
+    except Exception as e:
+        log.warning("⚠️ Suggest API Exception: %s", e)
+
+    # 2. Fallback to general available vehicles
+    url = f"{main.BACKEND_BASE_URL}/api/vehicles/available"
+    try:
+        resp = await http().get(url, params={"passengers": pax, "luggage": luggage}, headers=headers, timeout=turn_budget.timeout(6))
+        if resp.status_code == 200:
+            return main.parse_available_vehicles(resp.json())
+    except Exception: pass
+    return []
+
+async def sync_booking_to_backend(booking_data):
+    url = f"{main.BACKEND_BASE_URL}/api/bookings/create-manual"
+    try:
+        headers = main.sync_headers(await get_token(), booking_data)
+        resp = await http().post(url, json=booking_data, headers=headers, timeout=turn_budget.timeout(5))
+        log.info("🔄 Sync Status: %s", resp.status_code)
+        if not main.sync_succeeded(resp.status_code):
+            log.warning("⚠️ Sync failed: %s", resp.text)
+            return False
+        return True
+    except Exception as e:
+        log.error("❌ Sync Error: %s", e)
+        return False
+
+async def send_email(subject, body, text=None):
+    if not main.RESEND_API_KEY:
+        log.error("❌ No RESEND_API_KEY found.")
+        return False
+    for sender in main.EMAIL_SENDERS:
+        try:
+            headers, payload = main.email_request(sender, subject, body, text)
+            with main.USAGE.metered("resend", "email") as meter:
+                resp = await http().post(main.RESEND_URL, headers=headers, json=payload, timeout=turn_budget.timeout(10))
+                meter.quantity = int(resp.status_code == 200)
+            if resp.status_code == 200:
+                log.info("📧 Email Sent Successfully via %s", sender)
+                return True
+            log.warning("⚠️ Email Attempt failed via %s: %s", sender, resp.status_code)
+        except Exception as e:
+            log.error("❌ Email Exception: %s", e)
+    return False
+
+async def run_ai(history, slots, hints=None):
+    try:
+        with main.USAGE.metered("openai", main.AI_MODEL) as meter:
+            resp = meter.tokens(await ai().chat.completions.create(
+                model=main.AI_MODEL,
+                messages=main.ai_messages(history, slots, hints),
+                response_format={"type": "json_object"},
+                temperature=0.0,
+                timeout=turn_budget.timeout(8)
+            ))
+        return json.loads(resp.choices[0].message.content)
+    except Exception:
+        return dict(main.AI_FALLBACK)
+
+
+# ✅ TURN (same flow as main._process_turn)
+async def staged(name, dependency, coro):
+    with turn_budget.stage(name, dependency):
+        return await coro
+
+async def done(value):
+    """A step that was skipped, for gather()"""
+    return value
+
+async def plan_route(slots):
+    p_id, d_id = await asyncio.gather(
+        staged("geocode", "google_maps", resolve_address(slots.get('pickup_location', 'Dubai'))),
+        staged("geocode", "google_maps", resolve_address(slots.get('dropoff_location', 'Dubai'))))
+    p = main.resolve_address_text(p_id)
+    d = main.resolve_address_text(d_id)
+    base_dist = round(await staged("distance", "google_maps", calc_dist(p_id, d_id)), 1)
+    return {"p_id": p_id, "d_id": d_id, "p": p, "d": d, "base_dist": base_dist, "b_type": main.booking_type_for(p, d)}
+
+async def quote_fares(route, v_types, fares=None):
+    fares = dict(fares or {})
+    missing = [v for v in dict.fromkeys(v_types) if not fares.get(v)]
+    quotes = await asyncio.gather(*[
+        staged("fare", "backend", calculate_backend_fare(route['base_dist'], v_type, route['b_type'])) for v_type in missing])
+    fares.update(zip(missing, quotes))
+    return fares
+
+async def collect_prefetch(call_sid, state, slots):
+    """main.collect_prefetch, awaiting a still-running speculation instead of blocking the loop"""
+    future = main.PREFETCH.pending(call_sid, main.prefetch_key(slots))
+    if future is not None and not future.done():
+        with turn_budget.stage("prefetch"):
+            await asyncio.wait({asyncio.wrap_future(future)}, timeout=turn_budget.timeout(main.PREFETCH_WAIT_SECONDS))
+    return main.collect_prefetch(call_sid, state, slots)
+
+async def process_turn(call_sid, speech, caller):
+    with tracing.span("voice.turn", call_sid=call_sid, mode="asgi"):
+        state = main.CALL_SETUP.take(call_sid) or {"history": [], "slots": {}}
+        if not state['history']:
+            state = await staged("db", "postgres", load_state(call_sid)) or state
+        turn_budget.note_language(state['slots'].get('language'))
+        state['history'].append({"role": "user", "content": speech})
+
+        extracted, consumed = main.pre_extract(speech)
+        decision = main.rule_decision(state, extracted, consumed)
+        if decision is None:
+            decision = await staged("llm", "openai", run_ai(state['history'], state['slots'], extracted))
+        ai_msg, action = main.apply_decision(state, decision, extracted, consumed)
+        slots = state['slots']
+        sel_lang = slots.get('language', 'English')
+
+        if action in main.PRICED_ACTIONS:
+            pre = await collect_prefetch(call_sid, state, slots)
+            route = main.prefetched_route(pre, slots) or await plan_route(slots)
+            p, d, base_dist, b_type = route['p'], route['d'], route['base_dist'], route['b_type']
+            fares = main.prefetched_fares(pre, slots)
+
+        if action == "confirm_pitch":
+            options = main.prefetched_options(pre, slots)
+            if options is None:
+                options = await staged("vehicles", "backend", fetch_backend_vehicles(slots.get('passengers_count', 1), slots.get('luggage_count', 0)))
+            logging.info("🚗 Options found: %s - %s", type(options), options)
+            fares = await quote_fares(route, [v_type for v_type, _, _ in main.pitch_vehicles(options)], fares)
+            main.keep_prefetch(state, slots, route, fares, options)
+            prices = [fares.get(v_type) for v_type, _, _ in main.pitch_vehicles(options)]
+            ai_msg = main.build_pitch(options, prices, p, d, base_dist, sel_lang)
+
+        elif action == "ask_reqs":
+            v_type, v_model = main.quick_vehicle(slots)
+            fares = await quote_fares(route, [v_type], fares)
+            main.keep_prefetch(state, slots, route, fares)
+            price = fares[v_type]
+            if not price: price = int(50 + (base_dist * 3.5))
+            ai_msg = main.ask_reqs_message(v_model, price, sel_lang)
+
+        elif action == "finalize":
+            pax, lug, car_model, v_type = main.final_vehicle(slots)
+            clean_time = main.clean_pickup_time(slots.get('pickup_time', ''))
+            fare = (await quote_fares(route, [v_type], fares))[v_type] or main.fallback_fare(v_type, base_dist)
+            main.PREFETCH.forget(call_sid)
+
+            # One booking per call, however often Twilio retries this turn (booking_ledger.py)
+            key = booking_ledger.call_key(call_sid)
+            bk_ref, created, push, email = await staged("db", "postgres", claim_booking(key, main.booking_row(
+                slots, caller, p, d, fare, v_type, b_type, pax, lug, base_dist, call_sid)))
+            if not created: log.info("♻️ Finalize repeated for %s: nothing is sent twice", bk_ref)
+            email_html, email_text = main.booking_email(
+                bk_ref, p, d, main.display_pickup_time(clean_time), car_model, v_type,
+                pax, lug, base_dist, fare, slots, caller, main.TRANSCRIPTS.link(call_sid), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            # Backend sync and admin email don't depend on each other
+            synced, sent = await asyncio.gather(
+                staged("backend_sync", "backend", sync_booking_to_backend(main.booking_payload(
+                    slots, caller, p, d, b_type, v_type, base_dist, pax, lug, fare, car_model, clean_time,
+                    main.TRANSCRIPTS.link(call_sid), bk_ref))) if push else done(False),
+                staged("email", "resend", send_email(f"🚀 NEW BOOKING: {slots.get('customer_name', 'Guest')}", email_html, email_text))
+                if email else done(True))
+            if synced or not sent:
+                await staged("db", "postgres", settle_booking(key, synced, sent))
+
+            ai_msg = main.final_message(car_model, fare, sel_lang)
+            state['history'].append({"role": "assistant", "content": ai_msg})
+            main.record_turn(call_sid, state, state['history'][-2:])  # writer thread, not the loop
+            await staged("db", "postgres", save_state(call_sid, state))
+            return main.hangup_twiml(ai_msg, sel_lang)
+
+        state['history'].append({"role": "assistant", "content": ai_msg})
+        main.record_turn(call_sid, state, state['history'][-2:])
+        if action != "confirm_pitch":
+            main.speculate(call_sid, state)  # same prefetch pool as the sync path, off the event loop
+        await staged("db", "postgres", save_state(call_sid, state))
+        return main.gather_twiml(ai_msg, sel_lang)
+
+
+# ✅ ROUTES
+# A held turn's reply is parked in held_turns for whichever worker gets the poll;
+# holds are rare, so main.py's helpers run on a thread rather than through asyncpg
+_handoffs = set()  # hand_off_task tasks (parking replies), referenced until they finish
+
+async def hold_turn(call_sid):
+    await asyncio.to_thread(main.hold_turn, call_sid)
+
+async def park_turn(turn, twiml):
+    await asyncio.to_thread(main.park_turn, turn, twiml)
+
+async def reply_within_budget(turn, wait):
+    try:
+        twiml = await turn_budget.await_turn(turn, wait)
+    except Exception as e:
+        logging.error("❌ Turn Failed (%s): %s", turn.call_sid, e)
+        return main.apology_twiml(main.MISSED_MESSAGES, turn.language)
+    if twiml is not None:
+        if turn.polls:  # held, then served here after all: no reply or marker left for another worker
+            if turn_budget.served_here(turn): await turn.handoff
+            await asyncio.to_thread(main.held_db, main.drop_reply, turn.call_sid)
+        return twiml
+    log.info("⏳ Turn %s over budget (%.1fs). Holding.", turn.call_sid, turn.budget.elapsed())
+    if turn.polls == 0:
+        await hold_turn(turn.call_sid)  # before the hold message: the next poll may reach another worker
+        task = turn.handoff = asyncio.ensure_future(turn_budget.hand_off_task(turn, park_turn))
+        _handoffs.add(task)
+        task.add_done_callback(_handoffs.discard)
+    return main.hold_twiml(turn)
+
+async def handle_call(values):
+    call_sid = values.get('CallSid')
+    turn = turn_budget.start_task(call_sid, process_turn, call_sid, values.get('SpeechResult', ''), values.get('From'))
+    return await reply_within_budget(turn, turn.budget.remaining() - turn_budget.HOLD_RESERVE_SECONDS)
+
+async def handle_result(values):
+    turn = turn_budget.pending_turn(values.get('CallSid'))
+    if not turn:
+        return await asyncio.to_thread(main.held_elsewhere, values.get('CallSid'))
+    return await reply_within_budget(turn, turn_budget.TURN_BUDGET_SECONDS - turn_budget.HOLD_RESERVE_SECONDS)
+
+async def select_language(values):
+    call_sid = values.get('CallSid')
+    digit = values.get('Digits')
+    selected_lang = main.LANG_DIGITS.get(digit, "English")
+    log.info("🌍 Language Selected: %s (Digit: %s)", selected_lang, digit)
+    return main.open_call(call_sid, selected_lang)  # the write is a thread-pool job, nothing to await
+
+async def eleven_tts(values):
+    text = values.get('text', '')
+    if not text or not main.ELEVENLABS_API_KEY:
+        return "Missing data", 400, "text/plain"
+    url, headers, data = main.tts_request(text)
+    try:
+        with main.USAGE.metered("elevenlabs", "tts", len(text)) as meter:
+            r = await http().post(url, json=data, headers=headers, timeout=10)
+            if r.status_code != 200: meter.quantity = 0
+        if r.status_code == 200:
+            return r.content, 200, "audio/mpeg"
+        return f"Error: {r.text}", r.status_code, "text/plain"
+    except Exception as e:
+        return str(e), 500, "text/plain"
+
+async def whatsapp_unsupported(values):
+    log.error("❌ /whatsapp reached the ASGI app (from %s); point the WhatsApp webhook at the legacy app", values.get("From"))
+    return ("WhatsApp is not served in ASGI mode; point the Twilio WhatsApp webhook at the legacy app", 501, "text/plain")
+
+ROUTES = {
+    ("POST", "/handle"): handle_call,
+    ("POST", "/handle-result"): handle_result,
+    ("POST", "/select-language"): select_language,
+    ("GET", "/eleven-tts"): eleven_tts,
+    ("POST", "/whatsapp"): whatsapp_unsupported,
+}
+
+
+# ✅ ASGI PLUMBING
+async def read_body(receive):
+    body = b""
+    while True:
+        msg = await receive()
+        body += msg.get("body", b"")
+        if not msg.get("more_body"): return body
+
+def form_values(scope, body):
+    """Flask's request.values: query string + urlencoded form"""
+    values = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode(), keep_blank_values=True).items()}
+    values.update({k: v[0] for k, v in parse_qs(body.decode("utf-8", "replace"), keep_blank_values=True).items()})
+    return values
+
+async def respond(send, body, status=200, content_type="text/xml", headers=None):
+    if isinstance(body, str): body = body.encode()
+    head = headers or [(b"content-type", content_type.encode())]
+    await send({"type": "http.response.start", "status": status, "headers": head + [(b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE": environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH": environ[f"HTTP_{key}"] = value
+    return environ
+
+def call_wsgi(environ):
+    out = {}
+    def start_response(status, headers, exc_info=None):
+        out["status"], out["headers"] = int(status.split()[0]), headers
+    chunks = main.app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"): chunks.close()
+    return out["status"], out["headers"], body
+
+async def lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            await asyncio.to_thread(main.LIFECYCLE.start)  # schema + this worker's warmups (lifecycle.py)
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(main.LIFECYCLE.stop)
+            await close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http": return
+
+    body = await read_body(receive)
+    route = ROUTES.get((scope["method"], scope["path"]))
+    if route is None:
+        status, headers, data = await asyncio.to_thread(call_wsgi, wsgi_environ(scope, body))
+        head = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers if k.lower() != "content-length"]
+        return await respond(send, data, status, headers=head)
+
+    values = form_values(scope, body)
+    structured_log.bind(call_sid=values.get("CallSid"), phone=values.get("From"))  # this request's task only
+    try:
+        result = await route(values)
+    except Exception as e:
+        logging.error("❌ ASGI %s failed: %s", scope['path'], e)
+        result = ("Internal Server Error", 500, "text/plain")
+    if isinstance(result, str): result = (result, 200, "text/xml")
+    await respond(send, *result)
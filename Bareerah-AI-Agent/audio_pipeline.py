@@ -0,0 +1,242 @@
+# ✅ AUDIO PIPELINE - WhatsApp voice note -> Whisper with no temp files
+#
+# Old path: download -> NamedTemporaryFile -> `ffmpeg` (fresh process) ->
+# .mp3 on disk -> re-read for Whisper. Now:
+#   * OGG/Opus (what WhatsApp sends), MP3, M4A, WAV, WebM... are formats
+#     Whisper takes as-is, so the download goes straight to Whisper in memory.
+#   * Anything else (AMR, 3GPP) is streamed from the Twilio download into a
+#     pre-spawned ffmpeg's stdin and the MP3 is read back from its stdout.
+# The pool keeps AUDIO_TRANSCODERS ffmpeg processes started and waiting on
+# stdin (ffmpeg takes one input per process), so process start-up is paid in
+# the background, not on the voice note.
+#
+# Every voice note records wall time per phase and bytes copied (each handoff
+# between buffers inside this process); the totals show up on /metrics.
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+
+import requests
+
+import tracing
+
+AUDIO_TRANSCODERS = int(os.getenv("AUDIO_TRANSCODERS", "2"))
+AUDIO_CHUNK_BYTES = 64 * 1024
+TRANSCODE_TIMEOUT = 10
+MIN_VOICE_NOTE_BYTES = 100
+FFMPEG_CMD = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+              "-acodec", "libmp3lame", "-q:a", "5", "-f", "mp3", "pipe:1"]
+
+# content type -> filename Whisper sees (it sniffs the format from the extension)
+WHISPER_NATIVE = {
+    "audio/ogg": "voice.ogg", "audio/opus": "voice.ogg", "audio/oga": "voice.ogg",
+    "audio/mpeg": "voice.mp3", "audio/mp3": "voice.mp3", "audio/mp4": "voice.m4a",
+    "audio/m4a": "voice.m4a", "audio/x-m4a": "voice.m4a", "audio/wav": "voice.wav",
+    "audio/x-wav": "voice.wav", "audio/webm": "voice.webm", "audio/flac": "voice.flac",
+}
+
+
+def whisper_filename(content_type):
+    """Filename to send Whisper for this content type, or None when it needs transcoding"""
+    base = (content_type or "").split(";")[0].strip().lower()
+    return WHISPER_NATIVE.get(base)
+
+
+class VoiceNote:
+    """Audio ready for Whisper (as an OpenAI file tuple) plus how we got it"""
+
+    def __init__(self, data, filename, content_type):
+        self.data = data
+        self.filename = filename
+        self.content_type = content_type
+        self.mode = "passthrough"
+        self.bytes_in = 0
+        self.bytes_copied = 0
+        self.timings_ms = {}
+
+    def as_file(self):
+        return (self.filename, self.data, self.content_type)
+
+    def __len__(self):
+        return len(self.data)
+
+
+# ✅ TRANSCODER POOL
+class TranscoderPool:
+    """ffmpeg processes started ahead of time, each used for exactly one input"""
+
+    def __init__(self, size=AUDIO_TRANSCODERS, cmd=None):
+        self.size = size
+        self.cmd = cmd or FFMPEG_CMD
+        self.ready = deque()
+        self.lock = threading.Lock()
+        self.spawned = 0
+        self.cold_starts = 0
+
+    def available(self):
+        return bool(shutil.which(self.cmd[0]))
+
+    def _spawn(self):
+        proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        with self.lock:
+            self.spawned += 1
+        return proc
+
+    def _refill(self):
+        try:
+            proc = self._spawn()
+        except OSError as e:
+            logging.error("❌ Transcoder spawn failed: %s", e)
+            return
+        with self.lock:
+            self.ready.append(proc)
+
+    def warm(self):
+        """Fill the pool up to size (call at startup; refills happen after each use)"""
+        with self.lock:
+            missing = self.size - len(self.ready)
+        for _ in range(max(0, missing)):
+            self._refill()
+
+    def acquire(self):
+        proc = None
+        with self.lock:
+            while self.ready and proc is None:
+                candidate = self.ready.popleft()
+                if candidate.poll() is None: proc = candidate
+        if proc is None:
+            with self.lock:
+                self.cold_starts += 1
+            proc = self._spawn()
+        if self.size > 0:
+            threading.Thread(target=self._refill, name="transcoder-refill", daemon=True).start()
+        return proc
+
+    def transcode(self, chunks, note, timeout=None):
+        """Pipe chunks through one ffmpeg; returns the output bytes. An ffmpeg still
+        running after the timeout (a malformed input it hangs on) is killed."""
+        timeout = TRANSCODE_TIMEOUT if timeout is None else timeout
+        proc = self.acquire()
+        fed = {"bytes": 0, "error": None}
+        out, err = [], []
+
+        def feed():
+            try:
+                for chunk in chunks:
+                    if not chunk: continue
+                    proc.stdin.write(chunk)
+                    fed["bytes"] += len(chunk)
+            except Exception as e:
+                fed["error"] = e
+            finally:
+                try: proc.stdin.close()
+                except Exception: pass
+
+        # stdout and stderr are read at once, so neither pipe can fill up and stall ffmpeg
+        threads = [threading.Thread(target=feed, name="transcoder-feed", daemon=True)]
+        threads += [threading.Thread(target=lambda s=stream, sink=sink: sink.append(s.read()), name="transcoder-read", daemon=True)
+                    for stream, sink in ((proc.stdout, out), (proc.stderr, err))]
+        for t in threads: t.start()
+        deadline = time.monotonic() + timeout
+        for t in threads[1:]: t.join(max(0.0, deadline - time.monotonic()))
+        try:
+            if any(t.is_alive() for t in threads[1:]): raise subprocess.TimeoutExpired(self.cmd, timeout)
+            proc.wait(timeout=max(0.1, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        threads[0].join(timeout=max(0.1, deadline - time.monotonic()))
+        out, err = b"".join(out), b"".join(err)
+        note.bytes_in += fed["bytes"]
+        note.bytes_copied += fed["bytes"] + len(out)  # into the stdin pipe, out of the stdout pipe
+        if fed["error"]: raise fed["error"]
+        if proc.returncode != 0 or not out:
+            raise RuntimeError(f"ffmpeg exit {proc.returncode}: {err[:200].decode('utf-8', 'replace')}")
+        return out
+
+    def close(self):
+        with self.lock:
+            procs, self.ready = list(self.ready), deque()
+        for proc in procs:
+            proc.kill()
+            proc.wait()
+
+
+# ✅ STATS
+class PipelineStats:
+    def __init__(self, window=512):
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=window)
+        self.totals = {"voice_notes": 0, "passthrough": 0, "transcoded": 0, "too_short": 0, "failed": 0,
+                       "bytes_in": 0, "bytes_copied": 0}
+
+    def record(self, note=None, outcome=None):
+        with self.lock:
+            self.totals["voice_notes"] += 1
+            if outcome:
+                self.totals[outcome] += 1
+                return
+            self.totals[note.mode] += 1
+            self.totals["bytes_in"] += note.bytes_in
+            self.totals["bytes_copied"] += note.bytes_copied
+            self.recent.append(dict(note.timings_ms))
+
+    def snapshot(self):
+        with self.lock:
+            out = dict(self.totals)
+            for phase in ("download", "transcode", "total"):
+                values = sorted(t[phase] for t in self.recent if phase in t)
+                out[f"{phase}_p50_ms"] = tracing.percentile(values, 50)
+                out[f"{phase}_p95_ms"] = tracing.percentile(values, 95)
+            out["transcoders_spawned"] = transcoders.spawned
+            out["transcoder_cold_starts"] = transcoders.cold_starts
+            return out
+
+
+transcoders = TranscoderPool()
+stats = PipelineStats()
+tracing.register_gauge("audio_pipeline", stats.snapshot)
+
+
+# ✅ PIPELINE
+def fetch_voice_note(media_url, content_type, auth=None, timeout=10):
+    """Download a Twilio media URL into a Whisper-ready VoiceNote.
+    Returns None when the note is too short to transcribe."""
+    t0 = time.perf_counter()
+    filename = whisper_filename(content_type)
+    try:
+        with tracing.span("audio.fetch", "twilio", content_type=content_type or ""):
+            resp = requests.get(media_url, timeout=timeout, auth=auth, stream=True)
+            resp.raise_for_status()
+            chunks = resp.iter_content(chunk_size=AUDIO_CHUNK_BYTES)
+
+            if filename is None and transcoders.available():
+                note = VoiceNote(b"", "voice.mp3", "audio/mpeg")
+                note.mode = "transcoded"
+                with tracing.span("audio.transcode"):
+                    note.data = transcoders.transcode(chunks, note)
+                # download and transcode overlap; the transcode wall time covers both
+                note.timings_ms["transcode"] = round((time.perf_counter() - t0) * 1000, 2)
+            else:
+                if filename is None:
+                    logging.warning("⚠️ No ffmpeg for %s; sending it to Whisper as-is", content_type)
+                data = b"".join(chunks)
+                note = VoiceNote(data, filename or "voice.ogg", (content_type or "audio/ogg").split(";")[0])
+                note.bytes_in = note.bytes_copied = len(data)
+                note.timings_ms["download"] = round((time.perf_counter() - t0) * 1000, 2)
+    except Exception:
+        stats.record(outcome="failed")
+        raise
+
+    note.timings_ms["total"] = round((time.perf_counter() - t0) * 1000, 2)
+    if note.bytes_in < MIN_VOICE_NOTE_BYTES:
+        stats.record(outcome="too_short")
+        return None
+    stats.record(note)
+    logging.info("[AUDIO] 🎙️ %s: %s→%s bytes, copied %s, %s", note.mode, note.bytes_in, len(note), note.bytes_copied, note.timings_ms)
+    return note
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Replay recorded conversations against main.py in-process with stubbed vendors.
+
+Every customer line from 15_COMPLETE_CONVERSATIONS.txt is sent to /handle
+through the Flask test client (after /select-language), following any
+hold -> /handle-result redirects so the measured latency is what a caller
+would hear. OpenAI, Google Maps, the backend, Resend and Twilio are
+replaced by vendor_stubs with seeded latency distributions.
+
+    python bench_conversations.py
+    python bench_conversations.py --repeat 3 --latency openai=fixed:900 --json bench.json
+    python bench_conversations.py --no-latency          # pure CPU cost of our own code
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # main.py builds its client at import
+
+import tracing
+from vendor_stubs import VendorStubs, parse_latency_args
+
+CONVERSATIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "15_COMPLETE_CONVERSATIONS.txt")
+HOLD_MARKER = "/handle-result</Redirect>"
+
+
+def load_conversations(path=CONVERSATIONS_FILE):
+    """[(title, [customer lines])] parsed from the '🎬 CONVERSATION #N' transcript format"""
+    conversations = []
+    title, lines = None, []
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if line.startswith("🎬 CONVERSATION"):
+                if title and lines: conversations.append((title, lines))
+                title, lines = re.sub(r"^🎬\s*", "", line), []
+            elif line.startswith("👤 Customer:") and title:
+                lines.append(line.split(":", 1)[1].strip())
+    if title and lines: conversations.append((title, lines))
+    return conversations
+
+
+def run_turn(client, call_sid, speech, max_polls=30):
+    """POST /handle and follow hold redirects; returns (seconds, holds, twiml)"""
+    t0 = time.perf_counter()
+    r = client.post("/handle", data={"CallSid": call_sid, "SpeechResult": speech, "From": "+971500000000"})
+    body = r.get_data(as_text=True)
+    holds = 0
+    while HOLD_MARKER in body and holds < max_polls:
+        holds += 1
+        r = client.post("/handle-result", data={"CallSid": call_sid})
+        body = r.get_data(as_text=True)
+    return time.perf_counter() - t0, holds, body, r.status_code
+
+
+def replay(app_module, stubs, conversations, repeat=1, verbose=False):
+    client = app_module.app.test_client()
+    results = []
+    for rep in range(repeat):
+        for idx, (title, lines) in enumerate(conversations, 1):
+            call_sid = f"CABENCH{rep:02d}{idx:03d}"
+            stubs.reset_counts()
+            client.post("/select-language", data={"CallSid": call_sid, "Digits": "1"})
+            turns = []
+            for speech in lines:
+                secs, holds, twiml, status = run_turn(client, call_sid, speech)
+                turns.append({"seconds": secs, "holds": holds, "status": status, "hangup": "<Hangup" in twiml})
+                if verbose: print(f"   👤 {speech[:60]}\n   🤖 {re.sub('<[^>]+>', ' ', twiml).strip()[:100]}")
+                if "<Hangup" in twiml: break
+            results.append({
+                "conversation": title,
+                "repeat": rep,
+                "turns": turns,
+                "external_calls": stubs.counts(),
+                "completed_booking": any(t["hangup"] for t in turns),
+            })
+    return results
+
+
+def summarize(results, wall_seconds):
+    latencies = sorted(t["seconds"] * 1000 for r in results for t in r["turns"])
+    n_turns = len(latencies)
+    calls = Counter()
+    for r in results: calls.update(r["external_calls"])
+    n_conv = max(1, len(results))
+    return {
+        "conversations": len(results),
+        "turns": n_turns,
+        "wall_seconds": round(wall_seconds, 3),
+        "turns_per_sec": round(n_turns / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": {
+            "p50": tracing.percentile(latencies, 50),
+            "p95": tracing.percentile(latencies, 95),
+            "p99": tracing.percentile(latencies, 99),
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        "held_turns": sum(1 for r in results for t in r["turns"] if t["holds"]),
+        "errors": sum(1 for r in results for t in r["turns"] if t["status"] >= 400),
+        "bookings_completed": sum(1 for r in results if r["completed_booking"]),
+        "external_calls_per_conversation": {k: round(v / n_conv, 2) for k, v in sorted(calls.items())},
+    }
+
+
+def print_report(summary, results, stages):
+    print("=" * 70)
+    print("📊 CONVERSATION REPLAY BENCHMARK")
+    print("=" * 70)
+    for r in results:
+        ms = [t["seconds"] * 1000 for t in r["turns"]]
+        calls = " ".join(f"{k}={v}" for k, v in sorted(r["external_calls"].items()))
+        print(f"{r['conversation'][:48]:48} turns={len(ms):2d} avg={sum(ms) / max(1, len(ms)):7.1f}ms  {calls}")
+    print("-" * 70)
+    lat = summary["latency_ms"]
+    print(f"Turns: {summary['turns']} in {summary['wall_seconds']}s  →  {summary['turns_per_sec']} turns/sec")
+    print(f"Latency p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms max={lat['max']}ms")
+    print(f"Held turns: {summary['held_turns']} | Errors: {summary['errors']} | Bookings: {summary['bookings_completed']}")
+    print(f"External calls / conversation: {summary['external_calls_per_conversation']}")
+    print("Stage breakdown (p50 / p95 ms):")
+    for name, h in stages.items():
+        print(f"   {name:14} n={h['count']:5d}  {h['p50_ms']} / {h['p95_ms']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", default=CONVERSATIONS_FILE)
+    parser.add_argument("--conversations", type=int, default=0, help="only replay the first N")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", action="append", metavar="VENDOR=SPEC",
+                        help="e.g. openai=lognormal:650,0.35  google_maps=uniform:60-180  backend=fixed:80")
+    parser.add_argument("--no-latency", action="store_true", help="stubs answer instantly")
+    parser.add_argument("--json", help="write summary + per-conversation results here")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    conversations = load_conversations(args.file)
+    if args.conversations: conversations = conversations[:args.conversations]
+
+    import main as app_module
+    stubs = VendorStubs(seed=args.seed, latency=parse_latency_args(args.latency), sleep=not args.no_latency)
+    tracing.reset_metrics()
+    with stubs.installed(app_module):
+        t0 = time.perf_counter()
+        results = replay(app_module, stubs, conversations, args.repeat, args.verbose)
+        wall = time.perf_counter() - t0
+
+    summary = summarize(results, wall)
+    stages = tracing.metrics_snapshot()["stages"]
+    print_report(summary, results, stages)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "stages": stages, "results": results}, f, indent=2)
+        print(f"💾 Saved: {args.json}")
+    return 0 if summary["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
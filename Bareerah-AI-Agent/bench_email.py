@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Measure booking email render time and output size.
+
+Renders every email in email_templates (HTML and its plain-text twin) from a
+typical finalize-turn record (a 16-line transcript) and reports per-render
+latency and the bytes a mail provider would receive, raw and gzipped.
+
+    python bench_email.py
+    python bench_email.py --renders 20000 --json email_bench.json
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+import email_templates
+
+TRANSCRIPT = (
+    ("assistant", "As-Salamu Alaykum. Welcome to Star Skyline. I am Ayesha. May I have your name?"),
+    ("user", "Sara Khan"),
+    ("assistant", "Thank you Sara. Where should we pick you up?"),
+    ("user", "Dubai Marina, Marina Gate tower 2"),
+    ("assistant", "And where are you going?"),
+    ("user", "DXB terminal 3"),
+    ("assistant", "When would you like to be picked up?"),
+    ("user", "tomorrow at 4 pm"),
+    ("assistant", "How many passengers and bags?"),
+    ("user", "two of us, three suitcases"),
+    ("assistant", "I can offer a Lexus ES for AED 120 or a Mercedes E Class for AED 160."),
+    ("user", "Executive please"),
+    ("assistant", "The Mercedes E Class is AED 160. Any special requests?"),
+    ("user", "No thanks"),
+    ("assistant", "Your booking is confirmed. Thank you for choosing Star Skyline."),
+    ("user", "Bye"),
+)
+
+RECORD = email_templates.BookingEmail(
+    reference="SSL-A1B2C3", status="📞 New Booking Received via Ayesha AI.",
+    pickup="Marina Gate Tower 2, Dubai Marina, Dubai", dropoff="Dubai International Airport (DXB) Terminal 3",
+    pickup_time="Tuesday, 20 October 2026 at 04:00 PM", vehicle_type="executive", car_model="Mercedes E Class",
+    passengers=2, luggage=3, distance_km=31.4, fare=160, customer_name="Sara Khan", phone="+971500000001",
+    email="sara.khan@example.com", transcript=TRANSCRIPT, timestamp="2026-10-19 18:00:00")
+
+
+# notify_dispatcher's digest of low-priority alerts, at a busy evening's size
+DIGEST = email_templates.Digest(reference="20 follow-ups", status="20 callers may need a follow-up",
+                                items=(RECORD._replace(status="📞 Call Dropped - Customer May Need Follow-up"),) * 20)
+RECORDS = {"follow_up_digest": DIGEST}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench(renders):
+    out = {}
+    for name in email_templates.EMAILS:
+        for kind in ("html", "txt"):
+            record = RECORDS.get(name, RECORD)
+            body = email_templates.render(name, record, kind)
+            times = []
+            for _ in range(renders):
+                t0 = time.perf_counter()
+                email_templates.render(name, record, kind)
+                times.append((time.perf_counter() - t0) * 1e6)
+            raw = body.encode("utf-8")
+            out[f"{name}.{kind}"] = {
+                "p50_us": round(percentile(times, 50), 1),
+                "p95_us": round(percentile(times, 95), 1),
+                "bytes": len(raw),
+                "gzip_bytes": len(gzip.compress(raw)),
+            }
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders", type=int, default=5000)
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args(argv)
+
+    results = bench(args.renders)
+    print("=" * 70)
+    print(f"📧 EMAIL TEMPLATE BENCHMARK ({args.renders} renders each)")
+    print("=" * 70)
+    for name, r in results.items():
+        print(f"{name:22} p50={r['p50_us']:7.1f}us p95={r['p95_us']:7.1f}us  {r['bytes']:6d} bytes ({r['gzip_bytes']} gzipped)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# ✅ BOOKING LEDGER - one booking, one backend push, one email per idempotency key
+#
+# A Twilio retry of the finalize turn, a customer saying "yes" twice and the
+# legacy /handle complete path could each create the booking again: another
+# bookings row, another backend create-manual, another admin email. The
+# references didn't help - BOOK-<n> came from a per-process counter (every
+# worker starts at 1001) and STARS-<last 6 of CallSid> can repeat. Now:
+#   * every booking has an idempotency key: call:<CallSid> for voice, a key
+#     kept in the chat's booking state for WhatsApp
+#   * record() inserts the bookings row ON CONFLICT (idempotency_key) - the
+#     retry gets the first attempt's row and reference back, created=False
+#   * references are SSL- + 10 random Crockford base32 characters (50 bits),
+#     unique-indexed; a collision is retried with a fresh one
+#   * side effects (backend push, admin email) are claimed with once(): an
+#     INSERT into booking_effects that only one caller wins, on any worker.
+#     A failed email is release()d so the retry sends it; a failed push stays
+#     claimed and booking_reconciler retries it (the row is pending_confirmation)
+#   * the backend gets the reference as an Idempotency-Key header too
+# With no database the ledger keeps the last LEDGER_LOCAL_SIZE keys in memory,
+# which still covers retries landing on the same process.
+#
+#   BOOKING_REFERENCE_PREFIX  reference prefix (SSL)
+#   LEDGER_LOCAL_SIZE         keys remembered without a database (2048)
+import os
+import uuid
+import secrets
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+import tracing
+
+BOOKING_REFERENCE_PREFIX = os.getenv("BOOKING_REFERENCE_PREFIX", "SSL")
+LEDGER_LOCAL_SIZE = int(os.getenv("LEDGER_LOCAL_SIZE", "2048"))
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford: no I, L, O, U to misread
+REFERENCE_CHARS = 10
+REFERENCE_TRIES = 3
+# the request that records a booking pushes it itself; the reconciler waits this long
+PUSH_GRACE_SECONDS = 120
+
+COLUMNS = ("customer_name", "customer_phone", "customer_email", "pickup_location", "dropoff_location",
+           "vehicle_type", "service_type", "number_of_passengers", "number_of_luggage", "distance_km",
+           "fare_aed", "calculated_fare_aed", "call_sid")
+
+RECORD = f"""
+    INSERT INTO bookings (idempotency_key, booking_reference, booking_status, next_sync_at, {", ".join(COLUMNS)})
+    VALUES (%s, %s, %s, now() + make_interval(secs => %s), {", ".join(["%s"] * len(COLUMNS))})
+    ON CONFLICT (idempotency_key) DO UPDATE SET updated_at = now()
+    RETURNING booking_reference, (xmax = 0) AS created
+"""
+CLAIM_EFFECT = "INSERT INTO booking_effects (idempotency_key, effect) VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING effect"
+RELEASE_EFFECT = "DELETE FROM booking_effects WHERE idempotency_key = %s AND effect = %s"
+SETTLE = "UPDATE bookings SET booking_status = %s, next_sync_at = NULL, updated_at = now() WHERE idempotency_key = %s"
+
+
+def new_reference():
+    return f"{BOOKING_REFERENCE_PREFIX}-" + "".join(secrets.choice(ALPHABET) for _ in range(REFERENCE_CHARS))
+
+
+def call_key(call_sid):
+    return f"call:{call_sid}"
+
+
+def chat_key(phone):
+    """A fresh key for a chat booking; keep it in the booking state so retries reuse it"""
+    return f"chat:{phone}:{uuid.uuid4().hex}"
+
+
+def record_params(key, reference, status, row):
+    return (key, reference, status, PUSH_GRACE_SECONDS) + tuple(row.get(c) for c in COLUMNS)
+
+
+def _value(row, name, index):
+    return row[name] if isinstance(row, dict) else row[index]  # RealDictCursor (main) or tuples (legacy)
+
+
+class BookingLedger:
+    """Idempotent booking rows and once-only side effects, in Postgres (or memory)"""
+
+    def __init__(self, local_size=LEDGER_LOCAL_SIZE, name="ledger"):
+        self.name = name
+        self.local_size = local_size
+        self.local = OrderedDict()  # key -> {"reference", "effects"} when there's no DB
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def _local(self, key, reference=None):
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is None:
+                entry = self.local[key] = {"reference": reference or new_reference(), "effects": set()}
+                while len(self.local) > self.local_size:
+                    self.local.popitem(last=False)
+                return entry, True
+            self.local.move_to_end(key)
+            return entry, False
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def record(self, conn, key, status="pending_confirmation", reference=None, **row):
+        """Insert the booking once; returns (reference, created) - created is False for a retry.
+        reference: one already shown to the customer, kept unless it collides"""
+        if conn:
+            for _ in range(REFERENCE_TRIES):
+                try:
+                    with tracing.span("ledger_record", "postgres"):
+                        cur = conn.cursor()
+                        cur.execute(RECORD, record_params(key, reference or new_reference(), status, row))
+                        hit = cur.fetchone()
+                        conn.commit()
+                    reference, created = _value(hit, "booking_reference", 0), bool(_value(hit, "created", 1))
+                    self._count("created" if created else "duplicates")
+                    return reference, created
+                except Exception as e:
+                    conn.rollback()
+                    if "booking_reference" not in str(e):  # anything but a reference collision
+                        logging.error("❌ Ledger record failed, deduplicating in memory: %s", e)
+                        break
+                    self._count("reference_collisions")
+                    reference = None
+        entry, created = self._local(key, reference)
+        self._count("created" if created else "duplicates")
+        return entry["reference"], created
+
+    def once(self, conn, key, effect):
+        """True for exactly one caller per (key, effect); everyone else should skip the effect"""
+        if conn:
+            try:
+                cur = conn.cursor()
+                cur.execute(CLAIM_EFFECT, (key, effect))
+                won = cur.fetchone() is not None
+                conn.commit()
+                self._count(f"{effect}_claimed" if won else f"{effect}_skipped")
+                return won
+            except Exception as e:
+                conn.rollback()
+                logging.error("❌ Ledger claim failed, deduplicating in memory: %s", e)
+        entry, _ = self._local(key)
+        with self.lock:
+            won = effect not in entry["effects"]
+            entry["effects"].add(effect)
+            self.stats[f"{effect}_claimed" if won else f"{effect}_skipped"] += 1
+        return won
+
+    def release(self, conn, key, effect):
+        """The effect failed: let the next attempt claim it again"""
+        self._count(f"{effect}_released")
+        with self.lock:
+            entry = self.local.get(key)
+            if entry: entry["effects"].discard(effect)
+        if not conn: return
+        try:
+            conn.cursor().execute(RELEASE_EFFECT, (key, effect))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error("❌ Ledger release failed: %s", e)
+
+    def settle(self, conn, key, status):
+        """The backend has it: confirmed, and off the reconciler's list"""
+        if not conn: return
+        try:
+            conn.cursor().execute(SETTLE, (status, key))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error("❌ Ledger settle failed: %s", e)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, local_keys=len(self.local))
@@ -0,0 +1,173 @@
+# ✅ BOOKING RECONCILER - push pending bookings to the backend in the background
+#
+# The WhatsApp handler used to run sync_pending_bookings_to_backend on every
+# inbound message: a query plus up to 10 sequential backend POSTs before the
+# customer's text was even looked at, and two instances could push the same
+# booking twice. A single background thread per process now does it:
+#   * every RECONCILE_INTERVAL_SECONDS it claims up to RECONCILE_BATCH_SIZE due
+#     pending_confirmation bookings with SELECT ... FOR UPDATE SKIP LOCKED and,
+#     in the same statement, leases them (next_sync_at = now + lease) - another
+#     instance skips rows that are locked or leased, and the claim commits
+#     before any HTTP so no transaction stays open while the backend is slow
+#   * each claimed booking is POSTed; success marks it confirmed, failure
+#     pushes next_sync_at out by RECONCILE_BACKOFF_SECONDS * 2^(attempts-1)
+#     (capped, with jitter) and keeps the error for the portal
+#   * a process that dies mid-batch just lets the lease run out; the rows come
+#     back on someone else's next pass
+# A full batch runs the next pass straight away instead of waiting.
+#
+#   RECONCILE_INTERVAL_SECONDS     pause between passes (30)
+#   RECONCILE_BATCH_SIZE           bookings claimed per pass (10)
+#   RECONCILE_LEASE_SECONDS        how long a claim keeps other instances off (120)
+#   RECONCILE_BACKOFF_SECONDS      first retry delay after a failed push (30)
+#   RECONCILE_BACKOFF_MAX_SECONDS  longest retry delay (3600)
+#   RECONCILE_ENABLED=false        don't start the thread
+import os
+import random
+import logging
+import threading
+from collections import Counter
+
+import tracing
+
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "30"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "10"))
+RECONCILE_LEASE_SECONDS = float(os.getenv("RECONCILE_LEASE_SECONDS", "120"))
+RECONCILE_BACKOFF_SECONDS = float(os.getenv("RECONCILE_BACKOFF_SECONDS", "30"))
+RECONCILE_BACKOFF_MAX_SECONDS = float(os.getenv("RECONCILE_BACKOFF_MAX_SECONDS", "3600"))
+RECONCILE_ENABLED = os.getenv("RECONCILE_ENABLED", "true").lower() != "false"
+
+COLUMNS = ("id", "booking_reference", "customer_name", "customer_phone", "pickup_location", "dropoff_location", "calculated_fare_aed",
+           "vehicle_type", "service_type", "number_of_passengers", "number_of_luggage", "sync_attempts")
+
+CLAIM = f"""
+    UPDATE bookings SET next_sync_at = now() + make_interval(secs => %s), sync_attempts = sync_attempts + 1
+    WHERE id IN (
+        SELECT id FROM bookings
+        WHERE booking_status = 'pending_confirmation' AND (next_sync_at IS NULL OR next_sync_at <= now())
+        ORDER BY created_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING {", ".join(COLUMNS)}
+"""
+CONFIRM = "UPDATE bookings SET booking_status = 'confirmed', next_sync_at = NULL, last_sync_error = NULL, updated_at = now() WHERE id = %s"
+RETRY = "UPDATE bookings SET next_sync_at = now() + make_interval(secs => %s), last_sync_error = %s, updated_at = now() WHERE id = %s"
+
+
+def backend_payload(booking):
+    """A claimed row -> the backend's /bookings/create-manual body"""
+    return {
+        "customer_name": booking["customer_name"] or "Customer",
+        "customer_phone": booking["customer_phone"],
+        "pickup_location": booking["pickup_location"],
+        "dropoff_location": booking["dropoff_location"],
+        "fare_aed": int(booking["calculated_fare_aed"] or 0),
+        "vehicle_type": booking["vehicle_type"],
+        "booking_type": booking["service_type"],
+        "passengers_count": int(booking["number_of_passengers"] or 1),
+        "luggage_count": int(booking["number_of_luggage"] or 0),
+        "booking_reference": booking["booking_reference"],  # sent as Idempotency-Key too
+    }
+
+
+def backoff(attempts, base=RECONCILE_BACKOFF_SECONDS, cap=RECONCILE_BACKOFF_MAX_SECONDS):
+    """Seconds until a booking that has failed `attempts` times is tried again"""
+    delay = min(cap, base * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)  # instances that failed together don't retry together
+
+
+class Reconciler:
+    """One background thread claiming and pushing pending bookings"""
+
+    def __init__(self, connect, release, push, interval=RECONCILE_INTERVAL_SECONDS, batch_size=RECONCILE_BATCH_SIZE,
+                 lease_seconds=RECONCILE_LEASE_SECONDS, enabled=RECONCILE_ENABLED, name="reconciler"):
+        self.connect = connect  # () -> DB connection
+        self.release = release  # (conn) -> None
+        self.push = push  # (payload) -> bool
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.lease_seconds = lease_seconds
+        self.enabled = enabled
+        self.name = name
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def claim(self, conn):
+        with tracing.span("reconcile_claim", "postgres"):
+            cur = conn.cursor()
+            cur.execute(CLAIM, (self.lease_seconds, self.batch_size))
+            rows = cur.fetchall()
+            conn.commit()
+        # RealDictCursor rows, or tuples from the legacy pool
+        return [dict(row) if isinstance(row, dict) else dict(zip(COLUMNS, row)) for row in rows]
+
+    def settle(self, conn, booking, ok, error=None):
+        cur = conn.cursor()
+        if ok:
+            cur.execute(CONFIRM, (booking["id"],))
+        else:
+            cur.execute(RETRY, (backoff(booking["sync_attempts"] or 1), (error or "backend rejected the booking")[:500], booking["id"]))
+        conn.commit()
+
+    def run_once(self):
+        """One pass: claim a batch, push each, record the outcome; returns how many were claimed"""
+        try:
+            conn = self.connect()
+        except Exception as e:
+            self._count("errors")
+            logging.error("❌ Reconcile pass skipped, no DB connection: %s", e)
+            return 0
+        if not conn: return 0
+        try:
+            batch = self.claim(conn)
+            for booking in batch:
+                error = None
+                try:
+                    with tracing.span("reconcile_push", "backend"):
+                        ok = bool(self.push(backend_payload(booking)))
+                except Exception as e:
+                    ok, error = False, str(e)
+                self.settle(conn, booking, ok, error)
+                self._count("synced" if ok else "failed")
+                if ok: logging.info("[SYNC] ✅ Synced booking %s to backend", booking['id'])
+                else: logging.warning("[SYNC] ❌ Failed to sync booking %s to backend: %s", booking['id'], error)
+            self._count("passes")
+            return len(batch)
+        except Exception as e:
+            conn.rollback()
+            self._count("errors")
+            logging.error("❌ Reconcile pass failed: %s", e)
+            return 0
+        finally:
+            self.release(conn)
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            while self.run_once() >= self.batch_size and not self.stop_event.is_set():
+                pass  # a full batch: there's probably more waiting
+
+    def start(self):
+        """Start the thread once per process (no-op when disabled or already running)"""
+        with self.lock:
+            if not self.enabled or self.thread: return False
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self.thread.start()
+        logging.info("[SYNC] ✅ Booking reconciler started (every %.0fs, batches of %s)", self.interval, self.batch_size)
+        return True
+
+    def stop(self, timeout=10.0):
+        self.stop_event.set()
+        thread, self.thread = self.thread, None
+        if thread: thread.join(timeout)
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, running=bool(self.thread))
@@ -0,0 +1,92 @@
+# ✅ CALL SETUP STATE - the greeting never waits on Postgres
+#
+# /select-language used to open a fresh connection and upsert the opening
+# history before it returned the greeting, so the first thing the caller heard
+# waited on a connect + TLS + auth handshake and a commit. Now the initial
+# state is kept here and written by a background thread; the greeting goes
+# out at once.
+#
+# The write is an INSERT ... ON CONFLICT DO NOTHING, so if a turn saves first
+# (another worker, a slow database) the setup row never overwrites it. The
+# first turn served by this worker takes the in-memory copy and skips the read;
+# a turn on another worker reads the row as before - written long before the
+# caller has finished saying their name.
+#
+#   CALL_SETUP_WRITERS      background writer threads (default 2)
+#   CALL_SETUP_TTL_SECONDS  untaken entries are dropped after this (300)
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import tracing
+
+CALL_SETUP_WRITERS = int(os.getenv("CALL_SETUP_WRITERS", "2"))
+CALL_SETUP_TTL_SECONDS = float(os.getenv("CALL_SETUP_TTL_SECONDS", "300"))
+
+
+class CallStates:
+    """Initial call states held in memory until the first turn, persisted behind the reply"""
+
+    def __init__(self, writers=CALL_SETUP_WRITERS, ttl=CALL_SETUP_TTL_SECONDS, name="call_setup"):
+        self.name = name
+        self.ttl = ttl
+        self.pool = ThreadPoolExecutor(max_workers=max(1, writers), thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.entries = {}  # call_sid -> (state as JSON, opened)
+        self.running = set()
+        self.stats = {"opened": 0, "taken": 0, "written": 0, "failed": 0, "expired": 0}
+
+    def _prune(self, now):
+        for call_sid, (_, opened) in list(self.entries.items()):
+            if now - opened > self.ttl:
+                del self.entries[call_sid]
+                self.stats["expired"] += 1
+
+    def open(self, call_sid, state, write):
+        """Keep state for call_sid and run write(call_sid, state) in the background"""
+        now = time.monotonic()
+        with self.lock:
+            self._prune(now)
+            if call_sid: self.entries[call_sid] = (json.dumps(state), now)
+            self.stats["opened"] += 1
+            future = self.pool.submit(self._write, write, call_sid, state)
+            self.running.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self.lock:
+            self.running.discard(future)
+
+    def _write(self, write, call_sid, state):
+        with tracing.span(self.name, call_sid=call_sid):
+            try:
+                write(call_sid, state)
+                self._count("written")
+            except Exception as e:
+                self._count("failed")
+                logging.error("❌ Call setup write failed for %s: %s", call_sid, e)
+
+    def take(self, call_sid):
+        """A fresh copy of the state opened on this worker, once; None otherwise"""
+        with self.lock:
+            entry = self.entries.pop(call_sid, None)
+            if entry: self.stats["taken"] += 1
+        return json.loads(entry[0]) if entry else None
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def drain(self, timeout=30.0):
+        """Wait for every pending write (tests, shutdown)"""
+        with self.lock:
+            futures = list(self.running)
+        return not wait(futures, timeout=timeout).not_done
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, calls=len(self.entries), writing=len(self.running))
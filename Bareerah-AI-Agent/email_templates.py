@@ -0,0 +1,107 @@
+# ✅ EMAIL TEMPLATES - booking emails compiled once, rendered per booking
+#
+# The finalize turn used to build a ~200-line HTML email (CSS and all) in one
+# f-string on the request path, with customer-provided values (name, address,
+# transcript) pasted in raw and whole sections repeated; the legacy app had
+# its own copy of the same layout. Now the layout, the shared sections
+# (_parts.html macros) and each email live in templates/email/, Jinja2
+# compiles them to Python once at import, and a render is a function call
+# over a BookingEmail record:
+#   - HTML output is autoescaped - "<b>Ali</b>" in a name arrives as text
+#   - every email has a plain-text twin (<name>.txt) for the text/plain part
+#   - python bench_email.py measures render time and output size
+import os
+from datetime import datetime
+from collections import namedtuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+import tracing
+
+TEMPLATE_DIR = os.getenv("EMAIL_TEMPLATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "email"))
+EMAILS = ("booking_admin", "booking_status", "follow_up_digest")
+
+BookingEmail = namedtuple("BookingEmail", [
+    "reference", "status", "recipient",
+    "pickup", "dropoff", "pickup_time",
+    "vehicle_type", "car_model", "car_color",
+    "passengers", "luggage", "distance_km", "fare",
+    "customer_name", "phone", "email", "notes",
+    "driver_name", "driver_number",
+    "transcript",  # ((role, text), ...)
+    "transcript_url",  # link to /transcripts/<id> instead of the text
+    "timestamp",   # None -> now, at render time
+], defaults=(
+    "BOOK-XXXX", "New Booking Received", "Admin",
+    "N/A", "N/A", "TBD",
+    "N/A", "Pending", "N/A",
+    "N/A", "N/A", "N/A", "N/A",
+    "Not Provided", "N/A", "N/A", "",
+    "Pending Assignment", "N/A",
+    (), "",
+    None,
+))
+
+# notify_dispatcher's batched low-priority alerts; items are BookingEmail records
+Digest = namedtuple("Digest", "reference status recipient items timestamp",
+                    defaults=("Follow-ups", "Follow-ups", "Team", (), None))
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html"]),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,  # compiled once; never stat the files again
+)
+
+# Compile everything at import so a bad template fails the deploy, not a booking
+TEMPLATES = {(name, kind): env.get_template(f"{name}.{kind}") for name in EMAILS for kind in ("html", "txt")}
+_sizes = {}
+
+
+def from_booking(booking_data, status_message):
+    """booking_data (backend field names, as the legacy app builds it) -> BookingEmail"""
+    def val(key, default='N/A'):
+        return booking_data.get(key, default) or default
+    return BookingEmail(
+        reference=val('booking_reference', 'BOOK-XXXX'), status=status_message,
+        recipient=val('customer_name', 'Customer'),
+        pickup=val('pickup_location'), dropoff=val('dropoff_location'), pickup_time=val('datetime', 'TBD'),
+        vehicle_type=val('vehicle_type'), car_model=val('car_model', 'Pending'), car_color=val('car_color'),
+        passengers=val('passengers_count'), luggage=val('luggage_count'),
+        fare=booking_data.get('calculated_fare_aed', booking_data.get('fare', 'N/A')) or 'N/A',
+        customer_name=val('customer_name', 'Customer'), phone=val('customer_phone'), email=val('customer_email'),
+        notes=val('notes', '') or val('issue', ''),  # dropped-call alerts carry what happened in "issue"
+        driver_name=val('driver_name', 'Assigning...'), driver_number=val('driver_number'))
+
+
+def transcript(history):
+    """Chat history ([{"role", "content"}]) -> the record's transcript field"""
+    return tuple((m.get("role", ""), m.get("content", "")) for m in history or ())
+
+
+def _stamped(record):
+    if record.timestamp is None:
+        return record._replace(timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    return record
+
+
+def render(name, record, kind="html"):
+    """One email as a string; kind is "html" or "txt" """
+    out = TEMPLATES[(name, kind)].render(b=_stamped(record))
+    _sizes[(name, kind)] = len(out)
+    return out
+
+
+def render_both(name, record):
+    """(html, text) for the same record and timestamp"""
+    record = _stamped(record)
+    return render(name, record, "html"), render(name, record, "txt")
+
+
+def snapshot():
+    return {"templates": len(TEMPLATES), "last_bytes": {f"{n}.{k}": v for (n, k), v in _sizes.items()}}
+
+
+tracing.register_gauge("email_templates", snapshot)
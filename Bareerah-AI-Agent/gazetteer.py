@@ -0,0 +1,205 @@
+# ✅ GAZETTEER - offline Dubai landmark lookup (no LLM, no Places call)
+#
+# The legacy app sent every pickup through gpt-3.5 (extract_pickup_location_llm)
+# and then Google Places, with a 120-entry POPULAR_DUBAI_LOCATIONS dict rebuilt
+# inside validate_pickup_with_places_api on every call. Here the places live in
+# a data file (data/dubai_locations.csv: name, lat, lng, "|"-separated aliases
+# incl. Urdu/Arabic spellings) loaded once, and lookup() tries, cheapest first:
+#   1. exact     - the whole text is an alias (dict)
+#   2. contains  - aliases inside a sentence ("pick me from dubai mall please"),
+#                  longest wins; one trie-shaped regex via lexicon.Lexicon
+#   3. trigram   - misspelt names ("marena mall", "burj khalifaa"): an inverted
+#                  trigram index gives candidates, Dice similarity ranks them
+#   4. edit      - short names trigrams can't help with ("jbx", "deiraa"): a
+#                  BK-tree finds aliases within a small Levenshtein distance
+# A contained alias loses to a whole-text fuzzy match that explains more of the
+# text ("palm jumeira" is Palm Jumeirah, not Jumeirah).
+# Every step is a hash/regex/tree probe, so a lookup stays well under a
+# millisecond and grows with the size of the query, not of the file.
+import os
+import csv
+import logging
+import threading
+from collections import Counter, namedtuple
+
+import lexicon
+import tracing
+
+DATA_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dubai_locations.csv"))
+MIN_TRIGRAM_SCORE = 0.6
+MAX_EDIT_QUERY = 12  # longer texts have enough trigrams; the BK-tree only helps short names
+STOP_WORDS = {"the", "a", "an", "and", "or", "in", "at", "to", "from", "for", "by", "near", "please"}
+
+Place = namedtuple("Place", "name lat lng aliases")
+Match = namedtuple("Match", "place alias score method")
+
+
+def levenshtein(a, b):
+    """Edit distance; shared prefix/suffix trimmed first (names often differ in one spot)"""
+    if a == b: return 0
+    while a and b and a[0] == b[0]: a, b = a[1:], b[1:]
+    while a and b and a[-1] == b[-1]: a, b = a[:-1], b[:-1]
+    if len(a) < len(b): a, b = b, a
+    if not b: return len(a)
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur, left, diag = [i], i, i - 1
+        for j, cb in enumerate(b):
+            up = prev[j + 1]
+            cost = diag if ca == cb else diag + 1
+            if up + 1 < cost: cost = up + 1
+            if left + 1 < cost: cost = left + 1
+            cur.append(cost)
+            left, diag = cost, up
+        prev = cur
+    return prev[-1]
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def clean(text):
+    """Normalised words without stop words ("to the Dubai Mall!" -> "dubai mall")"""
+    return " ".join(w for w in lexicon.tokens(text) if w not in STOP_WORDS)
+
+
+class BKTree:
+    """Metric tree over strings: query(word, d) visits only subtrees whose edge
+    distance is within d of the query's distance to the node"""
+
+    def __init__(self, words=()):
+        self.root = None
+        for w in words: self.add(w)
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+        node = self.root
+        while True:
+            d = levenshtein(word, node[0])
+            if d == 0: return
+            if d not in node[1]:
+                node[1][d] = (word, {})
+                return
+            node = node[1][d]
+
+    def query(self, word, max_dist):
+        """[(distance, word)] within max_dist, closest first"""
+        found, stack = [], [self.root] if self.root else []
+        while stack:
+            term, children = stack.pop()
+            d = levenshtein(word, term)
+            if d <= max_dist: found.append((d, term))
+            stack.extend(child for edge, child in children.items() if d - max_dist <= edge <= d + max_dist)
+        return sorted(found)
+
+
+class Gazetteer:
+    def __init__(self, places):
+        self.places = list(places)
+        self.by_alias = {}
+        for place in self.places:
+            for alias in (place.name,) + tuple(place.aliases):
+                key = clean(alias)
+                if key: self.by_alias.setdefault(key, place)
+        self.lexicon = lexicon.Lexicon(self.by_alias)
+        self.index, self.sizes = {}, {}
+        for alias in self.by_alias:
+            grams = trigrams(alias)
+            self.sizes[alias] = len(grams)
+            for gram in grams:
+                self.index.setdefault(gram, []).append(alias)
+        # only names a short query can be within edit distance 2 of
+        self.tree = BKTree(a for a in self.by_alias if len(a) <= MAX_EDIT_QUERY + 2)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.places)
+
+    def _count(self, method):
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats[method] += 1
+
+    def find_all(self, text):
+        """Every known place named inside text, longest alias per span, in order"""
+        out = []
+        for _, alias in self.lexicon.find(clean(text)):
+            key = " ".join(alias.split())
+            out.append(Match(self.by_alias[key], key, 1.0, "contains"))
+        return out
+
+    def fuzzy(self, text):
+        """Closest alias to the whole text by trigram Dice score, then edit distance"""
+        query = clean(text)
+        if not query: return None
+        grams = trigrams(query)
+        shared = Counter(alias for g in grams for alias in self.index.get(g, ()))
+        best = None
+        for alias, common in shared.most_common(20):
+            score = 2 * common / (len(grams) + self.sizes[alias])
+            if score >= MIN_TRIGRAM_SCORE and (not best or score > best.score):
+                best = Match(self.by_alias[alias], alias, round(score, 3), "trigram")
+        if best:
+            # only part of a name ("dubai", "city") that several places share is no answer
+            words = set(query.split())
+            places = {self.by_alias[a] for a in shared if words <= set(a.split())}
+            return None if len(places) > 1 else best
+        if len(query) > MAX_EDIT_QUERY: return None
+        hits = self.tree.query(query, 1 if len(query) <= 5 else 2)
+        if hits:
+            d, alias = hits[0]
+            return Match(self.by_alias[alias], alias, round(1 - d / max(len(query), len(alias)), 3), "edit")
+        return None
+
+    def lookup(self, text, contained=True):
+        """Best Match for a location text, or None.
+        contained=False skips step 2 - for full addresses where a landmark inside
+        ("Tower 5, Dubai Marina") shouldn't replace the exact spot."""
+        query = clean(text)
+        if not query: return None
+        place = self.by_alias.get(query)
+        if place:
+            self._count("exact")
+            return Match(place, query, 1.0, "exact")
+        match = self.fuzzy(query)
+        if contained:
+            found = self.find_all(query)
+            if found:
+                inside = max(found, key=lambda m: len(m.alias))
+                if not (match and match.score >= 0.75 and len(match.alias) > len(inside.alias)):
+                    match = inside
+        self._count(match.method if match else "miss")
+        return match
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, places=len(self.places), aliases=len(self.by_alias))
+
+
+def load(path=DATA_PATH):
+    places = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            aliases = tuple(a.strip() for a in (row.get("aliases") or "").split("|") if a.strip())
+            places.append(Place(row["name"].strip(), float(row["lat"]), float(row["lng"]), aliases))
+    logging.info("🗺️ Gazetteer loaded: %s places from %s", len(places), os.path.basename(path))
+    return Gazetteer(places)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+def default():
+    """The shared gazetteer from DATA_PATH, loaded on first use"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = load()
+                tracing.register_gauge("gazetteer", _default.snapshot)
+    return _default
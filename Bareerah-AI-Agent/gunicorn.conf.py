@@ -0,0 +1,35 @@
+# ✅ GUNICORN HOOKS - picked up from the working directory by `gunicorn main:app` (Procfile)
+#
+# Workers, bind and timeouts stay on gunicorn's defaults / environment
+# (WEB_CONCURRENCY, PORT); this file only wires the app's lifecycle.py:
+#   on_starting       master, once, before any worker forks: schema migrations
+#   when_ready        master, with GUNICORN_PRELOAD=true: imports and caches
+#                     the workers then share instead of each paying for them
+#   post_worker_init  every worker, after it loaded the app: warmups
+#   worker_exit       every worker: stop its background threads
+import os
+
+import lifecycle
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"  # --preload on the command line works too
+
+
+def on_starting(server):
+    try:
+        if lifecycle.migrate_database():
+            server.log.info("Schema migrated by the master")
+    except Exception as e:
+        server.log.error("Schema migration failed in the master, the workers will retry: %s", e)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        lifecycle.preload_all()
+
+
+def post_worker_init(worker):
+    lifecycle.start_all()
+
+
+def worker_exit(server, worker):
+    lifecycle.stop_all()
@@ -0,0 +1,130 @@
+# ✅ LAZY VENDORS - heavy SDKs imported on first use, not at boot
+#
+# `import main` took about a second, and three quarters of it was the openai
+# package (its pydantic types, its vendored aiohttp) - paid by every cold
+# worker before it could answer its first call, plus OpenAI() clients built at
+# import. twilio.rest is another ~0.1s the voice path never needs.
+# (startup_profile.py measures this.) Instead of
+#     from openai import OpenAI
+#     client = OpenAI(api_key=KEY)
+# the apps write
+#     OpenAI = lazy_vendors.attr("openai", "OpenAI")
+#     client = lazy_vendors.client(lambda: OpenAI(api_key=KEY), "openai")
+# and nothing is imported or built until the first attribute access / call.
+# Everything behaves like the real object after that, and a test can still
+# patch the module attribute (vendor_stubs does).
+#
+# preload() imports every registered module up front: the lifecycle's preload
+# step calls it, so under `gunicorn --preload` (GUNICORN_PRELOAD=true) the
+# master pays the imports once and forked workers share them copy-on-write.
+# Clients are never built by preload() - their connection pools belong to the
+# worker that uses them.
+import sys
+import time
+import logging
+import threading
+
+_lock = threading.RLock()
+_modules = {}  # name -> LazyModule
+_import_ms = {}  # name -> how long the real import took
+
+
+def _load(name):
+    with _lock:
+        mod = sys.modules.get(name)
+        if mod is None:
+            started = time.perf_counter()
+            __import__(name)  # the import statement's path, so `-X importtime` still reports it
+            mod = sys.modules[name]
+            _import_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+            logging.info("📦 Imported %s on first use (%sms)", name, _import_ms[name])
+        return mod
+
+
+class LazyModule:
+    """Stands in for a module until an attribute is needed"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _resolve(self):
+        if self._module is None:
+            self._module = _load(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name} ({'loaded' if self._module else 'not loaded'})>"
+
+
+class LazyAttr:
+    """`from module import name`, resolved when it's first called or touched"""
+
+    def __init__(self, module, name):
+        self._module = module
+        self._name = name
+
+    def _resolve(self):
+        return getattr(self._module._resolve(), self._name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+
+class LazyClient:
+    """A client built by factory() on first use, once, even with threads racing for it"""
+
+    def __init__(self, factory, name):
+        self._factory = factory
+        self._name = name
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f"<lazy client {self._name} ({'built' if self._client is not None else 'not built'})>"
+
+
+def module(name):
+    with _lock:
+        if name not in _modules:
+            _modules[name] = LazyModule(name)
+        return _modules[name]
+
+
+def attr(module_name, name):
+    return LazyAttr(module(module_name), name)
+
+
+def client(factory, name="client"):
+    return LazyClient(factory, name)
+
+
+def preload():
+    """Import every registered SDK now (gunicorn --preload master, worker warmup)"""
+    for mod in list(_modules.values()):
+        try:
+            mod._resolve()
+        except ImportError as e:
+            logging.error("❌ Preload of %s failed: %s", mod._name, e)
+
+
+def snapshot():
+    with _lock:
+        return {name: {"loaded": mod._module is not None, "import_ms": _import_ms.get(name)}
+                for name, mod in _modules.items()}
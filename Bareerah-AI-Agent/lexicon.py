@@ -0,0 +1,179 @@
+# ✅ LEXICON - word lists compiled once, language detection by script + keywords
+#
+# The word lists (YES_WORDS, GREETINGS_*, CORRECTION_KEYWORDS_*, language
+# keywords) used to be scanned with `kw in text_lower` on every call: O(words)
+# per check and substring hits inside other words ("ok" in "book" was a yes,
+# "no" in "know" a no). A Lexicon compiles a list once into
+#   * one regex shaped as a character trie over every word and phrase
+#     ("go ahead", "baad mein"), anchored on word boundaries - a single
+#     left-to-right pass per utterance however long the list is
+#   * frozensets of its words, for token-level checks
+# Text is normalised the same way on both sides: lowercase, curly quotes
+# straightened, Arabic harakat/tatweel removed ("حسناً" == "حسنا").
+#
+# LanguageDetector scores en/ur/ar per utterance:
+#   1. Script first: Arabic-script letters vs Latin. Urdu and Arabic share the
+#      script but not every letter (ٹ ڈ ڑ ں ے ہ ک ی are Urdu, ك ي ة Arabic), so
+#      a sentence in Arabic script is usually decided here without any lookup.
+#   2. Otherwise (Latin / romanised speech) keyword hits per language. A word
+#      listed under more than one language ("dubai") is evidence for none.
+#   3. A small prior for the language the conversation is already in.
+# Evidence is summed per language and softmaxed, so scores are probabilities
+# that sum to 1; weights are set so one distinctive keyword in an otherwise
+# neutral sentence gives ~0.75 and a full Arabic-script sentence > 0.95.
+import re
+import math
+
+_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")  # harakat, tatweel
+_TOKEN = re.compile(r"[\w']+")
+_QUOTES = str.maketrans({"’": "'", "‘": "'"})
+
+URDU_LETTERS = frozenset("ٹڈڑںےۓہۂھکگیچپژ")
+ARABIC_LETTERS = frozenset("كيىة")
+
+# Romanised markers (what Whisper/Twilio produce when the speaker mixes languages)
+ENGLISH_MARKERS = {"i", "my", "the", "to", "from", "please", "need", "want", "is", "am", "a", "at",
+                   "pick", "me", "going", "would", "like", "can", "you", "book", "car", "today", "tomorrow"}
+ROMAN_URDU_MARKERS = {"hai", "hain", "hoon", "mera", "meri", "mein", "mujhe", "aap", "kya", "chahiye",
+                      "jana", "jaana", "karo", "kar", "nahi", "nahin", "haan", "theek", "acha", "bilkul",
+                      "sahab", "malik", "kal", "aaj", "se", "tak", "wala", "wali", "shukriya", "bhai"}
+ROMAN_ARABIC_MARKERS = {"yalla", "habibi", "shukran", "inshallah", "mashallah", "marhaba", "ahlan", "wallah",
+                        "khalas", "tayeb", "tayyib", "aiwa", "sahih", "ahal", "masr", "min fadlak", "hawaya"}
+
+SCRIPT_WEIGHT = 4.0
+KEYWORD_WEIGHT = 1.2
+PRIOR_WEIGHT = 0.3
+DECISIVE_SCRIPT_RATIO = 0.6
+
+
+def normalize(text):
+    """Lowercase; for non-ASCII text also straighten quotes and drop harakat/tatweel"""
+    text = (text or "").lower()
+    if not text.isascii():
+        text = _MARKS.sub("", text.translate(_QUOTES))
+    return text
+
+
+def tokens(text):
+    return _TOKEN.findall(normalize(text))
+
+
+def _trie_pattern(entries):
+    """One regex for a set of literals, shaped as a character trie so the engine
+    follows a single branch per position instead of trying every entry"""
+    trie = {}
+    for entry in entries:
+        node = trie
+        for ch in entry:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        end = node.get("") is True
+        branches = [(r"\s+" if ch == " " else re.escape(ch)) + build(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches: return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end: body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class Lexicon:
+    """A word list compiled for whole-word matching: single words in a hash set,
+    everything (words and phrases) in one trie-shaped regex"""
+
+    def __init__(self, *word_lists):
+        entries = {" ".join(normalize(w).split()) for words in word_lists for w in words if w}
+        entries.discard("")
+        self.entries = frozenset(entries)
+        self.words = frozenset(e for e in entries if _TOKEN.fullmatch(e))
+        self.vocabulary = frozenset(t for e in entries for t in _TOKEN.findall(e))  # words inside phrases too
+        self.pattern = re.compile(rf"(?<![\w'])(?:{_trie_pattern(entries)})(?![\w'])") if entries else None
+
+    def __contains__(self, text):
+        """The whole text is one entry"""
+        return " ".join(normalize(text).split()) in self.entries
+
+    def find(self, text):
+        """(position, term) for every match, in order of appearance"""
+        if not self.pattern: return []
+        return [(m.start(), m.group()) for m in self.pattern.finditer(normalize(text))]
+
+    def first(self, text):
+        """Position of the earliest match, or None"""
+        m = self.pattern.search(normalize(text)) if self.pattern else None
+        return m.start() if m else None
+
+    def search(self, text):
+        return self.first(text) is not None
+
+    def count(self, text):
+        return len(self.find(text))
+
+
+def script_profile(text):
+    """Letter counts by script, plus Arabic-script words that are clearly Urdu / clearly Arabic"""
+    profile = {"letters": 0, "arabic": 0, "latin": 0, "urdu_words": 0, "arabic_words": 0}
+    for word in tokens(text):
+        arabic_script = False
+        for ch in word:
+            if not ch.isalpha(): continue
+            profile["letters"] += 1
+            if "\u0600" <= ch <= "\u06ff" or "\u0750" <= ch <= "\u077f" or "\ufb50" <= ch <= "\ufeff":
+                profile["arabic"] += 1
+                arabic_script = True
+            elif ch.isascii() or "\u00c0" <= ch <= "\u024f":
+                profile["latin"] += 1
+        if arabic_script:
+            if URDU_LETTERS.intersection(word): profile["urdu_words"] += 1
+            elif ARABIC_LETTERS.intersection(word): profile["arabic_words"] += 1
+    return profile
+
+
+def softmax(logits):
+    top = max(logits.values())
+    exp = {k: math.exp(v - top) for k, v in logits.items()}
+    total = sum(exp.values())
+    return {k: round(v / total, 4) for k, v in exp.items()}
+
+
+class LanguageDetector:
+    """Per-utterance en/ur/ar probabilities from script ratios and keyword lexicons"""
+
+    def __init__(self, keywords):
+        claimed = {}
+        for lang, words in keywords.items():
+            for w in {normalize(w) for w in words}:
+                claimed.setdefault(w, set()).add(lang)
+        # a word several languages claim tells us nothing ("dubai")
+        self.languages = list(keywords)
+        self.lexicons = {lang: Lexicon(w for w, langs in claimed.items() if langs == {lang})
+                         for lang in keywords}
+
+    def scores(self, text, current=None):
+        logits = {lang: 0.0 for lang in self.languages}
+        if current in logits: logits[current] += PRIOR_WEIGHT
+        profile = script_profile(text) if not text.isascii() else {"letters": 0}
+        if profile["letters"]:
+            arabic_ratio = profile["arabic"] / profile["letters"]
+            if arabic_ratio and ("ur" in logits or "ar" in logits):
+                marked = profile["urdu_words"] + profile["arabic_words"]
+                # unmarked Arabic-script words count for both, slightly favouring Arabic
+                ur_share = profile["urdu_words"] / marked if marked else 0.45
+                logits["ur"] = logits.get("ur", 0) + SCRIPT_WEIGHT * arabic_ratio * ur_share
+                logits["ar"] = logits.get("ar", 0) + SCRIPT_WEIGHT * arabic_ratio * (1 - ur_share)
+                if arabic_ratio >= DECISIVE_SCRIPT_RATIO and marked:
+                    return softmax(logits)  # script alone decides
+        for lang, lex in self.lexicons.items():
+            hits = lex.count(text)
+            if hits: logits[lang] += KEYWORD_WEIGHT * (1 + math.log(hits))
+        return softmax(logits)
+
+    def detect(self, text, current="en", min_score=0.6):
+        """Most likely language, or current when no language is clearly ahead"""
+        if not text or not text.strip(): return current
+        scores = self.scores(text, current)
+        best = max(scores, key=scores.get)
+        return best if scores[best] >= min_score else current
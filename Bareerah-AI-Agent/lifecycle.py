@@ -0,0 +1,183 @@
+# ✅ LIFECYCLE - one-time schema setup, per-worker warmup, health probes
+#
+# main.py ran init_tables() at import, so every gunicorn worker ran the schema
+# migrations while booting, and the legacy app's @app.before_request init_app
+# started three threads (TTS prewarm, FAQ prewarm, email check) on every
+# single request. Startup now has phases:
+#   * schema - once, by a leader. Under gunicorn that's the master, in the
+#     on_starting hook (gunicorn.conf.py), before any worker forks; it marks
+#     the environment so the workers skip it. Anywhere else (python main.py,
+#     uvicorn, a second instance) start() runs it - migrations.migrate takes
+#     an advisory lock, so the others wait and find nothing left to do
+#   * preload - steps registered with on_preload() that only fill memory (SDK
+#     imports, indexes, caches): no threads, no sockets. Under gunicorn
+#     --preload the master runs them (when_ready) and the workers inherit the
+#     result copy-on-write; otherwise each worker runs them first thing
+#   * worker - the steps registered with on_worker(), run once per process in
+#     one background thread: post_worker_init under gunicorn, lifespan
+#     startup under uvicorn, __main__ otherwise. Threads don't survive a
+#     fork, so "once" means once per pid
+#   * probes - liveness() for /healthz (the process answers), readiness() for
+#     /readyz: 503 until the schema is in place and the warmups have run, and
+#     while any registered check() fails. A failed schema step is retried by
+#     the probe, at most every LIFECYCLE_RETRY_SECONDS
+#
+#   LIFECYCLE_RETRY_SECONDS  pause before a failed schema step is retried (30)
+import os
+import time
+import logging
+import threading
+
+import migrations
+
+LIFECYCLE_RETRY_SECONDS = float(os.getenv("LIFECYCLE_RETRY_SECONDS", "30"))
+SCHEMA_MARKER = "LIFECYCLE_SCHEMA_MIGRATED"  # set by the gunicorn master, inherited by its workers
+
+_lifecycles = []
+
+
+def migrate_database(database_url=None):
+    """The leader's schema step: migrate DATABASE_URL and tell forked workers it's done"""
+    database_url = database_url or os.getenv("DATABASE_URL")
+    if not database_url: return False
+    import psycopg2
+    conn = psycopg2.connect(database_url)
+    try:
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+    os.environ[SCHEMA_MARKER] = str(os.getpid())
+    return True
+
+
+def preload_all():
+    """gunicorn when_ready with --preload: the master fills memory the workers will share"""
+    for lc in _lifecycles: lc.preload()
+
+
+def start_all():
+    """gunicorn post_worker_init: start every app loaded in this worker"""
+    for lc in _lifecycles: lc.start()
+
+
+def stop_all():
+    for lc in _lifecycles: lc.stop()
+
+
+class Lifecycle:
+    """Startup phases and health probes for one app"""
+
+    def __init__(self, name, schema=None, retry_seconds=LIFECYCLE_RETRY_SECONDS):
+        self.name = name
+        self.schema = schema  # () -> True when migrated, False with no database; raises on failure
+        self.retry_seconds = retry_seconds
+        self.preloads = []  # (name, fn) - fork-safe, run once
+        self.warmups = []  # (name, fn) - run in every worker
+        self.stops = []
+        self.checks = {}  # name -> () -> bool
+        self.lock = threading.Lock()
+        self.schema_state = "pending"  # pending | leader | migrated | skipped | failed
+        self.schema_error = None
+        self.schema_tried_at = 0.0
+        self.preloaded = False
+        self.pid = None  # the process whose warmups ran
+        self.warm = {}
+        self.warm_done = False
+        self.started_at = time.time()
+        _lifecycles.append(self)
+
+    def on_preload(self, fn, name=None):
+        """Run fn once, before the fork when the app is preloaded; it must not start threads or open sockets"""
+        self.preloads.append((name or fn.__name__, fn))
+        return fn
+
+    def on_worker(self, fn, name=None, stop=None):
+        """Run fn once in every worker process; stop() on shutdown"""
+        self.warmups.append((name or fn.__name__, fn))
+        if stop: self.stops.append(stop)
+        return fn
+
+    def check(self, name, fn):
+        """An extra readiness condition for /readyz"""
+        self.checks[name] = fn
+
+    def ensure_schema(self):
+        with self.lock:
+            if self.schema_state in ("leader", "migrated", "skipped"): return True
+            if os.getenv(SCHEMA_MARKER):
+                self.schema_state = "leader"
+                return True
+            if self.schema_state == "failed" and time.time() - self.schema_tried_at < self.retry_seconds:
+                return False
+            self.schema_tried_at = time.time()
+            try:
+                done = self.schema() if self.schema else False
+                self.schema_state, self.schema_error = ("migrated" if done else "skipped"), None
+            except Exception as e:
+                self.schema_state, self.schema_error = "failed", str(e)
+                logging.error("❌ %s: schema setup failed, /readyz will retry: %s", self.name, e)
+                return False
+        logging.info("[LIFECYCLE] ✅ %s schema %s", self.name, self.schema_state)
+        return True
+
+    def start(self):
+        """Schema (unless the leader did it), then this process's warmups; once per process"""
+        with self.lock:
+            if self.pid == os.getpid(): return False
+            self.pid, self.warm_done = os.getpid(), False
+        self.ensure_schema()
+        threading.Thread(target=self._warm_up, name=f"{self.name}-warmup", daemon=True).start()
+        return True
+
+    def _run(self, name, fn):
+        try:
+            fn()
+            self.warm[name] = "ok"
+        except Exception as e:
+            self.warm[name] = f"failed: {e}"  # best effort - a cold cache isn't a reason to refuse traffic
+            logging.error("❌ %s: warmup %s failed: %s", self.name, name, e)
+
+    def preload(self):
+        with self.lock:
+            if self.preloaded: return False
+            self.preloaded = True
+        started = time.time()
+        for name, fn in self.preloads:
+            self._run(name, fn)
+        logging.info("[LIFECYCLE] ✅ %s preloaded in %.2fs (pid %s)", self.name, time.time() - started, os.getpid())
+        return True
+
+    def _warm_up(self):
+        self.preload()  # a no-op in workers forked from a preloaded master
+        for name, fn in self.warmups:
+            self._run(name, fn)
+        self.warm_done = True
+        logging.info("[LIFECYCLE] ✅ %s worker %s warm (%s steps)", self.name, os.getpid(), len(self.warmups))
+
+    def stop(self):
+        for fn in self.stops:
+            try: fn()
+            except Exception as e: logging.error("❌ %s: stop failed: %s", self.name, e)
+
+    def liveness(self):
+        return {"status": "ok", "app": self.name, "pid": os.getpid(), "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    def readiness(self):
+        """(ready, checks) - ready once the schema is in place and this worker is warm"""
+        if self.schema_state == "failed": self.ensure_schema()
+        started = self.pid == os.getpid()
+        checks = {
+            "schema": f"failed: {self.schema_error}" if self.schema_state == "failed" else self.schema_state,
+            "worker": "warm" if started and self.warm_done else "warming" if started else "not started",
+        }
+        ready = self.schema_state not in ("pending", "failed") and started and self.warm_done
+        for name, fn in self.checks.items():
+            try: passed = bool(fn())
+            except Exception: passed = False
+            checks[name] = "ok" if passed else "failing"
+            ready = ready and passed
+        return ready, checks
+
+    def snapshot(self):
+        return {"schema": self.schema_state, "preloaded": self.preloaded, "pid": self.pid,
+                "warm": dict(self.warm), "warm_done": self.warm_done}
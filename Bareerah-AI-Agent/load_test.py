@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""Load generator: N concurrent Twilio call / WhatsApp flows with a concurrency ramp.
+
+By default the app runs in-process on a threaded werkzeug server with every
+vendor stubbed (vendor_stubs.py), so the numbers measure our own code plus
+simulated vendor latency. Point --url at a running instance to test a real
+deployment instead (vendors are then whatever that instance talks to).
+
+Flows:
+  voice     POST /voice -> /select-language (Digits=1) -> /handle x N (SpeechResult),
+            following hold redirects to /handle-result (main.py, asgi_app.py)
+            POST /voice -> /handle?call_sid=... x N (legacy app)
+  whatsapp  POST /whatsapp with From/Body x N (legacy app)
+
+    python load_test.py --ramp 1,2,4,8,16 --duration 20
+    python load_test.py --app legacy --mix voice=0.5,whatsapp=0.5
+    python load_test.py --app asgi --ramp 8,32,128
+    python load_test.py --url http://localhost:5000 --database-url $DATABASE_URL
+    python load_test.py --compare loadtest-abc1234.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import importlib.util
+from collections import defaultdict
+from datetime import datetime, timezone
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-loadtest")
+
+import requests
+
+import tracing
+from bench_conversations import load_conversations, HOLD_MARKER
+from vendor_stubs import VendorStubs, parse_latency_args
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEGACY_APP_FILE = os.path.join(HERE, "9 december main.py")
+TWILIO_WEBHOOK_TIMEOUT = 15.0
+
+
+# ✅ APP LOADING
+def load_app(name):
+    if name == "main":
+        import main
+        return main
+    if name == "asgi":
+        import asgi_app
+        return asgi_app
+    spec = importlib.util.spec_from_file_location("legacy_app", LEGACY_APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def start_local_server(module):
+    if module.__name__ == "asgi_app":
+        return start_uvicorn(module)
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+class _UvicornHandle:
+    def __init__(self, server, thread):
+        self.server, self.thread = server, thread
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def start_uvicorn(module):
+    import socket
+    import uvicorn
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(module.app, log_level="warning", lifespan="off", backlog=4096))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, name="loadtest-server", daemon=True)
+    thread.start()
+    while not server.started and thread.is_alive():
+        time.sleep(0.02)
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", _UvicornHandle(server, thread)
+
+
+# ✅ RECORDING
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)  # endpoint -> [ms]
+        self.errors = defaultdict(int)
+        self.timeouts = 0
+        self.flows = 0
+        self.flow_errors = 0
+
+    def record(self, endpoint, ms, ok):
+        with self.lock:
+            self.samples[endpoint].append(ms)
+            if not ok: self.errors[endpoint] += 1
+            if ms >= TWILIO_WEBHOOK_TIMEOUT * 1000: self.timeouts += 1
+
+    def flow_done(self, ok):
+        with self.lock:
+            self.flows += 1
+            if not ok: self.flow_errors += 1
+
+
+def post(session, rec, base, path, data, endpoint=None):
+    t0 = time.perf_counter()
+    try:
+        r = session.post(base + path, data=data, timeout=TWILIO_WEBHOOK_TIMEOUT)
+        ok = r.status_code < 400
+        body = r.text
+    except requests.RequestException:
+        ok, body = False, ""
+    rec.record(endpoint or path.split("?")[0], (time.perf_counter() - t0) * 1000, ok)
+    return ok, body
+
+
+def voice_flow(session, rec, base, flow_id, lines, app_kind):
+    sid = f"CALOAD{flow_id:010d}"
+    ok, _ = post(session, rec, base, "/voice", {"CallSid": sid})
+    if app_kind != "legacy":
+        ok &= post(session, rec, base, "/select-language", {"CallSid": sid, "Digits": "1"})[0]
+    for speech in lines:
+        if app_kind != "legacy":
+            t0 = time.perf_counter()
+            good, body = post(session, rec, base, "/handle", {"CallSid": sid, "SpeechResult": speech, "From": "+971500000001"})
+            polls = 0
+            while good and HOLD_MARKER in body and polls < 30:
+                polls += 1
+                good, body = post(session, rec, base, "/handle-result", {"CallSid": sid})
+            # Caller-perceived turn time including hold polls
+            rec.record("voice.turn", (time.perf_counter() - t0) * 1000, good)
+        else:
+            good, body = post(session, rec, base, f"/handle?call_sid={sid}", {"SpeechResult": speech, "From": "+971500000001"})
+        ok &= good
+        if "<Hangup" in body: break
+    return ok
+
+
+def whatsapp_flow(session, rec, base, flow_id, lines, app_kind):
+    phone = f"whatsapp:+97155{flow_id % 10**7:07d}"
+    ok = True
+    for body in lines:
+        ok &= post(session, rec, base, "/whatsapp", {"From": phone, "Body": body})[0]
+    return ok
+
+
+FLOWS = {"voice": voice_flow, "whatsapp": whatsapp_flow}
+
+
+# ✅ DB CONNECTION SAMPLING
+class PgActivitySampler:
+    """Samples pg_stat_activity for the target database (for --url runs)"""
+
+    def __init__(self, dsn, interval=0.5):
+        import psycopg2
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")
+                    self.peak = max(self.peak, cur.fetchone()[0] - 1)  # minus our own session
+            except Exception:
+                pass
+            self.stop_event.wait(self.interval)
+
+    def start_level(self):
+        self.peak = 0
+        if not self.thread.is_alive(): self.thread.start()
+
+    def level_peak(self):
+        return self.peak
+
+    def close(self):
+        self.stop_event.set()
+        self.conn.close()
+
+
+class FakeDbSampler:
+    def __init__(self, db):
+        self.db = db
+
+    def start_level(self):
+        with self.db.lock:
+            self.db.peak_connections = self.db.open_connections
+
+    def level_peak(self):
+        return self.db.peak_connections
+
+    def close(self): pass
+
+
+# ✅ RAMP
+def run_level(base, app_kind, concurrency, duration, mix, conversations, rng_seed, db_sampler, flow_counter):
+    rec = Recorder()
+    deadline = time.monotonic() + duration
+    kinds, weights = zip(*mix.items())
+    if db_sampler: db_sampler.start_level()
+
+    def worker(idx):
+        rng = random.Random(rng_seed * 1000 + idx)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            with flow_counter["lock"]:
+                flow_counter["n"] += 1
+                flow_id = flow_counter["n"]
+            kind = rng.choices(kinds, weights)[0]
+            _, lines = rng.choice(conversations)
+            try:
+                ok = FLOWS[kind](session, rec, base, flow_id, lines, app_kind)
+            except Exception:
+                ok = False
+            rec.flow_done(ok)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - t0
+    return summarize_level(rec, concurrency, wall, db_sampler.level_peak() if db_sampler else None)
+
+
+def latency_stats(values):
+    data = sorted(values)
+    return {"n": len(data), "p50": tracing.percentile(data, 50), "p95": tracing.percentile(data, 95),
+            "p99": tracing.percentile(data, 99), "max": round(data[-1], 2) if data else None}
+
+
+def summarize_level(rec, concurrency, wall, db_peak):
+    webhooks = [ms for ep, vals in rec.samples.items() if ep != "voice.turn" for ms in vals]
+    requests_total = len(webhooks)
+    errors_total = sum(n for ep, n in rec.errors.items() if ep != "voice.turn")
+    return {
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 2),
+        "requests": requests_total,
+        "rps": round(requests_total / wall, 2) if wall else 0,
+        "flows": rec.flows,
+        "flows_per_sec": round(rec.flows / wall, 3) if wall else 0,
+        "error_rate": round(errors_total / requests_total, 4) if requests_total else 0,
+        "flow_error_rate": round(rec.flow_errors / rec.flows, 4) if rec.flows else 0,
+        "twilio_timeouts": rec.timeouts,
+        "latency_ms": latency_stats(webhooks),
+        "endpoints": {ep: dict(latency_stats(vals), errors=rec.errors.get(ep, 0)) for ep, vals in sorted(rec.samples.items())},
+        "db_connections_peak": db_peak,
+    }
+
+
+def find_saturation(levels, min_gain=0.10, error_limit=0.01, p95_factor=2.0):
+    """First level where throughput stops scaling, errors appear or p95 blows up.
+    Returns (saturated_at, max_sustainable) concurrency values."""
+    if not levels: return None, None
+    base_p95 = levels[0]["latency_ms"]["p95"] or 0
+    for prev, cur in zip(levels, levels[1:]):
+        gain = (cur["rps"] - prev["rps"]) / prev["rps"] if prev["rps"] else 0
+        p95 = cur["latency_ms"]["p95"] or 0
+        if cur["error_rate"] > error_limit or cur["twilio_timeouts"] or gain < min_gain or (base_p95 and p95 > p95_factor * base_p95):
+            return cur["concurrency"], prev["concurrency"]
+    return None, levels[-1]["concurrency"]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def print_levels(levels):
+    print(f"{'conc':>5} {'rps':>8} {'flows/s':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'turn p95':>9} {'db':>4}")
+    for lv in levels:
+        lat = lv["latency_ms"]
+        turn = lv["endpoints"].get("voice.turn", {}).get("p95")
+        print(f"{lv['concurrency']:>5} {lv['rps']:>8} {lv['flows_per_sec']:>8} {lv['error_rate'] * 100:>6.2f} "
+              f"{lat['p50'] or 0:>8.1f} {lat['p95'] or 0:>8.1f} {lat['p99'] or 0:>8.1f} {turn or 0:>9.1f} {lv['db_connections_peak'] if lv['db_connections_peak'] is not None else '-':>4}")
+
+
+def compare(old_path, new):
+    with open(old_path) as f:
+        old = json.load(f)
+    print(f"\n🔍 Compare {old.get('git_commit')} → {new.get('git_commit')}")
+    old_levels = {lv["concurrency"]: lv for lv in old.get("levels", [])}
+    for lv in new["levels"]:
+        o = old_levels.get(lv["concurrency"])
+        if not o: continue
+        d_rps = (lv["rps"] - o["rps"]) / o["rps"] * 100 if o["rps"] else 0
+        op95, np95 = o["latency_ms"]["p95"] or 0, lv["latency_ms"]["p95"] or 0
+        d_p95 = (np95 - op95) / op95 * 100 if op95 else 0
+        flag = "⚠️" if d_rps < -10 or d_p95 > 20 else "✅"
+        print(f"{flag} conc={lv['concurrency']:>3}  rps {o['rps']} → {lv['rps']} ({d_rps:+.1f}%)  p95 {op95} → {np95} ({d_p95:+.1f}%)")
+    print(f"   saturation: {old.get('saturation')} → {new.get('saturation')}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in FLOWS: raise SystemExit(f"Unknown flow: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", choices=["main", "asgi", "legacy"], default="main")
+    parser.add_argument("--url", help="test a running instance instead of an in-process server")
+    parser.add_argument("--ramp", default="1,2,4,8,16,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per level")
+    parser.add_argument("--mix", help="flow weights, e.g. voice=0.7,whatsapp=0.3")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", action="append", metavar="VENDOR=SPEC")
+    parser.add_argument("--no-latency", action="store_true")
+    parser.add_argument("--database-url", help="sample pg_stat_activity during --url runs")
+    parser.add_argument("--out", help="JSON results path (default loadtest-<commit>.json)")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix) if args.mix else ({"voice": 1.0} if args.app != "legacy" else {"voice": 0.5, "whatsapp": 0.5})
+    levels_to_run = [int(x) for x in args.ramp.split(",") if x.strip()]
+    conversations = load_conversations()
+    stubs, server, db_sampler, module = None, None, None, None
+
+    if args.url:
+        base = args.url.rstrip("/")
+        if args.database_url: db_sampler = PgActivitySampler(args.database_url)
+    else:
+        module = load_app(args.app)
+        stubs = VendorStubs(seed=args.seed, latency=parse_latency_args(args.latency), sleep=not args.no_latency)
+        # asgi_app serves /voice and friends through main.app, so stub both
+        stubs.install(*([module, sys.modules["main"]] if module.__name__ == "asgi_app" else [module]))
+        base, server = start_local_server(module)
+        db_sampler = FakeDbSampler(stubs.db)
+
+    print(f"🚦 Load test → {base} ({args.url and 'remote' or args.app + ' in-process'}) mix={mix}")
+    flow_counter = {"n": 0, "lock": threading.Lock()}
+    levels = []
+    try:
+        for i, conc in enumerate(levels_to_run):
+            print(f"   ▶ concurrency {conc} for {args.duration:.0f}s...", flush=True)
+            levels.append(run_level(base, args.app, conc, args.duration, mix, conversations, args.seed + i, db_sampler, flow_counter))
+            wa_queue = getattr(module, "whatsapp_queue", None) if not args.url else None
+            if wa_queue:
+                # /whatsapp only acknowledges; count the level as done once the workers catch up
+                t0 = time.perf_counter()
+                wa_queue.drain(120)
+                levels[-1]["whatsapp_queue"] = dict(wa_queue.snapshot(), drain_s=round(time.perf_counter() - t0, 2))
+                outbox = sys.modules["twilio_sender"].outbox
+                outbox.drain(120)
+                levels[-1]["twilio_outbox"] = outbox.snapshot()
+    finally:
+        if server: server.shutdown()
+        if stubs: stubs.uninstall()
+        if db_sampler: db_sampler.close()
+
+    saturated_at, max_ok = find_saturation(levels)
+    result = {
+        "git_commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "target": args.url or f"in-process:{args.app}",
+        "config": {"ramp": levels_to_run, "duration": args.duration, "mix": mix, "seed": args.seed,
+                   "latency": None if args.url else ("none" if args.no_latency else {k: v.spec for k, v in stubs.latency.items()})},
+        "levels": levels,
+        "saturation": {"saturated_at": saturated_at, "max_sustainable_concurrency": max_ok},
+    }
+    print_levels(levels)
+    print(f"📈 Saturation: {'none within ramp' if saturated_at is None else f'at concurrency {saturated_at}'} "
+          f"(max sustainable: {max_ok})")
+    out = args.out or f"loadtest-{result['git_commit']}.json"
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 Saved: {out}")
+    if args.compare: compare(args.compare, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
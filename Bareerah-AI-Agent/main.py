@@ -1,21 +1,50 @@
 # Ayesha Fluid AI V5.2 (Capacity & Pricing Fix) 🚀
 import os
+import hmac
 import json
 import logging
+import functools
 import requests
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, render_template
 from twilio.twiml.voice_response import VoiceResponse
-from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
+import turn_budget
+import tracing
+import slot_extract
+import gazetteer
+import prefetch
+import call_state
+import email_templates
+import transcript_store
+import migrations
+import booking_ledger
+import booking_reconciler
+import lifecycle
+import lazy_vendors
+import structured_log
+import usage_ledger
+
+OpenAI = lazy_vendors.attr("openai", "OpenAI")  # ~0.75s of import, paid on first use / preload
 
 # ✅ 1. SETUP
 load_dotenv()
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
+structured_log.setup()  # queued writer, LOG_LEVEL / LOG_FORMAT (structured_log.py)
+log = logging.getLogger("main")  # %s args: nothing is formatted below LOG_LEVEL
+tracing.register_gauge("log", structured_log.snapshot)
+
+# ✅ LOG CONTEXT: everything logged while serving a webhook carries its CallSid
+@app.before_request
+def bind_log_context():
+    structured_log.bind(call_sid=request.values.get('CallSid'), phone=request.values.get('From'))
+
+@app.teardown_request
+def unbind_log_context(exc):
+    structured_log.bind()
 
 # API Config
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -48,17 +77,17 @@ def get_token():
             if "username" in c: payload["username"] = c["username"]
             if "email" in c: payload["email"] = c["email"]
             
-            resp = requests.post(url, json=payload, timeout=5)
+            resp = requests.post(url, json=payload, timeout=turn_budget.timeout(5))
             if resp.status_code == 200:
                 CACHED_TOKEN = resp.json().get("token")
-                print(f"✅ Auth Success with: {c.get('username') or c.get('email')}")
+                log.info("✅ Auth Success with: %s", c.get('username') or c.get('email'))
                 return CACHED_TOKEN
         except: pass
     
-    print("❌ All Auth attempts failed")
+    log.error("❌ All Auth attempts failed")
     return None
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = lazy_vendors.client(lambda: OpenAI(api_key=OPENAI_API_KEY), "openai")
 
 # ✅ 2. DB HELPERS (Fault Tolerant)
 def get_db():
@@ -66,67 +95,80 @@ def get_db():
     try:
         return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
     except Exception as e:
-        logging.error(f"DB Connect Error: {e}")
+        logging.error("DB Connect Error: %s", e)
         return None
 
 def init_tables():
+    """Bring the schema up to date (migrations.py); lifecycle.py runs this once, not every worker"""
+    if not DATABASE_URL: return False
     conn = get_db()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS call_state (
-                    call_sid VARCHAR(255) PRIMARY KEY,
-                    data JSONB,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bookings (
-                    id SERIAL PRIMARY KEY,
-                    customer_name TEXT,
-                    phone TEXT,
-                    pickup TEXT,
-                    dropoff TEXT,
-                    fare TEXT,
-                    status TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            conn.commit()
-            print("Tables Init Success")
-        except Exception as e:
-            print(f"Table Init Error: {e}")
-        finally:
-            conn.close()
+    if not conn: raise RuntimeError("database unreachable")
+    try:
+        migrations.migrate(conn)
+        log.info("Tables Init Success")
+        return True
+    finally:
+        conn.close()
+
+# ✅ USAGE LEDGER: every billable vendor call, per CallSid, with its time (usage_ledger.py)
+USAGE = usage_ledger.UsageLedger(lambda: get_db(), lambda conn: conn.close())
+tracing.register_gauge("usage", USAGE.snapshot)
 
 # ✅ 3. CORE LOGIC (Requests Only - No Google Lib)
-def resolve_address(addr):
-    """Returns a Place ID + Human Name for accuracy and display"""
-    if not GOOGLE_MAPS_API_KEY: return addr
-    if len(addr) < 3: return addr
-    
+# Each vendor call is split into request building + response parsing so the
+# async serving path (asgi_app.py) reuses exactly the same rules.
+PLACES_URL = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+DISTANCE_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+RESEND_URL = "https://api.resend.com/emails"
+EMAIL_SENDERS = ["Star Skyline <info@sslbookings.com>", "Star Skyline <onboarding@resend.dev>"]
+DEFAULT_DISTANCE_KM = 20.0
+KNOWN_PLACE_SCORE = 0.8  # gazetteer matches at least this close skip Find Place
+
+def known_place(addr):
+    """Coordinates + name for a landmark from the offline gazetteer, in the ID|||Name format"""
+    match = gazetteer.default().lookup(addr or "", contained=False)
+    if match and match.score >= KNOWN_PLACE_SCORE:
+        return f"{match.place.lat},{match.place.lng}|||{match.place.name}"
+    return None
+
+def place_search_params(addr):
+    """Find Place query for an address, or None when it can't be looked up"""
+    if not GOOGLE_MAPS_API_KEY: return None
+    if len(addr) < 3: return None
+
     clean_addr = addr.lower().strip()
     search_query = addr
     if not any(x in clean_addr for x in ["dubai", "uae", "emirates"]):
         search_query = f"{addr}, Dubai, UAE"
+    return {
+        "input": search_query,
+        "inputtype": "textquery",
+        "fields": "place_id,formatted_address,name",
+        "locationbias": "circle:50000@25.2048,55.2708",
+        "key": GOOGLE_MAPS_API_KEY
+    }
+
+def parse_place(res, addr):
+    if res.get("status") == "OK" and res.get("candidates"):
+        cand = res['candidates'][0]
+        # Prioritize the specific Landmark Name (e.g. Dubai Mall)
+        p_id = cand['place_id']
+        disp = cand.get('name', cand.get('formatted_address', addr))
+        return f"place_id:{p_id}|||{disp}"
+    return f"{addr}, Dubai, UAE"
 
+def resolve_address(addr):
+    """Returns a Place ID (or landmark coordinates) + Human Name for accuracy and display"""
+    known = known_place(addr)
+    if known:
+        if GOOGLE_MAPS_API_KEY: USAGE.record("google", "find_place", cached=True)  # a Find Place the gazetteer saved
+        return known
+    params = place_search_params(addr)
+    if params is None: return addr
     try:
-        url = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
-        params = {
-            "input": search_query,
-            "inputtype": "textquery",
-            "fields": "place_id,formatted_address,name",
-            "locationbias": "circle:50000@25.2048,55.2708",
-            "key": GOOGLE_MAPS_API_KEY
-        }
-        res = requests.get(url, params=params, timeout=5).json()
-        if res.get("status") == "OK" and res.get("candidates"):
-            cand = res['candidates'][0]
-            # Prioritize the specific Landmark Name (e.g. Dubai Mall)
-            p_id = cand['place_id']
-            disp = cand.get('name', cand.get('formatted_address', addr))
-            return f"place_id:{p_id}|||{disp}"
+        with USAGE.metered("google", "find_place"):
+            res = requests.get(PLACES_URL, params=params, timeout=turn_budget.timeout(5))
+        return parse_place(res.json(), addr)
     except: pass
     return f"{addr}, Dubai, UAE"
 
@@ -136,166 +178,200 @@ def resolve_address_text(addr):
         return addr.split("|||")[1]
     return str(addr).replace("place_id:", "")
 
-def calc_dist(p, d):
-    """Google Distance Matrix via Requests"""
-    if not GOOGLE_MAPS_API_KEY: 
-        print("⚠️ No Google Maps Key. Defaulting to 20km.")
-        return 20.0
+def distance_params(p, d):
     # Extract real Place IDs if name is attached
     origin = p.split("|||")[0] if "|||" in str(p) else p
     dest = d.split("|||")[0] if "|||" in str(d) else d
-    
+    return {"origins": origin, "destinations": dest, "mode": "driving", "key": GOOGLE_MAPS_API_KEY}
+
+def parse_distance(res):
+    if res.get("status") == "REQUEST_DENIED":
+        log.warning("⚠️ Google Maps REQUEST_DENIED. Check API Key for domain restrictions.")
+    log.info("🗺️ Maps Status: %s | Elements: %s", res.get('status'), res.get('rows', [{}])[0].get('elements', [{}])[0].get('status') if res.get('rows') else 'N/A')
+    if res.get("rows") and res["rows"][0]["elements"][0]["status"] == "OK":
+        dist = res["rows"][0]["elements"][0]["distance"]["value"] / 1000.0
+        log.info("🗺️ Distance Calculated: %s km", dist)
+        if dist < 0.1: return DEFAULT_DISTANCE_KM # Safety for 0 distance
+        return dist
+    return DEFAULT_DISTANCE_KM
+
+def calc_dist(p, d):
+    """Google Distance Matrix via Requests"""
+    if not GOOGLE_MAPS_API_KEY:
+        log.warning("⚠️ No Google Maps Key. Defaulting to 20km.")
+        return DEFAULT_DISTANCE_KM
     try:
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
-        params = {"origins": origin, "destinations": dest, "mode": "driving", "key": GOOGLE_MAPS_API_KEY}
-        res = requests.get(url, params=params, timeout=5).json()
-        if res.get("status") == "REQUEST_DENIED":
-            print(f"⚠️ Google Maps REQUEST_DENIED. Check API Key for domain restrictions.")
-        print(f"🗺️ Maps Status: {res.get('status')} | Elements: {res.get('rows', [{}])[0].get('elements', [{}])[0].get('status') if res.get('rows') else 'N/A'}")
-        if res.get("rows") and res["rows"][0]["elements"][0]["status"] == "OK":
-            dist = res["rows"][0]["elements"][0]["distance"]["value"] / 1000.0
-            print(f"🗺️ Distance Calculated: {dist} km")
-            if dist < 0.1: return 20.0 # Safety for 0 distance
-            return dist
-    except Exception as e: 
-        print(f"❌ Maps Error: {e}")
-    return 20.0
-
-def send_email(subject, body):
+        with USAGE.metered("google", "distance_matrix"):
+            res = requests.get(DISTANCE_URL, params=distance_params(p, d), timeout=turn_budget.timeout(5))
+        return parse_distance(res.json())
+    except Exception as e:
+        log.error("❌ Maps Error: %s", e)
+    return DEFAULT_DISTANCE_KM
+
+def email_request(sender, subject, body, text=None):
+    headers = {"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"}
+    payload = {"from": sender, "to": [NOTIFICATION_EMAIL], "subject": subject, "html": body}
+    if text: payload["text"] = text
+    return headers, payload
+
+def send_email(subject, body, text=None):
     """Resend API via Requests - Consolidated & Robust"""
-    if not RESEND_API_KEY: 
-        print("❌ No RESEND_API_KEY found.")
-        return
+    if not RESEND_API_KEY:
+        log.error("❌ No RESEND_API_KEY found.")
+        return False
 
-    headers = {
-        "Authorization": f"Bearer {RESEND_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     # Transcript is already appended to body by the caller
     # Try sending with custom domain (info@sslbookings.com) first
-    senders = ["Star Skyline <info@sslbookings.com>", "Star Skyline <onboarding@resend.dev>"]
-    
-    for sender in senders:
+    for sender in EMAIL_SENDERS:
         try:
-            resp = requests.post(
-                "https://api.resend.com/emails",
-                headers={"Authorization": f"Bearer {RESEND_API_KEY}", "Content-Type": "application/json"},
-                json={"from": sender, "to": [NOTIFICATION_EMAIL], "subject": subject, "html": body},
-                timeout=10
-            )
+            headers, payload = email_request(sender, subject, body, text)
+            with USAGE.metered("resend", "email") as meter:
+                resp = requests.post(RESEND_URL, headers=headers, json=payload, timeout=turn_budget.timeout(10))
+                meter.quantity = int(resp.status_code == 200)  # only a sent email is billed
             if resp.status_code == 200:
-                print(f"📧 Email Sent Successfully via {sender}")
-                return
+                log.info("📧 Email Sent Successfully via %s", sender)
+                return True
             else:
-                print(f"⚠️ Email Attempt failed via {sender}: {resp.status_code}")
+                log.warning("⚠️ Email Attempt failed via %s: %s", sender, resp.status_code)
                 if "verify a domain" not in resp.text: # If it's not a domain error, don't just loop
-                     print(f"❌ Details: {resp.text}")
+                     log.error("❌ Details: %s", resp.text)
         except Exception as e:
-            print(f"❌ Email Exception: {e}")
+            log.error("❌ Email Exception: %s", e)
+    return False
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def fare_request(dist_km, v_type, b_type="point_to_point"):
+    return {
+        "distance_km": dist_km,
+        "vehicle_type": v_type.upper(),
+        "booking_type": b_type
+    }
+
+def parse_fare(res_json):
+    fare = res_json.get("fare_aed") or res_json.get("data", {}).get("fare")
+    # Use the fare if it's a valid positive number
+    try:
+        if fare and float(fare) > 0:
+            log.info("💰 Fare Received: %s", fare)
+            return int(float(fare))
+    except: pass
+    return None
 
 def calculate_backend_fare(dist_km, v_type, b_type="point_to_point"):
     """Call backend /api/bookings/calculate-fare for the perfect quote"""
     url = f"{BACKEND_BASE_URL}/api/bookings/calculate-fare"
-    token = get_token()
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    headers = auth_headers(get_token())
     try:
-        data = {
-            "distance_km": dist_km,
-            "vehicle_type": v_type.upper(),
-            "booking_type": b_type
-        }
-        print(f"💰 Fetching Fare: {url} -> {data}")
-        resp = requests.post(url, json=data, headers=headers, timeout=5)
+        data = fare_request(dist_km, v_type, b_type)
+        log.info("💰 Fetching Fare: %s -> %s", url, data)
+        resp = requests.post(url, json=data, headers=headers, timeout=turn_budget.timeout(5))
         if resp.status_code in [200, 201]:
-            res_json = resp.json()
-            fare = res_json.get("fare_aed") or res_json.get("data", {}).get("fare")
-            
-            # Use the fare if it's a valid positive number
-            try:
-                if fare and float(fare) > 0:
-                    print(f"💰 Fare Received: {fare}")
-                    return int(float(fare))
-            except: pass
-                
-        print(f"⚠️ Fare API returned 0 or error {resp.status_code}: {resp.text}")
+            fare = parse_fare(resp.json())
+            if fare: return fare
+        log.warning("⚠️ Fare API returned 0 or error %s: %s", resp.status_code, resp.text)
     except Exception as e:
-        print(f"❌ Fare API Error: {e}")
+        log.error("❌ Fare API Error: %s", e)
     return None
 
+def filter_suggested_vehicles(data, pax):
+    """Normalise the suggest-vehicles payload and enforce passenger capacity"""
+    # ✅ Handle diverse backend structures
+    if isinstance(data, dict):
+        v_list = data.get("suggested_vehicles") or data.get("data", {}).get("suggested_vehicles") or data.get("vehicles", [])
+    elif isinstance(data, list):
+        v_list = data
+    else: v_list = []
+
+    # --- STRICT CAPACITY FILTER ---
+    try:
+        pax_int = int(pax)
+    except: pax_int = 1
+
+    if pax_int > 4:
+        # 1. Filter backend list for capacity
+        filtered = [v for v in v_list if int(v.get('max_passengers', 4)) >= pax_int]
+
+        # 2. If no valid options found, or user has 7+ people, prioritize Vans/SUVs
+        if not filtered or pax_int >= 7:
+             return [
+                 {"vehicle_type": "elite_van", "model": "Mercedes V Class", "base_fare": 165, "max_passengers": 7},
+                 {"vehicle_type": "mini_bus", "model": "Luxury Minibus", "base_fare": 825, "max_passengers": 12}
+             ]
+        return filtered
+
+    return v_list
+
+def parse_available_vehicles(data):
+    if isinstance(data, list): return data
+    if isinstance(data, dict):
+        return data.get("data", []) or data.get("vehicles", []) or []
+    return []
+
 def fetch_backend_vehicles(pax, luggage):
     """Fetch real vehicle suggestions from Backend API based on capacity"""
-    token = get_token()
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
-    
+    headers = auth_headers(get_token())
+
     # 1. Try smart suggestion first
     url = f"{BACKEND_BASE_URL}/api/bookings/suggest-vehicles"
-    print(f"🚗 Fetching cars from: {url} (pax={pax}, luggage={luggage})")
+    log.info("🚗 Fetching cars from: %s (pax=%s, luggage=%s)", url, pax, luggage)
     try:
         params = {"passengers_count": int(pax), "luggage_count": int(luggage)}
-        resp = requests.get(url, params=params, headers=headers, timeout=6)
+        resp = requests.get(url, params=params, headers=headers, timeout=turn_budget.timeout(6))
         if resp.status_code == 200:
-            data = resp.json()
-            # ✅ Handle diverse backend structures
-            if isinstance(data, dict):
-                v_list = data.get("suggested_vehicles") or data.get("data", {}).get("suggested_vehicles") or data.get("vehicles", [])
-            elif isinstance(data, list):
-                v_list = data
-            else: v_list = []
-            
-            # --- STRICT CAPACITY FILTER ---
-            try:
-                pax_int = int(pax)
-            except: pax_int = 1
-
-            if pax_int > 4:
-                # 1. Filter backend list for capacity
-                filtered = [v for v in v_list if int(v.get('max_passengers', 4)) >= pax_int]
-                
-                # 2. If no valid options found, or user has 7+ people, prioritize Vans/SUVs
-                if not filtered or pax_int >= 7:
-                     return [
-                         {"vehicle_type": "elite_van", "model": "Mercedes V Class", "base_fare": 165, "max_passengers": 7},
-                         {"vehicle_type": "mini_bus", "model": "Luxury Minibus", "base_fare": 825, "max_passengers": 12}
-                     ]
-                return filtered
-            
-            return v_list
-
+            return filter_suggested_vehicles(resp.json(), pax)
     except Exception as e:
-        print(f"⚠️ Suggest API Exception: {e}")
-    
+        log.warning("⚠️ Suggest API Exception: %s", e)
+
     # 2. Fallback to general available vehicles
     url = f"{BACKEND_BASE_URL}/api/vehicles/available"
     try:
-        resp = requests.get(url, params={"passengers": pax, "luggage": luggage}, headers=headers, timeout=6)
+        resp = requests.get(url, params={"passengers": pax, "luggage": luggage}, headers=headers, timeout=turn_budget.timeout(6))
         if resp.status_code == 200:
-            data = resp.json()
-            if isinstance(data, list): return data
-            if isinstance(data, dict):
-                return data.get("data", []) or data.get("vehicles", []) or []
+            return parse_available_vehicles(resp.json())
     except: pass
-    
+
     return []
 
+def sync_headers(token, booking_data):
+    """Auth plus the booking reference as Idempotency-Key, so the backend can drop a repeat"""
+    headers = auth_headers(token)
+    if booking_data.get("booking_reference"): headers["Idempotency-Key"] = booking_data["booking_reference"]
+    return headers
+
+def sync_succeeded(status_code):
+    return status_code in (200, 201, 409)  # 409: the backend already has this reference
+
 def sync_booking_to_backend(booking_data):
-    """Sync confirmed booking to external backend"""
+    """Sync confirmed booking to external backend; True once the backend has it"""
     url = f"{BACKEND_BASE_URL}/api/bookings/create-manual"
-    token = get_token()
-    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    headers = sync_headers(get_token(), booking_data)
     try:
-        print(f"🔄 Syncing booking to {url}...")
-        resp = requests.post(url, json=booking_data, headers=headers, timeout=5)
-        print(f"🔄 Sync Status: {resp.status_code}")
-        if resp.status_code not in [200, 201]:
-            print(f"⚠️ Sync failed: {resp.text}")
-        else:
-            print(f"✅ Sync successful: {resp.status_code}")
+        log.info("🔄 Syncing booking to %s...", url)
+        resp = requests.post(url, json=booking_data, headers=headers, timeout=turn_budget.timeout(5))
+        log.info("🔄 Sync Status: %s", resp.status_code)
+        if not sync_succeeded(resp.status_code):
+            log.warning("⚠️ Sync failed: %s", resp.text)
+            return False
+        log.info("✅ Sync successful: %s", resp.status_code)
+        return True
     except Exception as e:
-        print(f"❌ Sync Error: {e}")
+        log.error("❌ Sync Error: %s", e)
+        return False
 
 # ✅ 4. AI BRAIN (The "Fluid" Part)
-def run_ai(history, slots):
+AI_MODEL = "gpt-4o-mini"
+AI_HISTORY_WINDOW = 15
+AI_FALLBACK = {"response": "I'm sorry, I missed that. Could you repeat?", "new_slots": {}, "action": "continue"}
+
+def ai_hints(hints):
+    """Rule-read values the model should check against the words, not take on trust"""
+    if not hints: return ""
+    return (f"RULE-READ FROM THE LAST MESSAGE (a regex pass; use these unless the caller's words say otherwise, "
+            f"and if only pickup_date is given ask for the hour): {json.dumps(hints)}")
+
+def ai_messages(history, slots, hints=None):
     system = f"""
     You are Ayesha, Star Skyline Limousine's AI agent. Professional and helpful.
     
@@ -306,7 +382,7 @@ def run_ai(history, slots):
     
     CRITICAL NLU EXTRACTION:
     - customer_name, pickup_location, dropoff_location.
-    - pickup_time: EXACT Date AND Time (e.g. "Tomorrow at 4pm", "5th Feb 10am"). TODAY is 2026-02-04. MUST include both.
+    - pickup_time: EXACT Date AND Time (e.g. "Tomorrow at 4pm", "5th Feb 10am"). TODAY is {slot_extract.today_text()}. MUST include both.
     - passengers_count, luggage_count.
     - preferred_vehicle: "Classic", "Executive", "SUV", "Van", "First Class".
     - extra_details: Capture any BARGAINING requests, discounts, special notes, or questions here.
@@ -338,6 +414,7 @@ def run_ai(history, slots):
     7. **EMPTY INPUT**: If silent, ask for missing detail.
     
     Current Info: {json.dumps(slots)}
+    {ai_hints(hints)}
     
     Output JSON Format:
     {{
@@ -346,17 +423,22 @@ def run_ai(history, slots):
       "action": "continue" | "confirm_pitch" | "ask_reqs" | "finalize"
     }}
     """
+    return [{"role": "system", "content": system}] + history[-AI_HISTORY_WINDOW:]
+
+def run_ai(history, slots, hints=None):
     try:
         # ✅ SPEED: Using gpt-4o-mini for 3x faster response
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system}] + history[-15:],
-            response_format={"type": "json_object"},
-            temperature=0.0
-        )
+        with USAGE.metered("openai", AI_MODEL) as meter:
+            resp = meter.tokens(client.chat.completions.create(
+                model=AI_MODEL,
+                messages=ai_messages(history, slots, hints),
+                response_format={"type": "json_object"},
+                temperature=0.0,
+                timeout=turn_budget.timeout(8)
+            ))
         return json.loads(resp.choices[0].message.content)
     except:
-        return {"response": "I'm sorry, I missed that. Could you repeat?", "new_slots": {}, "action": "continue"}
+        return dict(AI_FALLBACK)
 
 # ✅ 5. ROUTES (Matching Legacy Structure)
 
@@ -364,22 +446,33 @@ def run_ai(history, slots):
 def index():
     return "Ayesha Fluid AI V5 (Real Backend) Running"
 
-@app.route('/voice', methods=['POST'])
-@app.route('/incoming', methods=['POST'])
-def incoming_call():
+# Unanswered menus before the call carries on in English (was an endless /voice loop)
+LANGUAGE_MENU_ATTEMPTS = int(os.getenv("LANGUAGE_MENU_ATTEMPTS", "2"))
+
+@functools.lru_cache(maxsize=None)
+def language_menu_twiml(attempt):
     resp = VoiceResponse()
     # 1. Faster Greeting + Language in one block
     gather = resp.gather(num_digits=1, action='/select-language', timeout=5)
     gather.say("As-Salamu Alaykum. I am Ayesha. For English, press 1. For Arabic, press 2.", voice='Polly.Joanna-Neural')
-    resp.redirect('/voice') 
+    if attempt < LANGUAGE_MENU_ATTEMPTS:
+        resp.redirect(f'/voice?attempt={attempt + 1}')
+    else:
+        resp.redirect('/select-language?Digits=1')
     return str(resp)
 
-@app.route('/eleven-tts')
-def eleven_tts():
-    text = request.args.get('text', '')
-    if not text or not ELEVENLABS_API_KEY:
-        return "Missing data", 400
-        
+@app.route('/voice', methods=['POST'])
+@app.route('/incoming', methods=['POST'])
+def incoming_call():
+    TRANSCRIPTS.learn_base_url(request.url_root)
+    try:
+        attempt = int(request.values.get('attempt', 1))
+    except ValueError:
+        attempt = 1
+    return language_menu_twiml(min(max(attempt, 1), LANGUAGE_MENU_ATTEMPTS))
+
+def tts_request(text):
+    """ElevenLabs request for a phrase: (url, headers, body)"""
     url = f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
     headers = {
         "xi-api-key": ELEVENLABS_API_KEY,
@@ -390,9 +483,19 @@ def eleven_tts():
         "model_id": "eleven_multilingual_v2",
         "voice_settings": {"stability": 0.5, "similarity_boost": 0.5}
     }
-    
+    return url, headers, data
+
+@app.route('/eleven-tts')
+def eleven_tts():
+    text = request.args.get('text', '')
+    if not text or not ELEVENLABS_API_KEY:
+        return "Missing data", 400
+
+    url, headers, data = tts_request(text)
     try:
-        r = requests.post(url, json=data, headers=headers, timeout=10)
+        with USAGE.metered("elevenlabs", "tts", len(text)) as meter:
+            r = requests.post(url, json=data, headers=headers, timeout=10)
+            if r.status_code != 200: meter.quantity = 0
         if r.status_code == 200:
             from flask import Response
             return Response(r.content, mimetype="audio/mpeg")
@@ -401,567 +504,759 @@ def eleven_tts():
     except Exception as e:
         return str(e), 500
 
+# 1=English, 2=Arabic (Shifted from 3)
+LANG_DIGITS = {"1": "English", "2": "Arabic"}
+
+# Map start greeting to language
+GREETINGS = {
+    "English": "As-Salamu Alaykum. Welcome to Star Skyline. I am Ayesha. May I have your name?",
+    "Arabic": "السلام عليكم. مرحبًا بكم في ستار سكاي ليموزين. أنا عائشة. ما هو اسمك؟"
+}
+
+def initial_state(selected_lang):
+    # Init history with the Greeting so the AI knows the language
+    return {
+        "history": [{"role": "assistant", "content": GREETINGS[selected_lang]}],
+        "slots": {"language": selected_lang},
+        "transcript_len": 1
+    }
+
+@functools.lru_cache(maxsize=None)
+def greeting_twiml(selected_lang):
+    resp = VoiceResponse()
+    gather = resp.gather(input='speech', action='/handle', timeout=5, language=TW_LANG_MAP.get(selected_lang, "en-US"))
+
+    # Strict Voice Enforcement
+    gather.say(GREETINGS[selected_lang], voice=VOICE_MAP.get(selected_lang, "Polly.Joanna-Neural"))
+    return str(resp)
+
 @app.route('/select-language', methods=['POST'])
 @app.route('/select-language', methods=['POST'])
 def select_language():
     call_sid = request.values.get('CallSid')
     digit = request.values.get('Digits')
-    
-    # 1=English, 2=Arabic (Shifted from 3)
-    lang_map = {"1": "English", "2": "Arabic"}
-    selected_lang = lang_map.get(digit, "English")
-    print(f"🌍 Language Selected: {selected_lang} (Digit: {digit})")
-    
-    # Map start greeting to language
-    greetings = {
-        "English": "As-Salamu Alaykum. Welcome to Star Skyline. I am Ayesha. May I have your name?",
-        "Arabic": "السلام عليكم. مرحبًا بكم في ستار سكاي ليموزين. أنا عائشة. ما هو اسمك؟"
-    }
-    
-    # Init history with the Greeting so the AI knows the language
-    state = {
-        "history": [{"role": "assistant", "content": greetings[selected_lang]}], 
-        "slots": {"language": selected_lang}
-    }
+
+    selected_lang = LANG_DIGITS.get(digit, "English")
+    log.info("🌍 Language Selected: %s (Digit: %s)", selected_lang, digit)
+
+    return open_call(call_sid, selected_lang)
+
+# ✅ CALL SETUP: state in memory now, in Postgres behind the greeting
+CALL_SETUP = call_state.CallStates()
+tracing.register_gauge("call_setup", CALL_SETUP.snapshot)
+
+def write_initial_state(call_sid, state):
     conn = get_db()
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute("INSERT INTO call_state (call_sid, data) VALUES (%s, %s) ON CONFLICT (call_sid) DO UPDATE SET data = %s", 
-                        (call_sid, json.dumps(state), json.dumps(state)))
-        conn.commit()
-    
+    if not conn: return
+    try:
+        insert_state(conn, call_sid, state)
+    finally:
+        conn.close()
+
+def open_call(call_sid, selected_lang):
+    """Greeting TwiML for a new call; its initial state is written in the background"""
+    state = initial_state(selected_lang)
+    CALL_SETUP.open(call_sid, state, write_initial_state)
+    TRANSCRIPTS.append(call_sid, 0, state['history'])
+    return greeting_twiml(selected_lang)
+
+# ✅ TRANSCRIPTS: each turn written once (compressed), linked from emails, rendered on demand
+TRANSCRIPTS = transcript_store.TranscriptStore(lambda: get_db())
+tracing.register_gauge("transcripts", TRANSCRIPTS.snapshot)
+
+@app.route('/transcripts/<transcript_id>', methods=['GET'])
+def transcript_page(transcript_id):
+    page = TRANSCRIPTS.page(transcript_id, lambda messages: render_template(
+        "transcript.html", transcript_id=transcript_id, messages=messages))
+    if page is None:
+        return "Transcript not found", 404
+    return page, 200, {"Content-Type": "text/html; charset=utf-8", "Cache-Control": "private, max-age=60"}
+
+# ✅ BOOKING LEDGER: one row, one backend push and one email per call; pending ones are retried
+LEDGER = booking_ledger.BookingLedger()
+tracing.register_gauge("ledger", LEDGER.snapshot)
+RECONCILER = booking_reconciler.Reconciler(lambda: get_db(), lambda conn: conn.close(),
+                                           lambda payload: sync_booking_to_backend(payload))
+tracing.register_gauge("reconciler", RECONCILER.snapshot)
+
+# ✅ TURN BUDGET HELPERS
+VOICE_MAP = {"English": "Polly.Joanna-Neural", "Arabic": "Polly.Zeina"}
+TW_LANG_MAP = {"English": "en-US", "Arabic": "ar-XA"}
+HOLD_MESSAGES = {
+    "English": "One moment please, I'm checking that for you.",
+    "Arabic": "لحظة من فضلك، أتحقق من ذلك."
+}
+MISSED_MESSAGES = {
+    "English": "I'm sorry, I missed that. Could you repeat?",
+    "Arabic": "عذراً، لم أسمع ذلك جيداً. هل يمكنك التكرار؟"
+}
+AGAIN_MESSAGES = {
+    "English": "I'm sorry, could you say that again?",
+    "Arabic": "عذراً، هل يمكنك قول ذلك مرة أخرى؟"
+}
+
+def gather_twiml(msg, lang):
     resp = VoiceResponse()
-    voice_map = {"English": "Polly.Joanna-Neural", "Arabic": "Polly.Zeina"}
-    tw_lang_map = {"English": "en-US", "Arabic": "ar-XA"}
-    
-    gather = resp.gather(input='speech', action='/handle', timeout=5, language=tw_lang_map.get(selected_lang, "en-US"))
-    
-    # Strict Voice Enforcement
-    use_voice = voice_map.get(selected_lang, "Polly.Joanna-Neural")
-    gather.say(greetings[selected_lang], voice=use_voice)
+    gather = resp.gather(input='speech', action='/handle', timeout=5, language=TW_LANG_MAP.get(lang, "en-US"))
+    gather.say(msg, voice=VOICE_MAP.get(lang, "Polly.Joanna-Neural"))
+    resp.redirect('/handle')
+    return str(resp)
+
+def apology_twiml(messages, lang):
+    return gather_twiml(messages.get(lang, messages["English"]), lang)
+
+def hold_twiml(turn):
+    """Filler while the turn finishes in the background, then poll /handle-result"""
+    turn.polls += 1
+    if turn.polls > 1:
+        return poll_twiml()
+    resp = VoiceResponse()
+    resp.say(HOLD_MESSAGES.get(turn.language, HOLD_MESSAGES["English"]), voice=VOICE_MAP.get(turn.language, "Polly.Joanna-Neural"))
+    resp.redirect('/handle-result', method='POST')
     return str(resp)
 
-# ✅ ROUTE MATCHING: /handle -> Main Logic
+def poll_twiml():
+    resp = VoiceResponse()
+    resp.pause(length=1)
+    resp.redirect('/handle-result', method='POST')
+    return str(resp)
+
+def held_db(fn, *args):
+    """Run one held_turns helper on its own connection; None without a database"""
+    conn = get_db()
+    if not conn: return None
+    try:
+        return fn(conn, *args)
+    except Exception as e:
+        logging.error("❌ Held turn %s failed (%s): %s", fn.__name__, args[0], e)
+        return None
+    finally:
+        conn.close()
+
+def hold_turn(call_sid):
+    held_db(mark_held, call_sid)
+
+def park_turn(turn, twiml):
+    # a failed turn parks the same apology this worker would have given
+    held_db(park_reply, turn.call_sid, twiml or apology_twiml(MISSED_MESSAGES, turn.language))
+
+def held_elsewhere(call_sid):
+    """/handle-result with no pending turn here: the parked reply, a pause while another
+    worker is still on it, or - nothing held - ask again in the call's own language"""
+    conn = get_db()
+    try:
+        held = collect_reply(conn, call_sid, turn_budget.TURN_HARD_LIMIT_SECONDS) if conn else None
+        if held and held['twiml']: return held['twiml']
+        if held and held['running']: return poll_twiml()
+        state = (load_state(conn, call_sid) if conn else None) or {}
+    except Exception as e:
+        logging.error("❌ Held turn lookup failed (%s): %s", call_sid, e)
+        state = {}
+    finally:
+        if conn: conn.close()
+    return apology_twiml(AGAIN_MESSAGES, state.get('slots', {}).get('language', 'English'))
+
+def reply_within_budget(turn, wait):
+    try:
+        twiml = turn_budget.wait_for_turn(turn, wait)
+    except Exception as e:
+        logging.error("❌ Turn Failed (%s): %s", turn.call_sid, e)
+        return apology_twiml(MISSED_MESSAGES, turn.language)
+    if twiml is not None:
+        if turn.polls:  # held, then served here after all: no reply or marker left for another worker
+            turn_budget.served_here(turn)
+            held_db(drop_reply, turn.call_sid)
+        return twiml
+    log.info("⏳ Turn %s over budget (%.1fs). Holding.", turn.call_sid, turn.budget.elapsed())
+    if turn.polls == 0:
+        hold_turn(turn.call_sid)  # before the hold message: the next poll may reach another worker
+        turn_budget.hand_off(turn, park_turn)
+    return hold_twiml(turn)
+
+# ✅ ROUTE MATCHING: /handle -> Main Logic (runs under the turn budget)
 @app.route('/handle', methods=['POST'])
 def handle_call():
     call_sid = request.values.get('CallSid')
     speech = request.values.get('SpeechResult', '')
-    
-    # Load State
-    conn = get_db()
-    state = {"history": [], "slots": {}}
-    if conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT data FROM call_state WHERE call_sid = %s", (call_sid,))
-            row = cur.fetchone()
-            if row: state = row['data']
-    
-    state['history'].append({"role": "user", "content": speech})
-    
-    # Process
-    decision = run_ai(state['history'], state['slots'])
+    turn = turn_budget.start_turn(call_sid, process_turn, call_sid, speech, request.values.get('From'))
+    return reply_within_budget(turn, turn.budget.remaining() - turn_budget.HOLD_RESERVE_SECONDS)
+
+@app.route('/handle-result', methods=['POST'])
+def handle_result():
+    """Twilio polls here after a hold message until the turn's reply is ready"""
+    call_sid = request.values.get('CallSid')
+    turn = turn_budget.pending_turn(call_sid)
+    if not turn:
+        return held_elsewhere(call_sid)
+    return reply_within_budget(turn, turn_budget.TURN_BUDGET_SECONDS - turn_budget.HOLD_RESERVE_SECONDS)
+
+def process_turn(call_sid, speech, caller):
+    with tracing.span("voice.turn", call_sid=call_sid):
+        conn = get_db()
+        try:
+            return _process_turn(conn, call_sid, speech, caller)
+        finally:
+            if conn: conn.close()
+
+# ✅ TURN RULES (pure - shared by the sync path below and asgi_app.py)
+REQUIRED_SLOTS = ['customer_name', 'pickup_location', 'dropoff_location', 'pickup_time', 'luggage_count']
+
+def pre_extract(speech, at=None):
+    """Slots the compiled rules are sure of (dates, counts, email); returns (slots, consumed)"""
+    found = slot_extract.extract(speech, at)
+    slots = {}
+    if found['datetime'] and not found['ambiguous_time']:
+        slots['pickup_time'] = found['datetime'].isoformat(timespec="seconds")
+    if found['passengers'] is not None: slots['passengers_count'] = found['passengers']
+    if found['luggage'] is not None: slots['luggage_count'] = found['luggage']
+    if found['email']: slots['email'] = found['email']
+    if found['date'] and 'pickup_time' not in slots:
+        slots['pickup_date'] = found['date'].isoformat()  # "kal subah": never consumed, only a hint - the hour is still to ask
+    return slots, found['consumed']
+
+def rule_decision(state, extracted, consumed):
+    """A decision without the LLM when the utterance was only slot values and they
+    complete the booking (the pitch text is built from the backend anyway)"""
+    if not (consumed and extracted): return None
+    merged = dict(state['slots'], **extracted)
+    if all(merged.get(k) for k in REQUIRED_SLOTS) and not merged.get('preferred_vehicle'):
+        return {"response": "", "new_slots": extracted, "action": "confirm_pitch"}
+    return None
+
+def record_turn(call_sid, state, messages):
+    """This turn's messages go to the transcript once; call_state keeps what the model reads"""
+    seq = state.get('transcript_len', max(0, len(state['history']) - len(messages)))
+    TRANSCRIPTS.append(call_sid, seq, messages)
+    state['transcript_len'] = seq + len(messages)
+    state['history'] = state['history'][-AI_HISTORY_WINDOW:]
+
+def apply_decision(state, decision, extracted=None, consumed=False):
+    """Merge the AI's slots into state; returns (ai_msg, action) after the safety override.
+    Rule-extracted slots only win when the utterance was nothing but them (consumed) -
+    otherwise the model got them as hints and its reading stands."""
     state['slots'].update(decision.get('new_slots', {}))
+    if extracted and consumed: state['slots'].update(extracted)
     ai_msg = decision.get('response', 'Understood.')
     action = decision.get('action', 'continue')
 
-    # ✅ SAFETY OVERRIDE: Force Pitch if logic gets stuck
-    # ✅ SHARED VARS for all states
-    p_id = resolve_address(state['slots'].get('pickup_location', 'Dubai'))
-    d_id = resolve_address(state['slots'].get('dropoff_location', 'Dubai'))
-    
-    # Human readable versions for sync/email
-    p = resolve_address_text(p_id)
-    d = resolve_address_text(d_id)
-
-    try:
-        base_dist = round(calc_dist(p_id, d_id), 1) # Calculate Accurate & Round for Speech
-    except:
-        base_dist = 20.0
-    b_type = "airport_transfer" if "airport" in (p+d).lower() else "point_to_point"
-
     # ✅ SAFETY OVERRIDE: Force Pitch ONLY if all info is there AND vehicle is NOT selected
-    required = ['customer_name', 'pickup_location', 'dropoff_location', 'pickup_time', 'luggage_count']
     # Check if preferred_vehicle is MISSING. If it's present, we don't need to pitch.
-    if  all(state['slots'].get(k) for k in required) and \
+    if  all(state['slots'].get(k) for k in REQUIRED_SLOTS) and \
         not state['slots'].get('preferred_vehicle') and \
         action == "continue":
-        print("🛠️ Safety Trigger: Forcing 'confirm_pitch' because all core slots are full.")
+        log.info("🛠️ Safety Trigger: Forcing 'confirm_pitch' because all core slots are full.")
         action = "confirm_pitch"
-    
+    return ai_msg, action
+
+def booking_type_for(p, d):
+    return "airport_transfer" if "airport" in (p+d).lower() else "point_to_point"
+
+def pitch_vehicles(options):
+    """The (at most two) options we quote, as (v_type, v_model, raw_option)"""
+    out = []
+    if not isinstance(options, list): return out
+    for v in options[:2]:
+        if not isinstance(v, dict): continue
+        v_type = v.get('vehicle_type', v.get('type', v.get('category', 'SEDAN'))).upper()
+
+        # Generic Name Logic
+        if v_type == 'CLASSIC': v_model = "Classic Sedan"
+        elif v_type == 'EXECUTIVE': v_model = "Executive Sedan"
+        elif v_type == 'SUV': v_model = "Luxury SUV"
+        elif v_type == 'ELITE_VAN': v_model = "Mercedes V Class"
+        else: v_model = v.get('vehicle_type', v.get('model', v.get('vehicle', 'Car'))).replace("_", " ").title()
+        out.append((v_type, v_model, v))
+    return out
+
+def estimate_option_price(v, v_type, base_dist):
+    """Local estimate when the fare API has no quote for an option"""
+    if v.get('base_fare'):
+        return int(float(v['base_fare']) + (base_dist * float(v.get('per_km_rate', 1))))
+    return int(50 + (base_dist * 3.5)) if v_type == "SEDAN" else int(80 + (base_dist * 5.0))
+
+def build_pitch(options, prices, p, d, base_dist, sel_lang):
+    """Spoken pitch for the quoted options; prices line up with pitch_vehicles(options)"""
+    vehicles = pitch_vehicles(options)
+    if isinstance(options, list) and len(options) > 0:
+        # 1. Start with Address Confirmation
+        if sel_lang == 'Arabic':
+            pitch = f"حسناً، لقد حددت المسار من {p} إلى {d}. "
+            pitch += f"لقد وجدت هذه الخيارات: "
+        else:
+            pitch = f"I've located the route from {p} to {d}. "
+            pitch += "I have these options for you based on our availability: "
+
+        # 2. Build the list of cars
+        for (v_type, v_model, v), price in zip(vehicles, prices):
+            if not price:
+                price = estimate_option_price(v, v_type, base_dist)
+
+            # APPEND to pitch (Don't overwrite!)
+            if sel_lang == 'Arabic':
+                pitch += f"سعر {v_model} لمسافة {base_dist} كيلومتر هو {price} درهم. "
+            else:
+                pitch += f"A {v_model} for this {base_dist} kilometer journey is {price} Dirhams. "
+
+        # 3. Add closing question
+        if sel_lang == 'Arabic': pitch += "أي سيارة تود حجزها؟"
+        else: pitch += "Which option would you like to book?"
+    else:
+        # Fallback if no cars found
+        if sel_lang == 'Arabic': pitch = "عفواً، لا توجد سيارات متاحة الآن."
+        else: pitch = "I'm sorry, I couldn't find any available vehicles for your requirements at the moment."
+    return pitch
+
+def quick_vehicle(slots):
+    """Vehicle quoted before final confirmation: (v_type, v_model)"""
+    p_val = slots.get('preferred_vehicle')
+    pref = str(p_val).lower() if p_val else "car"
+
+    # Quick Map (Same as Finalize)
+    if "classic" in pref or "sedan" in pref or "car" in pref: return "CLASSIC", "Classic Sedan"
+    elif 'executive' in pref or 'vip' in pref: return "EXECUTIVE", "Executive Sedan"
+    elif 'van' in pref or 'elite' in pref: return "ELITE_VAN", "Luxury Van"
+    elif 'suv' in pref: return "LUXURY_SUV", "Luxury SUV"
+    return "CLASSIC", "Classic Sedan"
+
+def ask_reqs_message(v_model, price, sel_lang):
+    if sel_lang == 'Arabic':
+        return f"سعر {v_model} هو {price} درهم. هل لديك أي متطلبات أخرى؟"
+    return f"The price for the {v_model} is {price} Dirhams. Do you have any other requirements?"
+
+def final_vehicle(slots):
+    """Validate capacity and map the preference to the booked car: (pax, lug, car_model, v_type)"""
+    # Validate Capacity BEFORE Booking
+    try:
+        pax = int(slots.get('passengers_count', 1))
+    except: pax = 1
+
+    try:
+        lug = int(slots.get('luggage_count', 0))
+    except: lug = 0
+
+    # Get user preference first (Safe String)
+    p_val = slots.get('preferred_vehicle')
+    pref = str(p_val).lower() if p_val else "car"
+
+    # 1. Force Upgrade for 7+ Passengers (Must be a Van or MiniBus)
+    if pax >= 7:
+        # Explicit checks to avoid Generator Scoping issues
+        is_van_type = "van" in pref or "bus" in pref or "sprinter" in pref or "v-class" in pref
+        if not is_van_type:
+             logging.info("⚠️ High Capacity (%s pax). Forcing Upgrade to Elite Van.", pax)
+             pref = "van"
+
+    # 2. Force Upgrade for 5-6 Passengers (Must be SUV or Van)
+    elif pax > 4:
+        is_small_type = "classic" in pref or "executive" in pref or "sedan" in pref or "car" in pref or "lexus" in pref or "first class" in pref
+        if is_small_type:
+            logging.info("⚠️ Capacity Mismatch (Pax %s). Upgrading %s to SUV.", pax, pref)
+            pref = "suv"
+
+    # Mapping Logic that respects backend types & typos
+    if "classic" in pref or "classis" in pref or "sedan" in pref or "car" in pref or "lexus" in pref or "standard" in pref:
+         car_model = "Classic Sedan"
+         v_type = "CLASSIC"
+    elif 'executive' in pref or 'business' in pref or 'vip' in pref:
+         car_model = "Executive Sedan"
+         v_type = "EXECUTIVE"
+    elif 'first class' in pref:
+         car_model = "First Class"
+         v_type = "FIRST_CLASS"
+    elif 'elite' in pref or 'v-class' in pref or 'mercedes van' in pref:
+         car_model = "Mercedes V Class"
+         v_type = "ELITE_VAN"
+    elif 'van' in pref:
+         car_model = "Luxury Van"
+         v_type = "ELITE_VAN"
+    elif 'minibus' in pref or 'bus' in pref:
+         car_model = "Luxury Minibus"
+         v_type = "MINI_BUS"
+    elif 'suv' in pref or 'gmc' in pref or 'yukon' in pref:
+         car_model = "Luxury SUV"
+         v_type = "LUXURY_SUV"
+    else:
+         # Hard Fallback to avoid 'CAR' 0-fare error
+         car_model = "Lexus ES"
+         v_type = "SEDAN"
+    return pax, lug, car_model, v_type
+
+def fallback_fare(v_type, base_dist):
+    return int(80 + (base_dist * 5.0)) if v_type == "SUV" else int(50 + (base_dist * 3.5))
+
+def clean_pickup_time(raw_time):
+    # Clean Time Format for Backend (Remove "p.m." etc if AI slipped up)
+    return (raw_time or '').replace('p.m.', '').replace('a.m.', '').strip()
+
+def display_pickup_time(clean_time):
+    # Pretty Format Pickup Time
+    try:
+        # Attempt to parse ISO or common formats
+        if "T" in clean_time:
+            return datetime.fromisoformat(clean_time).strftime('%d %b %Y, %I:%M %p')
+    except: pass
+    return clean_time
+
+def booking_payload(slots, caller, p, d, b_type, v_type, base_dist, pax, lug, fare, car_model, clean_time, transcript_url=None, reference=None):
+    """Backend create-manual body (verified mandatory fields)"""
+    payload = {
+        "customer_name": slots.get('customer_name'),
+        "customer_phone": caller,
+        "customer_email": slots.get('email', 'no@email.com'),
+        "pickup_location": p,
+        "dropoff_location": d,
+        "booking_type": b_type,
+        "vehicle_type": v_type,
+        "distance_km": base_dist,
+        "passengers_count": pax,
+        "luggage_count": lug,
+        "fare_aed": fare,
+        "vehicle_model": car_model,
+        "vehicle_name": car_model,
+        "vehicle": car_model,
+        "category": v_type,
+        "car_type": v_type,
+        "pickup_time": clean_time,
+        "notes": slots.get('extra_details', '')
+    }
+    if transcript_url: payload["transcript_url"] = transcript_url
+    if reference: payload["booking_reference"] = reference
+    return payload
+
+def final_message(car_model, fare, lang):
+    # Multi-language final message
+    if lang == "Arabic":
+        return f"شكراً. لقد تم حجز {car_model} بمبلغ {fare} درهم. ستتلقى تأكيداً قريباً. مع السلامة!"
+    return f"Great. I have booked the {car_model} for {fare} Dirhams. You will receive a confirmation shortly. Goodbye!"
+
+def hangup_twiml(msg, lang):
+    resp = VoiceResponse()
+    resp.say(msg, voice=VOICE_MAP.get(lang, "Polly.Joanna-Neural"))
+    resp.hangup()
+    return str(resp)
+
+def booking_email(bk_ref, p, d, display_time, car_model, v_type, pax, lug, base_dist, fare, slots, caller, transcript_url, timestamp):
+    """Premium admin email for a confirmed booking: (html, text)"""
+    return email_templates.render_both("booking_admin", email_templates.BookingEmail(
+        reference=bk_ref, status="📞 New Booking Received via Ayesha AI.",
+        pickup=p, dropoff=d, pickup_time=display_time, vehicle_type=v_type, car_model=car_model,
+        passengers=pax, luggage=lug, distance_km=base_dist, fare=fare,
+        customer_name=slots.get('customer_name', 'Not Provided'), phone=caller or 'N/A',
+        transcript_url=transcript_url, timestamp=timestamp))
+
+# ✅ SPECULATIVE PREFETCH (route, vehicles and fares fetched while the caller talks)
+PREFETCH = prefetch.Prefetcher()
+tracing.register_gauge("prefetch", PREFETCH.snapshot)
+PRICED_ACTIONS = ("confirm_pitch", "ask_reqs", "finalize")
+PREFETCH_WAIT_SECONDS = 6
+
+def route_key(slots):
+    return json.dumps([slots.get('pickup_location', 'Dubai'), slots.get('dropoff_location', 'Dubai')])
+
+def vehicles_key(slots):
+    return json.dumps([slots.get('passengers_count', 1), slots.get('luggage_count', 0)])
+
+def prefetch_key(slots):
+    return route_key(slots) + vehicles_key(slots)
+
+def plan_route(slots):
+    """Geocode both ends + driving distance"""
+    with turn_budget.stage("geocode", "google_maps"):
+        p_id = resolve_address(slots.get('pickup_location', 'Dubai'))
+        d_id = resolve_address(slots.get('dropoff_location', 'Dubai'))
+    # Human readable versions for sync/email
+    p, d = resolve_address_text(p_id), resolve_address_text(d_id)
+    try:
+        with turn_budget.stage("distance", "google_maps"):
+            base_dist = round(calc_dist(p_id, d_id), 1) # Calculate Accurate & Round for Speech
+    except:
+        base_dist = DEFAULT_DISTANCE_KM
+    return {"p_id": p_id, "d_id": d_id, "p": p, "d": d, "base_dist": base_dist, "b_type": booking_type_for(p, d)}
+
+def quote_fares(route, v_types, fares=None):
+    """Backend fare per vehicle type for a route, reusing quotes we already have"""
+    fares = dict(fares or {})
+    for v_type in v_types:
+        if fares.get(v_type): continue
+        with turn_budget.stage("fare", "backend"):
+            fares[v_type] = calculate_backend_fare(route['base_dist'], v_type, route['b_type'])
+    return fares
+
+def speculate_pitch(slots):
+    """Everything build_pitch needs (runs in the prefetch pool)"""
+    route = plan_route(slots)
+    with turn_budget.stage("vehicles", "backend"):
+        options = fetch_backend_vehicles(slots.get('passengers_count', 1), slots.get('luggage_count', 0))
+    return {"route_key": route_key(slots), "route": route, "vehicles_key": vehicles_key(slots), "options": options,
+            "fares": quote_fares(route, [v_type for v_type, _, _ in pitch_vehicles(options)])}
+
+def speculate(call_sid, state):
+    """Start the pitch prefetch once the route is known and the pitch is still ahead"""
+    slots = state['slots']
+    pre = collect_prefetch(call_sid, state, slots)
+    if not (slots.get('pickup_location') and slots.get('dropoff_location')) or slots.get('preferred_vehicle'): return
+    if pre.get('route_key') == route_key(slots) and pre.get('vehicles_key') == vehicles_key(slots): return
+    PREFETCH.start(call_sid, prefetch_key(slots), speculate_pitch, dict(slots))
+
+def collect_prefetch(call_sid, state, slots, wait_seconds=0.0):
+    """Move this call's finished speculation into state['prefetch'] (it is saved with the call
+    state). A job for older slots is only kept if the state has nothing for this route yet -
+    its route and fares still count when only passengers or luggage changed."""
+    found = PREFETCH.take(call_sid, prefetch_key(slots), wait_seconds)
+    if found and (found[0] == prefetch_key(slots) or not prefetched_route(state.get('prefetch') or {}, slots)):
+        state['prefetch'] = found[1]
+    return state.get('prefetch') or {}
+
+def keep_prefetch(state, slots, route, fares, options=None):
+    """Remember what a priced turn used, so later turns (repeat pitch, ask_reqs, finalize) reuse it"""
+    pre = state.get('prefetch') or {}
+    if options is None and pre.get('vehicles_key') == vehicles_key(slots): options = pre.get('options')
+    state['prefetch'] = {"route_key": route_key(slots), "route": route, "fares": fares,
+                         "vehicles_key": vehicles_key(slots) if options is not None else None, "options": options}
+
+def prefetched_route(pre, slots):
+    return pre.get('route') if pre.get('route_key') == route_key(slots) else None
+
+def prefetched_options(pre, slots):
+    return pre.get('options') if pre.get('vehicles_key') == vehicles_key(slots) else None
+
+def prefetched_fares(pre, slots):
+    return (pre.get('fares') or {}) if pre.get('route_key') == route_key(slots) else {}
+
+# ✅ DB (sync path)
+def load_state(conn, call_sid):
+    with conn.cursor() as cur:
+        cur.execute("SELECT data FROM call_state WHERE call_sid = %s", (call_sid,))
+        row = cur.fetchone()
+        return row['data'] if row else None
+
+def upsert_state(conn, call_sid, state):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO call_state (call_sid, data) VALUES (%s, %s) ON CONFLICT (call_sid) DO UPDATE SET data = %s",
+                    (call_sid, json.dumps(state), json.dumps(state)))
+    conn.commit()
+
+def insert_state(conn, call_sid, state):
+    """First write of a call; never replaces a state a turn has already saved"""
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO call_state (call_sid, data) VALUES (%s, %s) ON CONFLICT (call_sid) DO NOTHING",
+                    (call_sid, json.dumps(state)))
+    conn.commit()
+
+# held_turns: a held turn's reply, parked for whichever worker gets Twilio's next poll
+def mark_held(conn, call_sid, ttl=None):
+    """The call's turn is running; also clears its last reply and rows of callers who hung up"""
+    ttl = turn_budget.PENDING_TTL_SECONDS if ttl is None else ttl
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM held_turns WHERE held_at < now() - make_interval(secs => %s)", (ttl,))
+        cur.execute("INSERT INTO held_turns (call_sid, twiml) VALUES (%s, NULL) ON CONFLICT (call_sid) DO UPDATE SET twiml = NULL, held_at = now()",
+                    (call_sid,))
+    conn.commit()
+
+def park_reply(conn, call_sid, twiml):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE held_turns SET twiml = %s WHERE call_sid = %s", (twiml, call_sid))
+    conn.commit()
+
+def drop_reply(conn, call_sid):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM held_turns WHERE call_sid = %s", (call_sid,))
+    conn.commit()
+
+def collect_reply(conn, call_sid, running_for):
+    """{'twiml', 'running'} for a held turn (a parked reply is handed out once), None if nothing is held"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT twiml, held_at > now() - make_interval(secs => %s) AS running FROM held_turns WHERE call_sid = %s",
+                    (running_for, call_sid))
+        held = cur.fetchone()
+        if held and held['twiml']:
+            cur.execute("DELETE FROM held_turns WHERE call_sid = %s", (call_sid,))
+    conn.commit()
+    return held
+
+def booking_row(slots, caller, p, d, fare, v_type, b_type, pax, lug, base_dist, call_sid):
+    """bookings columns for the ledger: numbers go in as numbers (typed since migration 2)"""
+    try: fare = round(float(fare), 2)
+    except (TypeError, ValueError): fare = None
+    return {"customer_name": slots.get('customer_name'), "customer_phone": caller, "customer_email": slots.get('email'),
+            "pickup_location": p, "dropoff_location": d, "vehicle_type": v_type, "service_type": b_type,
+            "number_of_passengers": pax, "number_of_luggage": lug, "distance_km": base_dist,
+            "fare_aed": fare, "calculated_fare_aed": fare, "call_sid": call_sid}
+
+def claim_booking(conn, key, row):
+    """Save Booking once per key and claim its side effects: (reference, created, push, email).
+    A retried finalize gets the first reference back and push/email False once they're done."""
+    reference, created = LEDGER.record(conn, key, **row)
+    return reference, created, LEDGER.once(conn, key, "backend"), LEDGER.once(conn, key, "email")
+
+def settle_booking(conn, key, synced, emailed):
+    """A failed sync stays pending for the reconciler; a failed email is released for the next try"""
+    if synced: LEDGER.settle(conn, key, "confirmed")
+    if not emailed: LEDGER.release(conn, key, "email")
+
+def save_state(conn, call_sid, state):
+    # an upsert: the setup row may still be on its way (or lost with a DB blip)
+    upsert_state(conn, call_sid, state)
+
+def _process_turn(conn, call_sid, speech, caller):
+    # Load State: the first turn on this worker already has it from /select-language
+    state = CALL_SETUP.take(call_sid) or {"history": [], "slots": {}}
+    if conn and not state['history']:
+        with turn_budget.stage("db", "postgres"):
+            state = load_state(conn, call_sid) or state
+    turn_budget.note_language(state['slots'].get('language'))
+
+    state['history'].append({"role": "user", "content": speech})
+
+    # Process: dates/counts/email by rule first, the LLM only when something is left to understand
+    extracted, consumed = pre_extract(speech)
+    decision = rule_decision(state, extracted, consumed)
+    if decision is None:
+        with turn_budget.stage("llm", "openai"):
+            decision = run_ai(state['history'], state['slots'], extracted)
+    ai_msg, action = apply_decision(state, decision, extracted, consumed)
+    slots = state['slots']
+    sel_lang = slots.get('language', 'English')
+
+    # ✅ SHARED VARS for priced states: from the prefetch when the route hasn't changed
+    if action in PRICED_ACTIONS:
+        with turn_budget.stage("prefetch"):
+            pre = collect_prefetch(call_sid, state, slots, turn_budget.timeout(PREFETCH_WAIT_SECONDS))
+        route = prefetched_route(pre, slots) or plan_route(slots)
+        p, d, base_dist, b_type = route['p'], route['d'], route['base_dist'], route['b_type']
+        fares = prefetched_fares(pre, slots)
+
     # Logic: Present Options or Finalize
     if action == "confirm_pitch":
-        # Vars already calculated above
-        
         # Fetch Real Options (Matches Capacity)
-        pax = state['slots'].get('passengers_count', 1)
-        lug = state['slots'].get('luggage_count', 0)
-        options = fetch_backend_vehicles(pax, lug)
-        sel_lang = state['slots'].get('language', 'English')
-        
-        # Construction of the Pitch
-        logging.info(f"🚗 Options found: {type(options)} - {options}")
-        
-        if isinstance(options, list) and len(options) > 0:
-            # 1. Start with Address Confirmation
-            sel_lang = state['slots'].get('language', 'English')
-            if sel_lang == 'Arabic':
-                pitch = f"حسناً، لقد حددت المسار من {p} إلى {d}. "
-                pitch += f"لقد وجدت هذه الخيارات: "
-            else:
-                pitch = f"I've located the route from {p} to {d}. "
-                pitch += "I have these options for you based on our availability: "
-
-            # 2. Build the list of cars
-            for v in options[:2]:
-                if not isinstance(v, dict): continue
-                v_type = v.get('vehicle_type', v.get('type', v.get('category', 'SEDAN'))).upper()
-                
-                # Generic Name Logic
-                if v_type == 'CLASSIC': v_model = "Classic Sedan"
-                elif v_type == 'EXECUTIVE': v_model = "Executive Sedan"
-                elif v_type == 'SUV': v_model = "Luxury SUV"
-                elif v_type == 'ELITE_VAN': v_model = "Mercedes V Class"
-                else: v_model = v.get('vehicle_type', v.get('model', v.get('vehicle', 'Car'))).replace("_", " ").title()
-                
-                price = calculate_backend_fare(base_dist, v_type, b_type)
-                if not price:
-                    if v.get('base_fare'):
-                         price = int(float(v['base_fare']) + (base_dist * float(v.get('per_km_rate', 1))))
-                    else:
-                         price = int(50 + (base_dist * 3.5)) if v_type == "SEDAN" else int(80 + (base_dist * 5.0))
-                
-                # APPEND to pitch (Don't overwrite!)
-                if sel_lang == 'Arabic':
-                    pitch += f"سعر {v_model} لمسافة {base_dist} كيلومتر هو {price} درهم. "
-                else:
-                    pitch += f"A {v_model} for this {base_dist} kilometer journey is {price} Dirhams. "
-                
-            # 3. Add closing question
-            if sel_lang == 'Arabic': pitch += "أي سيارة تود حجزها؟"
-            else: pitch += "Which option would you like to book?"
-        else:
-            # Fallback if no cars found
-            if sel_lang == 'Arabic': pitch = "عفواً، لا توجد سيارات متاحة الآن."
-            else: pitch = "I'm sorry, I couldn't find any available vehicles for your requirements at the moment."
-        
+        options = prefetched_options(pre, slots)
+        if options is None:
+            with turn_budget.stage("vehicles", "backend"):
+                options = fetch_backend_vehicles(slots.get('passengers_count', 1), slots.get('luggage_count', 0))
+        logging.info("🚗 Options found: %s - %s", type(options), options)
+
+        fares = quote_fares(route, [v_type for v_type, _, _ in pitch_vehicles(options)], fares)
+        keep_prefetch(state, slots, route, fares, options)
+        prices = [fares.get(v_type) for v_type, _, _ in pitch_vehicles(options)]
         # Override AI response
-        ai_msg = pitch
+        ai_msg = build_pitch(options, prices, p, d, base_dist, sel_lang)
 
     elif action == "ask_reqs":
         # Calculate Price & State it BEFORE final confirmation
-        pax = state['slots'].get('passengers_count', 1)
-        p_val = state['slots'].get('preferred_vehicle')
-        pref = str(p_val).lower() if p_val else "car"
-        
-        # Quick Map (Same as Finalize)
-        if "classic" in pref or "sedan" in pref or "car" in pref: v_type = "CLASSIC"; v_model = "Classic Sedan"
-        elif 'executive' in pref or 'vip' in pref: v_type = "EXECUTIVE"; v_model = "Executive Sedan"
-        elif 'van' in pref or 'elite' in pref: v_type = "ELITE_VAN"; v_model = "Luxury Van"
-        elif 'suv' in pref: v_type = "LUXURY_SUV"; v_model = "Luxury SUV"
-        else: v_type = "CLASSIC"; v_model = "Classic Sedan"
-
-        price = calculate_backend_fare(base_dist, v_type, b_type)
+        v_type, v_model = quick_vehicle(slots)
+        fares = quote_fares(route, [v_type], fares)
+        keep_prefetch(state, slots, route, fares)
+        price = fares[v_type]
         if not price: price = int(50 + (base_dist * 3.5))
-
-        sel_lang = state['slots'].get('language', 'English')
-        if sel_lang == 'Arabic':
-            ai_msg = f"سعر {v_model} هو {price} درهم. هل لديك أي متطلبات أخرى؟"
-        else:
-            ai_msg = f"The price for the {v_model} is {price} Dirhams. Do you have any other requirements?"
+        ai_msg = ask_reqs_message(v_model, price, sel_lang)
 
     elif action == "finalize":
-        # p, d, base_dist, b_type are already calculated at top of function
-        
-        # Validate Capacity BEFORE Booking
-        try:
-            pax = int(state['slots'].get('passengers_count', 1))
-        except: pax = 1
-        
-        try:
-            lug = int(state['slots'].get('luggage_count', 0))
-        except: lug = 0
-        
-        # Get user preference first (Safe String)
-        p_val = state['slots'].get('preferred_vehicle')
-        pref = str(p_val).lower() if p_val else "car"
-
-        # 1. Force Upgrade for 7+ Passengers (Must be a Van or MiniBus)
-        if pax >= 7:
-            # Explicit checks to avoid Generator Scoping issues
-            is_van_type = "van" in pref or "bus" in pref or "sprinter" in pref or "v-class" in pref
-            if not is_van_type:
-                 logging.info(f"⚠️ High Capacity ({pax} pax). Forcing Upgrade to Elite Van.")
-                 pref = "van"
-
-        # 2. Force Upgrade for 5-6 Passengers (Must be SUV or Van)
-        elif pax > 4:
-            is_small_type = "classic" in pref or "executive" in pref or "sedan" in pref or "car" in pref or "lexus" in pref or "first class" in pref
-            if is_small_type:
-                logging.info(f"⚠️ Capacity Mismatch (Pax {pax}). Upgrading {pref} to SUV.")
-                pref = "suv"
-
-        # Determine Car & Final Price Dynamically
-        
-        # Mapping Logic that respects backend types & typos
-        if "classic" in pref or "classis" in pref or "sedan" in pref or "car" in pref or "lexus" in pref or "standard" in pref:
-             car_model = "Classic Sedan"
-             v_type = "CLASSIC"
-        elif 'executive' in pref or 'business' in pref or 'vip' in pref:
-             car_model = "Executive Sedan"
-             v_type = "EXECUTIVE"
-        elif 'first class' in pref:
-             car_model = "First Class"
-             v_type = "FIRST_CLASS"
-        elif 'elite' in pref or 'v-class' in pref or 'mercedes van' in pref:
-             car_model = "Mercedes V Class"
-             v_type = "ELITE_VAN" 
-        elif 'van' in pref: 
-             car_model = "Luxury Van"
-             v_type = "ELITE_VAN"
-        elif 'minibus' in pref or 'bus' in pref:
-             car_model = "Luxury Minibus"
-             v_type = "MINI_BUS"
-        elif 'suv' in pref or 'gmc' in pref or 'yukon' in pref:
-             car_model = "Luxury SUV"
-             v_type = "LUXURY_SUV" 
-        else:
-             # Hard Fallback to avoid 'CAR' 0-fare error
-             car_model = "Lexus ES"
-             v_type = "SEDAN"
-             
-        # Clean Time Format for Backend (Remove "p.m." etc if AI slipped up)
-        raw_time = state['slots'].get('pickup_time', '')
-        clean_time = raw_time.replace('p.m.', '').replace('a.m.', '').strip()
-             
+        pax, lug, car_model, v_type = final_vehicle(slots)
+        clean_time = clean_pickup_time(slots.get('pickup_time', ''))
+
         # Get Final Perfect Fare from Backend
-        fare = calculate_backend_fare(base_dist, v_type, b_type) or (
-            int(80 + (base_dist * 5.0)) if v_type == "SUV" else int(50 + (base_dist * 3.5))
-        )
+        fare = quote_fares(route, [v_type], fares)[v_type] or fallback_fare(v_type, base_dist)
+        PREFETCH.forget(call_sid)
 
-        # Save Booking (Verified Columns)
-        if conn:
-            try:
-                with conn.cursor() as cur:
-                    try:
-                         # Use columns confirmed by validation script:
-                         # customer_name, customer_phone, pickup_location, dropoff_location, fare_aed
-                         cur.execute("""
-                            INSERT INTO bookings 
-                            (customer_name, customer_phone, pickup_location, dropoff_location, fare_aed, status) 
-                            VALUES (%s, %s, %s, %s, %s, 'CONFIRMED')
-                         """, (
-                            state['slots'].get('customer_name'), 
-                            request.values.get('From'), 
-                            p, d, str(fare)
-                         ))
-                    except Exception as e:
-                        cur.connection.rollback()
-                        logging.error(f"❌ Primary Insert Failed: {e}")
-                        # Minimal Fallback
-                        try:
-                           cur.execute("INSERT INTO bookings (customer_name, fare_aed, status) VALUES (%s, %s, 'CONFIRMED')",
-                                    (state['slots'].get('customer_name'), str(fare)))
-                        except:
-                           cur.connection.rollback()
-                conn.commit()
-            except Exception as e:
-                logging.error(f"DB Connection Error: {e}")
+        # One booking per call, however often Twilio retries this turn (booking_ledger.py)
+        key = booking_ledger.call_key(call_sid)
+        with turn_budget.stage("db", "postgres"):
+            bk_ref, created, push, email = claim_booking(conn, key, booking_row(
+                slots, caller, p, d, fare, v_type, b_type, pax, lug, base_dist, call_sid))
+        if not created: log.info("♻️ Finalize repeated for %s: nothing is sent twice", bk_ref)
 
         # ✅ SYNC TO BACKEND (Verified mandatory fields)
-        sync_booking_to_backend({
-            "customer_name": state['slots'].get('customer_name'),
-            "customer_phone": request.values.get('From'),
-            "customer_email": state['slots'].get('email', 'no@email.com'),
-            "pickup_location": p,
-            "dropoff_location": d,
-            "booking_type": b_type,
-            "vehicle_type": v_type,
-            "distance_km": base_dist,
-            "passengers_count": pax,
-            "luggage_count": lug,
-            "fare_aed": fare,
-            "vehicle_model": car_model,
-            "vehicle_name": car_model, 
-            "vehicle": car_model, 
-            "category": v_type,
-            "car_type": v_type,
-            "pickup_time": clean_time,
-            "notes": state['slots'].get('extra_details', '')
-        })
+        synced = False
+        if push:
+            with turn_budget.stage("backend_sync", "backend"):
+                synced = sync_booking_to_backend(booking_payload(slots, caller, p, d, b_type, v_type, base_dist, pax, lug, fare, car_model,
+                                                                 clean_time, TRANSCRIPTS.link(call_sid), bk_ref))
 
         # Send Email (Premium Template)
-        bk_ref = f"STARS-{call_sid[-6:].upper() if call_sid else 'XXXX'}"
-        now_str = datetime.now().strftime('%d %B, %I:%M %p')
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Pretty Format Pickup Time
-        display_time = clean_time
-        try:
-            # Attempt to parse ISO or common formats
-            if "T" in clean_time:
-                dt_obj = datetime.fromisoformat(clean_time)
-                display_time = dt_obj.strftime('%d %b %Y, %I:%M %p')
-            else:
-                 # Fallback/Cleanup for non-ISO
-                 display_time = clean_time
-        except: pass
-        
-        email_body = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Helvetica, Arial, sans-serif; line-height: 1.5; color: #333; margin: 0; padding: 0; }}
-                .container {{ max-width: 900px; margin: 0 auto; background: #f8f9fa; padding: 15px; }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 25px; text-align: center; border-radius: 8px 8px 0 0; }}
-                .header h1 {{ margin: 0; font-size: 26px; font-weight: 700; }}
-                .content {{ background: white; padding: 25px; border-radius: 0 0 8px 8px; }}
-                .status {{ background: #e8f5e9; color: #2e7d32; padding: 12px; margin: 15px 0; border-radius: 5px; text-align: center; font-weight: 600; font-size: 15px; }}
-                .booking-bar {{ display: flex; justify-content: space-between; align-items: center; background: #f0f7ff; border-left: 4px solid #667eea; padding: 12px 15px; margin: 15px 0; border-radius: 5px; }}
-                .booking-label {{ color: #666; font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px; }}
-                .booking-value {{ font-size: 18px; font-weight: 700; color: #667eea; }}
-                .route-section {{ background: #f8f9fa; border-radius: 6px; padding: 15px; margin: 15px 0; }}
-                .route-header {{ font-size: 13px; color: #667eea; font-weight: 700; text-transform: uppercase; letter-spacing: 0.5px; margin-bottom: 12px; border-bottom: 2px solid #667eea; padding-bottom: 8px; }}
-                .route-flow {{ display: flex; justify-content: space-between; align-items: center; gap: 10px; }}
-                .route-item {{ flex: 1; text-align: center; padding: 10px; }}
-                .route-icon {{ font-size: 28px; margin-bottom: 5px; }}
-                .route-label {{ color: #999; font-size: 10px; text-transform: uppercase; margin-bottom: 3px; }}
-                .route-text {{ font-size: 13px; font-weight: 600; color: #333; }}
-                .connector {{ font-size: 20px; color: #ddd; margin-top: 20px; }}
-                .details-bar {{ display: grid; grid-template-columns: 1fr 1fr 1fr 1fr 1fr 1fr; gap: 10px; margin: 15px 0; }}
-                .detail-box {{ background: #f8f9fa; padding: 10px; border-radius: 5px; text-align: center; }}
-                .detail-label {{ color: #666; font-size: 10px; text-transform: uppercase; }}
-                .detail-value {{ font-size: 14px; font-weight: 700; color: #667eea; margin-top: 3px; }}
-                .detail-value.vehicle {{ color: #333; }}
-                .driver-section {{ background: #f0f7ff; border-left: 4px solid #667eea; border-radius: 6px; padding: 15px; margin: 15px 0; display: flex; gap: 15px; }}
-                .driver-pic {{ width: 80px; height: 80px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 8px; display: flex; align-items: center; justify-content: center; color: white; font-size: 40px; flex-shrink: 0; }}
-                .driver-info {{ flex: 1; }}
-                .driver-header {{ font-size: 13px; color: #667eea; font-weight: 700; text-transform: uppercase; margin-bottom: 10px; }}
-                .driver-name {{ font-size: 18px; font-weight: 700; color: #333; }}
-                .driver-number {{ font-size: 14px; color: #667eea; margin-top: 5px; font-weight: 600; }}
-                .driver-number a {{ color: #667eea; text-decoration: none; }}
-                .driver-number a:hover {{ text-decoration: underline; }}
-                .info-bar {{ display: grid; grid-template-columns: 1fr 1fr; gap: 12px; margin: 15px 0; }}
-                .info-item {{ background: #f8f9fa; padding: 12px; border-radius: 5px; }}
-                .info-label {{ color: #666; font-size: 11px; text-transform: uppercase; }}
-                .info-value {{ font-size: 14px; font-weight: 600; color: #333; margin-top: 4px; word-break: break-all; }}
-                .helpline-box {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px; border-radius: 6px; margin: 15px 0; text-align: center; }}
-                .helpline-label {{ font-size: 12px; text-transform: uppercase; opacity: 0.9; }}
-                .helpline-number {{ font-size: 18px; font-weight: 700; margin-top: 8px; }}
-                .helpline-number a {{ color: white; text-decoration: none; }}
-                .helpline-number a:hover {{ text-decoration: underline; }}
-                .footer {{ text-align: center; padding: 15px; color: #999; font-size: 11px; border-top: 1px solid #eee; margin-top: 20px; }}
-                .footer a {{ color: #667eea; text-decoration: none; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>⭐ Star Skyline Limousine</h1>
-                </div>
-                
-                <div class="content">
-                    <p>Hi <strong>Admin</strong>,</p>
-                    
-                    <div class="status">✅ 📞 New Booking Received via Ayesha AI.</div>
-                    
-                    <div class="booking-bar">
-                        <div>
-                            <div class="booking-label">Booking Reference</div>
-                            <div class="booking-value">{bk_ref}</div>
-                        </div>
-                    </div>
-                    <div class="route-section">
-                        <div class="route-header">📍 Route & Time</div>
-                        <div class="route-flow">
-                            <div class="route-item">
-                                <div class="route-icon">📤</div>
-                                <div class="route-label">Pickup Location</div>
-                                <div class="route-text">{p}</div>
-                            </div>
-                            <div class="connector">→</div>
-                            <div class="route-item">
-                                <div class="route-icon">⏰</div>
-                                <div class="route-label">Pickup Time</div>
-                                <div class="route-text">{display_time}</div>
-                            </div>
-                            <div class="connector">→</div>
-                            <div class="route-item">
-                                <div class="route-icon">📥</div>
-                                <div class="route-label">Dropoff Location</div>
-                                <div class="route-text">{d}</div>
-                            </div>
-                        </div>
-                    </div>
-                    
-                    <div class="info-bar">
-                        <div class="info-item">
-                            <div class="info-label">🚗 Vehicle</div>
-                            <div class="info-value vehicle">{car_model} <span style="font-size:12px; color:#999;">({v_type})</span></div>
-                        </div>
-                        <div class="info-item">
-                             <div class="info-label">👥 Passengers</div>
-                             <div class="info-value">{pax}</div>
-                        </div>
-                        <div class="info-item">
-                             <div class="info-label">🧳 Luggage</div>
-                             <div class="info-value">{lug}</div>
-                        </div>
-                         <div class="info-item">
-                             <div class="info-label">📏 Distance</div>
-                             <div class="info-value">{base_dist} km</div>
-                        </div>
-                    </div>
-
-                    <div class="driver-section">
-                        <div class="driver-pic">👨‍✈️</div>
-                        <div class="driver-info">
-                             <div class="driver-header">Your Chauffeur Service</div>
-                             <div class="driver-name">Star Skyline Chauffeurs</div>
-                             <div class="driver-number">Call for Support: <a href="tel:+971505374823">+971 50 537 4823</a></div>
-                        </div>
-                    </div>
-                    
-                    <!-- TRANSCRIPT MOVED TO BOTTOM -->
-                    <div style="margin-top: 20px; border-top: 1px solid #eee; padding-top: 15px;">
-                        <div class="booking-label" style="text-align:center; margin-bottom:10px;">Full Conversation Transcript</div>
-                        <div style="background:#f1f1f1; padding:15px; border-radius:5px; font-size:11px; color:#555; white-space: pre-wrap; max-height: 200px; overflow-y: auto;">
-{chr(10).join([f"{m['role'].upper()}: {m['content']}" for m in state['history']])}
-                        </div>
-                    </div>
-                                <div class="route-icon">📥</div>
-                                <div class="route-label">Dropoff Location</div>
-                                <div class="route-text">{d}</div>
-                            </div>
-                        </div>
-                    </div>
-                    
-                    <div class="details-bar">
-                        <div class="detail-box">
-                            <div class="detail-label">Vehicle Type</div>
-                            <div class="detail-value vehicle">{v_type}</div>
-                        </div>
-                        <div class="detail-box">
-                            <div class="detail-label">Car Model</div>
-                            <div class="detail-value vehicle">{car_model}</div>
-                        </div>
-                        <div class="detail-box">
-                            <div class="detail-label">Distance</div>
-                            <div class="detail-value">{base_dist} km</div>
-                        </div>
-                        <div class="detail-box">
-                            <div class="detail-label">Passengers</div>
-                            <div class="detail-value">{pax}</div>
-                        </div>
-                        <div class="detail-box">
-                            <div class="detail-label">Luggage</div>
-                            <div class="detail-value">{lug}</div>
-                        </div>
-                        <div class="detail-box">
-                            <div class="detail-label">Total Fare</div>
-                            <div class="detail-value">AED {fare}</div>
-                        </div>
-                    </div>
-                    
-                    <div class="driver-section">
-                        <div class="driver-pic">👨💼</div>
-                        <div class="driver-info">
-                            <div class="driver-header">🚗 Driver Status</div>
-                            <div class="driver-name">Pending Assignment</div>
-                            <div class="driver-number">📞 <a href="tel:N/A">N/A</a></div>
-                        </div>
-                    </div>
-                    
-                    <div class="info-bar">
-                        <div class="info-item">
-                            <div class="info-label">👤 Customer Name</div>
-                            <div class="info-value">{state['slots'].get('customer_name', 'Not Provided')}</div>
-                        </div>
-                        <div class="info-item">
-                            <div class="info-label">📞 Phone</div>
-                            <div class="info-value">{request.values.get('From', 'N/A')}</div>
-                        </div>
-                    </div>
-                    
-                    <div class="helpline-box">
-                        <div class="helpline-label">Need Help? Contact Management</div>
-                        <div class="helpline-number"><a href="tel:+971501234567">+971 50 123 4567</a></div>
-                    </div>
-                    
-                    <p style="margin-top: 30px; color: #666; font-size: 14px;">
-                        ✅ Booking has been synced to the primary backend.<br>
-                        ⏱️ Admin follow-up required for driver assignment.
-                    </p>
-                    
-                    <div class="footer">
-                        <p>Star Skyline Limousine Service • Dubai, UAE<br>
-                        <a href="https://starskyline.ae">Visit our website</a> | 
-                        <a href="tel:+971501234567">Call us</a></p>
-                        <p>Booking Timestamp: {timestamp}</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        try:
-            send_email(f"🚀 NEW BOOKING: {state['slots'].get('customer_name', 'Guest')}", email_body)
-        except Exception as e:
-            logging.error(f"❌ Critical Email Failure: {e}")
-        
+        sent = not email
+        if email:
+            email_html, email_text = booking_email(
+                bk_ref, p, d, display_pickup_time(clean_time), car_model, v_type,
+                pax, lug, base_dist, fare, slots, caller, TRANSCRIPTS.link(call_sid), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            try:
+                with turn_budget.stage("email", "resend"):
+                    sent = send_email(f"🚀 NEW BOOKING: {slots.get('customer_name', 'Guest')}", email_html, email_text)
+            except Exception as e:
+                logging.error("❌ Critical Email Failure: %s", e)
+        if synced or not sent:
+            with turn_budget.stage("db", "postgres"):
+                settle_booking(conn, key, synced, sent)
+
         # Save Final History
-        lang = state['slots'].get('language', 'English')
-        
-        # Multi-language final message
-        if lang == "Arabic":
-            ai_msg = f"شكراً. لقد تم حجز {car_model} بمبلغ {fare} درهم. ستتلقى تأكيداً قريباً. مع السلامة!"
-        else:
-            ai_msg = f"Great. I have booked the {car_model} for {fare} Dirhams. You will receive a confirmation shortly. Goodbye!"
-            
+        ai_msg = final_message(car_model, fare, sel_lang)
         state['history'].append({"role": "assistant", "content": ai_msg})
+        record_turn(call_sid, state, state['history'][-2:])
         if conn:
-            with conn.cursor() as cur:
-                cur.execute("UPDATE call_state SET data = %s WHERE call_sid = %s", (json.dumps(state), call_sid))
-            conn.commit()
-            conn.close()
-
-        resp = VoiceResponse()
-        voice_map = {"English": "Polly.Joanna-Neural", "Arabic": "Polly.Zeina"}
-        
-        resp.say(ai_msg, voice=voice_map.get(lang, "Polly.Joanna-Neural"))
-             
-        resp.hangup()
-        return str(resp)
-    
+            with turn_budget.stage("db", "postgres"):
+                save_state(conn, call_sid, state)
+        return hangup_twiml(ai_msg, sel_lang)
+
     # Continue Loop (Global History Update)
     state['history'].append({"role": "assistant", "content": ai_msg})
+    record_turn(call_sid, state, state['history'][-2:])
+    if action != "confirm_pitch":
+        speculate(call_sid, state)  # runs while the reply is spoken and the caller answers
     if conn:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE call_state SET data = %s WHERE call_sid = %s", (json.dumps(state), call_sid))
-        conn.commit()
-    
+        with turn_budget.stage("db", "postgres"):
+            save_state(conn, call_sid, state)
+
     # Multi-language voice selection
-    lang = state['slots'].get('language', 'English')
-    voice_map = {"English": "Polly.Joanna-Neural", "Arabic": "Polly.Zeina"}
-    tw_lang_map = {"English": "en-US", "Arabic": "ar-XA"}
-    
-    
-    resp = VoiceResponse()
-    gather = resp.gather(input='speech', action='/handle', timeout=5, language=tw_lang_map.get(lang, "en-US"))
-    
-    use_voice = voice_map.get(lang, "Polly.Joanna-Neural")
-    gather.say(ai_msg, voice=use_voice)
-        
-    resp.redirect('/handle')
-    return str(resp)
+    return gather_twiml(ai_msg, sel_lang)
+
+# ✅ METRICS: p50/p95/p99 per stage and per dependency
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(tracing.metrics_snapshot())
+
+# ✅ USAGE REPORT: cost and vendor time per item and per call; needs ADMIN_TOKEN (404 without one)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def admin_authorized():
+    """Authorization: Bearer only - a ?token= would end up in access logs, proxies and browser history"""
+    scheme, _, supplied = request.headers.get("Authorization", "").partition(" ")
+    return scheme == "Bearer" and hmac.compare_digest(supplied.strip().encode(), ADMIN_TOKEN.encode())
+
+@app.route('/admin/usage', methods=['GET'])
+def admin_usage():
+    if not ADMIN_TOKEN: return "Not Found", 404
+    if not admin_authorized(): return "Unauthorized", 401
+    if request.args.get('call'):
+        return jsonify({"call_key": request.args['call'], "items": USAGE.call(request.args['call'])})
+    return jsonify(USAGE.report(request.args.get('hours', 24, type=float), request.args.get('top', 10, type=int)))
 
 # ✅ ROUTE MATCHING: /call-status -> Dummy handler to prevent 404s
 @app.route('/call-status', methods=['POST'])
 def call_status():
     return "OK", 200
 
-# Init Tables
-with app.app_context():
-    init_tables()
+# ✅ LIFECYCLE: schema once (gunicorn master), warmups per worker - see lifecycle.py
+LIFECYCLE = lifecycle.Lifecycle("main", schema=init_tables)
+LIFECYCLE.on_worker(RECONCILER.start, "reconciler", stop=RECONCILER.stop)  # finalize leaves failed syncs pending
+LIFECYCLE.on_worker(USAGE.start, "usage", stop=USAGE.stop)
+LIFECYCLE.on_preload(lazy_vendors.preload, "vendor_sdks")
+LIFECYCLE.on_preload(gazetteer.default, "gazetteer")
+tracing.register_gauge("lifecycle", LIFECYCLE.snapshot)
+tracing.register_gauge("vendors", lazy_vendors.snapshot)
+
+# ✅ HEALTH: liveness and readiness probes
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify(LIFECYCLE.liveness())
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, checks = LIFECYCLE.readiness()
+    return jsonify({"ready": ready, "checks": checks}), (200 if ready else 503)
+
+# Setup TwiML is the same for every call: render it once
+for _lang in GREETINGS: greeting_twiml(_lang)
+for _attempt in range(1, LANGUAGE_MENU_ATTEMPTS + 1): language_menu_twiml(_attempt)
 
 if __name__ == "__main__":
+    LIFECYCLE.start()
     app.run(host='0.0.0.0', port=os.environ.get("PORT", 5000))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# ✅ SCHEMA MIGRATIONS - versioned, forward-only, applied at startup
+#
+# init_tables used to CREATE TABLE IF NOT EXISTS a bookings table with a TEXT
+# fare and no indexes, while finalize inserted into columns that table never
+# had (customer_phone, pickup_location, fare_aed) and fell back to a second
+# INSERT; the legacy app's pending sync filtered on customer_phone and
+# booking_status with nothing to index them. Schema changes now live here:
+#   * MIGRATIONS is an ordered list of (version, name, statements); a version,
+#     once shipped, is never edited - change the schema with a new one
+#   * schema_migrations records what ran; migrate() applies the rest, each
+#     migration in its own transaction
+#   * a Postgres advisory lock keeps gunicorn workers starting together from
+#     racing each other; the second one finds nothing left to do
+# Statements are written to work on a fresh database and on the tables
+# production already has (ADD COLUMN IF NOT EXISTS, ALTER ... TYPE ... USING).
+#
+#   python migrations.py            apply pending migrations to DATABASE_URL
+#   python migrations.py --status   list applied / pending versions
+import os
+import sys
+import logging
+import argparse
+
+LOCK_KEY = 7746120  # pg_advisory_lock key, shared by every process of this app
+
+BOOKING_STATES = ("pending", "pending_confirmation", "pending_location_issue", "pending_no_response",
+                  "confirmed", "cancelled", "completed")
+
+MIGRATIONS = [
+    (1, "baseline", [
+        """CREATE TABLE IF NOT EXISTS call_state (
+               call_sid VARCHAR(255) PRIMARY KEY,
+               data JSONB,
+               updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+        """CREATE TABLE IF NOT EXISTS bookings (
+               id SERIAL PRIMARY KEY,
+               customer_name TEXT,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )""",
+        """CREATE TABLE IF NOT EXISTS transcript_segments (
+               transcript_id VARCHAR(64),
+               seq INTEGER,
+               call_sid VARCHAR(255),
+               codec VARCHAR(8),
+               body BYTEA,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               PRIMARY KEY (transcript_id, seq)
+           )""",
+    ]),
+    (2, "typed_bookings", [
+        # the states main.py and the legacy app write into booking_status
+        """DO $$ BEGIN
+               CREATE TYPE booking_state AS ENUM (%s);
+           EXCEPTION WHEN duplicate_object THEN NULL;
+           END $$""" % ", ".join(f"'{s}'" for s in BOOKING_STATES),
+        """ALTER TABLE bookings
+               ADD COLUMN IF NOT EXISTS booking_reference VARCHAR(32),
+               ADD COLUMN IF NOT EXISTS call_sid VARCHAR(255),
+               ADD COLUMN IF NOT EXISTS customer_phone VARCHAR(32),
+               ADD COLUMN IF NOT EXISTS customer_email TEXT,
+               ADD COLUMN IF NOT EXISTS pickup_location TEXT,
+               ADD COLUMN IF NOT EXISTS dropoff_location TEXT,
+               ADD COLUMN IF NOT EXISTS pickup_time TIMESTAMPTZ,
+               ADD COLUMN IF NOT EXISTS vehicle_type VARCHAR(32),
+               ADD COLUMN IF NOT EXISTS service_type VARCHAR(32),
+               ADD COLUMN IF NOT EXISTS number_of_passengers SMALLINT,
+               ADD COLUMN IF NOT EXISTS number_of_luggage SMALLINT,
+               ADD COLUMN IF NOT EXISTS distance_km NUMERIC(8, 2),
+               ADD COLUMN IF NOT EXISTS fare_aed TEXT,
+               ADD COLUMN IF NOT EXISTS calculated_fare_aed TEXT,
+               ADD COLUMN IF NOT EXISTS booking_status TEXT,
+               ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now()""",
+        # the first schema's columns, where a database still has them
+        """DO $$ BEGIN
+               UPDATE bookings SET customer_phone = COALESCE(customer_phone, phone),
+                                   pickup_location = COALESCE(pickup_location, pickup),
+                                   dropoff_location = COALESCE(dropoff_location, dropoff),
+                                   fare_aed = COALESCE(fare_aed, fare),
+                                   booking_status = COALESCE(booking_status, status);
+           EXCEPTION WHEN undefined_column THEN NULL;
+           END $$""",
+        # "AED 120", "120.0", "" -> 120.00 / NULL
+        """ALTER TABLE bookings
+               ALTER COLUMN fare_aed TYPE NUMERIC(10, 2)
+                   USING NULLIF(regexp_replace(fare_aed::text, '[^0-9.]', '', 'g'), '')::numeric,
+               ALTER COLUMN calculated_fare_aed TYPE NUMERIC(10, 2)
+                   USING NULLIF(regexp_replace(calculated_fare_aed::text, '[^0-9.]', '', 'g'), '')::numeric""",
+        # 'CONFIRMED' (main.py) and 'confirmed' (legacy) are the same state; anything unknown is pending
+        """ALTER TABLE bookings
+               ALTER COLUMN booking_status TYPE booking_state
+                   USING CASE WHEN lower(booking_status::text) IN (%s) THEN lower(booking_status::text)::booking_state
+                              ELSE 'pending' END,
+               ALTER COLUMN booking_status SET DEFAULT 'pending',
+               ALTER COLUMN booking_status SET NOT NULL""" % ", ".join(f"'{s}'" for s in BOOKING_STATES),
+        """ALTER TABLE bookings
+               ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+               ALTER COLUMN created_at SET DEFAULT now(),
+               ALTER COLUMN created_at SET NOT NULL""",
+    ]),
+    (3, "booking_indexes", [
+        # legacy sync_pending_bookings_to_backend: WHERE customer_phone = %s AND booking_status = ...
+        "CREATE INDEX IF NOT EXISTS bookings_phone_status_idx ON bookings (customer_phone, booking_status)",
+        # the portal / follow-ups: open bookings, newest first
+        "CREATE INDEX IF NOT EXISTS bookings_status_created_idx ON bookings (booking_status, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS bookings_created_idx ON bookings (created_at DESC)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS bookings_reference_idx ON bookings (booking_reference) WHERE booking_reference IS NOT NULL",
+    ]),
+    (4, "booking_sync", [
+        # booking_reconciler.py: retry bookkeeping for pushes to the backend
+        """ALTER TABLE bookings
+               ADD COLUMN IF NOT EXISTS sync_attempts SMALLINT NOT NULL DEFAULT 0,
+               ADD COLUMN IF NOT EXISTS next_sync_at TIMESTAMPTZ,
+               ADD COLUMN IF NOT EXISTS last_sync_error TEXT""",
+        # only the (few) bookings still waiting for the backend
+        """CREATE INDEX IF NOT EXISTS bookings_sync_due_idx ON bookings (next_sync_at, created_at)
+               WHERE booking_status = 'pending_confirmation'""",
+    ]),
+    (5, "booking_idempotency", [
+        # booking_ledger.py: one row per idempotency key, one claim per side effect
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS idempotency_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS bookings_idempotency_idx ON bookings (idempotency_key)",
+        """CREATE TABLE IF NOT EXISTS booking_effects (
+               idempotency_key TEXT,
+               effect VARCHAR(32),
+               claimed_at TIMESTAMPTZ DEFAULT now(),
+               PRIMARY KEY (idempotency_key, effect)
+           )""",
+    ]),
+    (6, "call_usage", [
+        # usage_ledger.py: billable vendor calls summed per call + vendor + item
+        """CREATE TABLE IF NOT EXISTS call_usage (
+               call_key VARCHAR(64),
+               phone VARCHAR(32),
+               vendor VARCHAR(32),
+               item VARCHAR(64),
+               unit VARCHAR(16),
+               events INTEGER DEFAULT 0,
+               cached_events INTEGER DEFAULT 0,
+               quantity NUMERIC DEFAULT 0,
+               quantity_out NUMERIC DEFAULT 0,
+               ms BIGINT DEFAULT 0,
+               cost_usd NUMERIC(14,6) DEFAULT 0,
+               saved_usd NUMERIC(14,6) DEFAULT 0,
+               first_at TIMESTAMPTZ DEFAULT now(),
+               last_at TIMESTAMPTZ DEFAULT now(),
+               PRIMARY KEY (call_key, vendor, item)
+           )""",
+        "CREATE INDEX IF NOT EXISTS call_usage_last_at_idx ON call_usage (last_at DESC)",
+    ]),
+    (7, "held_turns", [
+        # turn_budget.hand_off: a held turn's reply, collected by whichever worker Twilio polls
+        """CREATE TABLE IF NOT EXISTS held_turns (
+               call_sid VARCHAR(255) PRIMARY KEY,
+               twiml TEXT,
+               held_at TIMESTAMPTZ DEFAULT now()
+           )""",
+    ]),
+    (8, "whatsapp_deliveries", [
+        # transcript_cache.MessageDedup: one claim per MessageSid across workers
+        """CREATE TABLE IF NOT EXISTS whatsapp_deliveries (
+               delivery_id VARCHAR(255) PRIMARY KEY,
+               seen_at TIMESTAMPTZ DEFAULT now()
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_whatsapp_deliveries_seen_at ON whatsapp_deliveries (seen_at)",
+    ]),
+]
+
+
+def _version(row):
+    return row["version"] if isinstance(row, dict) else row[0]  # RealDictCursor (main) or tuples (legacy)
+
+
+def applied_versions(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                       version INTEGER PRIMARY KEY,
+                       name TEXT NOT NULL,
+                       applied_at TIMESTAMPTZ DEFAULT now()
+                   )""")
+    cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return {_version(row) for row in cur.fetchall()}
+
+
+def pending(applied, migrations=MIGRATIONS):
+    return [m for m in migrations if m[0] not in applied]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply every migration not yet in schema_migrations; returns the versions applied.
+    A failing migration is rolled back and raised - the ones before it stay applied."""
+    done = []
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        todo = pending(applied_versions(cur), migrations)
+        conn.commit()
+        for version, name, statements in todo:
+            try:
+                for sql in statements:
+                    cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logging.error("❌ Migration %s (%s) failed; schema is at %s", version, name, done[-1] if done else 'its previous version')
+                raise
+            done.append(version)
+            logging.info("[DB] ✅ Migration %s applied: %s", version, name)
+    finally:
+        try:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+            conn.commit()
+        except Exception:
+            conn.rollback()  # the lock goes with the session anyway
+        cur.close()
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply the app's schema migrations")
+    parser.add_argument("--status", action="store_true", help="list applied and pending versions only")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        print("❌ DATABASE_URL not set")
+        return 1
+    import psycopg2
+    conn = psycopg2.connect(args.database_url)
+    try:
+        if args.status:
+            with conn.cursor() as cur:
+                applied = applied_versions(cur)
+            conn.commit()
+            for version, name, _ in MIGRATIONS:
+                print(f"{'✅' if version in applied else '⏳'} {version:3d} {name}")
+            return 0
+        done = migrate(conn)
+        print(f"✅ {len(done)} migration(s) applied" if done else "✅ Schema is up to date")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# ✅ NOTIFY DISPATCHER - team alerts over reused SMTP connections, optionally as a digest
+#
+# notify_booking_to_team put every alert (created, pending, dropped,
+# partial_info, location_failed) on the WhatsApp sender threads, and every
+# send opened its own smtplib.SMTP_SSL connection: connect + TLS + AUTH per
+# email, hundreds of handshakes on a busy evening, and email bursts holding
+# threads that WhatsApp replies were waiting for. Now:
+#   * SmtpSessions keeps logged-in connections and hands them out again; one
+#     idle for longer than SMTP_IDLE_SECONDS is replaced, and a connection the
+#     server dropped is reopened once before the send counts as failed
+#   * alerts have their own bounded outbox (twilio_sender.Outbox, unpaced)
+#   * digest mode (NOTIFY_DIGEST_MINUTES > 0): low-priority alerts
+#     (NOTIFY_DIGEST_STATUSES) are collected and go out as one
+#     follow_up_digest email every N minutes, or as soon as NOTIFY_DIGEST_MAX
+#     are waiting. "created", "location_failed" and the rest are sent at once.
+#
+#   NOTIFY_WORKERS          sender threads (default 2)
+#   NOTIFY_QUEUE_MAX        alerts waiting before notify() refuses (500)
+#   NOTIFY_DIGEST_MINUTES   0 = off: every alert is its own email (default)
+#   NOTIFY_DIGEST_STATUSES  statuses batched into the digest (partial_info,dropped)
+#   NOTIFY_DIGEST_MAX       send the digest early at this many alerts (50)
+#   SMTP_IDLE_SECONDS       reuse a connection idle for at most this long (120)
+import os
+import time
+import smtplib
+import threading
+from collections import Counter
+
+import tracing
+import twilio_sender
+import email_templates
+
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "2"))
+NOTIFY_QUEUE_MAX = int(os.getenv("NOTIFY_QUEUE_MAX", "500"))
+NOTIFY_DIGEST_MINUTES = float(os.getenv("NOTIFY_DIGEST_MINUTES", "0"))
+NOTIFY_DIGEST_STATUSES = tuple(s.strip() for s in os.getenv("NOTIFY_DIGEST_STATUSES", "partial_info,dropped").split(",") if s.strip())
+NOTIFY_DIGEST_MAX = int(os.getenv("NOTIFY_DIGEST_MAX", "50"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "120"))
+
+# status -> (subject, status line in the email)
+ALERTS = {
+    "created": ("✅ New Booking Confirmed - Star Skyline", "🎉 Booking successfully created and confirmed by customer!"),
+    "pending": ("⏳ Pending Booking (Backend Down) - Star Skyline", "⚠️ Booking saved locally - Backend was unavailable. Please sync when backend is online."),
+    "failed": ("❌ Booking Failed - Customer May Not Have Confirmed", "❌ Booking creation failed. Customer needs manual follow-up."),
+    "dropped": ("📞 Call Dropped - Customer May Need Follow-up", "📞 Customer call dropped mid-conversation. Please follow up immediately!"),
+    "partial_info": ("⚠️ Partial Booking Data Collected - Customer May Need Follow-up", "⚠️ Customer provided some booking details but didn't complete the full booking. Follow up with them!"),
+    "location_failed": ("🚨 MISSED LEAD - Pickup Location Issue - Star Skyline", "🚨 URGENT: Customer called but could not provide a valid pickup location after 3 attempts. PLEASE CALL THEM BACK IMMEDIATELY!"),
+}
+
+
+def alert_text(status):
+    return ALERTS.get(status, (f"Booking Notification ({status})", "New booking notification"))
+
+
+class SmtpSessions:
+    """Logged-in SMTP connections, reused across sends. connect() returns a new one."""
+
+    def __init__(self, connect, idle_seconds=SMTP_IDLE_SECONDS):
+        self.connect = connect
+        self.idle_seconds = idle_seconds
+        self.idle = []  # (conn, generation, last_used)
+        self.generation = 0  # bumped by close(): connections out on a send aren't reused
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def _checkout(self):
+        now, stale = time.monotonic(), []
+        with self.lock:
+            while self.idle:
+                conn, gen, used = self.idle.pop()
+                if gen == self.generation and now - used <= self.idle_seconds:
+                    self.stats["reused"] += 1
+                    return conn, gen, True
+                stale.append(conn)
+            gen = self.generation
+        for conn in stale: self._quit(conn)
+        with tracing.span("smtp_connect", "smtp"):
+            conn = self.connect()
+        self._count("connected")
+        return conn, gen, False
+
+    def _checkin(self, conn, gen):
+        with self.lock:
+            if gen == self.generation:
+                self.idle.append((conn, gen, time.monotonic()))
+                return
+        self._quit(conn)
+
+    def _quit(self, conn):
+        try: conn.quit()
+        except Exception: pass
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def send(self, msg):
+        conn, gen, reused = self._checkout()
+        try:
+            conn.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self._quit(conn)
+            if not reused: raise
+            # the server closed a connection we'd kept: one fresh try
+            self._count("reconnected")
+            conn, gen, _ = self._checkout()
+            try:
+                conn.send_message(msg)
+            except Exception:
+                self._quit(conn)
+                raise
+        except Exception:
+            self._quit(conn)
+            raise
+        self._count("sent")
+        self._checkin(conn, gen)
+
+    def close(self):
+        with self.lock:
+            self.generation += 1
+            idle, self.idle = self.idle, []
+        for conn, _, _ in idle: self._quit(conn)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, idle=len(self.idle))
+
+
+class Dispatcher:
+    """Team alerts: urgent ones sent at once, low-priority ones optionally batched"""
+
+    def __init__(self, deliver, digest_minutes=NOTIFY_DIGEST_MINUTES, digest_statuses=NOTIFY_DIGEST_STATUSES,
+                 digest_max=NOTIFY_DIGEST_MAX, workers=NOTIFY_WORKERS, queue_max=NOTIFY_QUEUE_MAX, name="notify"):
+        self.deliver = deliver  # (subject, html, text) -> bool
+        self.digest_seconds = digest_minutes * 60
+        self.digest_statuses = set(digest_statuses)
+        self.digest_max = max(1, digest_max)
+        self.outbox = twilio_sender.Outbox(workers=workers, queue_max=queue_max, dest_interval=0, mps=0, name=name)
+        self.waiting = []  # BookingEmail records for the next digest
+        self.timer = None
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def notify(self, booking_data, status="created"):
+        """"sent" (queued now), "digest" (held for the next digest) or None (queue full)"""
+        subject, line = alert_text(status)
+        record = email_templates.from_booking(booking_data, line)
+        if self.digest_seconds > 0 and status in self.digest_statuses:
+            self._hold(record._replace(status=subject, timestamp=time.strftime('%Y-%m-%d %H:%M:%S')))
+            return "digest"
+        if not self.outbox.call(lambda: self._send(subject, "booking_status", record), kind=f"email:{status}"):
+            self._count("refused")
+            return None
+        return "sent"
+
+    def _send(self, subject, template, record):
+        html, text = email_templates.render_both(template, record)
+        ok = self.deliver(subject, html, text)
+        self._count("sent" if ok else "failed")
+        return ok
+
+    def _hold(self, record):
+        with self.lock:
+            self.waiting.append(record)
+            self.stats["held"] += 1
+            full = len(self.waiting) >= self.digest_max
+            if not full and self.timer is None:
+                self.timer = threading.Timer(self.digest_seconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if full: self.flush()
+
+    def flush(self):
+        """Queue the digest of everything waiting now; False when nothing was waiting"""
+        with self.lock:
+            items, self.waiting = tuple(self.waiting), []
+            if self.timer is not None: self.timer.cancel()
+            self.timer = None
+            if items: self.stats["digests"] += 1
+        if not items: return False
+        subject = f"📋 {len(items)} Follow-up{'s' if len(items) > 1 else ''} - Star Skyline"
+        digest = email_templates.Digest(
+            reference=f"{len(items)} follow-ups",
+            status=f"{len(items)} callers from {items[0].timestamp} to {items[-1].timestamp} may need a follow-up",
+            items=items)
+        if not self.outbox.call(lambda: self._send(subject, "follow_up_digest", digest), kind="email:digest"):
+            self._count("refused")
+            return False
+        return True
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def drain(self, timeout=30.0):
+        """Send the waiting digest and wait for every queued email (tests, shutdown)"""
+        self.flush()
+        return self.outbox.drain(timeout)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, waiting=len(self.waiting), digest_minutes=self.digest_seconds / 60,
+                        pending=self.outbox.pending)
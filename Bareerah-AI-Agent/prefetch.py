@@ -0,0 +1,127 @@
+# ✅ SPECULATIVE PREFETCH - fetch the pitch while the caller is still talking
+#
+# Pickup and dropoff are usually known two or three turns before the pitch
+# ("how many passengers?", "any luggage?"), but geocoding, distance, vehicle
+# suggestions and fare quotes were only fetched on the confirm_pitch turn, in
+# series, inside the 2.5s turn budget. The voice paths now hand that work to
+# this pool as soon as the route is known and go on answering; the pitch turn
+# picks the finished results up instead of blocking on five vendor calls.
+#
+# One entry per call, tagged with the key of the slots it was computed from
+# (pickup, dropoff, passengers, luggage). start() with the same key is a no-op;
+# a new key replaces the entry (the old job finishes but nobody reads it).
+# take() hands a finished result over once: callers keep it in the call state
+# (plain JSON), so a turn served by another worker process still finds it.
+#
+#   PREFETCH_WORKERS      background threads (default 4)
+#   PREFETCH_TTL_SECONDS  entries older than this are dropped (900)
+#   PREFETCH_ENABLED=false  fetch everything on the pitch turn again
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import tracing
+import structured_log
+
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "900"))
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() != "false"
+
+
+class Prefetcher:
+    """Per-call speculative jobs on a small thread pool"""
+
+    def __init__(self, workers=PREFETCH_WORKERS, ttl=PREFETCH_TTL_SECONDS, name="prefetch", enabled=PREFETCH_ENABLED):
+        self.name = name
+        self.ttl = ttl
+        self.enabled = enabled
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.entries = {}  # call_sid -> (key, future, started)
+        self.running = set()  # every unfinished future, including replaced/forgotten ones
+        self.stats = {"started": 0, "reused": 0, "hits": 0, "stale": 0, "waited": 0, "not_ready": 0, "failed": 0, "expired": 0}
+
+    def _prune(self, now):
+        for call_sid, (_, _, started) in list(self.entries.items()):
+            if now - started > self.ttl:
+                del self.entries[call_sid]
+                self.stats["expired"] += 1
+
+    def start(self, call_sid, key, fn, *args):
+        """Run fn(*args) in the background for this call unless the same key is already there"""
+        if not self.enabled or not call_sid: return None
+        now = time.monotonic()
+        with self.lock:
+            self._prune(now)
+            entry = self.entries.get(call_sid)
+            if entry and entry[0] == key and not (entry[1].done() and entry[1].exception()):
+                self.stats["reused"] += 1
+                return entry[1]
+            future = self.pool.submit(self._run, call_sid, fn, *args)
+            self.entries[call_sid] = (key, future, now)
+            self.running.add(future)
+            self.stats["started"] += 1
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self.lock:
+            self.running.discard(future)
+
+    def _run(self, call_sid, fn, *args):
+        structured_log.bind(call_sid=call_sid)
+        with tracing.span(self.name, call_sid=call_sid):
+            try:
+                return fn(*args)
+            except Exception as e:
+                with self.lock:
+                    self.stats["failed"] += 1
+                logging.error("❌ Prefetch failed for %s: %s", call_sid, e)
+                raise
+            finally:
+                structured_log.bind()
+
+    def pending(self, call_sid, key):
+        """The future for this call and key (running or done), or None"""
+        with self.lock:
+            entry = self.entries.get(call_sid)
+        return entry[1] if entry and entry[0] == key else None
+
+    def take(self, call_sid, key=None, wait_seconds=0.0):
+        """(key, result) of this call's finished job, removed from the pool so the
+        caller's copy is the only one. A job still running for `key` is waited on
+        for up to wait_seconds; None when nothing finished (or it failed)."""
+        with self.lock:
+            entry = self.entries.get(call_sid)
+        if entry is None: return None
+        job_key, future, _ = entry
+        if not future.done():
+            if job_key != key or wait_seconds <= 0 or not wait([future], timeout=wait_seconds).done:
+                self._count("not_ready")
+                return None
+            self._count("waited")
+        with self.lock:
+            if self.entries.get(call_sid) is entry: del self.entries[call_sid]
+        if future.exception(): return None  # counted as failed by _run
+        self._count("hits" if job_key == key else "stale")
+        return job_key, future.result()
+
+    def forget(self, call_sid):
+        with self.lock:
+            self.entries.pop(call_sid, None)
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def drain(self, timeout=30.0):
+        """Wait for every running job (tests, shutdown)"""
+        with self.lock:
+            futures = list(self.running)
+        return not wait(futures, timeout=timeout).not_done
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, calls=len(self.entries), running=len(self.running), enabled=self.enabled)
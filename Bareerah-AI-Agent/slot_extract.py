@@ -0,0 +1,481 @@
+# ✅ SLOT EXTRACT - deterministic dates, times, counts and emails
+#
+# Dates and times used to come only from the LLM, against a date written into
+# the prompt ("TODAY is 2026-02-04"), and spoken emails went through a chain of
+# str.replace calls. This module reads what it can from an utterance with
+# regexes compiled once at import, against the real clock in Dubai:
+#   * relative days     today / tomorrow / day after tomorrow / weekdays,
+#                       "kal", "aaj", "parson", "bukra", "اليوم", "بكرة", "کل"
+#   * explicit dates    "5th feb", "feb 5", "5/2" (day first), "2026-02-05",
+#                       "on the 25th" (the next 25th)
+#   * times             "4pm", "4:30 p.m.", "16:30", "char baje", "saade 4",
+#                       "half past four", noon / midnight, subah / shaam / raat
+#                       (periods), "in 2 hours", "right now" / "foran"
+#   * counts            "3 people", "do log", "teen bags", "no luggage", "just me"
+#   * emails            "john dot smith at gmail dot com", "ایٹ", "ڈاٹ", "نقطة"
+# A bare "at 5" with no am/pm or period, or a day part with no hour ("kal
+# subah"), is ambiguous: the date is reported, the time isn't guessed. A date
+# the rules can't place leaves the datetime unset rather than falling back to
+# a default day. Counts are restatements, not sums - the last one said (or the
+# one after "actually" / "I mean") wins, "2 of us" is part of the party, and
+# only different kinds of traveller (adults + children) or bags joined by
+# "and" add up. extract() also says whether anything else was said
+# (`consumed`), so a caller can skip the LLM when the utterance was nothing
+# but slot values; otherwise its values are hints for the model, not answers.
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import lexicon
+
+BUSINESS_TZ = os.getenv("BUSINESS_TZ", "Asia/Dubai")
+try:
+    from zoneinfo import ZoneInfo
+    TZ = ZoneInfo(BUSINESS_TZ)
+except Exception:
+    TZ = timezone(timedelta(hours=4))  # Dubai has no DST
+
+DEFAULT_EMAIL_DOMAINS = {"gmail", "yahoo", "hotmail", "outlook", "icloud", "live"}
+
+# ✅ NUMBERS (EN/UR/AR) - the legacy app's SPOKEN_NUMBERS / NUMBER_WORDS
+SPOKEN_NUMBERS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+NUMBER_WORDS = {
+    # English
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    # Urdu
+    "do": 2, "teen": 3, "char": 4, "paanch": 5, "chhe": 6, "saat": 7,
+    "aath": 8, "nau": 9, "das": 10, "ek": 1, "gyarah": 11, "barah": 12,
+    # Arabic
+    "واحد": 1, "اثنين": 2, "ثلاثة": 3, "اربعة": 4, "خمسة": 5,
+    "ستة": 6, "سبعة": 7, "ثمانية": 8, "تسعة": 9, "عشرة": 10
+}
+
+DAY_OFFSETS = {
+    "today": 0, "tonight": 0, "aaj": 0, "aj": 0, "اليوم": 0, "آج": 0,
+    "tomorrow": 1, "tmrw": 1, "kal": 1, "bukra": 1, "bokra": 1, "بكرة": 1, "بكره": 1, "غدا": 1, "کل": 1,
+    "day after tomorrow": 2, "parson": 2, "parso": 2, "پرسوں": 2, "بعد بكرة": 2, "بعد غد": 2,
+}
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "peer": 0, "somwar": 0, "الاثنين": 0,
+    "tuesday": 1, "tue": 1, "mangal": 1, "الثلاثاء": 1,
+    "wednesday": 2, "wed": 2, "budh": 2, "الاربعاء": 2, "الأربعاء": 2,
+    "thursday": 3, "thu": 3, "jumeraat": 3, "الخميس": 3,
+    "friday": 4, "fri": 4, "juma": 4, "jumma": 4, "الجمعة": 4,
+    "saturday": 5, "sat": 5, "hafta": 5, "السبت": 5,
+    "sunday": 6, "sun": 6, "itwar": 6, "itwaar": 6, "الاحد": 6, "الأحد": 6,
+}
+MONTHS = {m: i + 1 for i, names in enumerate([
+    ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",), ("june", "jun"),
+    ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"), ("october", "oct"),
+    ("november", "nov"), ("december", "dec")]) for m in names}
+# am/pm only count right after a number (the clock pattern): "I am" is not a.m.
+PERIODS = {
+    "morning": "am", "subah": "am", "صباحا": "am", "الصبح": "am",
+    "afternoon": "pm", "evening": "pm", "night": "pm", "tonight": "pm",
+    "dopahar": "pm", "shaam": "pm", "sham": "pm", "raat": "pm", "مساء": "pm", "المساء": "pm", "بالليل": "pm",
+}
+ADULT_NOUNS = {"adults", "adult"}
+CHILD_NOUNS = {"children", "child", "kids", "kid", "bachay", "bachche"}
+INFANT_NOUNS = {"infant", "baby"}
+PAX_NOUNS = ["people", "persons", "person", "passengers", "passenger", "pax", "adults", "adult", "guests",
+             "members", "of us", "children", "child", "kids", "kid", "infant", "baby", "bachay", "bachche", "log", "afraad", "bande", "banday", "لوگ", "افراد", "أشخاص", "اشخاص", "ركاب", "شخص"]
+BAG_NOUNS = ["bags", "bag", "suitcases", "suitcase", "luggage", "luggages", "pieces", "pcs", "backpacks",
+             "saman", "samaan", "بیگ", "حقائب", "حقيبة", "شنط", "شنطة"]
+NO_BAGS = ["no bags", "no bag", "no luggage", "without luggage", "koi saman nahi", "saman nahi", "no suitcases",
+           "bina saman", "بدون حقائب", "بدون شنط"]
+CORRECTIONS = ["actually", "sorry", "i mean", "no wait", "wait", "make it", "correction", "rather", "balki",
+               "nahi nahi", "matlab", "عفوا", "لا بل", "بل", "اقصد"]
+ORDINAL_NOT_A_DATE = ["floor", "street", "st", "road", "rd", "gate", "terminal", "exit", "avenue", "building", "tower", "interchange"]
+ALONE = ["just me", "only me", "myself", "alone", "akela", "akeli", "sirf main", "وحدي"]
+EMAIL_WORDS = {
+    "at the rate of": "@", "at the rate": "@", "at rate": "@", "at": "@", "ایٹ": "@", "آت": "@",
+    "dot com": ".com", "dotcom": ".com", "com": ".com", "dot": ".", "ڈاٹ": ".", "نقطة": ".", "دوت": ".",
+    "underscore": "_", "انڈرسکور": "_", "dash": "-", "hyphen": "-", "شرطة": "-",
+}
+EMAIL_LEADINS = {"my", "email", "e-mail", "mail", "address", "is", "it's", "its", "hai", "mera", "meri", "id"}
+FILLER = lexicon.Lexicon([
+    "at", "on", "the", "a", "an", "by", "around", "about", "for", "is", "it", "it's", "my", "me", "i", "we",
+    "us", "will", "be", "please", "pickup", "pick", "up", "time", "and", "with", "of", "ok", "okay", "so",
+    "need", "want", "car", "ride", "taxi", "would", "like", "hai", "hain", "ko", "ka", "ki", "ke", "se",
+    "mein", "chahiye", "baje", "bajay", "o'clock", "sharp", "there", "be", "then", "also", "total", "are",
+    "hum", "only", "just", "next", "this", "coming", "in", "email", "mail", "address", "id",
+]).words
+
+
+def _alt(words):
+    """Longest-first alternation of literal words/phrases (spaces match any whitespace)"""
+    return "|".join(re.escape(w).replace(r"\ ", r"\s+") for w in sorted(words, key=len, reverse=True))
+
+
+_B = r"(?<![\w'])"  # word start
+_E = r"(?![\w'])"   # word end
+_NUM = rf"(?:\d{{1,2}}|{_alt(NUMBER_WORDS)})"
+_RE = {
+    "day": re.compile(rf"{_B}(?P<day>{_alt(DAY_OFFSETS)}){_E}"),
+    "weekday": re.compile(rf"{_B}(?:(?P<next>next|agle|aglay)\s+)?(?P<wd>{_alt(WEEKDAYS)}){_E}"),
+    "iso_date": re.compile(r"(?<!\d)(?P<y>20\d\d)-(?P<m>\d{1,2})-(?P<d>\d{1,2})(?!\d)"),
+    "slash_date": re.compile(r"(?<![\d:])(?P<d>\d{1,2})/(?P<m>\d{1,2})(?:/(?P<y>\d{2,4}))?(?![\d:])"),
+    "ordinal_day": re.compile(rf"{_B}(?:on\s+(?:the\s+)?|the\s+)(?P<d>\d{{1,2}})(?:st|nd|rd|th){_E}"
+                              rf"(?!\s+(?:{_alt(ORDINAL_NOT_A_DATE)}){_E})"),
+    "day_month": re.compile(rf"{_B}(?P<d>\d{{1,2}})(?:st|nd|rd|th)?(?:\s+of)?\s+(?P<mon>{_alt(MONTHS)}){_E}"),
+    "month_day": re.compile(rf"{_B}(?P<mon>{_alt(MONTHS)})\s+(?P<d>\d{{1,2}})(?:st|nd|rd|th)?{_E}"),
+    "relative": re.compile(rf"{_B}in\s+(?P<n>{_NUM}|an?|half\s+an?)\s+(?P<unit>hours?|hrs?|minutes?|mins?){_E}"
+                           rf"|{_B}(?P<n2>{_NUM})\s+(?P<unit2>ghante|ghanta|minute|mint)\s+(?:baad|bad|mein){_E}"),
+    "now": re.compile(rf"{_B}(?:right\s+now|right\s+away|asap|immediately|foran|fauran|الحين|الآن){_E}"),
+    "half_past": re.compile(rf"{_B}(?P<kind>half|quarter)\s+(?P<rel>past|to)\s+(?P<h>{_NUM}){_E}"),
+    "saade": re.compile(rf"{_B}(?P<kind>saade|sade|sawa|pone|paune)\s+(?P<h>{_NUM}){_E}"),
+    "clock": re.compile(rf"{_B}(?P<h>\d{{1,2}})(?:[:.](?P<min>\d{{2}}))?\s*(?P<ap>a\.?m\.?|p\.?m\.?){_E}"
+                        rf"|{_B}(?P<hw>{_alt(NUMBER_WORDS)})\s+(?P<ap2>a\.?m\.?|p\.?m\.?){_E}"),
+    "hhmm": re.compile(r"(?<![\d/:])(?P<h>\d{1,2})[:.](?P<min>\d{2})(?![\d/])"),
+    "baje": re.compile(rf"{_B}(?P<h>{_NUM})\s*(?:baje|bajay|bje|o'?clock){_E}"),
+    "bare_at": re.compile(rf"{_B}(?:at|@|around|by|الساعة)\s+(?P<h>\d{{1,2}}){_E}(?![:./])"),
+    "noon": re.compile(rf"{_B}(?P<w>noon|midday|midnight){_E}"),
+    "period": re.compile(rf"{_B}(?P<p>{_alt(PERIODS)})(?![\w'])"),
+    "pax": re.compile(rf"{_B}(?:we\s+are\s+|hum\s+|family\s+of\s+|party\s+of\s+)?(?P<n>{_NUM}|a\s+couple\s+of)\s+"
+                      rf"(?:(?:more|total)\s+)?(?P<noun>{_alt(PAX_NOUNS)}){_E}|{_B}(?:we\s+are|family\s+of|party\s+of)\s+(?P<n2>{_NUM}){_E}"),
+    "bags": re.compile(rf"{_B}(?P<n>{_NUM}|an?|a\s+couple\s+of)\s+(?:(?:big|small|large|hand|carry[\s-]on|more)\s+)?"
+                       rf"(?:{_alt(BAG_NOUNS)}){_E}(?P<each>\s+each)?"),
+    "joined": re.compile(r"\s*,?\s*(?:and|plus|aur|&|\+|و)?\s*"),
+    "correction": re.compile(rf"{_B}(?:{_alt(CORRECTIONS)}){_E}"),
+    "no_bags": re.compile(rf"{_B}(?:{_alt(NO_BAGS)}){_E}"),
+    "alone": re.compile(rf"{_B}(?:{_alt(ALONE)}){_E}"),
+    "email_words": re.compile(rf"\s*{_B}(?:{_alt(EMAIL_WORDS)}){_E}\s*"),
+    "email": re.compile(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}"),
+}
+
+
+def now():
+    """The real clock where the business is"""
+    return datetime.now(TZ)
+
+
+def today_text(at=None):
+    """'Monday 2026-10-19, 14:05 (Dubai time)' for prompts"""
+    at = at or now()
+    return f"{at.strftime('%A %Y-%m-%d, %H:%M')} (Dubai time)"
+
+
+def number(word):
+    """'4' / 'four' / 'char' / 'اربعة' -> 4"""
+    if word is None: return None
+    word = " ".join(word.split())
+    if word.isdigit(): return int(word)
+    if word in ("a", "an"): return 1
+    if word == "a couple of": return 2
+    if word.startswith("half"): return 0.5
+    return NUMBER_WORDS.get(word)
+
+
+# ✅ DATES + TIMES
+def _date(text, base, spans):
+    """(date | None, said): said is True when a date was mentioned, even one that couldn't be placed"""
+    m = _RE["iso_date"].search(text)
+    if m:
+        spans.append(m.span())
+        return _valid(int(m["y"]), int(m["m"]), int(m["d"])), True
+    for key in ("day_month", "month_day"):
+        m = _RE[key].search(text)
+        if m:
+            spans.append(m.span())
+            return _roll_year(base, MONTHS[m["mon"]], int(m["d"])), True
+    m = _RE["slash_date"].search(text)
+    if m and 1 <= int(m["m"]) <= 12:
+        spans.append(m.span())
+        if m["y"]:
+            year = int(m["y"]) + (2000 if len(m["y"]) == 2 else 0)
+            return _valid(year, int(m["m"]), int(m["d"])), True
+        return _roll_year(base, int(m["m"]), int(m["d"])), True
+    m = _RE["ordinal_day"].search(text)
+    if m:
+        spans.append(m.span())
+        return _next_day_of_month(base, int(m["d"])), True
+    m = _RE["day"].search(text)
+    if m:
+        spans.append(m.span())
+        return (base + timedelta(days=DAY_OFFSETS[" ".join(m["day"].split())])).date(), True
+    m = _RE["weekday"].search(text)
+    if m:
+        spans.append(m.span())
+        ahead = (WEEKDAYS[m["wd"]] - base.weekday()) % 7
+        if ahead == 0 or m["next"]: ahead = ahead or 7
+        return (base + timedelta(days=ahead)).date(), True
+    return None, False
+
+
+def _valid(year, month, day):
+    try:
+        return datetime(year, month, day).date()
+    except ValueError:
+        return None
+
+
+def _next_day_of_month(base, day):
+    """"the 25th": this month's if it hasn't passed, else the next month that has one"""
+    year, month = base.year, base.month
+    for _ in range(13):
+        d = _valid(year, month, day)
+        if d and d >= base.date(): return d
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return None
+
+
+def _roll_year(base, month, day):
+    """A day/month without a year is the next one that hasn't passed"""
+    try:
+        d = datetime(base.year, month, day).date()
+        return d if d >= base.date() else datetime(base.year + 1, month, day).date()
+    except ValueError:
+        return None
+
+
+def _period(text):
+    m = _RE["period"].search(text)
+    return (PERIODS[" ".join(m["p"].split())], m.span()) if m else (None, None)
+
+
+def _to_24h(hour, minute, period):
+    if period == "am" and hour == 12: hour = 0
+    elif period == "pm" and hour < 12: hour += 12
+    return hour, minute
+
+
+def _time(text, spans):
+    """(hour, minute, ambiguous) or None"""
+    m = _RE["clock"].search(text)
+    if m:
+        spans.append(m.span())
+        hour = int(m["h"]) if m["h"] else number(m["hw"])
+        ap = (m["ap"] or m["ap2"]).replace(".", "")
+        if hour is None or hour > 12: return None
+        return (*_to_24h(hour, int(m["min"] or 0), ap), False)
+    m = _RE["noon"].search(text)
+    if m:
+        spans.append(m.span())
+        return (0 if m["w"] == "midnight" else 12, 0, False)
+
+    hour = minute = None
+    for key, minutes in (("half_past", None), ("saade", None)):
+        m = _RE[key].search(text)
+        if not m: continue
+        spans.append(m.span())
+        h = number(m["h"])
+        if h is None: return None
+        kind = m["kind"]
+        if kind in ("half", "saade", "sade"): hour, minute = h, 30
+        elif kind == "sawa" or (kind == "quarter" and m.groupdict().get("rel") == "past"): hour, minute = h, 15
+        else: hour, minute = (h - 1) % 24 or 12, 45  # quarter to / pone
+        break
+    if hour is None:
+        m = _RE["hhmm"].search(text)
+        if m:
+            spans.append(m.span())
+            hour, minute = int(m["h"]), int(m["min"])
+            if hour > 23 or minute > 59: return None
+            if hour == 0 or hour > 12 or m["h"].startswith("0"): return (hour, minute, False)  # 24-hour clock
+    if hour is None:
+        for key in ("baje", "bare_at"):
+            m = _RE[key].search(text)
+            if m:
+                spans.append(m.span())
+                hour, minute = number(m["h"]), 0
+                break
+    if hour is None:
+        period, span = _period(text)
+        if period:  # "kal subah": a part of the day, but which hour?
+            spans.append(span)
+            return (None, None, True)
+        return None
+    if hour > 23: return None
+
+    period, span = _period(text)
+    if period:
+        spans.append(span)
+        return (*_to_24h(hour, minute, period), False)
+    return (hour, minute, hour <= 12)
+
+
+def extract_datetime(text, at=None):
+    """{"datetime": aware datetime | None, "date": date | None, "ambiguous": bool, "spans": [...]}
+    datetime is only set when both the day and an unambiguous time are known
+    (a time alone means the next time it comes round); ambiguous means the hour
+    still has to be asked for."""
+    base = at or now()
+    norm = lexicon.normalize(text)
+    spans = []
+    out = {"datetime": None, "date": None, "ambiguous": False, "spans": spans}
+
+    m = _RE["now"].search(norm)
+    if m:
+        spans.append(m.span())
+        out["datetime"] = base.replace(second=0, microsecond=0)
+        out["date"] = out["datetime"].date()
+        return out
+    m = _RE["relative"].search(norm)
+    if m:
+        spans.append(m.span())
+        n = number(m["n"] or m["n2"])
+        unit = m["unit"] or m["unit2"]
+        if n is not None:
+            delta = timedelta(hours=n) if unit.startswith(("h", "g")) else timedelta(minutes=n)
+            out["datetime"] = (base + delta).replace(second=0, microsecond=0)
+            out["date"] = out["datetime"].date()
+            return out
+
+    day, said = _date(norm, base, spans)
+    clock = _time(norm, spans)
+    out["date"] = day
+    if clock is None: return out
+    hour, minute, ambiguous = clock
+    if ambiguous:
+        out["ambiguous"] = True
+        return out
+    if said and day is None: return out  # a date we couldn't place: not today, not tomorrow
+    day = day or base.date()
+    when = datetime(day.year, day.month, day.day, hour, minute, tzinfo=base.tzinfo)
+    if when < base - timedelta(minutes=5) and out["date"] is None:
+        when += timedelta(days=1)  # "at 4pm" said at 6pm means tomorrow
+    out["datetime"] = when
+    out["date"] = when.date()
+    return out
+
+
+# ✅ COUNTS
+def _count(m):
+    return int(number(m.groupdict().get("n") or m.groupdict().get("n2")))
+
+
+def _traveller(m):
+    noun = " ".join((m.groupdict().get("noun") or "").split())
+    if noun == "of us": return "subset"
+    if noun in ADULT_NOUNS: return "adults"
+    if noun in CHILD_NOUNS: return "children"
+    if noun in INFANT_NOUNS: return "infants"
+    return "people"
+
+
+def _after_correction(text, matches):
+    """Counts said after the last "actually" / "sorry" / "I mean" replace the ones before it"""
+    fixes = [m.end() for m in _RE["correction"].finditer(text)]
+    if fixes:
+        later = [m for m in matches if m.start() >= fixes[-1]]
+        if later: return later
+    return matches
+
+
+def _party(matches):
+    """Passengers from the counts said: the last one, or adults + children + infants when
+    those are what was counted. None when "people" and a kind of traveller are mixed
+    ("3 people and 2 kids" - are the kids in the 3?)"""
+    last = {}
+    for m in matches: last[_traveller(m)] = _count(m)
+    if len(last) == 1: return next(iter(last.values()))
+    if "people" in last: return None
+    return sum(last.values())
+
+
+def extract_counts(text):
+    """{"passengers": int | None, "luggage": int | None, "spans": [...]}"""
+    norm = lexicon.normalize(text)
+    out = {"passengers": None, "luggage": None, "spans": []}
+
+    pax = [m for m in _RE["pax"].finditer(norm) if number(m["n"] or m["n2"]) is not None]
+    out["spans"] += [m.span() for m in pax]
+    pax = _after_correction(norm, pax)
+    subset = [m for m in pax if _traveller(m) == "subset"]  # "2 of us have bags": part of the party
+    party = [m for m in pax if _traveller(m) != "subset"]
+    if party: out["passengers"] = _party(party)
+    elif subset: out["passengers"] = _count(subset[-1])  # "there are two of us"
+    else:
+        m = _RE["alone"].search(norm)
+        if m:
+            out["passengers"] = 1
+            out["spans"].append(m.span())
+
+    m = _RE["no_bags"].search(norm)
+    if m:
+        out["luggage"] = 0
+        out["spans"].append(m.span())
+        return out
+    bags = [m for m in _RE["bags"].finditer(norm) if number(m["n"]) is not None]
+    out["spans"] += [m.span() for m in bags]
+    total, prev = None, None
+    for m in _after_correction(norm, bags):
+        n = int(number(m["n"]))
+        if m["each"]:  # "2 of us have 2 bags each"
+            owners = _count(subset[-1]) if subset else out["passengers"]
+            if owners is None: return dict(out, luggage=None)
+            n *= owners
+        joined = prev is not None and _RE["joined"].fullmatch(norm[prev.end():m.start()])
+        total = total + n if joined else n  # "2 big bags and 1 small one" adds; "3 bags ... 4 bags" restates
+        prev = m
+    out["luggage"] = total
+    return out
+
+
+# ✅ EMAILS
+def spoken_email(text):
+    """Spoken email words to symbols in one pass, spaces removed ("john at gmail dot com" -> john@gmail.com)"""
+    if not text: return ""
+    norm = lexicon.normalize(text).strip()
+    return _RE["email_words"].sub(lambda m: EMAIL_WORDS[" ".join(m.group().split())], norm).replace(" ", "")
+
+
+def extract_email(text):
+    """The email address in an utterance, or None. Lead-ins ("my email is") are dropped and
+    a bare provider ("john at gmail") gets .com."""
+    if not text: return None
+    norm = lexicon.normalize(text)
+    spaced = _RE["email_words"].sub(lambda m: f" {EMAIL_WORDS[' '.join(m.group().split())]} ", norm)
+    words = spaced.replace(" .", ".").replace(". ", ".").split()
+    if "@" not in words:
+        m = _RE["email"].search(norm.replace(" ", ""))
+        return m.group() if m else None
+    at = words.index("@")
+    local = []
+    for w in reversed(words[:at]):
+        if w in EMAIL_LEADINS: break
+        local.insert(0, w)
+    domain = []
+    for w in words[at + 1:]:
+        if not re.fullmatch(r"[\w.-]+", w): break
+        domain.append(w)
+        if "." in w and re.search(r"\.[a-z]{2,}$", w): break
+    address = "".join(local) + "@" + "".join(domain)
+    if "." not in address.split("@", 1)[1] and address.split("@", 1)[1] in DEFAULT_EMAIL_DOMAINS:
+        address += ".com"
+    m = _RE["email"].fullmatch(address)
+    return m.group() if m else None
+
+
+# ✅ EVERYTHING AT ONCE
+def extract(text, at=None):
+    """All the slots the rules can read from one utterance:
+    {"datetime", "date", "ambiguous_time", "passengers", "luggage", "email", "consumed"}
+    date: the day even when the hour is still missing ("kal subah").
+    consumed: nothing but those values (and filler) was said."""
+    when = extract_datetime(text, at)
+    counts = extract_counts(text)
+    email = extract_email(text)
+    norm = lexicon.normalize(text)
+    if email:
+        rest = ""
+    else:
+        rest = norm
+        for a, b in sorted(when["spans"] + counts["spans"], reverse=True):
+            rest = rest[:a] + " " + rest[b:]
+    leftover = [t for t in lexicon.tokens(rest) if t not in FILLER and not t.isdigit()]
+    found = when["datetime"] or counts["passengers"] is not None or counts["luggage"] is not None or email
+    return {
+        "datetime": when["datetime"],
+        "date": when["date"],
+        "ambiguous_time": when["ambiguous"],
+        "passengers": counts["passengers"],
+        "luggage": counts["luggage"],
+        "email": email,
+        "consumed": bool(found) and not leftover and not when["ambiguous"]
+                    and (when["datetime"] is not None or when["date"] is None),
+    }
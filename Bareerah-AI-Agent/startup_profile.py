@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# ✅ STARTUP PROFILE - where a cold web process spends its boot
+#
+# Imports one of the apps in a fresh interpreter under `python -X importtime`
+# and reports the slowest imports. Times are cumulative, so a package's own
+# dependencies count under it (openai -> pydantic, aiohttp, ...). The SDKs
+# lazy_vendors defers shouldn't show up at all unless --preload is given,
+# which also runs lazy_vendors.preload() - what a `gunicorn --preload` master
+# pays once for all its workers.
+#
+#   python startup_profile.py                  main.py, top 15 imports
+#   python startup_profile.py legacy --top 30  the 9 December app
+#   python startup_profile.py asgi --preload
+#   python startup_profile.py --budget-ms 600  exit 1 when the import is slower (CI)
+import os
+import sys
+import argparse
+import subprocess
+from collections import namedtuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LEGACY_APP_FILE = "9 december main.py"
+
+APPS = {
+    "main": "import main",
+    "asgi": "import asgi_app",
+    # the legacy file name isn't importable; load it the way load_test.py does
+    "legacy": ("import importlib.util; spec = importlib.util.spec_from_file_location('legacy_app', %r); "
+               "spec.loader.exec_module(importlib.util.module_from_spec(spec))" % LEGACY_APP_FILE),
+}
+
+APP_MARKER = "# app\n"
+Entry = namedtuple("Entry", "name self_us cumulative_us depth")
+
+
+def parse(text):
+    """`-X importtime` stderr -> Entry per imported module, in the order they finished"""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "[us]" in line: continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.rstrip().lstrip()
+        depth = (len(name.rstrip()) - len(stripped) - 1) // 2
+        entries.append(Entry(stripped, int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def top_imports(entries):
+    """The modules the app itself pulled in: the outermost imports, unwrapping a lone root (import main)"""
+    roots = [i for i, e in enumerate(entries) if e.depth == 0]
+    while len(roots) == 1:
+        root = roots[0]
+        start = root
+        while start > 0 and entries[start - 1].depth > entries[root].depth: start -= 1  # children come first
+        children = [i for i in range(start, root) if entries[i].depth == entries[root].depth + 1]
+        if not children: break
+        roots = children
+    return sorted((entries[i] for i in roots), key=lambda e: e.cumulative_us, reverse=True)
+
+
+def profile(app="main", preload=False):
+    """(wall ms for the import, [Entry]) from a fresh interpreter"""
+    code = ("import time, sys; sys.stderr.write(%r); started = time.perf_counter(); " % APP_MARKER + APPS[app] + "; "
+            + ("import lazy_vendors; lazy_vendors.preload(); " if preload else "")
+            + "print(round((time.perf_counter() - started) * 1000, 1))")
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY") or "sk-profile")
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE, env=env,
+                         capture_output=True, text=True, timeout=120)
+    if out.returncode != 0:
+        raise RuntimeError(f"importing {app} failed:\n{out.stderr[-2000:]}")
+    return float(out.stdout.strip().splitlines()[-1]), parse(out.stderr.split(APP_MARKER, 1)[-1])  # not the interpreter's own
+
+
+def report(app, total_ms, entries, top=15):
+    roots = top_imports(entries)
+    loaded = {e.name for e in entries}
+    lines = [f"⏱️  {app}: {total_ms:.0f}ms to import, {len(entries)} modules", ""]
+    lines += [f"  {e.cumulative_us / 1000:8.1f}ms  {e.name}" for e in roots[:top]]
+    heavy = [name for name in ("openai", "twilio.rest", "jwt") if name in loaded]
+    lines += ["", f"  heavy SDKs at boot: {', '.join(heavy) if heavy else 'none (lazy_vendors)'}"]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the web process's import time")
+    parser.add_argument("app", nargs="?", default="main", choices=sorted(APPS))
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--preload", action="store_true", help="also import the SDKs lazy_vendors defers")
+    parser.add_argument("--budget-ms", type=float, help="fail when the import takes longer than this")
+    args = parser.parse_args(argv)
+    total_ms, entries = profile(args.app, args.preload)
+    print(report(args.app, total_ms, entries, args.top))
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"❌ {total_ms:.0f}ms is over the {args.budget_ms:.0f}ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# ✅ STRUCTURED LOG - queued, level-gated, per-call logging instead of print(flush=True)
+#
+# The legacy app printed with flush=True a couple of hundred times per call -
+# the FAQ matcher once per matching candidate, box-art conversation logs, raw
+# LLM dumps - and every line was a write syscall on the request thread. Now:
+#   * setup() sends the root logger through a QueueWriter: emit() only puts
+#     the record on a bounded queue (when it's full the record is dropped and
+#     counted - logging never blocks a call); one background thread formats
+#     and writes whatever has queued up, with one flush per batch
+#   * the apps log through module loggers (main, legacy, asgi_app) with %s
+#     args, so a line below LOG_LEVEL costs a level check - nothing is
+#     formatted and nothing is written
+#   * bind(call_sid=..., phone=...) puts the call on every record logged in
+#     that context (contextvars), next to the tracing trace id
+#   * DEBUG is sampled per call: LOG_DEBUG_SAMPLE of calls keep all their debug
+#     lines, the rest keep none - a sampled call still reads end to end
+#   * LOG_FORMAT=json writes one JSON object per line for log shipping
+# The writer thread starts with the first record in each process, so
+# importing an app stays fork-safe under gunicorn --preload.
+#
+#   LOG_LEVEL         DEBUG | INFO | WARNING | ERROR (INFO)
+#   LOG_FORMAT        text | json (text)
+#   LOG_DEBUG_SAMPLE  fraction of calls whose DEBUG lines are kept (0.1)
+#   LOG_QUEUE_MAX     records buffered before new ones are dropped (10000)
+import os
+import sys
+import json
+import zlib
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from datetime import datetime, timezone
+from collections import Counter
+
+import tracing
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "0.1"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+BATCH_MAX = 512
+
+_context = contextvars.ContextVar("log_context", default={})
+_handler = None
+
+
+def bind(**fields):
+    """The call this context is serving; replaces what the thread had bound for its previous request"""
+    return _context.set({k: v for k, v in fields.items() if v})
+
+
+def bound():
+    return _context.get()
+
+
+def sampled(call_sid, rate=None):
+    """Whether a call keeps its DEBUG lines - the same answer for every line of one call"""
+    rate = LOG_DEBUG_SAMPLE if rate is None else rate
+    if rate >= 1: return True
+    if not call_sid: return random.random() < rate
+    return zlib.crc32(call_sid.encode()) % 10000 < rate * 10000
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the logging thread: stamps the bound call and trace, samples DEBUG"""
+
+    def __init__(self, stats):
+        super().__init__()
+        self.stats = stats
+
+    def filter(self, record):
+        ctx = _context.get()
+        record.call_sid = ctx.get("call_sid")
+        record.phone = ctx.get("phone")
+        span = tracing.current_span()
+        record.trace_id = span.trace_id if span else None
+        if record.levelno <= logging.DEBUG and not sampled(record.call_sid or record.phone):
+            self.stats["sampled_out"] += 1
+            return False
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = record.getMessage()
+        if record.call_sid or record.phone: line += f"  [{record.call_sid or record.phone}]"
+        if record.exc_info: line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        msg = record.getMessage()
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": msg,
+        }
+        if msg.startswith("[") and "]" in msg[:24]: doc["tag"] = msg[1:msg.index("]")]
+        for key in ("call_sid", "phone", "trace_id"):
+            if getattr(record, key, None): doc[key] = getattr(record, key)
+        doc.update(getattr(record, "fields", None) or {})
+        if record.exc_info: doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class QueueWriter(logging.Handler):
+    """Hands records to a per-process writer thread; never blocks the caller"""
+
+    def __init__(self, stream=None, queue_max=LOG_QUEUE_MAX):
+        super().__init__()
+        self.stream = stream  # None: whatever sys.stdout is when the batch is written
+        self.queue_max = queue_max
+        self.queue = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+        self.stats = Counter()
+
+    def _ensure_writer(self):
+        if self.pid == os.getpid(): return
+        with self.start_lock:
+            if self.pid == os.getpid(): return
+            self.queue = queue.Queue(self.queue_max)  # a fresh one after a fork: the parent's lock may be held
+            threading.Thread(target=self._write_loop, args=(self.queue,), name="log-writer", daemon=True).start()
+            self.pid = os.getpid()
+
+    def emit(self, record):
+        try:
+            self._ensure_writer()
+            record.message = record.getMessage()  # the args as they are now, not when the writer gets to it
+            record.msg, record.args = record.message, None
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+        except Exception:
+            self.handleError(record)
+
+    def _write_loop(self, q):
+        while True:
+            batch = [q.get()]
+            while len(batch) < BATCH_MAX:
+                try: batch.append(q.get_nowait())
+                except queue.Empty: break
+            lines, waiters = [], []
+            for item in batch:
+                if isinstance(item, threading.Event): waiters.append(item)
+                else: lines.append(self.format(item))
+            if lines:
+                try:
+                    out = self.stream or sys.stdout
+                    out.write("\n".join(lines) + "\n")
+                    out.flush()
+                    self.stats["written"] += len(lines)
+                except (OSError, ValueError):
+                    self.stats["write_errors"] += 1
+            for event in waiters: event.set()
+
+    def drain(self, timeout=5.0):
+        """Block until everything queued so far is written (exit, tests)"""
+        if self.pid != os.getpid(): return True
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def snapshot(self):
+        return dict(self.stats, queued=self.queue.qsize() if self.queue else 0)
+
+
+def setup(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Route the root logger through one QueueWriter (idempotent); returns it"""
+    global _handler
+    if _handler is None:
+        _handler = QueueWriter(stream)
+        _handler.addFilter(ContextFilter(_handler.stats))
+        atexit.register(_handler.drain)
+        logging.getLogger().addHandler(_handler)
+    _handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    logging.getLogger().setLevel(level)
+    return _handler
+
+
+def drain(timeout=5.0):
+    return _handler.drain(timeout) if _handler else True
+
+
+def snapshot():
+    return _handler.snapshot() if _handler else {}
+
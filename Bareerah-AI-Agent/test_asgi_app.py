@@ -0,0 +1,100 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import asyncio
+import httpx
+
+import main
+import asgi_app
+import load_test
+from vendor_stubs import VendorStubs
+
+LINES = ["Sara", "Dubai Marina", "Airport", "Two of us", "Executive", "No thanks"]
+
+async def call(client, sid, lines):
+    await client.post("/select-language", data={"CallSid": sid, "Digits": "1"})
+    bodies = []
+    for speech in lines:
+        r = await client.post("/handle", data={"CallSid": sid, "SpeechResult": speech, "From": "+971500000001"})
+        assert r.status_code == 200
+        bodies.append(r.text)
+        if "<Hangup" in r.text: break
+    return bodies
+
+def run_calls(stubs, n):
+    async def go():
+        transport = httpx.ASGITransport(app=asgi_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[call(client, f"CAASGI{i:04d}", LINES) for i in range(n)])
+    with stubs.installed(main, asgi_app):
+        return asyncio.run(go())
+
+def test_async_turns_match_sync_path():
+    stubs = VendorStubs(seed=1, sleep=False)
+    bodies = run_calls(stubs, 1)[0]
+    assert "<Hangup" in bodies[-1] and "Executive Sedan" in bodies[-1]
+    assert any("Which option would you like to book?" in b for b in bodies)
+    assert stubs.counts()["resend"] == 1
+    assert stubs.db.usage()["open"] == 0
+
+def test_concurrent_calls_share_one_loop():
+    stubs = VendorStubs(seed=2, latency={"openai": "fixed:50"})
+    results = run_calls(stubs, 40)
+    assert all("<Hangup" in bodies[-1] for bodies in results)
+    assert stubs.db.usage()["open"] == 0
+
+def test_wsgi_fallback_routes():
+    async def go():
+        transport = httpx.ASGITransport(app=asgi_app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            voice = await client.post("/voice", data={"CallSid": "CAX"})
+            metrics = await client.get("/metrics")
+            whatsapp = await client.post("/whatsapp", data={"From": "whatsapp:+971500000001", "Body": "Hi"})
+            return voice, metrics, whatsapp
+    voice, metrics, whatsapp = asyncio.run(go())
+    assert "/select-language" in voice.text
+    assert "stages" in metrics.json()
+    assert whatsapp.status_code == 501 and "legacy app" in whatsapp.text  # unsupported here, and says so
+
+def test_a_held_turn_is_parked_for_the_next_poll():
+    stubs = VendorStubs(seed=3, sleep=False)
+    async def slow():
+        await asyncio.sleep(0.2)
+        return "<Response>ready</Response>"
+    async def go():
+        turn = main.turn_budget.start_task("CAASGIHELD", slow)
+        held = await asgi_app.reply_within_budget(turn, 0.01)
+        await asyncio.gather(*asgi_app._handoffs)
+        main.turn_budget._forget(turn)  # the next poll reaches another worker
+        return held, await asgi_app.handle_result({"CallSid": "CAASGIHELD"}), await asgi_app.handle_result({"CallSid": "CAASGIHELD"})
+    with stubs.installed(main, asgi_app):
+        stubs.db.call_state["CAASGIHELD"] = {"history": [], "slots": {"language": "Arabic"}}
+        held, parked, again = asyncio.run(go())
+    assert "/handle-result" in held and parked == "<Response>ready</Response>"
+    assert main.AGAIN_MESSAGES["Arabic"] in again
+
+def test_form_values_merge_query_and_body():
+    scope = {"query_string": b"call_sid=CA1&text="}
+    values = asgi_app.form_values(scope, b"SpeechResult=Dubai+Mall&From=%2B9715")
+    assert values == {"call_sid": "CA1", "text": "", "SpeechResult": "Dubai Mall", "From": "+9715"}
+
+def test_uvicorn_voice_flow():
+    stubs = VendorStubs(seed=3, sleep=False)
+    with stubs.installed(main, asgi_app):
+        base, server = load_test.start_local_server(asgi_app)
+        try:
+            rec = load_test.Recorder()
+            ok = load_test.voice_flow(load_test.requests.Session(), rec, base, 1, LINES, "asgi")
+        finally:
+            server.shutdown()
+    assert ok and not rec.errors
+
+if __name__ == "__main__":
+    test_async_turns_match_sync_path()
+    test_concurrent_calls_share_one_loop()
+    test_wsgi_fallback_routes()
+    test_a_held_turn_is_parked_for_the_next_poll()
+    test_form_values_merge_query_and_body()
+    test_uvicorn_voice_flow()
+    print("✅ ASGI app tests passed")
@@ -0,0 +1,86 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import sys
+
+import audio_pipeline
+from vendor_stubs import VendorStubs, FakeResponse
+
+REVERSE = [sys.executable, "-c", "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read()[::-1])"]
+
+def test_whisper_native_formats_skip_transcoding():
+    assert audio_pipeline.whisper_filename("audio/ogg; codecs=opus") == "voice.ogg"
+    assert audio_pipeline.whisper_filename("audio/mpeg") == "voice.mp3"
+    assert audio_pipeline.whisper_filename("audio/amr") is None
+
+def test_passthrough_keeps_audio_in_memory():
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed():
+        note = audio_pipeline.fetch_voice_note("https://api.twilio.com/media/ME1", "audio/ogg; codecs=opus")
+    assert note.mode == "passthrough" and note.data.startswith(b"OggS")
+    assert note.as_file() == ("voice.ogg", note.data, "audio/ogg")
+    assert note.bytes_copied == note.bytes_in == len(note)
+
+def test_transcoder_pool_pipes_and_prespawns():
+    pool = audio_pipeline.TranscoderPool(size=1, cmd=REVERSE)
+    pool.warm()
+    try:
+        note = audio_pipeline.VoiceNote(b"", "voice.mp3", "audio/mpeg")
+        out = pool.transcode(iter([b"abc", b"", b"def"]), note)
+        assert out == b"fedcba"
+        assert note.bytes_in == 6 and note.bytes_copied == 12
+        assert pool.cold_starts == 0
+    finally:
+        pool.close()
+
+def test_a_hung_transcoder_is_killed_and_a_chatty_one_never_stalls():
+    import time
+    import subprocess
+    hang = audio_pipeline.TranscoderPool(size=0, cmd=[sys.executable, "-c", "import time; time.sleep(30)"])
+    started = time.monotonic()
+    try:
+        hang.transcode(iter([b"abc"]), audio_pipeline.VoiceNote(b"", "voice.mp3", "audio/mpeg"), timeout=0.5)
+        assert False, "a hung ffmpeg must time out"
+    except subprocess.TimeoutExpired:
+        pass
+    assert time.monotonic() - started < 5
+    # 1MB on stderr before any stdout: reading stdout first would wait on a full stderr pipe forever
+    chatty = audio_pipeline.TranscoderPool(size=0, cmd=[sys.executable, "-c",
+        "import sys; data = sys.stdin.buffer.read(); sys.stderr.buffer.write(b'x' * 1000000); sys.stdout.buffer.write(data)"])
+    assert chatty.transcode(iter([b"abc"]), audio_pipeline.VoiceNote(b"", "voice.mp3", "audio/mpeg"), timeout=10) == b"abc"
+
+def test_unsupported_format_is_transcoded_and_tiny_notes_rejected():
+    stubs = VendorStubs(seed=1, sleep=False)
+    saved = audio_pipeline.transcoders
+    audio_pipeline.transcoders = audio_pipeline.TranscoderPool(size=1, cmd=REVERSE)
+    try:
+        with stubs.installed():
+            note = audio_pipeline.fetch_voice_note("https://api.twilio.com/media/ME2", "audio/amr")
+            assert note.mode == "transcoded" and note.filename == "voice.mp3"
+            assert note.data == (b"OggS" + b"\x00" * 4096)[::-1]
+            stubs._route = lambda *a, **k: ("twilio", FakeResponse(200, None, content=b"tiny"))
+            assert audio_pipeline.fetch_voice_note("https://api.twilio.com/media/ME3", "audio/ogg") is None
+    finally:
+        audio_pipeline.transcoders.close()
+        audio_pipeline.transcoders = saved
+    snap = audio_pipeline.stats.snapshot()
+    assert snap["transcoded"] >= 1 and snap["too_short"] >= 1
+
+def test_legacy_voice_note_reaches_whisper():
+    import load_test
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(legacy):
+        legacy.process_whatsapp_message({"From": "whatsapp:+971500000010", "MessageSid": "SMV1",
+                                         "MediaContentType0": "audio/ogg", "MediaUrl0": "https://api.twilio.com/media/ME4"})
+    assert stubs.counts()["openai"] >= 1 and stubs.counts()["twilio"] >= 1
+
+if __name__ == "__main__":
+    test_whisper_native_formats_skip_transcoding()
+    test_passthrough_keeps_audio_in_memory()
+    test_transcoder_pool_pipes_and_prespawns()
+    test_a_hung_transcoder_is_killed_and_a_chatty_one_never_stalls()
+    test_unsupported_format_is_transcoded_and_tiny_notes_rejected()
+    test_legacy_voice_note_reaches_whisper()
+    print("✅ Audio pipeline tests passed")
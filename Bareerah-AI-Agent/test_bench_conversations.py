@@ -0,0 +1,42 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import random
+import bench_conversations
+from vendor_stubs import Latency, VendorStubs
+
+def test_transcript_parses_all_conversations():
+    convs = bench_conversations.load_conversations()
+    assert len(convs) == 15
+    assert all(lines for _, lines in convs)
+    assert convs[0][1][0].startswith("Hi! I need a car")
+
+def test_latency_specs():
+    rng = random.Random(1)
+    assert Latency("fixed:50").sample_ms(rng) == 50
+    assert 20 <= Latency("uniform:20-80").sample_ms(rng) <= 80
+    assert Latency("lognormal:600,0.3").sample_ms(rng) > 0
+    assert Latency("none").sample_ms(rng) == 0
+
+def test_replay_books_with_stubbed_vendors():
+    import main
+    stubs = VendorStubs(seed=3, sleep=False)
+    convs = [("Scripted", ["Sara", "Dubai Marina", "Airport", "Two of us", "Executive", "No thanks"])]
+    with stubs.installed(main):
+        results = bench_conversations.replay(main, stubs, convs)
+    assert main.client is not stubs.openai  # uninstalled
+    turns = results[0]["turns"]
+    assert results[0]["completed_booking"]
+    assert all(t["status"] == 200 for t in turns)
+    calls = results[0]["external_calls"]
+    assert calls["openai"] == len(turns) - 1  # "Two of us" completes the slots by rule, no LLM call
+    assert calls["resend"] == 1
+    assert len(stubs.db.bookings) == 1
+    assert stubs.db.usage()["open"] == 0
+
+if __name__ == "__main__":
+    test_transcript_parses_all_conversations()
+    test_latency_specs()
+    test_replay_books_with_stubbed_vendors()
+    print("✅ Bench harness tests passed")
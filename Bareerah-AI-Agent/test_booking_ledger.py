@@ -0,0 +1,86 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import re
+import copy
+
+import booking_ledger
+from vendor_stubs import VendorStubs, FakeResponse
+
+def recording(stubs):
+    """Every vendor request the stubs answer, with its Idempotency-Key header"""
+    seen, real = [], stubs.request
+    def request(method, url, params=None, **kwargs):
+        seen.append((method, url, (kwargs.get("headers") or {}).get("Idempotency-Key")))
+        return real(method, url, params=params, **kwargs)
+    stubs.request = request
+    return seen
+
+def test_references_are_random_and_readable():
+    refs = {booking_ledger.new_reference() for _ in range(20000)}
+    assert len(refs) == 20000
+    assert all(re.fullmatch(r"SSL-[0-9A-HJKMNP-TV-Z]{10}", ref) for ref in refs)
+    assert booking_ledger.call_key("CA1") == booking_ledger.call_key("CA1") == "call:CA1"
+    assert booking_ledger.chat_key("+9715") != booking_ledger.chat_key("+9715")
+
+def test_one_row_and_one_claim_per_key_with_or_without_a_db():
+    stubs = VendorStubs(seed=1, sleep=False)
+    for conn in (stubs.db.connect(), None):
+        ledger = booking_ledger.BookingLedger(local_size=2, name="test")
+        ref, created = ledger.record(conn, "call:CA1", reference="SSL-KEEPTHIS1", customer_name="Sara", fare_aed=160.0)
+        assert (ref, created) == ("SSL-KEEPTHIS1", True)
+        assert ledger.record(conn, "call:CA1", customer_name="Sara") == (ref, False)
+        assert ledger.once(conn, "call:CA1", "email") and not ledger.once(conn, "call:CA1", "email")
+        ledger.release(conn, "call:CA1", "email")  # the send failed: the retry may send it
+        assert ledger.once(conn, "call:CA1", "email") and ledger.once(conn, "call:CA1", "backend")
+        snap = ledger.snapshot()
+        assert (snap["created"], snap["duplicates"], snap["email_claimed"], snap["email_skipped"]) == (1, 1, 2, 1)
+    assert len(stubs.db.bookings) == 1
+    for n in range(3): ledger.record(None, f"call:LRU{n}")
+    assert ledger.snapshot()["local_keys"] == 2
+
+def test_retried_finalize_turn_books_syncs_and_emails_once():
+    import main
+    stubs = VendorStubs(seed=3, sleep=False)
+    seen = recording(stubs)
+    with stubs.installed(main):
+        client = main.app.test_client()
+        client.post("/select-language", data={"CallSid": "CARETRY", "Digits": "1"})
+        for line in ["Sara", "Dubai Marina", "Airport", "Two of us", "Executive"]:
+            client.post("/handle", data={"CallSid": "CARETRY", "SpeechResult": line, "From": "+971500000001"})
+        before = copy.deepcopy(stubs.db.call_state["CARETRY"])
+        replies = []
+        for _ in range(2):  # Twilio retries the finalize turn before the first one's state lands
+            stubs.db.call_state["CARETRY"] = copy.deepcopy(before)
+            replies.append(client.post("/handle", data={"CallSid": "CARETRY", "SpeechResult": "No thanks", "From": "+971500000001"}).data)
+    assert b"I have booked" in replies[0] and replies[0] == replies[1]
+    syncs = [key for method, url, key in seen if method == "POST" and url.endswith("/create-manual")]
+    assert len(stubs.db.bookings) == 1 and len(syncs) == 1 and stubs.counts()["resend"] == 1
+    ref = stubs.db.bookings[0][1]
+    assert syncs == [ref] and stubs.db.settled == {"call:CARETRY": "confirmed"}
+    assert main.LEDGER.snapshot()["duplicates"] >= 1
+
+def test_legacy_chat_booking_is_pushed_and_alerted_once():
+    import load_test
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=1, sleep=False)
+    seen = recording(stubs)
+    payload = {"customer_name": "Omar", "customer_phone": "+971500000002", "pickup_location": "Marina",
+               "dropoff_location": "DXB", "booking_type": "point_to_point", "passengers_count": 2}
+    with stubs.installed(legacy):
+        first = legacy.with_ledger_conn(legacy.claim_chat_booking, "chat:+971500000002:1", "SSL-CHAT000001", payload, {"fare": 120})
+        again = legacy.with_ledger_conn(legacy.claim_chat_booking, "chat:+971500000002:1", "SSL-OTHER00001", payload, {"fare": 120})
+        assert first == ("SSL-CHAT000001", True, True, True) and again == ("SSL-CHAT000001", False, False, False)
+        assert legacy.create_booking_direct(dict(payload, booking_reference="SSL-CHAT000001"))
+        stubs.request = lambda method, url, params=None, **kwargs: ("backend", FakeResponse(409, {"error": "duplicate"}))[1]
+        assert legacy.create_booking_direct(dict(payload, booking_reference="SSL-CHAT000001"))  # already there = done
+    assert ("POST", legacy.BACKEND_BASE_URL + "/api/bookings/create-manual", "SSL-CHAT000001") in seen
+    assert not legacy.generate_booking_reference().startswith("BOOK-")
+
+if __name__ == "__main__":
+    test_references_are_random_and_readable()
+    test_one_row_and_one_claim_per_key_with_or_without_a_db()
+    test_retried_finalize_turn_books_syncs_and_emails_once()
+    test_legacy_chat_booking_is_pushed_and_alerted_once()
+    print("✅ Booking ledger tests passed")
@@ -0,0 +1,79 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import booking_reconciler
+
+ROW = {"id": 7, "booking_reference": "SSL-0000000007", "customer_name": None, "customer_phone": "+971500000001", "pickup_location": "Marina",
+       "dropoff_location": "DXB", "calculated_fare_aed": 160, "vehicle_type": "executive", "service_type": "airport_transfer",
+       "number_of_passengers": 2, "number_of_luggage": None, "sync_attempts": 1}
+
+class FakeDB:
+    """Records the reconciler's statements; the claim hands out whatever is queued once"""
+    def __init__(self, rows):
+        self.rows, self.log = list(rows), []
+    def cursor(self): return self
+    def execute(self, sql, params=()):
+        q = " ".join(sql.split())
+        self.log.append(("claim" if "SKIP LOCKED" in q else "confirm" if "'confirmed'" in q else "retry", params))
+        self.claimed, self.rows = (self.rows, []) if "SKIP LOCKED" in q else ([], self.rows)
+    def fetchall(self): return self.claimed
+    def commit(self): self.log.append(("commit", ()))
+    def rollback(self): self.log.append(("rollback", ()))
+
+def test_backoff_doubles_to_a_cap_and_payload_matches_the_backend():
+    for attempts, base in ((1, 30), (2, 60), (4, 240)):
+        assert base * 0.8 <= booking_reconciler.backoff(attempts, 30, 3600) <= base * 1.2
+    assert booking_reconciler.backoff(20, 30, 3600) <= 3600 * 1.2
+    payload = booking_reconciler.backend_payload(ROW)
+    assert payload["customer_name"] == "Customer" and payload["fare_aed"] == 160
+    assert (payload["booking_type"], payload["passengers_count"], payload["luggage_count"]) == ("airport_transfer", 2, 0)
+
+def test_claim_commits_before_any_push_and_outcomes_are_recorded():
+    tuple_row = tuple(dict(ROW, id=8, sync_attempts=3)[c] for c in booking_reconciler.COLUMNS)  # legacy pool rows
+    db = FakeDB([ROW, tuple_row])
+    pushed = []
+    def push(payload):
+        pushed.append(db.log[:])
+        return len(pushed) == 1
+    reconciler = booking_reconciler.Reconciler(lambda: db, lambda conn: None, push, lease_seconds=120, batch_size=5)
+    assert reconciler.run_once() == 2
+    assert pushed[0][:2] == [("claim", (120, 5)), ("commit", ())]  # no lock is held while the backend is called
+    kinds = [kind for kind, _ in db.log]
+    assert kinds == ["claim", "commit", "confirm", "commit", "retry", "commit"]
+    delay, error, booking_id = db.log[4][1]
+    assert booking_id == 8 and 30 * 4 * 0.8 <= delay <= 30 * 4 * 1.2 and error == "backend rejected the booking"
+    assert reconciler.run_once() == 0  # nothing left to claim
+    snap = reconciler.snapshot()
+    assert (snap["synced"], snap["failed"], snap["passes"]) == (1, 1, 2)
+
+def test_claim_query_is_safe_for_several_instances():
+    q = " ".join(booking_reconciler.CLAIM.split())
+    assert "FOR UPDATE SKIP LOCKED" in q and "booking_status = 'pending_confirmation'" in q
+    assert "next_sync_at IS NULL OR next_sync_at <= now()" in q and q.startswith("UPDATE bookings SET next_sync_at")
+    def boom(): raise RuntimeError("db down")
+    reconciler = booking_reconciler.Reconciler(boom, lambda conn: None, lambda p: True, enabled=False)
+    assert reconciler.start() is False and reconciler.snapshot()["running"] is False
+    assert reconciler.run_once() == 0 and reconciler.snapshot()["errors"] == 1  # the thread outlives a DB outage
+
+def test_legacy_whatsapp_no_longer_syncs_in_the_request_path():
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    assert not hasattr(legacy, "sync_pending_bookings_to_backend")
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(legacy):
+        assert legacy.create_booking_direct(booking_reconciler.backend_payload(ROW))  # the reconciler's push
+        stubs.reset_counts()
+        client = legacy.app.test_client()
+        client.post("/whatsapp", data={"From": "whatsapp:+971500000010", "Body": "Hi", "MessageSid": "SMNOSYNC1"})
+        assert legacy.whatsapp_queue.drain(30)
+        assert stubs.counts().get("postgres") == 1  # the whatsapp_deliveries claim; no booking sync
+    assert "reconciler" in legacy.tracing.metrics_snapshot()["gauges"]
+
+if __name__ == "__main__":
+    test_backoff_doubles_to_a_cap_and_payload_matches_the_backend()
+    test_claim_commits_before_any_push_and_outcomes_are_recorded()
+    test_claim_query_is_safe_for_several_instances()
+    test_legacy_whatsapp_no_longer_syncs_in_the_request_path()
+    print("✅ Booking reconciler tests passed")
@@ -0,0 +1,69 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+
+import call_state
+
+def test_state_is_handed_to_the_first_turn_once():
+    states = call_state.CallStates(writers=1, name="test")
+    written = []
+    states.open("CA1", {"history": [], "slots": {"language": "Arabic"}}, lambda sid, st: written.append(sid))
+    first = states.take("CA1")
+    assert first == {"history": [], "slots": {"language": "Arabic"}}
+    first["slots"]["customer_name"] = "Ali"  # the turn's copy is its own
+    assert states.take("CA1") is None
+    def boom(sid, st): raise RuntimeError("db down")
+    states.open("CA2", {}, boom)
+    assert states.drain(5) and written == ["CA1"]
+    snap = states.snapshot()
+    assert (snap["opened"], snap["taken"], snap["written"], snap["failed"]) == (2, 1, 1, 1)
+
+def test_untaken_states_expire():
+    states = call_state.CallStates(writers=1, ttl=0.05, name="test")
+    states.open("CA3", {}, lambda *a: None)
+    time.sleep(0.1)
+    states.open("CA4", {}, lambda *a: None)
+    assert states.take("CA3") is None and states.snapshot()["expired"] == 1
+
+def test_greeting_does_not_wait_for_postgres():
+    import main
+    from vendor_stubs import VendorStubs
+    stubs = VendorStubs(seed=1, latency={"postgres": "fixed:300"})
+    with stubs.installed(main):
+        client = main.app.test_client()
+        t0 = time.perf_counter()
+        greeting = client.post("/select-language", data={"CallSid": "CASETUP", "Digits": "2"}).data.decode()
+        assert time.perf_counter() - t0 < 0.2
+        assert "ستار سكاي" in greeting and 'language="ar-XA"' in greeting
+        assert main.CALL_SETUP.drain(5)
+        assert stubs.db.call_state["CASETUP"]["slots"]["language"] == "Arabic"
+        # the first turn starts from memory: its only queries are the save and its transcript segment
+        assert main.TRANSCRIPTS.drain(5)
+        stubs.reset_counts()
+        client.post("/handle", data={"CallSid": "CASETUP", "SpeechResult": "Sara", "From": "+971500000001"})
+        assert main.TRANSCRIPTS.drain(5)
+        assert stubs.counts().get("postgres") == 2
+        saved = stubs.db.call_state["CASETUP"]
+        assert saved["slots"]["language"] == "Arabic" and len(saved["history"]) == 3
+        # a late setup write never replaces what a turn saved
+        main.write_initial_state("CASETUP", main.initial_state("English"))
+        assert stubs.db.call_state["CASETUP"] == saved
+
+def test_language_menu_gives_up_in_english():
+    import main
+    client = main.app.test_client()
+    first = client.post("/voice", data={"CallSid": "CAMENU"}).data.decode()
+    assert "/voice?attempt=2" in first
+    last = client.post(f"/voice?attempt={main.LANGUAGE_MENU_ATTEMPTS}", data={"CallSid": "CAMENU"}).data.decode()
+    assert "/select-language?Digits=1" in last and "/voice" not in last
+    assert client.post("/voice?attempt=oops", data={}).data.decode() == first
+    assert main.greeting_twiml("English") is main.greeting_twiml("English")  # rendered once
+
+if __name__ == "__main__":
+    test_state_is_handed_to_the_first_turn_once()
+    test_untaken_states_expire()
+    test_greeting_does_not_wait_for_postgres()
+    test_language_menu_gives_up_in_english()
+    print("✅ Call setup tests passed")
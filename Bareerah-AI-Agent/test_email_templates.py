@@ -0,0 +1,58 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+
+import email_templates
+
+RECORD = email_templates.BookingEmail(
+    reference="SSL-1", pickup="<script>alert(1)</script> Marina", dropoff="DXB", customer_name="Ali & Sons",
+    fare=160, distance_km=31.4, transcript=email_templates.transcript([{"role": "user", "content": "I'm <b>late</b>"}]),
+    timestamp="2026-10-19 18:00:00")
+
+def test_customer_values_are_escaped_in_html_only():
+    html, text = email_templates.render_both("booking_admin", RECORD)
+    assert "<script>" not in html and "&lt;script&gt;alert(1)&lt;/script&gt; Marina" in html
+    assert "Ali &amp; Sons" in html and "USER: I&#39;m &lt;b&gt;late&lt;/b&gt;" in html
+    assert "📤 Pickup: <script>alert(1)</script> Marina" in text and "USER: I'm <b>late</b>" in text
+    assert "Booking Timestamp: 2026-10-19 18:00:00" in html and "Booking Timestamp: 2026-10-19 18:00:00" in text
+
+def test_each_section_appears_once():
+    html = email_templates.render("booking_admin", RECORD)
+    for label in ("Dropoff Location", "Total Fare", "Passengers", "Full Conversation Transcript"):
+        assert html.count(f">{label}<") == 1, label
+    assert "AED 160" in html and "31.4 km" in html
+    # the timestamp is filled at render time when the record has none, the same for both parts
+    html, text = email_templates.render_both("booking_admin", RECORD._replace(timestamp=None))
+    assert html.split("Booking Timestamp: ")[1][:19] == text.split("Booking Timestamp: ")[1][:19]
+
+def test_main_and_legacy_emails_come_from_the_templates():
+    import main
+    import load_test
+    html, text = main.booking_email("SSL-2", "Marina", "DXB", "Tomorrow 4 PM", "Lexus ES", "classic", 2, 1, 20.0, 120,
+                                    {"customer_name": "Sara"}, "+971500000001", "https://x.test/transcripts/abc", "2026-10-19 18:00:00")
+    assert "SSL-2" in html and "Lexus ES" in text and "👤 Customer: Sara (+971500000001)" in text
+    assert 'href="https://x.test/transcripts/abc"' in html and "Transcript: https://x.test/transcripts/abc" in text
+    _, payload = main.email_request("Star Skyline <info@sslbookings.com>", "subject", html, text)
+    assert payload["html"] == html and payload["text"] == text
+    legacy = load_test.load_app("legacy")
+    booking = {"customer_name": "Omar", "vehicle_type": "suv", "driver_number": "+971 50 111 2222", "notes": "child seat <2>"}
+    html = legacy.generate_professional_email_html(booking, "New Booking Confirmed")
+    assert ">SUV<" in html and 'href="tel:971501112222"' in html and "child seat &lt;2&gt;" in html and "Hi <strong>Omar</strong>" in html
+
+def test_renders_stay_sub_millisecond():
+    digest = email_templates.Digest(items=(RECORD,) * 10)
+    for name, record in (("booking_admin", RECORD), ("booking_status", RECORD), ("follow_up_digest", digest)):
+        email_templates.render(name, record)
+        t0 = time.perf_counter()
+        for _ in range(200): email_templates.render_both(name, record)
+        assert (time.perf_counter() - t0) / 200 < 0.002
+    assert email_templates.snapshot()["templates"] == 2 * len(email_templates.EMAILS)
+
+if __name__ == "__main__":
+    test_customer_values_are_escaped_in_html_only()
+    test_each_section_appears_once()
+    test_main_and_legacy_emails_come_from_the_templates()
+    test_renders_stay_sub_millisecond()
+    print("✅ Email template tests passed")
@@ -0,0 +1,63 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+
+import gazetteer
+
+def _name(text, **kw):
+    match = gazetteer.default().lookup(text, **kw)
+    return match.place.name if match else None
+
+def test_exact_contained_and_misspelt_names():
+    assert _name("Dubai Mall") == "The Dubai Mall, Downtown Dubai, Dubai"
+    assert _name("to the airport please").startswith("Dubai International Airport (DXB)")
+    assert _name("مطار دبي").startswith("Dubai International Airport (DXB)")
+    assert _name("pick me up from JBR near the beach").startswith("JBR")
+    assert _name("marena mall") == "Dubai Marina Mall, Sheikh Zayed Road, Dubai"
+    assert _name("mall of emirate") == "Mall of the Emirates, Al Barsha, Dubai"
+    assert _name("palm jumeira") == "Palm Jumeirah, Dubai"  # not the shorter "jumeira" inside it
+    assert _name("jbx").startswith("JBR")  # edit distance 1 via the BK-tree
+    assert _name("Dubai") is None and _name("random street xyz") is None
+    # a landmark inside a full address doesn't stand in for it unless asked to
+    assert gazetteer.default().lookup("Tower 5, Dubai Marina", contained=False).score < 0.8
+
+def test_bk_tree_and_edit_distance():
+    assert gazetteer.levenshtein("deira", "deiraa") == 1
+    assert gazetteer.levenshtein("kitten", "sitting") == 3
+    assert gazetteer.levenshtein("", "abc") == 3
+    tree = gazetteer.BKTree(["deira", "dubai", "jbr", "jlt", "difc"])
+    assert tree.query("jbx", 1) == [(1, "jbr")]
+    assert [w for _, w in tree.query("dera", 1)] == ["deira"]
+
+def test_loads_from_csv_and_stays_fast():
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "places.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('name,lat,lng,aliases\n"Test Tower, Dubai",25.1,55.2,test tower|ٹیسٹ ٹاور\n')
+    g = gazetteer.load(path)
+    assert len(g) == 1 and g.lookup("ٹیسٹ ٹاور").place.lat == 25.1
+    g = gazetteer.default()
+    queries = ["dubai mall", "to the airport", "marena mall", "business bay tower 3", "burj khalifaa"] * 200
+    t0 = time.perf_counter()
+    for q in queries: g.lookup(q)
+    assert (time.perf_counter() - t0) / len(queries) < 0.001
+
+def test_apps_resolve_landmarks_without_the_network():
+    import main
+    import load_test
+    known = main.known_place("Dubai Marina Mall")
+    assert known == "25.0764,55.1403|||Dubai Marina Mall, Sheikh Zayed Road, Dubai"
+    assert main.resolve_address("Dubai Marina Mall") == known
+    assert main.known_place("Tower 5, Street 12, Al Quoz") is None
+    legacy = load_test.load_app("legacy")
+    assert legacy.extract_pickup_location_llm("I am at the dubai mall") == "The Dubai Mall, Downtown Dubai, Dubai"
+    assert legacy.validate_pickup_with_places_api("burj khalifaa")
+
+if __name__ == "__main__":
+    test_exact_contained_and_misspelt_names()
+    test_bk_tree_and_edit_distance()
+    test_loads_from_csv_and_stays_fast()
+    test_apps_resolve_landmarks_without_the_network()
+    print("✅ Gazetteer tests passed")
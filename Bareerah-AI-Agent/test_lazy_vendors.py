@@ -0,0 +1,71 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import sys
+import threading
+
+import lazy_vendors
+import startup_profile
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       300 |        300 |     _json
+import time:       900 |       1200 |   json
+import time:       100 |        100 |   tracing
+import time:      5000 |       6300 | main
+"""
+
+def test_nothing_is_imported_or_built_until_first_use():
+    sys.modules.pop("colorsys", None)
+    hsv = lazy_vendors.attr("colorsys", "rgb_to_hsv")
+    assert "colorsys" not in sys.modules and not lazy_vendors.snapshot()["colorsys"]["loaded"]
+    assert hsv(1, 0, 0) == (0.0, 1.0, 1)
+    assert lazy_vendors.snapshot()["colorsys"]["loaded"] and lazy_vendors.snapshot()["colorsys"]["import_ms"] is not None
+    built, go = [], threading.Event()
+    client = lazy_vendors.client(lambda: built.append(1) or {"ok": True}, "racy")
+    def use():
+        go.wait()
+        client.get("ok")
+    threads = [threading.Thread(target=use) for _ in range(8)]
+    for t in threads: t.start()
+    go.set()
+    for t in threads: t.join()
+    assert built == [1] and "built" in repr(client)  # one client, however many threads race for it
+
+def test_apps_boot_without_the_heavy_sdks():
+    for app in ("main", "legacy"):
+        total_ms, entries = startup_profile.profile(app)
+        loaded = {e.name for e in entries}
+        assert not loaded & {"openai", "twilio.rest", "jwt"}, app
+        assert "flask" in loaded and total_ms > 0
+    _, entries = startup_profile.profile("main", preload=True)  # what a --preload master imports for its workers
+    assert {"openai", "twilio.rest"} <= {e.name for e in entries}
+
+def test_preload_step_fills_memory_without_threads():
+    import main
+    from vendor_stubs import VendorStubs
+    assert "openai" in lazy_vendors.snapshot() and "twilio.rest" in lazy_vendors.snapshot()
+    threads = threading.active_count()
+    lazy_vendors.preload()
+    assert threading.active_count() == threads  # safe to run before gunicorn forks
+    assert all(v["loaded"] for v in lazy_vendors.snapshot().values())
+    assert "not built" in repr(main.client)  # clients (and their connection pools) are left to the workers
+    with VendorStubs(seed=1, sleep=False).installed(main) as stubs:
+        main.client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+        assert stubs.counts()["openai"] == 1  # the facade is still patchable like the real client
+    assert "vendors" in main.tracing.metrics_snapshot()["gauges"]
+
+def test_profile_report_and_budget():
+    entries = startup_profile.parse(SAMPLE)
+    assert entries[-1] == startup_profile.Entry("main", 5000, 6300, 0) and entries[0].depth == 2
+    assert [e.name for e in startup_profile.top_imports(entries)] == ["json", "tracing"]  # unwraps `import main`
+    text = startup_profile.report("main", 6.3, entries)
+    assert "1.2ms  json" in text and "none (lazy_vendors)" in text
+    assert startup_profile.main(["main", "--budget-ms", "1"]) == 1
+
+if __name__ == "__main__":
+    test_nothing_is_imported_or_built_until_first_use()
+    test_apps_boot_without_the_heavy_sdks()
+    test_preload_step_fills_memory_without_threads()
+    test_profile_report_and_budget()
+    print("✅ Lazy vendor tests passed")
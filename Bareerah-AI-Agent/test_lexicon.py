@@ -0,0 +1,73 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import lexicon
+
+LABELLED = [
+    ("I need a car from Dubai Marina to the airport", "en"),
+    ("please pick me up at Dubai Mall tomorrow", "en"),
+    ("meri pickup location Dubai Marina Mall hai", "ur"),
+    ("mujhe kal airport jana hai", "ur"),
+    ("theek hai bilkul", "ur"),
+    ("yalla habibi, Dubai Mall", "ar"),
+    ("shukran habibi, inshallah", "ar"),
+    ("السلام علیکم، مجھے ایئرپورٹ جانا ہے", "ur"),
+    ("السلام عليكم، أريد سيارة إلى المطار", "ar"),
+    ("حسناً، شكراً جزيلاً", "ar"),
+]
+
+def _detector():
+    return lexicon.LanguageDetector({"en": lexicon.ENGLISH_MARKERS,
+                                     "ur": lexicon.ROMAN_URDU_MARKERS | {"dubai"},
+                                     "ar": lexicon.ROMAN_ARABIC_MARKERS | {"dubai"}})
+
+def test_lexicon_matches_whole_words_and_phrases():
+    yes = lexicon.Lexicon(["yes", "ok", "go ahead", "that's right", "حسناً"])
+    assert not yes.search("book a car") and not yes.search("I know")
+    assert yes.search("Ok.") and yes.search("sure, go  ahead") and yes.search("That’s right")
+    assert yes.search("حسنا")  # harakat stripped on both sides
+    assert [term for _, term in yes.find("ok then, go ahead")] == ["ok", "go ahead"]
+    assert "go ahead" in yes and "go" not in yes
+    assert {"go", "ahead", "that's"} <= yes.vocabulary
+
+def test_scores_are_probabilities_and_labels_match():
+    detector = _detector()
+    for text, lang in LABELLED:
+        scores = detector.scores(text, current="en")
+        assert abs(sum(scores.values()) - 1) < 1e-3
+        assert max(scores, key=scores.get) == lang, (text, scores)
+        assert detector.detect(text, "en") == lang
+
+def test_script_decides_arabic_vs_urdu_and_shared_words_are_neutral():
+    detector = _detector()
+    assert detector.scores("السلام عليكم، أريد سيارة إلى المطار")["ar"] > 0.95
+    assert detector.scores("السلام علیکم، مجھے ایئرپورٹ جانا ہے")["ur"] > 0.95
+    # "dubai" is listed for both ur and ar: on its own it doesn't move the language
+    assert detector.detect("dubai", "en") == "en"
+    assert detector.detect("", "ur") == "ur"
+    # mixed sentence: Arabic is ahead but not clearly, so the call keeps its language
+    scores = detector.scores("shukran, inshallah tomorrow", "en")
+    assert max(scores, key=scores.get) == "ar" and detector.detect("shukran, inshallah tomorrow", "en") == "en"
+
+def test_legacy_helpers_use_compiled_lexicons():
+    import load_test
+    legacy = load_test.load_app("legacy")
+    assert legacy.check_yes_no("book it please") == "yes"
+    assert legacy.check_yes_no("I want to book") == "yes"  # "book" is a yes word; "ok" inside it is not matched
+    assert legacy.check_yes_no("no, that's right") == "no"
+    assert legacy.check_yes_no("I know the way") is None
+    assert legacy.check_yes_no("نعم") == "yes"
+    assert legacy.has_explicit_correction("that's wrong", "en")
+    assert not legacy.has_explicit_correction("I changed planes", "en")
+    assert legacy.is_confirmation_or_greeting("Yes, go ahead.")
+    assert not legacy.is_confirmation_or_greeting("Dubai Marina Mall")
+    assert legacy.detect_language_from_speech("Dubai Marina", "en") == "en"
+    assert legacy.detect_language_from_speech("meri pickup Dubai Marina se hai", "en") == "ur"
+
+if __name__ == "__main__":
+    test_lexicon_matches_whole_words_and_phrases()
+    test_scores_are_probabilities_and_labels_match()
+    test_script_decides_arabic_vs_urdu_and_shared_words_are_neutral()
+    test_legacy_helpers_use_compiled_lexicons()
+    print("✅ Lexicon tests passed")
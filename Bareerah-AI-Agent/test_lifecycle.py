@@ -0,0 +1,104 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+import threading
+import importlib.util
+
+import lifecycle
+from vendor_stubs import VendorStubs
+
+def warmed(lc, timeout=10):
+    deadline = time.time() + timeout
+    while not lc.warm_done and time.time() < deadline:
+        time.sleep(0.01)
+    return lc.warm_done
+
+def test_schema_once_and_warmups_once_per_process():
+    ran = []
+    lc = lifecycle.Lifecycle("t", schema=lambda: ran.append("schema") or True)
+    lc.on_worker(lambda: ran.append("warm"), "cache")
+    assert lc.readiness() == (False, {"schema": "pending", "worker": "not started"})
+    assert lc.start() and not lc.start() and warmed(lc)
+    assert ran == ["schema", "warm"] and lc.readiness() == (True, {"schema": "migrated", "worker": "warm"})
+    lc.pid = -1  # what a forked worker sees: the parent's warmup threads are gone
+    assert lc.start() and warmed(lc) and ran == ["schema", "warm", "warm"]
+    os.environ[lifecycle.SCHEMA_MARKER] = "1"  # the gunicorn master already migrated
+    try:
+        follower = lifecycle.Lifecycle("t", schema=lambda: ran.append("again"))
+        assert follower.ensure_schema() and follower.schema_state == "leader" and "again" not in ran
+    finally:
+        del os.environ[lifecycle.SCHEMA_MARKER]
+
+def test_readyz_stays_down_until_the_schema_and_checks_pass():
+    attempts, db = [], {"up": False}
+    def schema():
+        attempts.append(1)
+        if not db["up"]: raise RuntimeError("database unreachable")
+        return True
+    lc = lifecycle.Lifecycle("t", schema=schema, retry_seconds=0)
+    lc.check("backend", lambda: db["up"])
+    lc.on_worker(lambda: 1 / 0, "broken_warmup")
+    lc.start()
+    assert warmed(lc) and lc.warm["broken_warmup"].startswith("failed")  # best effort, doesn't block readiness
+    ready, checks = lc.readiness()
+    assert not ready and checks["schema"] == "failed: database unreachable" and checks["backend"] == "failing"
+    db["up"] = True
+    assert lc.readiness() == (True, {"schema": "migrated", "worker": "warm", "backend": "ok"})
+    assert len(attempts) == 3  # start, then one retry per probe until it worked
+
+def test_gunicorn_hooks_migrate_in_the_master_and_warm_each_worker():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    logged = []
+    def log(msg, *args): logged.append(msg % args)
+    server = type("Server", (), {"log": type("Log", (), {"info": staticmethod(log), "error": staticmethod(log)})()})()
+    real_migrate, real_all = lifecycle.migrate_database, lifecycle._lifecycles
+    try:
+        lifecycle.migrate_database = lambda: (_ for _ in ()).throw(RuntimeError("db down"))
+        conf.on_starting(server)  # a master that can't migrate still starts; the workers retry
+        assert "workers will retry" in logged[-1]
+        lifecycle._lifecycles = []
+        warmed_in = []
+        lc = lifecycle.Lifecycle("t")
+        lc.on_worker(lambda: warmed_in.append(os.getpid()), stop=lambda: warmed_in.append("stopped"))
+        conf.post_worker_init(None)
+        assert warmed(lc) and warmed_in == [os.getpid()] and lc.schema_state == "skipped"
+        conf.worker_exit(server, None)
+        assert warmed_in[-1] == "stopped"
+    finally:
+        lifecycle.migrate_database, lifecycle._lifecycles = real_migrate, real_all
+    assert lifecycle.migrate_database(database_url="") is False
+
+def test_apps_do_no_startup_work_on_import_or_per_request():
+    import main
+    import load_test
+    legacy = load_test.load_app("legacy")
+    assert not main.RECONCILER.snapshot()["running"] and main.LIFECYCLE.pid is None
+    assert [f.__name__ for f in legacy.app.before_request_funcs.get(None, [])] == ["bind_log_context"]  # no init_app
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(main, legacy):
+        for mod in (main, legacy):
+            client = mod.app.test_client()
+            assert client.get("/healthz").status_code == 200
+            assert client.get("/readyz").status_code == 503
+            client.get("/")  # the log writer thread starts with a process's first record
+            threads = threading.active_count()
+            for _ in range(20): client.get("/")
+            assert threading.active_count() == threads  # no threads per request
+            mod.LIFECYCLE.start()
+            assert warmed(mod.LIFECYCLE)
+            ready = client.get("/readyz")
+            assert ready.status_code == 200 and ready.get_json()["checks"]["schema"] == "migrated"
+            mod.LIFECYCLE.stop()
+    assert stubs.db.migrations  # the schema step ran against the (stub) database
+    assert not main.RECONCILER.snapshot()["running"]
+
+if __name__ == "__main__":
+    test_schema_once_and_warmups_once_per_process()
+    test_readyz_stays_down_until_the_schema_and_checks_pass()
+    test_gunicorn_hooks_migrate_in_the_master_and_warm_each_worker()
+    test_apps_do_no_startup_work_on_import_or_per_request()
+    print("✅ Lifecycle tests passed")
@@ -0,0 +1,54 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import load_test
+
+def level(conc, rps, p95, err=0.0, timeouts=0):
+    return {"concurrency": conc, "rps": rps, "error_rate": err, "twilio_timeouts": timeouts, "latency_ms": {"p95": p95}}
+
+def test_saturation_when_throughput_flattens():
+    levels = [level(1, 10, 100), level(2, 19, 110), level(4, 20, 180)]
+    assert load_test.find_saturation(levels) == (4, 2)
+
+def test_saturation_on_errors_or_latency():
+    assert load_test.find_saturation([level(1, 10, 100), level(2, 20, 100, err=0.05)]) == (2, 1)
+    assert load_test.find_saturation([level(1, 10, 100), level(2, 20, 250)]) == (2, 1)
+
+def test_no_saturation_within_ramp():
+    assert load_test.find_saturation([level(1, 10, 100), level(2, 20, 110)]) == (None, 2)
+
+def test_level_summary():
+    rec = load_test.Recorder()
+    rec.record("/handle", 120, True)
+    rec.record("/handle", 80, False)
+    rec.record("voice.turn", 200, True)
+    rec.flow_done(True)
+    lv = load_test.summarize_level(rec, 2, 1.0, 3)
+    assert lv["requests"] == 2 and lv["error_rate"] == 0.5
+    assert lv["endpoints"]["voice.turn"]["p50"] == 200
+    assert lv["db_connections_peak"] == 3
+
+def test_in_process_voice_flow():
+    import main
+    from vendor_stubs import VendorStubs
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(main):
+        base, server = load_test.start_local_server(main)
+        try:
+            rec = load_test.Recorder()
+            lines = ["Sara", "Dubai Marina", "Airport", "Two of us", "Executive", "No thanks"]
+            ok = load_test.voice_flow(load_test.requests.Session(), rec, base, 1, lines, "main")
+        finally:
+            server.shutdown()
+    assert ok
+    assert rec.samples["/handle"] and not rec.errors
+    assert stubs.db.usage()["open"] == 0
+
+if __name__ == "__main__":
+    test_saturation_when_throughput_flattens()
+    test_saturation_on_errors_or_latency()
+    test_no_saturation_within_ramp()
+    test_level_summary()
+    test_in_process_voice_flow()
+    print("✅ Load test helper tests passed")
@@ -0,0 +1,66 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import migrations
+from vendor_stubs import VendorStubs
+
+def test_versions_are_ordered_and_cover_the_booking_queries():
+    versions = [v for v, _, _ in migrations.MIGRATIONS]
+    assert versions == sorted(set(versions)) and versions[0] == 1
+    ddl = " ".join(" ".join(sql.split()) for _, _, statements in migrations.MIGRATIONS for sql in statements)
+    assert "fare_aed TYPE NUMERIC(10, 2)" in ddl and "CREATE TYPE booking_state AS ENUM" in ddl
+    assert "bookings (customer_phone, booking_status)" in ddl and "bookings (created_at DESC)" in ddl
+    for state in ("confirmed", "pending_confirmation", "pending_location_issue", "pending_no_response"):
+        assert state in migrations.BOOKING_STATES  # every booking_status the apps write
+
+def test_only_pending_migrations_run_and_are_recorded_once():
+    stubs = VendorStubs(seed=1, sleep=False)
+    conn = stubs.db.connect()
+    assert migrations.migrate(conn) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert stubs.db.migrations == {version: name for version, name, _ in migrations.MIGRATIONS}
+    assert stubs.db.migrations[1] == "baseline"
+    stubs.reset_counts()
+    assert migrations.migrate(conn) == []  # a second worker booting finds nothing to do
+    assert stubs.counts()["postgres"] == 4  # lock, schema_migrations, select, unlock
+    extra = migrations.MIGRATIONS + [(99, "next", ["SELECT 1"])]
+    assert migrations.migrate(conn, extra) == [99]
+
+def test_a_failing_migration_is_rolled_back_and_stops_the_run():
+    executed, rolled_back = [], []
+    class Cursor:
+        def execute(self, sql, params=()):
+            if sql == "BROKEN": raise RuntimeError("syntax error")
+            executed.append(sql)
+        def fetchall(self): return [(1,)]  # tuple rows, like the legacy pool's connections
+        def close(self): pass
+    class Conn:
+        def cursor(self): return Cursor()
+        def commit(self): pass
+        def rollback(self): rolled_back.append(True)
+    steps = [(1, "done", ["ONE"]), (2, "ok", ["TWO"]), (3, "bad", ["THREE", "BROKEN"]), (4, "later", ["FOUR"])]
+    try:
+        migrations.migrate(Conn(), steps)
+        assert False, "expected the failure to surface"
+    except RuntimeError:
+        pass
+    assert "ONE" not in executed and "TWO" in executed and "FOUR" not in executed
+    assert rolled_back and "pg_advisory_unlock" in executed[-1]
+
+def test_bookings_are_saved_with_typed_values():
+    import main
+    stubs = VendorStubs(seed=1, sleep=False)
+    conn = stubs.db.connect()
+    row = main.booking_row({"customer_name": "Sara"}, "+971500000001", "Marina", "DXB", "160", "executive", "airport_transfer", 2, 1, 31.4, "CA1")
+    assert (row["fare_aed"], row["number_of_passengers"], row["service_type"]) == (160.0, 2, "airport_transfer")
+    assert main.booking_row({}, None, "Marina", "DXB", None, "classic", "point_to_point", 1, 0, 20.0, "CA2")["fare_aed"] is None
+    main.claim_booking(conn, "call:CA1", row)
+    saved = stubs.db.bookings[0]
+    assert saved[0] == "call:CA1" and saved[2] == "pending_confirmation" and 160.0 in saved
+
+if __name__ == "__main__":
+    test_versions_are_ordered_and_cover_the_booking_queries()
+    test_only_pending_migrations_run_and_are_recorded_once()
+    test_a_failing_migration_is_rolled_back_and_stops_the_run()
+    test_bookings_are_saved_with_typed_values()
+    print("✅ Migration tests passed")
@@ -0,0 +1,87 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+import smtplib
+
+import notify_dispatcher
+
+class Conn:
+    def __init__(self, log, fail=0):
+        self.log, self.fail = log, fail
+    def send_message(self, msg):
+        if self.fail:
+            self.fail -= 1
+            raise smtplib.SMTPServerDisconnected("closed")
+        self.log.append(msg)
+    def quit(self): pass
+
+def test_connections_are_reused_and_reopened_when_dropped():
+    sent, made = [], []
+    def connect():
+        made.append(Conn(sent))
+        return made[-1]
+    smtp = notify_dispatcher.SmtpSessions(connect)
+    for i in range(5): smtp.send(f"m{i}")
+    assert len(made) == 1 and len(sent) == 5
+    made[0].fail = 1  # the server dropped the idle connection
+    smtp.send("m5")
+    assert len(made) == 2 and sent[-1] == "m5" and smtp.snapshot()["reconnected"] == 1
+    smtp.idle_seconds = 0
+    time.sleep(0.01)
+    smtp.send("m6")
+    assert len(made) == 3
+
+def _dispatcher(**kw):
+    delivered = []
+    d = notify_dispatcher.Dispatcher(lambda subject, html, text: delivered.append((subject, html, text)) or True, **kw)
+    return d, delivered
+
+def test_without_digest_every_alert_is_its_own_email():
+    d, delivered = _dispatcher(digest_minutes=0)
+    assert d.notify({"customer_name": "Sara <x>", "customer_phone": "+9715001"}, "dropped") == "sent"
+    assert d.notify({"customer_name": "Ali"}, "created") == "sent"
+    assert d.drain(5)
+    subjects = sorted(s for s, _, _ in delivered)
+    assert subjects == ["✅ New Booking Confirmed - Star Skyline", "📞 Call Dropped - Customer May Need Follow-up"]
+    assert any("Sara &lt;x&gt;" in html and "Sara <x>" in text for _, html, text in delivered)
+
+def test_digest_batches_low_priority_alerts_only():
+    d, delivered = _dispatcher(digest_minutes=60, digest_max=3)
+    assert d.notify({"customer_phone": "+9715001", "issue": "hung up"}, "partial_info") == "digest"
+    assert d.notify({"customer_phone": "+9715002"}, "dropped") == "digest"
+    assert d.notify({"customer_phone": "+9715003"}, "location_failed") == "sent"
+    d.outbox.drain(5)
+    assert [s for s, _, _ in delivered] == ["🚨 MISSED LEAD - Pickup Location Issue - Star Skyline"]
+    d.notify({"customer_phone": "+9715004"}, "dropped")  # the third one fills the digest: sent early
+    d.outbox.drain(5)
+    subject, html, text = delivered[-1]
+    assert subject == "📋 3 Follow-ups - Star Skyline"
+    assert all(p in html and p in text for p in ("+9715001", "+9715002", "+9715004")) and "hung up" in text
+    assert d.snapshot()["waiting"] == 0 and d.snapshot()["digests"] == 1
+    # and on a timer
+    d, delivered = _dispatcher(digest_minutes=0.001)
+    d.notify({"customer_phone": "+9715005"}, "partial_info")
+    time.sleep(0.3)
+    d.outbox.drain(5)
+    assert [s for s, _, _ in delivered] == ["📋 1 Follow-up - Star Skyline"]
+
+def test_legacy_alerts_share_one_smtp_connection():
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(legacy):
+        for i in range(6):
+            legacy.notify_booking_to_team({"customer_name": f"Caller {i}", "customer_phone": f"+97150000000{i}"}, "created")
+        assert legacy.TEAM_NOTIFIER.drain(10)
+        assert stubs.counts()["resend"] == 6
+        assert legacy.TEAM_SMTP.snapshot()["connected"] <= notify_dispatcher.NOTIFY_WORKERS
+
+if __name__ == "__main__":
+    test_connections_are_reused_and_reopened_when_dropped()
+    test_without_digest_every_alert_is_its_own_email()
+    test_digest_batches_low_priority_alerts_only()
+    test_legacy_alerts_share_one_smtp_connection()
+    print("✅ Notify dispatcher tests passed")
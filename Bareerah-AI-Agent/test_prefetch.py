@@ -0,0 +1,73 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+import threading
+
+import prefetch
+
+def test_same_key_runs_once_and_result_is_handed_over_once():
+    runs = []
+    box = prefetch.Prefetcher(workers=2, name="test")
+    gate = threading.Event()
+    def job(n):
+        gate.wait(5)
+        runs.append(n)
+        return {"n": n}
+    first = box.start("CA1", "k1", job, 1)
+    assert box.start("CA1", "k1", job, 2) is first  # already running for these slots
+    assert box.take("CA1", "k1") is None  # not finished, no wait
+    gate.set()
+    assert box.take("CA1", "k1", wait_seconds=5) == ("k1", {"n": 1})
+    assert box.take("CA1", "k1") is None  # the caller owns it now
+    assert runs == [1]
+    snap = box.snapshot()
+    assert (snap["started"], snap["reused"], snap["hits"], snap["waited"]) == (1, 1, 1, 1)
+
+def test_new_keys_replace_and_failures_are_dropped():
+    box = prefetch.Prefetcher(workers=1, name="test")
+    box.start("CA2", "old", lambda: "old")
+    box.start("CA2", "new", lambda: "new")
+    assert box.drain(5)
+    assert box.take("CA2", "other") == ("new", "new")  # a finished job for older slots comes back as stale
+    def boom(): raise RuntimeError("backend down")
+    box.start("CA3", "k", boom)
+    assert box.drain(5)
+    assert box.take("CA3", "k") is None
+    snap = box.snapshot()
+    assert (snap["stale"], snap["failed"], snap["calls"]) == (1, 1, 0)
+
+def test_entries_expire():
+    box = prefetch.Prefetcher(workers=1, ttl=0.05, name="test")
+    box.start("CA4", "k", lambda: 1)
+    time.sleep(0.1)
+    box.start("CA5", "k", lambda: 2)  # pruning happens on start
+    assert box.take("CA4", "k") is None and box.snapshot()["expired"] == 1
+
+def test_pitch_turn_uses_prefetched_route_and_fares():
+    import main
+    from vendor_stubs import VendorStubs
+    stubs = VendorStubs(seed=1, sleep=False)
+    calls = []
+    with stubs.installed(main):
+        client = main.app.test_client()
+        client.post("/select-language", data={"CallSid": "CAPREFETCH", "Digits": "1"})
+        for line in ["Sara", "Dubai Marina", "Airport", "Two of us"]:
+            stubs.reset_counts()
+            body = client.post("/handle", data={"CallSid": "CAPREFETCH", "SpeechResult": line, "From": "+971500000001"}).data
+            assert main.PREFETCH.drain(5)  # the caller is talking
+            calls.append(stubs.counts())
+    # "Dubai Marina" completes the route: the prefetch geocodes and quotes in the background
+    assert calls[1]["google_maps"] == 2 and calls[1]["backend"] >= 3
+    # the pitch only asks for vehicles again (passengers changed since); route and fares are reused
+    assert "google_maps" not in calls[2] and calls[2]["backend"] == 1
+    # repeating the pitch needs no vendor at all
+    assert set(calls[3]) == {"postgres"} and b"Which option would you like to book?" in body
+
+if __name__ == "__main__":
+    test_same_key_runs_once_and_result_is_handed_over_once()
+    test_new_keys_replace_and_failures_are_dropped()
+    test_entries_expire()
+    test_pitch_turn_uses_prefetched_route_and_fares()
+    print("✅ Prefetch tests passed")
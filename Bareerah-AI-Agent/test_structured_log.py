@@ -0,0 +1,113 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import io
+import json
+import time
+import logging
+import threading
+
+import tracing
+import structured_log
+
+def writer(name, stream=None, queue_max=100, fmt=structured_log.TextFormatter()):
+    """A QueueWriter on its own logger, so the test reads only its own lines"""
+    handler = structured_log.QueueWriter(stream or io.StringIO(), queue_max)
+    handler.addFilter(structured_log.ContextFilter(handler.stats))
+    handler.setFormatter(fmt)
+    logger = logging.getLogger(name)
+    logger.handlers, logger.propagate = [handler], False
+    logger.setLevel(logging.INFO)
+    return handler, logger
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(structured_log.ContextFilter({}))
+    def emit(self, record): self.records.append(record)
+
+def test_lines_below_the_level_are_never_formatted_and_written_off_thread():
+    handler, logger = writer("t.level")
+    logger.setLevel(logging.WARNING)
+    class Loud:
+        def __str__(self): raise AssertionError("formatted below the level")
+    logger.info("[CACHE] hit %s", Loud())  # info below WARNING: the arg is never str()'d
+    logger.error("[TTS] ❌ ElevenLabs down %s", 503)
+    assert handler.drain()
+    assert handler.stream.getvalue() == "[TTS] ❌ ElevenLabs down 503\n" and handler.stats["written"] == 1
+
+def test_bound_call_and_trace_in_json_lines():
+    handler, logger = writer("t.json", fmt=structured_log.JsonFormatter())
+    structured_log.bind(call_sid="CA1", phone="+971500000001")
+    with tracing.span("voice.turn") as span:
+        logger.info("[BOOKING] %s confirmed", "SSL-ABC", extra={"fields": {"fare": 160}})
+    other = threading.Thread(target=lambda: logger.info("[SYNC] background"))  # a thread has its own context
+    other.start(); other.join()
+    structured_log.bind()
+    assert handler.drain()
+    first, second = [json.loads(line) for line in handler.stream.getvalue().splitlines()]
+    assert (first["msg"], first["tag"], first["call_sid"], first["phone"], first["fare"]) == \
+           ("[BOOKING] SSL-ABC confirmed", "BOOKING", "CA1", "+971500000001", 160)
+    assert first["trace_id"] == span.trace_id and first["level"] == "info"
+    assert "call_sid" not in second and second["tag"] == "SYNC"
+
+def test_debug_sampled_per_call_and_a_full_queue_drops_instead_of_blocking():
+    handler, logger = writer("t.sample")
+    logger.setLevel(logging.DEBUG)
+    calls = [f"CA{n}" for n in range(200)]
+    kept = [c for c in calls if structured_log.sampled(c, 0.25)]
+    assert kept == [c for c in calls if structured_log.sampled(c, 0.25)] and 20 < len(kept) < 80
+    real = structured_log.LOG_DEBUG_SAMPLE
+    try:
+        structured_log.LOG_DEBUG_SAMPLE = 0.0
+        structured_log.bind(call_sid="CA1")
+        logger.debug("[DEBUG RAW LLM] %s", {"big": "dump"})
+        assert handler.stats["sampled_out"] == 1
+    finally:
+        structured_log.LOG_DEBUG_SAMPLE = real
+        structured_log.bind()
+    release = threading.Event()
+    class Stuck(io.StringIO):
+        def write(self, s):
+            release.wait(5)
+            return super().write(s)
+    stuck, slow = writer("t.full", stream=Stuck(), queue_max=2)
+    started = time.perf_counter()
+    for n in range(50): slow.info("line %d", n)
+    assert time.perf_counter() - started < 0.5 and stuck.stats["dropped"] >= 40  # the caller never waits on the write
+    release.set()
+    assert stuck.drain()
+
+def test_apps_log_through_the_pipeline_with_the_call_bound():
+    import main
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    assert "print" not in vars(legacy) and "print" not in vars(main)  # module loggers, not a shadowed builtin
+    assert (legacy.log.name, main.log.name) == ("legacy", "main")
+    assert isinstance(structured_log.setup(), structured_log.QueueWriter)
+    records = Records()
+    logging.getLogger("legacy").addHandler(records)
+    try:
+        legacy.log_conversation("+971500000001", "Customer", "I need a car to the airport")
+        legacy.get_cached_faq_response("how much is a ride to dubai airport from the marina")
+        faq = [r for r in records.records if "[CACHE]" in r.getMessage()]
+        assert len(faq) <= 1  # one line for the winner, not one per improving candidate
+        convo = records.records[0]
+        assert convo.getMessage() == "[CONVERSATION] CUSTOMER: I need a car to the airport" and convo.fields["speaker"] == "customer"
+        with VendorStubs(seed=1, sleep=False).installed(legacy):
+            legacy.app.test_client().post("/call-status", data={"CallSid": "CALOG", "CallStatus": "completed"})
+        assert any(r.call_sid == "CALOG" for r in records.records)
+        assert structured_log.bound() == {}  # unbound once the request is over
+    finally:
+        logging.getLogger("legacy").removeHandler(records)
+    assert "log" in main.tracing.metrics_snapshot()["gauges"]
+
+if __name__ == "__main__":
+    test_lines_below_the_level_are_never_formatted_and_written_off_thread()
+    test_bound_call_and_trace_in_json_lines()
+    test_debug_sampled_per_call_and_a_full_queue_drops_instead_of_blocking()
+    test_apps_log_through_the_pipeline_with_the_call_bound()
+    print("✅ Structured log tests passed")
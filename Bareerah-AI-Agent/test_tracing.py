@@ -0,0 +1,66 @@
+
+import tracing
+
+class ListExporter:
+    def __init__(self):
+        self.traces = []
+    def export(self, spans):
+        self.traces.append(spans)
+
+def test_child_spans_export_with_root():
+    tracing.reset_metrics()
+    exporter = ListExporter()
+    tracing.add_exporter(exporter)
+    try:
+        with tracing.span("voice.turn", call_sid="CALL_TR_1"):
+            with tracing.span("llm", "openai"):
+                pass
+            with tracing.span("geocode", "google_maps"):
+                pass
+        tracing.flush()
+    finally:
+        tracing._exporters.remove(exporter)
+    spans = exporter.traces[-1]
+    assert [s.name for s in spans] == ["voice.turn", "llm", "geocode"]
+    assert len({s.trace_id for s in spans}) == 1
+    assert spans[1].parent is spans[0]
+
+def test_metrics_per_stage_and_dependency():
+    tracing.reset_metrics()
+    for _ in range(20):
+        with tracing.span("distance", "google_maps"):
+            pass
+    try:
+        with tracing.span("fare", "backend"):
+            raise RuntimeError("backend down")
+    except RuntimeError:
+        pass
+    snap = tracing.metrics_snapshot()
+    assert snap["stages"]["distance"]["count"] == 20
+    assert snap["stages"]["fare"]["errors"] == 1
+    assert set(snap["dependencies"]) == {"google_maps", "backend"}
+    assert snap["stages"]["distance"]["p99_ms"] is not None
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert tracing.percentile(values, 50) == 50
+    assert tracing.percentile(values, 95) == 95
+    assert tracing.percentile(values, 99) == 99
+    assert tracing.percentile([], 50) is None
+
+def test_otlp_payload_shape():
+    with tracing.span("voice.turn") as root:
+        with tracing.span("llm", "openai", model="gpt-4o-mini"):
+            pass
+    payload = tracing.OtlpHttpExporter("http://collector:4318").payload([root] + root.children)
+    spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert len(spans[0]["traceId"]) == 32 and len(spans[0]["spanId"]) == 16
+    assert {"key": "peer.service", "value": {"stringValue": "openai"}} in spans[1]["attributes"]
+
+if __name__ == "__main__":
+    test_child_spans_export_with_root()
+    test_metrics_per_stage_and_dependency()
+    test_percentile_nearest_rank()
+    test_otlp_payload_shape()
+    print("✅ Tracing tests passed")
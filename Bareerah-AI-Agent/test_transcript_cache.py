@@ -0,0 +1,107 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import time
+import tempfile
+import threading
+
+import transcript_cache
+from vendor_stubs import VendorStubs
+
+def test_dedup_first_delivery_only():
+    dedup = transcript_cache.MessageDedup(ttl=60)
+    assert dedup.first_delivery("SM1")
+    assert not dedup.first_delivery("SM1")
+    assert dedup.first_delivery("SM2")
+    assert dedup.first_delivery(None) and dedup.first_delivery(None)
+    dedup.forget("SM1")
+    assert dedup.first_delivery("SM1")
+    assert dedup.duplicates == 1
+
+def test_dedup_expires_old_sids():
+    dedup = transcript_cache.MessageDedup(ttl=0.05)
+    assert dedup.first_delivery("SM1")
+    time.sleep(0.06)
+    assert dedup.first_delivery("SM1")
+
+def test_dedup_is_shared_across_workers():
+    stubs = VendorStubs(seed=1, sleep=False)
+    workers = [transcript_cache.MessageDedup(ttl=60, connect=stubs.db.connect, release=stubs.db.release) for _ in range(2)]
+    assert workers[0].first_delivery("SM1")
+    assert not workers[1].first_delivery("SM1")  # Twilio's redelivery lands on the other worker
+    assert not workers[1].first_delivery("SM1") and workers[1].duplicates == 2
+    workers[0].forget("SM1")
+    workers[1].forget("SM1")
+    assert workers[1].first_delivery("SM1") and not workers[0].first_delivery("SM1")
+    assert stubs.db.usage()["open"] == 0
+    down = transcript_cache.MessageDedup(ttl=60, connect=lambda: 1 / 0)
+    assert down.first_delivery("SM2") and not down.first_delivery("SM2")  # no database: memory still dedups
+
+def test_cache_is_content_addressed_and_persistent():
+    calls = []
+    def whisper():
+        calls.append(1)
+        return "Dubai Marina to the airport"
+    with tempfile.TemporaryDirectory() as d:
+        cache = transcript_cache.TranscriptCache(directory=d)
+        assert cache.transcribe(b"OggS-audio", "en", whisper) == "Dubai Marina to the airport"
+        assert cache.transcribe(b"OggS-audio", "en", whisper) == "Dubai Marina to the airport"
+        assert len(calls) == 1
+        cache.transcribe(b"OggS-audio", "ar", whisper)  # language is part of the key
+        assert len(calls) == 2
+        fresh = transcript_cache.TranscriptCache(directory=d)
+        assert fresh.transcribe(b"OggS-audio", "en", whisper) == "Dubai Marina to the airport"
+        assert len(calls) == 2 and fresh.snapshot()["disk_hits"] == 1
+
+def test_failed_transcripts_are_not_cached():
+    cache = transcript_cache.TranscriptCache()
+    assert cache.transcribe(b"x", "en", lambda: None) is None
+    assert cache.transcribe(b"x", "en", lambda: "hello") == "hello"
+
+def test_concurrent_misses_share_one_call():
+    cache = transcript_cache.TranscriptCache()
+    calls = []
+    def slow_whisper():
+        calls.append(1)
+        time.sleep(0.1)
+        return "same note"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.transcribe(b"dup", "en", slow_whisper))) for _ in range(5)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert results == ["same note"] * 5 and len(calls) == 1
+
+def test_redelivered_webhook_is_processed_once():
+    import load_test
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=1, sleep=False)
+    form = {"From": "whatsapp:+971500000011", "MessageSid": "SMREDELIVER1",
+            "MediaContentType0": "audio/ogg", "MediaUrl0": "https://api.twilio.com/media/ME9"}
+    saved_cache = transcript_cache.transcripts
+    transcript_cache.transcripts = transcript_cache.TranscriptCache()
+    whisper_calls = []
+    real_whisper = legacy.transcribe_with_whisper
+    legacy.transcribe_with_whisper = lambda *a, **k: whisper_calls.append(1) or real_whisper(*a, **k)
+    with stubs.installed(legacy):
+        client = legacy.app.test_client()
+        assert client.post("/whatsapp", data=form).get_json()["status"] == "queued"
+        assert client.post("/whatsapp", data=form).get_json()["status"] == "duplicate"
+        assert legacy.whatsapp_queue.drain(30)
+        # A new SID with identical audio reuses the transcript
+        legacy.process_whatsapp_message(dict(form, MessageSid="SMREDELIVER2"))
+        assert legacy.twilio_sender.outbox.drain(30)
+    legacy.transcribe_with_whisper = real_whisper
+    hits = transcript_cache.transcripts.snapshot()["hits"]
+    transcript_cache.transcripts = saved_cache
+    assert len(whisper_calls) == 1 and hits == 1
+
+if __name__ == "__main__":
+    test_dedup_first_delivery_only()
+    test_dedup_expires_old_sids()
+    test_dedup_is_shared_across_workers()
+    test_cache_is_content_addressed_and_persistent()
+    test_failed_transcripts_are_not_cached()
+    test_concurrent_misses_share_one_call()
+    test_redelivered_webhook_is_processed_once()
+    print("✅ Transcript cache tests passed")
@@ -0,0 +1,82 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import json
+
+import transcript_store
+from vendor_stubs import VendorStubs
+
+def test_segments_compress_and_round_trip():
+    raw = json.dumps([{"role": "assistant", "content": "Where should we pick you up? " * 20}]).encode()
+    codec, body = transcript_store.compress(raw)
+    assert codec in ("zstd", "zlib") and len(body) < len(raw) / 4
+    assert transcript_store.decompress(codec, memoryview(body)) == raw
+    assert transcript_store.decompress("raw", raw) == raw
+
+def test_appended_segments_read_back_in_order_once():
+    stubs = VendorStubs(seed=1, sleep=False)
+    store = transcript_store.TranscriptStore(lambda: stubs.db.connect(), secret="k", base_url="https://x.test", name="test")
+    store.append("CA1", 2, [{"role": "user", "content": "DXB"}])
+    store.append("CA1", 0, [{"role": "assistant", "content": "Hi"}, {"role": "user", "content": "Sara"}])
+    store.append("CA1", 2, [{"role": "user", "content": "retried turn"}])  # same seq: the first write stays
+    assert store.drain(5)
+    tid = store.transcript_id("CA1")
+    assert store.link("CA1") == f"https://x.test/transcripts/{tid}" and tid != store.transcript_id("CA2")
+    assert [m["content"] for m in store.load(tid)] == ["Hi", "Sara", "DXB"]
+    assert store.load(store.transcript_id("CA2")) is None
+    assert store.snapshot()["segments"] == 3 and stubs.db.usage()["open"] == 0
+
+def test_without_a_secret_nothing_is_linked_or_served():
+    stubs = VendorStubs(seed=1, sleep=False)
+    store = transcript_store.TranscriptStore(lambda: stubs.db.connect(), secret="", base_url="https://x.test", name="test")
+    store.append("CA1", 0, [{"role": "user", "content": "Sara"}])
+    assert store.drain(5) and store.snapshot()["segments"] == 1  # still kept
+    assert store.link("CA1") is None and store.page(store.transcript_id("CA1"), str) is None
+    assert not store.snapshot()["linked"]
+
+def test_call_state_keeps_the_window_and_the_page_has_everything():
+    import main
+    stubs = VendorStubs(seed=1, sleep=False)
+    window, key = main.AI_HISTORY_WINDOW, main.TRANSCRIPTS.key
+    main.AI_HISTORY_WINDOW, main.TRANSCRIPTS.key = 4, b"k"
+    try:
+        with stubs.installed(main):
+            client = main.app.test_client()
+            client.post("/select-language", data={"CallSid": "CATRANSCRIPT", "Digits": "1"})
+            for line in ["Sara <b>Khan</b>", "Dubai Marina", "Airport", "Two of us"]:
+                client.post("/handle", data={"CallSid": "CATRANSCRIPT", "SpeechResult": line, "From": "+971500000001"})
+            assert main.TRANSCRIPTS.drain(5)
+            saved = stubs.db.call_state["CATRANSCRIPT"]
+            assert len(saved["history"]) == 4 and saved["transcript_len"] == 9
+            link = main.TRANSCRIPTS.link("CATRANSCRIPT")
+            path = link[link.index(transcript_store.ROUTE):]
+            page = client.get(path)
+            assert page.status_code == 200 and "private" in page.headers["Cache-Control"]
+            html = page.data.decode()
+            assert "9 messages" in html and "Sara &lt;b&gt;Khan&lt;/b&gt;" in html and "Dubai Marina" in html
+            stubs.reset_counts()
+            assert client.get(path).data.decode() == html and "postgres" not in stubs.counts()  # from the page cache
+            assert client.get(transcript_store.ROUTE + "unknown").status_code == 404
+            main.TRANSCRIPTS.key = b""
+            assert client.get(path).status_code == 404  # no secret: no page, even a cached one
+    finally:
+        main.AI_HISTORY_WINDOW, main.TRANSCRIPTS.key = window, key
+
+def test_booking_email_and_payload_carry_the_link():
+    import main
+    link = transcript_store.TranscriptStore(lambda: None, secret="k", base_url="https://x.test", name="test").link("CALINK")
+    html, text = main.booking_email("SSL-9", "Marina", "DXB", "Tomorrow 4 PM", "Lexus ES", "classic", 2, 1, 20.0, 120,
+                                    {"customer_name": "Sara"}, "+971500000001", link, "2026-10-19 18:00:00")
+    assert f'href="{link}"' in html and link in text and "USER:" not in text
+    payload = main.booking_payload({"customer_name": "Sara"}, "+971500000001", "Marina", "DXB", "airport_transfer",
+                                   "classic", 20.0, 2, 1, 120, "Lexus ES", "2026-10-20 16:00", link)
+    assert payload["transcript_url"] == link
+
+if __name__ == "__main__":
+    test_segments_compress_and_round_trip()
+    test_appended_segments_read_back_in_order_once()
+    test_without_a_secret_nothing_is_linked_or_served()
+    test_call_state_keeps_the_window_and_the_page_has_everything()
+    test_booking_email_and_payload_carry_the_link()
+    print("✅ Transcript store tests passed")
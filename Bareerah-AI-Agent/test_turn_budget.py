@@ -0,0 +1,94 @@
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+import time
+import turn_budget
+
+def test_fast_turn_returns_inline():
+    turn = turn_budget.start_turn("CALL_TB_FAST", lambda: "<Response/>")
+    assert turn_budget.wait_for_turn(turn, 1.0) == "<Response/>"
+    assert turn_budget.pending_turn("CALL_TB_FAST") is None
+
+def test_slow_turn_is_held_then_collected():
+    turn = turn_budget.start_turn("CALL_TB_SLOW", lambda: (time.sleep(0.3), "done")[1])
+    assert turn_budget.wait_for_turn(turn, 0.05) is None
+    # Still pending so /handle-result can pick it up
+    assert turn_budget.pending_turn("CALL_TB_SLOW") is turn
+    assert turn_budget.wait_for_turn(turn, 2.0) == "done"
+    assert turn_budget.pending_turn("CALL_TB_SLOW") is None
+
+def test_stage_timeouts_clip_to_hard_limit():
+    budget = turn_budget.TurnBudget(total=2.5, hard_limit=3.0)
+    assert budget.timeout(10) <= 3.0
+    assert budget.timeout(1) == 1
+    budget.started -= 10
+    assert budget.timeout(5) == turn_budget.MIN_CALL_TIMEOUT
+
+def test_turn_sees_its_budget_and_language():
+    def work():
+        turn_budget.note_language("Arabic")
+        with turn_budget.stage("llm"):
+            pass
+        return turn_budget.timeout(100)
+    turn = turn_budget.start_turn("CALL_TB_CTX", work)
+    assert turn_budget.wait_for_turn(turn, 1.0) <= turn_budget.TURN_HARD_LIMIT_SECONDS
+    assert turn.language == "Arabic"
+    assert [name for name, _ in turn.budget.stages] == ["llm"]
+    assert str(turn.budget) == turn.budget.summary() and "llm=" in str(turn.budget)  # logged lazily as a %s arg
+    # Outside a turn the caller's own cap is used
+    assert turn_budget.timeout(7) == 7
+
+def test_turns_nobody_polls_for_expire():
+    stale = turn_budget.start_turn("CALL_TB_HUNGUP", lambda: "bye")
+    stale.budget.started -= turn_budget.PENDING_TTL_SECONDS + 1  # its caller hung up long ago
+    turn_budget.start_turn("CALL_TB_NEXT", lambda: "hi")
+    assert turn_budget.pending_turn("CALL_TB_HUNGUP") is None
+    assert turn_budget.wait_for_turn(turn_budget.pending_turn("CALL_TB_NEXT"), 1.0) == "hi"
+
+def test_a_held_turn_is_delivered_by_another_worker_in_the_callers_language():
+    import main
+    from vendor_stubs import VendorStubs
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(main):
+        stubs.db.call_state["CALL_TB_MOVED"] = {"history": [], "slots": {"language": "Arabic"}}
+        turn = turn_budget.start_turn("CALL_TB_MOVED", lambda: (time.sleep(0.3), "<Response>booked</Response>")[1])
+        turn.language = "Arabic"
+        assert "<Say" in main.reply_within_budget(turn, 0.01)  # held on this worker...
+        turn_budget._forget(turn)  # ...and Twilio's poll lands on a worker that never saw it
+        assert stubs.db.held_turns["CALL_TB_MOVED"]["twiml"] is None  # marked before the hold message went out
+        client = main.app.test_client()
+        poll = client.post("/handle-result", data={"CallSid": "CALL_TB_MOVED"}).get_data(as_text=True)
+        assert "<Pause" in poll and "/handle-result" in poll  # still running elsewhere: keep polling
+        turn.future.result(timeout=2.0)
+        deadline = time.monotonic() + 2.0
+        while not stubs.db.held_turns["CALL_TB_MOVED"]["twiml"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.post("/handle-result", data={"CallSid": "CALL_TB_MOVED"}).get_data(as_text=True) == "<Response>booked</Response>"
+        again = client.post("/handle-result", data={"CallSid": "CALL_TB_MOVED"}).get_data(as_text=True)
+        assert main.AGAIN_MESSAGES["Arabic"] in again and "ar-XA" in again  # delivered once; then ask again, in Arabic
+    assert stubs.db.usage()["open"] == 0
+
+def test_a_held_turn_served_here_leaves_nothing_parked():
+    import main
+    from vendor_stubs import VendorStubs
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(main):
+        turn = turn_budget.start_turn("CALL_TB_LOCAL", lambda: (time.sleep(0.2), "<Response>first</Response>")[1])
+        main.reply_within_budget(turn, 0.01)
+        assert main.reply_within_budget(turn, 2.0) == "<Response>first</Response>"  # the next poll came back here
+        time.sleep(0.05)
+        assert "CALL_TB_LOCAL" not in stubs.db.held_turns  # a later stray poll can't replay it
+        poll = main.app.test_client().post("/handle-result", data={"CallSid": "CALL_TB_LOCAL"}).get_data(as_text=True)
+        assert "first" not in poll and main.AGAIN_MESSAGES["English"] in poll
+    assert stubs.db.usage()["open"] == 0
+
+if __name__ == "__main__":
+    test_fast_turn_returns_inline()
+    test_slow_turn_is_held_then_collected()
+    test_stage_timeouts_clip_to_hard_limit()
+    test_turn_sees_its_budget_and_language()
+    test_turns_nobody_polls_for_expire()
+    test_a_held_turn_is_delivered_by_another_worker_in_the_callers_language()
+    test_a_held_turn_served_here_leaves_nothing_parked()
+    print("✅ Turn budget tests passed")
@@ -0,0 +1,90 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+
+import time
+import threading
+
+from twilio.base.exceptions import TwilioRestException
+
+import twilio_sender
+
+def _job(fn, to=None, retries=3):
+    return twilio_sender.Job(fn, to=to, retries=retries)
+
+def test_messages_to_one_number_are_paced_in_order():
+    sent = []
+    box = twilio_sender.Outbox(workers=4, dest_interval=0.1, mps=0, name="test")
+    t0 = time.monotonic()
+    for n in range(4):
+        assert box.submit(_job(lambda n=n: sent.append(("a", n, time.monotonic() - t0)), to="+971500000001"))
+    assert box.submit(_job(lambda: sent.append(("b", 0, time.monotonic() - t0)), to="+971500000002"))
+    assert box.drain(5)
+    a = [t for who, n, t in sent if who == "a"]
+    assert [n for who, n, t in sent if who == "a"] == [0, 1, 2, 3]
+    assert all(later - earlier >= 0.09 for earlier, later in zip(a, a[1:]))
+    assert [t for who, n, t in sent if who == "b"][0] < 0.05  # other numbers aren't held up
+    assert box.snapshot()["paced"] == 3
+
+def test_429_and_5xx_are_retried_but_4xx_is_not():
+    twilio_sender.BACKOFF_BASE, base = 0.01, twilio_sender.BACKOFF_BASE
+    try:
+        calls = {"busy": 0, "bad": 0}
+        def busy():
+            calls["busy"] += 1
+            if calls["busy"] < 3: raise TwilioRestException(429 if calls["busy"] == 1 else 503, "uri", "slow down")
+            return "ok"
+        def bad():
+            calls["bad"] += 1
+            raise TwilioRestException(400, "uri", "invalid To")
+
+        box = twilio_sender.Outbox(workers=2, dest_interval=0, mps=0, name="test")
+        ok, failed = _job(busy, to="+1"), _job(bad, to="+2")
+        box.submit(ok)
+        box.submit(failed)
+        assert box.drain(5)
+    finally:
+        twilio_sender.BACKOFF_BASE = base
+    assert (ok.result, ok.attempts, ok.error) == ("ok", 3, None)
+    assert failed.attempts == 1 and calls["bad"] == 1 and failed.error.status == 400
+    snap = box.snapshot()
+    assert (snap["sent"], snap["failed"], snap["retried"]) == (1, 1, 2)
+
+def test_notifications_share_the_sender_threads():
+    box = twilio_sender.Outbox(workers=2, dest_interval=0, mps=0, name="test")
+    names = []
+    for _ in range(5):
+        assert box.call(lambda: names.append(threading.current_thread().name))
+    assert box.drain(5)
+    assert len(names) == 5 and all(n.startswith("test-") for n in names)
+    assert len(box.threads) == 2
+
+def test_legacy_replies_reuse_one_client_and_track_delivery():
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    built = []
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(legacy):
+        fake = twilio_sender.TwilioClient
+        twilio_sender.TwilioClient = lambda *a: built.append(a) or fake(*a)
+        try:
+            jobs = [twilio_sender.send_whatsapp(f"+97150000002{i}", body="hi", wait=5) for i in range(3)]
+        finally:
+            twilio_sender.TwilioClient = fake
+        assert len(built) == 1 and stubs.counts()["twilio"] == 3
+        sid = jobs[0].result.sid
+        client = legacy.app.test_client()
+        resp = client.post("/twilio/message-status", data={"MessageSid": sid, "MessageStatus": "delivered"})
+        assert resp.status_code == 204
+        delivery = client.get("/metrics").get_json()["gauges"]["twilio_outbox"]["delivery"]
+        assert delivery["delivered"] >= 1
+
+if __name__ == "__main__":
+    test_messages_to_one_number_are_paced_in_order()
+    test_429_and_5xx_are_retried_but_4xx_is_not()
+    test_notifications_share_the_sender_threads()
+    test_legacy_replies_reuse_one_client_and_track_delivery()
+    print("✅ Twilio sender tests passed")
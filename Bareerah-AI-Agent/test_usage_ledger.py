@@ -0,0 +1,126 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import types
+
+import structured_log
+import usage_ledger
+from vendor_stubs import VendorStubs
+
+def close(a, b):
+    return abs(a - b) < 1e-9
+
+def reply(prompt_tokens, completion_tokens):
+    return types.SimpleNamespace(usage=types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens))
+
+def test_prices_cached_savings_and_the_bound_call():
+    ledger = usage_ledger.UsageLedger(enabled=True)
+    structured_log.bind(call_sid="CA1", phone="+971500000001")
+    try:
+        with ledger.metered("openai", "gpt-4o-mini") as meter:
+            meter.tokens(reply(1000, 500))
+        ledger.record("google", "find_place", cached=True)  # the gazetteer answered
+        try:
+            with ledger.metered("google", "distance_matrix"):
+                raise TimeoutError("maps")
+        except TimeoutError:
+            pass
+        ledger.record("twilio", "sms")
+    finally:
+        structured_log.bind()
+    ledger.record("resend", "email")  # nothing bound: a background send
+    usage = ledger.call("CA1")
+    assert usage["openai:gpt-4o-mini"]["cost_usd"] == 1000 * 0.15e-6 + 500 * 0.60e-6
+    assert usage["google:find_place"]["cost_usd"] == 0 and close(usage["google:find_place"]["saved_usd"], 0.017)
+    assert usage["google:distance_matrix"]["events"] == 1 and usage["google:distance_matrix"]["cost_usd"] == 0  # raised: not billed
+    assert usage["openai:gpt-4o-mini"]["phone"] == "+971500000001" and ledger.snapshot()["unpriced"] == 1
+    report = ledger.report()
+    assert report["source"] == "memory" and report["calls"] == 2 and {c["call_key"] for c in report["top_calls"]} == {"CA1", "unattributed"}
+    find_place = next(i for i in report["items"] if i["item"] == "find_place")
+    assert find_place["cache_hit_rate"] == 1.0 and close(report["saved_usd"], 0.017)
+    prices = usage_ledger.load_prices('{"google:find_place": {"usd": 0.02}, "twilio:sms": {"unit": "message", "usd": 0.05}}')
+    assert prices["google:find_place"] == ("request", 0.02, 0.0) and prices["twilio:sms"].unit == "message"
+    assert usage_ledger.load_prices("not json") == usage_ledger.PRICES
+    assert usage_ledger.audio_seconds(("voice.ogg", b"x" * 4000, "audio/ogg")) == 2.0
+    assert usage_ledger.audio_seconds(b"", reported=7.5) == 7.5
+
+def test_flush_sums_rows_and_keeps_deltas_through_a_failed_write():
+    stubs = VendorStubs(seed=1, sleep=False)
+    db = {"up": False}
+    def connect():
+        if not db["up"]: raise RuntimeError("database unreachable")
+        return stubs.db.connect()
+    ledger = usage_ledger.UsageLedger(connect, lambda conn: conn.close(), interval=0.01, enabled=True)
+    ledger.record("openai", "whisper-1", 12.0, call_sid="CA2")
+    assert ledger.flush() == 0 and ledger.snapshot()["pending"] == 1 and ledger.snapshot()["flush_errors"] == 1
+    ledger.record("openai", "whisper-1", 3.0, call_sid="CA2")
+    db["up"] = True
+    assert ledger.flush() == 1  # both records, one upsert
+    row = stubs.db.call_usage[("CA2", "openai", "whisper-1")]
+    assert (row["events"], row["quantity"]) == (2, 15.0) and close(row["cost_usd"], 15 * 0.006 / 60)
+    ledger.record("openai", "whisper-1", 5.0, call_sid="CA2")
+    assert ledger.start() and not ledger.start()
+    ledger.stop()  # the last pass flushes what's left
+    assert stubs.db.call_usage[("CA2", "openai", "whisper-1")]["events"] == 3 and not ledger.snapshot()["pending"]
+    report = ledger.report(hours=1)
+    assert report["source"] == "database" and report["items"][0]["quantity"] == 20.0
+    assert stubs.db.open_connections == 0
+
+def test_a_voice_call_is_billed_to_its_call_sid_and_reported_to_admins():
+    import main
+    stubs = VendorStubs(seed=5, sleep=False)
+    real_token = main.ADMIN_TOKEN
+    with stubs.installed(main):
+        client = main.app.test_client()
+        client.post("/select-language", data={"CallSid": "CAUSAGE", "Digits": "1"})
+        for line in ["Sara", "Jumeirah Village Circle", "Dubai Airport", "Two of us", "Executive", "No thanks"]:
+            client.post("/handle", data={"CallSid": "CAUSAGE", "SpeechResult": line, "From": "+971500000003"})
+        usage = main.USAGE.call("CAUSAGE")
+        llm = usage["openai:gpt-4o-mini"]
+        assert llm["events"] == stubs.counts()["openai"] and llm["quantity"] > 0 and llm["quantity_out"] > 0
+        assert usage["google:distance_matrix"]["events"] >= 1 and usage["resend:email"]["quantity"] == 1
+        assert usage["google:find_place"]["events"] >= 2 and llm["ms"] >= 0
+        try:
+            main.ADMIN_TOKEN = None
+            assert client.get("/admin/usage").status_code == 404
+            main.ADMIN_TOKEN = "s3cret"
+            assert client.get("/admin/usage").status_code == 401
+            assert client.get("/admin/usage?token=s3cret").status_code == 401  # never from the query string
+            assert client.get("/admin/usage", headers={"Authorization": "s3cret"}).status_code == 401
+            resp = client.get("/admin/usage?hours=2", headers={"Authorization": "Bearer s3cret"})
+            assert resp.status_code == 200
+            report = resp.get_json()
+            assert report["source"] == "database" and "CAUSAGE" in {c["call_key"] for c in report["top_calls"]}
+            one = client.get("/admin/usage?call=CAUSAGE", headers={"Authorization": "Bearer s3cret"}).get_json()
+            assert one["items"]["openai:gpt-4o-mini"]["events"] == llm["events"]
+        finally:
+            main.ADMIN_TOKEN = real_token
+    assert ("CAUSAGE", "openai", "gpt-4o-mini") in stubs.db.call_usage
+    gauge = main.tracing.metrics_snapshot()["gauges"]["usage"]
+    assert not {"cost_usd", "saved_usd", "calls"} & set(gauge) and "pending" in gauge  # /metrics is public: health only
+
+def test_legacy_whisper_maps_and_llm_calls_are_billed_to_the_phone():
+    import load_test
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=1, sleep=False)
+    with stubs.installed(legacy):
+        structured_log.bind(phone="+971500000004")  # what process_whatsapp_message binds
+        try:
+            assert legacy.transcribe_with_whisper(("voice.ogg", b"x" * 8000, "audio/ogg"))
+            assert legacy.calculate_distance_google_maps("Dubai Marina", "Dubai Airport") == 23.4
+            legacy.translate_to_urdu("Your car is on the way")
+        finally:
+            structured_log.bind()
+        assert legacy.app.test_client().get("/admin/usage").status_code == 404  # no ADMIN_TOKEN
+    usage = legacy.USAGE.call("+971500000004")
+    assert usage["openai:whisper-1"]["quantity"] == 4.0 and usage["openai:whisper-1"]["unit"] == "second"
+    assert usage["google:distance_matrix"]["events"] == 1 and usage["openai:gpt-4o-mini"]["quantity"] > 0
+    assert sum(row["cost_usd"] for row in usage.values()) > 0
+
+if __name__ == "__main__":
+    test_prices_cached_savings_and_the_bound_call()
+    test_flush_sums_rows_and_keeps_deltas_through_a_failed_write()
+    test_a_voice_call_is_billed_to_its_call_sid_and_reported_to_admins()
+    test_legacy_whisper_maps_and_llm_calls_are_billed_to_the_phone()
+    print("✅ Usage ledger tests passed")
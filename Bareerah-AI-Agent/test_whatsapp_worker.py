@@ -0,0 +1,161 @@
+
+import os
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+
+import time
+import threading
+
+import whatsapp_worker
+
+def test_per_sender_order_and_parallel_senders():
+    seen = []
+    active = set()
+    overlap = threading.Event()
+    lock = threading.Lock()
+
+    def handler(msg):
+        with lock:
+            active.add(msg["sender"])
+            if len(active) > 1: overlap.set()
+        time.sleep(0.005)
+        with lock:
+            active.discard(msg["sender"])
+            seen.append((msg["sender"], msg["n"]))
+
+    pool = whatsapp_worker.WorkerPool(handler, workers=4, queue_max=100, name="test")
+    senders = ["+971500000001", "+971500000002", "+971500000003", "+971500000004"]
+    assert len({pool.shard(s) for s in senders}) > 1
+    for n in range(10):
+        for s in senders:
+            assert pool.submit(s, {"sender": s, "n": n})
+    assert pool.drain(10)
+    for s in senders:
+        assert [n for who, n in seen if who == s] == list(range(10))
+    assert overlap.is_set()
+    snap = pool.snapshot()
+    assert snap["processed"] == 40 and snap["depth"] == 0 and snap["in_flight"] == 0
+
+def test_full_queue_rejects_and_failures_are_counted():
+    gate = threading.Event()
+    def handler(msg):
+        gate.wait(5)
+        if msg == "boom": raise ValueError("boom")
+
+    pool = whatsapp_worker.WorkerPool(handler, workers=1, queue_max=1, name="test")
+    assert pool.submit("a", "first")
+    time.sleep(0.05)  # worker picks up "first" and blocks
+    assert pool.submit("a", "boom")
+    assert not pool.submit("a", "third")
+    gate.set()
+    assert pool.drain(5)
+    snap = pool.snapshot()
+    assert (snap["processed"], snap["failed"], snap["rejected"]) == (1, 1, 1)
+
+def test_legacy_webhook_acks_before_processing():
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=1, latency={"openai": "fixed:300", "backend": "fixed:300"})
+    with stubs.installed(legacy):
+        client = legacy.app.test_client()
+        t0 = time.perf_counter()
+        resp = client.post("/whatsapp", data={"From": "whatsapp:+971500000009", "Body": "Hi, I need a car", "MessageSid": "SM1"})
+        ack_ms = (time.perf_counter() - t0) * 1000
+        assert resp.status_code == 200 and resp.get_json()["status"] == "queued"
+        assert ack_ms < 250
+        assert legacy.whatsapp_queue.drain(30)
+        assert legacy.twilio_sender.outbox.drain(30)
+        assert stubs.counts().get("twilio", 0) >= 1
+        assert "whatsapp_queue" in client.get("/metrics").get_json()["gauges"]
+
+def test_bursts_are_coalesced_per_sender():
+    batches = []
+    pool = whatsapp_worker.WorkerPool(batches.append, workers=2, queue_max=10, name="test", coalesce=0.1, coalesce_max=1.0)
+    for text in ["from marina", "to airport", "tomorrow 5pm"]:
+        pool.submit("+971500000001", {"Body": text})
+        time.sleep(0.02)
+    pool.submit("+971500000002", {"Body": "hello"})
+    time.sleep(0.4)
+    assert pool.drain(5)
+    merged = [b for b in batches if "parts" in b]
+    assert len(batches) == 2 and len(merged) == 1
+    assert [p["Body"] for p in merged[0]["parts"]] == ["from marina", "to airport", "tomorrow 5pm"]
+    snap = pool.snapshot()
+    assert (snap["processed"], snap["batches"], snap["coalesced"]) == (4, 2, 2)
+
+def test_coalescing_never_holds_past_max_wait():
+    batches = []
+    pool = whatsapp_worker.WorkerPool(batches.append, workers=1, queue_max=50, name="test", coalesce=0.1, coalesce_max=0.25)
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 0.6:
+        pool.submit("+971500000003", {"Body": "typing"})
+        time.sleep(0.03)
+    assert pool.drain(5)
+    assert len(batches) >= 2  # a steady stream is still flushed every coalesce_max
+
+def test_held_bursts_count_against_capacity_and_a_full_worker_never_stalls_the_rest():
+    gate, seen = threading.Event(), []
+    def handler(msg):
+        if msg == "slow": gate.wait(5)
+        seen.append(msg)
+    pool = whatsapp_worker.WorkerPool(handler, workers=2, queue_max=1, name="test", coalesce=0.05, coalesce_max=0.1)
+    a = "+971500000001"
+    b = next(f"+97150000{n:04d}" for n in range(100) if pool.shard(f"+97150000{n:04d}") != pool.shard(a))
+    assert pool.submit(a, "slow")
+    time.sleep(0.15)  # flushed; a's worker is stuck on it
+    assert pool.submit(a, "held")
+    assert not pool.submit(a, "over")  # the held burst already fills a's worker
+    with pool.lock:
+        pool.in_flight += 1
+    pool.queues[pool.shard(a)].put_nowait((time.monotonic(), "filler", 1))  # a's queue fills before "held" is flushed
+    assert pool.submit(b, "other")
+    deadline = time.monotonic() + 2
+    while "other" not in seen and time.monotonic() < deadline: time.sleep(0.01)
+    assert "other" in seen and pool.snapshot()["deferred"] >= 1  # b went through while a's burst waited
+    gate.set()
+    assert pool.drain(5)
+    assert seen.index("filler") < seen.index("held") and pool.snapshot()["rejected"] == 1
+
+def test_legacy_burst_gets_one_reply():
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    assert legacy.join_whatsapp_texts(["from marina", "(voice note failed)", "to airport."]) == "from marina, to airport."
+    replies = []
+    real_send = legacy.send_whatsapp_text_message
+    legacy.send_whatsapp_text_message = lambda phone, text: replies.append(text) or True
+    try:
+        with VendorStubs(seed=1, sleep=False).installed(legacy):
+            client = legacy.app.test_client()
+            for i, body in enumerate(["from dubai marina", "to the airport", "tomorrow 5pm"]):
+                client.post("/whatsapp", data={"From": "whatsapp:+971500000012", "Body": body, "MessageSid": f"SMBURST{i}"})
+            assert legacy.whatsapp_queue.drain(30)
+    finally:
+        legacy.send_whatsapp_text_message = real_send
+    assert len(replies) == 1
+
+def test_replies_queued_under_the_stubs_are_sent_through_them():
+    import load_test
+    from vendor_stubs import VendorStubs
+    legacy = load_test.load_app("legacy")
+    stubs = VendorStubs(seed=4, sleep=False)
+    with stubs.installed(legacy):
+        client = legacy.app.test_client()
+        for n, body in enumerate(["Hi", "I need a car"]):
+            assert client.post("/whatsapp", data={"From": "whatsapp:+971500000011", "Body": body, "MessageSid": f"SMLEAK{n}"}).status_code == 200
+    # no drain above: leaving the stubs flushed the pool and the paced outbox before TwilioClient came back
+    assert legacy.whatsapp_queue.snapshot()["in_flight"] == 0 and legacy.twilio_sender.outbox.snapshot()["pending"] == 0
+    assert stubs.counts().get("twilio", 0) >= 1
+
+if __name__ == "__main__":
+    test_per_sender_order_and_parallel_senders()
+    test_full_queue_rejects_and_failures_are_counted()
+    test_legacy_webhook_acks_before_processing()
+    test_bursts_are_coalesced_per_sender()
+    test_coalescing_never_holds_past_max_wait()
+    test_held_bursts_count_against_capacity_and_a_full_worker_never_stalls_the_rest()
+    test_legacy_burst_gets_one_reply()
+    test_replies_queued_under_the_stubs_are_sent_through_them()
+    print("✅ WhatsApp worker tests passed")
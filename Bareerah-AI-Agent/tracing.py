@@ -0,0 +1,303 @@
+# ✅ TRACING - Lightweight per-turn spans + latency histograms
+#
+# A turn opens a root span (e.g. "voice.turn"); every stage inside it
+# (llm, geocode, distance, vehicles, fare, db, email) is a child span tagged
+# with the external dependency it waits on. Finished traces go to the
+# exporters on a background thread so a slow collector never slows a call:
+#   TRACE_JSONL_PATH             -> one JSON span per line (local debugging)
+#   OTEL_EXPORTER_OTLP_ENDPOINT  -> OTLP/HTTP JSON, POST {endpoint}/v1/traces
+# Every span also feeds a rolling histogram served by /metrics, next to any
+# gauges other modules register (queue depths, pool sizes).
+import os
+import json
+import math
+import time
+import queue
+import logging
+import secrets
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "star-skyline-agent")
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+HISTOGRAM_WINDOW = int(os.getenv("TRACE_HISTOGRAM_WINDOW", "2048"))
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, dependency=None, attributes=None):
+        self.name = name
+        self.dependency = dependency
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self.children = []  # finished child spans, collected on the root
+
+    @property
+    def root(self):
+        span = self
+        while span.parent:
+            span = span.parent
+        return span
+
+    def duration_ms(self):
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "dependency": self.dependency,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms(), 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+# ✅ HISTOGRAMS (rolling window per stage / dependency)
+class Histogram:
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, ms, error=False):
+        self.samples.append(ms)
+        self.count += 1
+        if error: self.errors += 1
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def snapshot(self):
+        data = sorted(self.samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": percentile(data, 50),
+            "p95_ms": percentile(data, 95),
+            "p99_ms": percentile(data, 99),
+            "max_ms": round(data[-1], 2) if data else None,
+            "buckets_ms": dict(zip([str(b) for b in BUCKETS_MS] + ["+Inf"], self.buckets)),
+        }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values: return None
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return round(sorted_values[idx], 2)
+
+
+_stages = {}
+_dependencies = {}
+_gauges = {}  # name -> fn() returning the current value (e.g. queue depth)
+_metrics_lock = threading.Lock()
+
+
+def _record(span):
+    ms = span.duration_ms()
+    failed = span.error is not None
+    with _metrics_lock:
+        _stages.setdefault(span.name, Histogram()).observe(ms, failed)
+        if span.dependency:
+            _dependencies.setdefault(span.dependency, Histogram()).observe(ms, failed)
+
+
+def register_gauge(name, fn):
+    """Report fn() under "gauges" in metrics_snapshot()"""
+    with _metrics_lock:
+        _gauges[name] = fn
+
+
+def _read_gauges(gauges):
+    out = {}
+    for name, fn in sorted(gauges.items()):
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = f"error: {e}"
+    return out
+
+
+def metrics_snapshot():
+    with _metrics_lock:
+        snap = {
+            "service": SERVICE_NAME,
+            "stages": {k: h.snapshot() for k, h in sorted(_stages.items())},
+            "dependencies": {k: h.snapshot() for k, h in sorted(_dependencies.items())},
+        }
+        gauges = dict(_gauges)
+    snap["gauges"] = _read_gauges(gauges)
+    return snap
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _stages.clear()
+        _dependencies.clear()
+
+
+# ✅ SPANS
+@contextmanager
+def span(name, dependency=None, **attributes):
+    """Open a span; with no active span this starts (and later exports) a new trace"""
+    parent = _current.get()
+    s = Span(name, parent, dependency, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+        _record(s)
+        if parent:
+            parent.root.children.append(s)
+        else:
+            _export([s] + s.children)
+
+
+def traced(name, dependency=None):
+    """Decorator form of span() for helpers that always hit one dependency"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name, dependency):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def current_span():
+    return _current.get()
+
+
+def annotate(key, value):
+    s = _current.get()
+    if s: s.set(key, value)
+
+
+# ✅ EXPORTERS
+class JsonlExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+
+class OtlpHttpExporter:
+    """OTLP/HTTP with the JSON encoding - accepted by the OpenTelemetry Collector, Jaeger, Tempo"""
+
+    def __init__(self, endpoint):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+
+    @staticmethod
+    def _attr(key, value):
+        if isinstance(value, bool): v = {"boolValue": value}
+        elif isinstance(value, int): v = {"intValue": str(value)}
+        elif isinstance(value, float): v = {"doubleValue": value}
+        else: v = {"stringValue": str(value)}
+        return {"key": key, "value": v}
+
+    def payload(self, spans):
+        out = []
+        for s in spans:
+            attrs = dict(s.attributes)
+            if s.dependency: attrs["peer.service"] = s.dependency
+            item = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 3 if s.dependency else 1,  # CLIENT for dependency calls, INTERNAL otherwise
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [self._attr(k, v) for k, v in attrs.items()],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+            }
+            if s.parent: item["parentSpanId"] = s.parent.span_id
+            out.append(item)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [self._attr("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "bareerah.tracing"}, "spans": out}],
+        }]}
+
+    def export(self, spans):
+        requests.post(self.url, json=self.payload(spans), timeout=5)
+
+
+_exporters = []
+if TRACE_JSONL_PATH: _exporters.append(JsonlExporter(TRACE_JSONL_PATH))
+if OTLP_ENDPOINT: _exporters.append(OtlpHttpExporter(OTLP_ENDPOINT))
+
+_export_queue = queue.Queue(maxsize=1000)
+_export_thread = None
+_export_thread_lock = threading.Lock()
+
+
+def add_exporter(exporter):
+    _exporters.append(exporter)
+
+
+def _export(spans):
+    if not _exporters: return
+    _ensure_export_thread()
+    try:
+        _export_queue.put_nowait(spans)
+    except queue.Full:
+        logging.warning("⚠️ Trace export queue full, dropping trace")
+
+
+def _ensure_export_thread():
+    global _export_thread
+    if _export_thread and _export_thread.is_alive(): return
+    with _export_thread_lock:
+        if _export_thread and _export_thread.is_alive(): return
+        _export_thread = threading.Thread(target=_export_loop, name="trace-export", daemon=True)
+        _export_thread.start()
+
+
+def _export_loop():
+    while True:
+        spans = _export_queue.get()
+        for exporter in list(_exporters):
+            try:
+                exporter.export(spans)
+            except Exception as e:
+                logging.warning("⚠️ Trace export failed (%s): %s", type(exporter).__name__, e)
+        _export_queue.task_done()
+
+
+def flush(timeout=5.0):
+    """Wait for queued traces to be exported (tests / shutdown)"""
+    deadline = time.monotonic() + timeout
+    while _export_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
@@ -0,0 +1,210 @@
+# ✅ TRANSCRIPT CACHE + DELIVERY DEDUP
+#
+# Twilio redelivers a WhatsApp webhook when it doesn't hear back in time, and
+# every redelivery used to re-download MediaUrl0 and pay for another Whisper
+# call. Two layers stop that:
+#   MessageDedup     - a MessageSid is processed once; redeliveries inside
+#                      WHATSAPP_DEDUP_TTL_SECONDS are acknowledged and dropped.
+#                      With a database the claim is a row in
+#                      whatsapp_deliveries, so a redelivery that lands on
+#                      another gunicorn worker is dropped too; the in-memory
+#                      set stays in front of it.
+#   TranscriptCache  - transcripts keyed by sha256(audio bytes) + language, so
+#                      the same audio (forwarded voice note, retry with a new
+#                      SID) never costs a second Whisper call. Concurrent
+#                      misses on one key share a single call. Set
+#                      TRANSCRIPT_CACHE_DIR to keep entries across restarts
+#                      and share them between workers.
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import tracing
+
+DEDUP_TTL_SECONDS = float(os.getenv("WHATSAPP_DEDUP_TTL_SECONDS", "3600"))
+DEDUP_MAX_ENTRIES = 20000
+TRANSCRIPT_CACHE_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_ENTRIES", "2048"))
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", "")
+SHARED_WAIT_SECONDS = 15
+DEDUP_PRUNE_SECONDS = 300
+
+CLAIM_DELIVERY = "INSERT INTO whatsapp_deliveries (delivery_id) VALUES (%s) ON CONFLICT DO NOTHING RETURNING delivery_id"
+RELEASE_DELIVERY = "DELETE FROM whatsapp_deliveries WHERE delivery_id = %s"
+PRUNE_DELIVERIES = "DELETE FROM whatsapp_deliveries WHERE seen_at < now() - make_interval(secs => %s)"
+
+
+class MessageDedup:
+    """Remembers recently seen MessageSids, in memory and (when connected) in whatsapp_deliveries"""
+
+    def __init__(self, ttl=DEDUP_TTL_SECONDS, max_entries=DEDUP_MAX_ENTRIES, connect=None, release=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.seen = OrderedDict()  # sid -> first seen (monotonic)
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.use_database(connect, release)
+
+    def use_database(self, connect, release=None):
+        """connect: () -> DB connection (None: memory only); release: (conn) -> None"""
+        self.connect = connect
+        self.release = release
+        self.pruned_at = time.monotonic()
+
+    def first_delivery(self, message_sid):
+        """True the first time a SID shows up; False for a redelivery. Missing SIDs always pass."""
+        if not message_sid: return True
+        now = time.monotonic()
+        with self.lock:
+            while self.seen:
+                sid, at = next(iter(self.seen.items()))
+                if now - at < self.ttl and len(self.seen) < self.max_entries: break
+                self.seen.popitem(last=False)
+            if message_sid in self.seen:
+                self.duplicates += 1
+                return False
+            self.seen[message_sid] = now
+        if self._claim(message_sid, now): return True
+        with self.lock:
+            self.duplicates += 1  # another worker took this delivery; keep it in memory so the next one is cheap
+        return False
+
+    def _claim(self, message_sid, now):
+        """Claim the SID in whatsapp_deliveries; any database trouble falls back to the in-memory answer"""
+        if not self.connect: return True
+        conn = None
+        try:
+            conn = self.connect()
+            if not conn: return True
+            cur = conn.cursor()
+            if now - self.pruned_at >= DEDUP_PRUNE_SECONDS:
+                self.pruned_at = now
+                cur.execute(PRUNE_DELIVERIES, (self.ttl,))
+            cur.execute(CLAIM_DELIVERY, (message_sid,))
+            won = cur.fetchone() is not None
+            conn.commit()
+            return won
+        except Exception as e:
+            if conn is not None:
+                try: conn.rollback()
+                except Exception: pass
+            logging.error("❌ Delivery claim failed, deduplicating in memory: %s", e)
+            return True
+        finally:
+            if conn is not None and self.release: self.release(conn)
+
+    def forget(self, message_sid):
+        """Let a redelivery through again (e.g. the first attempt was never queued)"""
+        with self.lock:
+            self.seen.pop(message_sid, None)
+        if not message_sid or not self.connect: return
+        conn = None
+        try:
+            conn = self.connect()
+            if not conn: return
+            conn.cursor().execute(RELEASE_DELIVERY, (message_sid,))
+            conn.commit()
+        except Exception as e:
+            logging.error("❌ Delivery release failed: %s", e)
+        finally:
+            if conn is not None and self.release: self.release(conn)
+
+
+class TranscriptCache:
+    """Content-addressed transcripts: sha256(audio) + language -> text"""
+
+    def __init__(self, max_entries=TRANSCRIPT_CACHE_ENTRIES, directory=TRANSCRIPT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.inflight = {}  # key -> Event while one thread transcribes it
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "shared_waits": 0}
+        if directory: os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(data, language):
+        return f"{hashlib.sha256(data).hexdigest()}-{language or 'auto'}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _remember(self, key, text):
+        self.entries[key] = text
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]
+        if self.directory:
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                return None
+            with self.lock:
+                self._remember(key, text)
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+            return text
+        return None
+
+    def put(self, key, text):
+        with self.lock:
+            self._remember(key, text)
+        if self.directory:
+            try:
+                tmp = self._path(key) + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp, self._path(key))
+            except OSError as e:
+                logging.warning("⚠️ Transcript cache write failed: %s", e)
+
+    def transcribe(self, data, language, fn):
+        """Cached transcript for data, calling fn() (Whisper) only on a miss.
+        Empty results aren't cached so a failed call can be retried."""
+        key = self.key(data, language)
+        mine = None
+        while mine is None:
+            text = self.get(key)
+            if text is not None:
+                tracing.annotate("transcript_cache", "hit")
+                return text
+            with self.lock:
+                waiter = self.inflight.get(key)
+                if waiter is None:
+                    mine = self.inflight[key] = threading.Event()
+                    self.stats["misses"] += 1
+                    break
+                self.stats["shared_waits"] += 1
+            # Another thread is transcribing the same audio: wait, then re-check
+            if not waiter.wait(SHARED_WAIT_SECONDS):
+                break  # that call is stuck; make our own
+
+        try:
+            text = fn()
+            if text: self.put(key, text)
+            return text
+        finally:
+            if mine:
+                with self.lock:
+                    self.inflight.pop(key, None)
+                mine.set()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
+
+
+dedup = MessageDedup()
+transcripts = TranscriptCache()
+tracing.register_gauge("whatsapp_dedup", lambda: {"duplicates": dedup.duplicates, "tracked": len(dedup.seen)})
+tracing.register_gauge("transcript_cache", transcripts.snapshot)
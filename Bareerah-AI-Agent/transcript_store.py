@@ -0,0 +1,178 @@
+# ✅ TRANSCRIPT STORE - every turn written once, compressed, read back by ID
+#
+# call_state carried the whole conversation and /handle rewrote all of it on
+# every turn (a 20-turn call writes the greeting 20 times), and the finalize
+# email pasted the full text in again. Now:
+#   * call_state keeps only the messages the model reads (AI_HISTORY_WINDOW)
+#   * each turn's new messages are appended once to transcript_segments as a
+#     compressed segment - zstd (requirements.txt), or zlib where zstandard
+#     isn't installed; the codec is stored per segment so either reads back
+#   * a call's transcript has a stable ID, an HMAC of the CallSid (a CallSid
+#     alone can't be turned into a link), and emails / the backend get
+#     /transcripts/<id> instead of the text
+#   * /transcripts/<id> is rendered on demand; rendered pages are kept in a
+#     small LRU for TRANSCRIPT_CACHE_SECONDS
+# Segment writes go through their own writer thread, off the turn.
+#
+#   TRANSCRIPT_SECRET         key for transcript IDs; without it segments are
+#                             still written, but no link is issued and
+#                             /transcripts/<id> answers 404 (the page has no
+#                             other auth, so the ID must not be guessable)
+#   TRANSCRIPT_BASE_URL       public URL for links; defaults to the app's own once
+#                             a webhook has shown it (like twilio_sender)
+#   TRANSCRIPT_CACHE_SIZE     rendered pages kept (256)
+#   TRANSCRIPT_CACHE_SECONDS  how long a rendered page is served from memory (60)
+import os
+import json
+import hmac
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import tracing
+import twilio_sender
+
+TRANSCRIPT_SECRET = os.getenv("TRANSCRIPT_SECRET", "")
+TRANSCRIPT_BASE_URL = os.getenv("TRANSCRIPT_BASE_URL", "")
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256"))
+TRANSCRIPT_CACHE_SECONDS = float(os.getenv("TRANSCRIPT_CACHE_SECONDS", "60"))
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+ROUTE = "/transcripts/"
+
+def compress(data):
+    """(codec, compressed bytes) with the best codec available here"""
+    if zstandard:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec, blob):
+    blob = bytes(blob)  # psycopg2 hands BYTEA back as a memoryview
+    if codec == "zstd":
+        if not zstandard: raise RuntimeError("transcript segment is zstd but zstandard isn't installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "zlib": return zlib.decompress(blob)
+    return blob
+
+
+class TranscriptStore:
+    """Append-only, compressed per-call transcripts in Postgres"""
+
+    def __init__(self, connect, secret=TRANSCRIPT_SECRET, base_url=TRANSCRIPT_BASE_URL,
+                 cache_size=TRANSCRIPT_CACHE_SIZE, cache_seconds=TRANSCRIPT_CACHE_SECONDS, name="transcripts"):
+        if not secret:
+            logging.warning("⚠️ TRANSCRIPT_SECRET not set; transcripts are stored but not linked or served")
+        self.connect = connect  # () -> DB connection or None
+        self.key = secret.encode()  # empty: no links, no pages
+        self.base_url = base_url
+        self.cache_size = cache_size
+        self.cache_seconds = cache_seconds
+        self.writer = twilio_sender.Outbox(workers=1, dest_interval=0, mps=0, name=name)
+        self.pages = OrderedDict()  # transcript_id -> (rendered, at)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def transcript_id(self, call_sid):
+        return hmac.new(self.key, (call_sid or "").encode(), hashlib.sha256).hexdigest()[:24]
+
+    def link(self, call_sid):
+        """Absolute (or, before we know our URL, relative) /transcripts/<id> link; None without a secret"""
+        if not self.key: return None
+        return f"{self.base_url.rstrip('/')}{ROUTE}{self.transcript_id(call_sid)}"
+
+    def learn_base_url(self, url_root):
+        if not self.base_url and url_root and url_root.startswith("https://"):
+            self.base_url = url_root.rstrip("/")
+
+    # ---- writing ----
+    def append(self, call_sid, seq, messages):
+        """Queue messages (the call's seq-th onwards) to be written once; False if there's no room"""
+        if not call_sid or not messages: return False
+        return self.writer.call(lambda: self._write(call_sid, seq, list(messages)), kind="transcript")
+
+    def _write(self, call_sid, seq, messages):
+        conn = self.connect()
+        if not conn: return
+        try:
+            self.write(conn, call_sid, seq, messages)
+        finally:
+            conn.close()
+
+    def write(self, conn, call_sid, seq, messages):
+        raw = json.dumps(messages, ensure_ascii=False).encode("utf-8")
+        codec, body = compress(raw)
+        with tracing.span("transcript_write", "postgres"):
+            with conn.cursor() as cur:
+                # a retried turn writes the same seq again: keep the first
+                cur.execute("INSERT INTO transcript_segments (transcript_id, seq, call_sid, codec, body) VALUES (%s, %s, %s, %s, %s) "
+                            "ON CONFLICT (transcript_id, seq) DO NOTHING",
+                            (self.transcript_id(call_sid), seq, call_sid, codec, body))
+            conn.commit()
+        with self.lock:
+            self.stats["segments"] += 1
+            self.stats["raw_bytes"] += len(raw)
+            self.stats["stored_bytes"] += len(body)
+
+    # ---- reading ----
+    def load(self, transcript_id):
+        """Every message of a transcript in order, or None when there's none"""
+        conn = self.connect()
+        if not conn: return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT seq, codec, body FROM transcript_segments WHERE transcript_id = %s ORDER BY seq", (transcript_id,))
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        if not rows: return None
+        messages = []
+        for row in rows:
+            messages.extend(json.loads(decompress(row['codec'], row['body'])))
+        return messages
+
+    def page(self, transcript_id, render):
+        """render(messages) for a transcript, from the page cache when fresh; None if unknown"""
+        if not self.key:
+            self._count("page_misses")
+            return None
+        now = time.monotonic()
+        with self.lock:
+            hit = self.pages.get(transcript_id)
+            if hit and now - hit[1] <= self.cache_seconds:
+                self.pages.move_to_end(transcript_id)
+                self.stats["page_hits"] += 1
+                return hit[0]
+        messages = self.load(transcript_id)
+        if messages is None:
+            self._count("page_misses")
+            return None
+        rendered = render(messages)
+        with self.lock:
+            self.stats["page_renders"] += 1
+            self.pages[transcript_id] = (rendered, now)
+            self.pages.move_to_end(transcript_id)
+            while len(self.pages) > self.cache_size:
+                self.pages.popitem(last=False)
+        return rendered
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def drain(self, timeout=30.0):
+        """Wait for every queued segment (tests, shutdown)"""
+        return self.writer.drain(timeout)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, codec="zstd" if zstandard else "zlib", linked=bool(self.key), cached_pages=len(self.pages),
+                        pending=self.writer.pending)
@@ -0,0 +1,239 @@
+# ✅ TURN LATENCY BUDGET - Guarantees Twilio hears back from /handle in time
+#
+# Every /handle turn runs on a worker thread with a TurnBudget. The webhook
+# waits for the turn only while budget is left; otherwise it answers with a
+# short hold message and a <Redirect> to /handle-result, which picks up the
+# finished reply on the next poll. Outbound calls made during the turn ask
+# timeout() for their timeout so the background work still ends inside
+# TURN_HARD_LIMIT_SECONDS (Twilio drops the webhook at ~15s).
+# The async serving mode (asgi_app.py) runs turns as asyncio tasks instead
+# (start_task / await_turn); the current turn lives in a contextvar so both
+# worker threads and tasks see their own.
+# A held turn lives in this process only, and Twilio's poll may reach another
+# gunicorn worker: hand_off / hand_off_task let the app park the finished reply
+# where any worker can collect it. Turns nobody polls for (the caller hung up)
+# are dropped after TURN_PENDING_TTL_SECONDS.
+import os
+import time
+import logging
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import tracing
+import structured_log
+
+TURN_BUDGET_SECONDS = float(os.getenv("TURN_BUDGET_SECONDS", "2.5"))
+TURN_HARD_LIMIT_SECONDS = float(os.getenv("TURN_HARD_LIMIT_SECONDS", "12"))
+HOLD_RESERVE_SECONDS = float(os.getenv("TURN_HOLD_RESERVE_SECONDS", "0.3"))
+PENDING_TTL_SECONDS = float(os.getenv("TURN_PENDING_TTL_SECONDS", "60"))
+MIN_CALL_TIMEOUT = 0.5
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TURN_WORKERS", "8")), thread_name_prefix="turn")
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+_pending = {}  # call_sid -> PendingTurn (popped when delivered, dropped after the TTL)
+_pending_lock = threading.Lock()
+
+
+class TurnBudget:
+    """Deadline shared by all stages of one conversational turn"""
+
+    def __init__(self, total=TURN_BUDGET_SECONDS, hard_limit=TURN_HARD_LIMIT_SECONDS):
+        self.started = time.monotonic()
+        self.total = total
+        self.hard_limit = hard_limit
+        self.stages = []  # [(stage_name, seconds)]
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return max(0.0, self.total - self.elapsed())
+
+    def nearly_spent(self, reserve=HOLD_RESERVE_SECONDS):
+        return self.remaining() <= reserve
+
+    def timeout(self, cap):
+        """Timeout for one outbound call: the stage's own cap, clipped to the hard limit"""
+        left = self.hard_limit - self.elapsed()
+        return max(MIN_CALL_TIMEOUT, min(cap, left))
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.monotonic() - t0))
+
+    def summary(self):
+        parts = " ".join(f"{name}={secs * 1000:.0f}ms" for name, secs in self.stages)
+        return f"total={self.elapsed() * 1000:.0f}ms {parts}".strip()
+
+    __str__ = summary  # logged as a %s arg: built only when the line is written
+
+
+class PendingTurn:
+    """A turn running in the background; language is filled in once state is loaded"""
+
+    def __init__(self, call_sid, budget):
+        self.call_sid = call_sid
+        self.budget = budget
+        self.future = None
+        self.language = "English"
+        self.polls = 0
+        self.lock = threading.Lock()
+        self.parked = False  # its reply was handed to park() for another worker
+        self.delivered = False  # ...or this worker served it first
+        self.handoff = None  # asgi_app: the hand_off_task parking its reply
+
+
+def current_budget():
+    turn = _current_turn.get()
+    return turn.budget if turn else None
+
+
+def timeout(cap):
+    """Timeout for an outbound call made on the current turn (cap outside a turn)"""
+    budget = current_budget()
+    return budget.timeout(cap) if budget else cap
+
+
+@contextmanager
+def stage(name, dependency=None):
+    """Charge a stage to the current turn's budget and trace it as a span"""
+    budget = current_budget()
+    with tracing.span(name, dependency):
+        if not budget:
+            yield
+            return
+        with budget.stage(name):
+            yield
+
+
+def note_language(language):
+    """Let the webhook speak its hold message in the caller's language"""
+    turn = _current_turn.get()
+    if turn and language:
+        turn.language = language
+
+
+def start_turn(call_sid, fn, *args):
+    """Run fn(*args) on the turn pool and register it as the call's pending turn"""
+    turn = PendingTurn(call_sid, TurnBudget())
+    log_context = dict(structured_log.bound(), call_sid=call_sid)  # the pool thread logs (and bills) for this call
+
+    def run():
+        token = _current_turn.set(turn)
+        structured_log.bind(**log_context)
+        try:
+            return fn(*args)
+        finally:
+            _current_turn.reset(token)
+            logging.info("⏱️ Turn %s: %s", call_sid, turn.budget)
+            structured_log.bind()
+
+    _register(turn)
+    turn.future = _executor.submit(run)
+    return turn
+
+
+def start_task(call_sid, coro_fn, *args):
+    """Async twin of start_turn: run coro_fn(*args) as a task on the running loop"""
+    turn = PendingTurn(call_sid, TurnBudget())
+
+    async def run():
+        _current_turn.set(turn)  # the task runs in its own copy of the context
+        try:
+            return await coro_fn(*args)
+        finally:
+            logging.info("⏱️ Turn %s: %s", call_sid, turn.budget)
+
+    _register(turn)
+    turn.future = asyncio.ensure_future(run())
+    return turn
+
+
+def _register(turn, ttl=None):
+    ttl = PENDING_TTL_SECONDS if ttl is None else ttl
+    with _pending_lock:
+        for call_sid, old in list(_pending.items()):
+            if old.budget.elapsed() > ttl:
+                del _pending[call_sid]
+        _pending[turn.call_sid] = turn
+
+
+def pending_turn(call_sid):
+    with _pending_lock:
+        return _pending.get(call_sid)
+
+
+def wait_for_turn(turn, wait):
+    """Return the turn's result if it finishes within `wait` seconds, else None.
+    Exceptions raised by the turn propagate to the caller."""
+    try:
+        result = turn.future.result(timeout=max(0.0, wait))
+    except FutureTimeout:
+        return None
+    except Exception:
+        _forget(turn)
+        raise
+    _forget(turn)
+    return result
+
+
+def _forget(turn):
+    with _pending_lock:
+        if _pending.get(turn.call_sid) is turn:
+            del _pending[turn.call_sid]
+
+
+def hand_off(turn, park):
+    """Let another worker deliver a held turn: park(turn, reply) once it ends (reply is None
+    if it failed), unless this worker has served it by then. The caller marks the hold
+    itself, before the hold message goes out."""
+    def parked(future):
+        try:
+            reply = future.result()
+        except Exception:
+            reply = None
+        with turn.lock:
+            if turn.delivered: return
+            turn.parked = True
+            park(turn, reply)
+
+    turn.future.add_done_callback(parked)
+
+
+async def hand_off_task(turn, park):
+    """Async twin of hand_off: park is a coroutine function"""
+    try:
+        reply = await asyncio.shield(turn.future)
+    except Exception:
+        reply = None
+    if turn.delivered: return
+    turn.parked = True
+    await park(turn, reply)
+
+
+def served_here(turn):
+    """Mark a held turn as delivered by this worker, so its reply is not parked after this;
+    True if it already was (hand_off_task may still be writing it)"""
+    with turn.lock:  # waits for a park() in progress
+        turn.delivered = True
+        return turn.parked
+
+
+async def await_turn(turn, wait):
+    """Async twin of wait_for_turn for turns started with start_task"""
+    try:
+        result = await asyncio.wait_for(asyncio.shield(turn.future), timeout=max(0.0, wait))
+    except asyncio.TimeoutError:
+        return None
+    except Exception:
+        _forget(turn)
+        raise
+    _forget(turn)
+    return result
@@ -0,0 +1,275 @@
+# ✅ TWILIO SENDER - one REST client, one outbound queue
+#
+# send_whatsapp_text_message / send_whatsapp_audio_message used to build a new
+# TwilioClient (and re-read the credentials) for every message and send it on
+# the caller's thread. Now the client is built once and every outbound message
+# goes through Outbox:
+#   * a small set of sender threads - no thread per send (team emails have
+#     their own Outbox in notify_dispatcher)
+#   * per-destination pacing: at most one message per TWILIO_DEST_INTERVAL to
+#     the same number, so a chatty conversation can't trip Twilio's
+#     per-recipient limits; plus an account-wide TWILIO_SEND_MPS bucket
+#   * 429 and 5xx responses (and connection errors) are retried with
+#     exponential backoff; anything else (bad number, 4xx) fails once
+#   * delivery status: messages carry a StatusCallback to
+#     /twilio/message-status and the last status per SID is kept, so /metrics
+#     shows queued/sent/delivered/failed/undelivered counts
+#
+#   TWILIO_SEND_WORKERS          sender threads (default 4)
+#   TWILIO_SEND_QUEUE_MAX        jobs waiting before send() refuses (1000)
+#   TWILIO_DEST_INTERVAL         seconds between messages to one number (1.0)
+#   TWILIO_SEND_MPS              account-wide messages per second (80)
+#   TWILIO_SEND_RETRIES          retries after a 429/5xx (3)
+#   TWILIO_WHATSAPP_FROM         sender (whatsapp:+14155238886, the sandbox)
+#   TWILIO_STATUS_CALLBACK_URL   delivery-status webhook; defaults to this app's
+#                                /twilio/message-status once a webhook has shown
+#                                us our public URL
+import os
+import time
+import heapq
+import atexit
+import random
+import logging
+import itertools
+import threading
+from collections import OrderedDict, Counter
+
+import requests
+
+import tracing
+import lazy_vendors
+
+TwilioClient = lazy_vendors.attr("twilio.rest", "Client")  # ~0.1s of import the voice path never needs
+
+TWILIO_SEND_WORKERS = int(os.getenv("TWILIO_SEND_WORKERS", "4"))
+TWILIO_SEND_QUEUE_MAX = int(os.getenv("TWILIO_SEND_QUEUE_MAX", "1000"))
+TWILIO_DEST_INTERVAL = float(os.getenv("TWILIO_DEST_INTERVAL", "1.0"))
+TWILIO_SEND_MPS = float(os.getenv("TWILIO_SEND_MPS", "80"))
+TWILIO_SEND_RETRIES = int(os.getenv("TWILIO_SEND_RETRIES", "3"))
+TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886")
+TWILIO_STATUS_CALLBACK_URL = os.getenv("TWILIO_STATUS_CALLBACK_URL", "")
+STATUS_PATH = "/twilio/message-status"
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+TRACKED_MESSAGES = 5000
+TRACKED_DESTINATIONS = 10000
+
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
+
+
+def client():
+    """The shared TwilioClient (rebuilt only if the credentials change); None without credentials"""
+    global _client, _client_key
+    key = (os.environ.get("TWILIO_ACCOUNT_SID", ""), os.environ.get("TWILIO_AUTH_TOKEN", ""))
+    if not all(key): return None
+    with _client_lock:
+        if _client is None or _client_key != key:
+            _client, _client_key = TwilioClient(*key), key
+        return _client
+
+
+def retryable(error):
+    """429 / 5xx from Twilio, or the request never got an answer"""
+    status = getattr(error, "status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError))
+
+
+class Job:
+    """One unit of outbound work; messages have `to`, notifications don't"""
+
+    def __init__(self, fn, to=None, kind="message", retries=TWILIO_SEND_RETRIES):
+        self.fn = fn
+        self.to = to
+        self.kind = kind
+        self.attempts = 0
+        self.retries = retries
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Outbox:
+    """Delay queue + sender threads: per-destination pacing, account-wide MPS, retry on 429/5xx"""
+
+    def __init__(self, workers=TWILIO_SEND_WORKERS, queue_max=TWILIO_SEND_QUEUE_MAX,
+                 dest_interval=TWILIO_DEST_INTERVAL, mps=TWILIO_SEND_MPS, name="twilio-send"):
+        self.workers = max(1, workers)
+        self.queue_max = queue_max
+        self.dest_interval = dest_interval
+        self.mps = mps
+        self.name = name
+        self.heap = []  # (not_before, seq, job)
+        self.seq = itertools.count()
+        self.next_slot = {}  # destination -> earliest time the next message may go
+        self.tokens = mps
+        self.refilled = time.monotonic()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.stats = Counter()
+        self.statuses = OrderedDict()  # message SID -> last delivery status
+        self.status_url = TWILIO_STATUS_CALLBACK_URL
+
+    def _start(self):
+        with self.lock:
+            if self.threads: return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def _push(self, job, not_before):
+        heapq.heappush(self.heap, (not_before, next(self.seq), job))
+        self.ready.notify()
+
+    def submit(self, job):
+        """Queue a job; False when the outbox is full"""
+        self._start()
+        now = time.monotonic()
+        with self.lock:
+            if self.pending >= self.queue_max:
+                self.stats["rejected"] += 1
+                logging.warning("⚠️ %s full; dropping %s to %s", self.name, job.kind, job.to or 'team')
+                return False
+            not_before = now
+            if len(self.next_slot) > TRACKED_DESTINATIONS:
+                self.next_slot = {to: t for to, t in self.next_slot.items() if t > now}
+            if job.to and self.dest_interval > 0:
+                # Reserve the destination's next slot now so its messages keep their order
+                not_before = max(now, self.next_slot.get(job.to, 0.0))
+                self.next_slot[job.to] = not_before + self.dest_interval
+                if not_before > now: self.stats["paced"] += 1
+            self.pending += 1
+            self.stats["queued"] += 1
+            self._push(job, not_before)
+        return True
+
+    def call(self, fn, kind="notify"):
+        """Run fn() on the sender threads (jobs without a destination: no pacing)"""
+        return self.submit(Job(fn, kind=kind, retries=0))
+
+    # ---- sending ----
+    def _take(self):
+        with self.lock:
+            while True:
+                if self.heap:
+                    wait = self.heap[0][0] - time.monotonic()
+                    if wait <= 0: return heapq.heappop(self.heap)[2]
+                    self.ready.wait(wait)
+                else:
+                    self.ready.wait()
+
+    def _take_token(self):
+        """Account-wide token bucket; sleeps (outside the lock) until a token is free"""
+        if self.mps <= 0: return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.mps, self.tokens + (now - self.refilled) * self.mps)
+                self.refilled = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.mps
+            time.sleep(wait)
+
+    def _run(self):
+        while True:
+            job = self._take()
+            if job.to: self._take_token()
+            job.attempts += 1
+            try:
+                job.result = job.fn()
+            except Exception as e:
+                if job.attempts <= job.retries and retryable(e):
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (job.attempts - 1)) * random.uniform(0.8, 1.2)
+                    logging.warning("⚠️ %s: %s to %s failed (%s); retry %s in %.1fs", self.name, job.kind, job.to, e, job.attempts, delay)
+                    with self.lock:
+                        self.stats["retried"] += 1
+                        self._push(job, time.monotonic() + delay)
+                    continue
+                job.error = e
+                logging.error("❌ %s: %s to %s failed: %s", self.name, job.kind, job.to or 'team', e)
+            self._finish(job)
+
+    def _finish(self, job):
+        with self.lock:
+            self.stats["failed" if job.error else "sent"] += 1
+            self.pending -= 1
+            if self.pending == 0: self.idle.notify_all()
+        job.done.set()
+
+    # ---- delivery status ----
+    def track(self, sid, status, to=None):
+        with self.lock:
+            self.statuses[sid] = status
+            self.statuses.move_to_end(sid)
+            while len(self.statuses) > TRACKED_MESSAGES:
+                self.statuses.popitem(last=False)
+
+    def record_status(self, sid, status, error_code=None):
+        """Twilio StatusCallback: queued -> sent -> delivered / read, or failed / undelivered"""
+        if not sid or not status: return
+        self.track(sid, status)
+        if error_code:
+            logging.warning("⚠️ Twilio message %s %s (error %s)", sid, status, error_code)
+
+    def learn_base_url(self, url_root):
+        """Default the StatusCallback to this app once a webhook tells us where we live"""
+        if not self.status_url and url_root and url_root.startswith("https://"):
+            self.status_url = url_root.rstrip("/") + STATUS_PATH
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, pending=self.pending, scheduled=len(self.heap),
+                        delivery=dict(Counter(self.statuses.values())))
+
+    def drain(self, timeout=30.0):
+        """Wait until every queued job has been sent or given up on (tests, shutdown)"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.pending:
+                left = deadline - time.monotonic()
+                if left <= 0: return False
+                self.idle.wait(left)
+        return True
+
+
+outbox = Outbox()
+tracing.register_gauge("twilio_outbox", outbox.snapshot)
+# The old per-notification threads were non-daemon so emails went out before exit
+atexit.register(outbox.drain, 10.0)
+
+
+# ✅ SENDING
+def _create(to, body=None, media_url=None):
+    c = client()
+    if c is None:
+        raise RuntimeError("Missing Twilio credentials")
+    kwargs = {"from_": TWILIO_WHATSAPP_FROM, "to": f"whatsapp:{to}"}
+    if body is not None: kwargs["body"] = body
+    if media_url is not None: kwargs["media_url"] = media_url
+    if outbox.status_url: kwargs["status_callback"] = outbox.status_url
+    with tracing.span("whatsapp_send", "twilio"):
+        message = c.messages.create(**kwargs)
+    outbox.track(message.sid, getattr(message, "status", None) or "queued")
+    return message
+
+
+def send_whatsapp(to, body=None, media_url=None, wait=None):
+    """Queue a WhatsApp message to `to` (+E.164). Returns the Job, or None when it
+    can't be queued. wait=seconds blocks until it was sent (job.result is the message)."""
+    if client() is None:
+        return None
+    job = Job(lambda: _create(to, body, media_url), to=to, kind="media" if media_url else "text")
+    if not outbox.submit(job):
+        return None
+    if wait: job.done.wait(wait)
+    return job
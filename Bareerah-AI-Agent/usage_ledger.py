@@ -0,0 +1,303 @@
+# ✅ USAGE LEDGER - what each call cost us, vendor by vendor
+#
+# Every billable external call (LLM tokens, Whisper seconds, Google Places /
+# Distance Matrix requests, ElevenLabs characters, Resend emails) is recorded
+# against the call it served - the CallSid, or the phone for WhatsApp - with
+# its wall time. Caches record their hits too (cached=True): a hit bills
+# nothing and its list price is counted as saved_usd, so a cache's worth shows
+# up in dollars and milliseconds instead of a hit rate.
+#   * record() only adds to in-memory totals under a lock; one background
+#     thread per process upserts the deltas into call_usage every
+#     USAGE_FLUSH_SECONDS (one row per call + vendor + item, summed), and a
+#     flush that fails keeps its deltas for the next one
+#   * the call comes from structured_log's bound context (webhooks and the
+#     turn / prefetch pools bind it), so call sites don't thread it through
+#   * report() is what /admin/usage serves: cost, savings and time per
+#     vendor item, cost per call and the most expensive calls; the /metrics
+#     gauge (snapshot) is unauthenticated and carries only the ledger's health
+# Prices are list prices in USD and only as right as PRICES; the quantities
+# and times are exact. Override or add prices with USAGE_PRICES_JSON, e.g.
+# {"openai:gpt-4o-mini": {"usd": 1.5e-7, "usd_out": 6e-7}}.
+#
+#   USAGE_FLUSH_SECONDS      pause between writes to call_usage (10)
+#   USAGE_MAX_CALLS          calls kept in memory for the report (1000)
+#   USAGE_PRICES_JSON        price overrides, "vendor:item" -> {unit, usd, usd_out}
+#   USAGE_LEDGER_ENABLED=false  record nothing
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import Counter, OrderedDict, namedtuple
+
+import tracing
+import structured_log
+
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+USAGE_MAX_CALLS = int(os.getenv("USAGE_MAX_CALLS", "1000"))
+USAGE_LEDGER_ENABLED = os.getenv("USAGE_LEDGER_ENABLED", "true").lower() != "false"
+MAX_PENDING = 20000  # unflushed (call, vendor, item) rows kept while the database is down
+WHISPER_BYTES_PER_SECOND = 2000  # ~16 kbit/s: WhatsApp voice notes, when Whisper doesn't report a duration
+
+Price = namedtuple("Price", "unit usd usd_out")
+PRICES = {
+    "openai:gpt-4o-mini": Price("token", 0.15e-6, 0.60e-6),
+    "openai:gpt-4o": Price("token", 2.50e-6, 10.00e-6),
+    "openai:gpt-3.5-turbo": Price("token", 0.50e-6, 1.50e-6),
+    "openai:whisper-1": Price("second", 0.006 / 60, 0.0),
+    "google:find_place": Price("request", 0.017, 0.0),
+    "google:autocomplete": Price("request", 0.00283, 0.0),
+    "google:distance_matrix": Price("element", 0.005, 0.0),
+    "elevenlabs:tts": Price("character", 0.30 / 1000, 0.0),
+    "resend:email": Price("email", 0.0004, 0.0),
+}
+UNPRICED = Price("unit", 0.0, 0.0)
+FIELDS = ("events", "cached_events", "quantity", "quantity_out", "ms", "cost_usd", "saved_usd")
+COLUMNS = ("call_key", "phone", "vendor", "item", "unit") + FIELDS
+
+UPSERT = f"""
+    INSERT INTO call_usage ({", ".join(COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(COLUMNS))})
+    ON CONFLICT (call_key, vendor, item) DO UPDATE SET
+        phone = COALESCE(call_usage.phone, EXCLUDED.phone),
+        {", ".join(f"{f} = call_usage.{f} + EXCLUDED.{f}" for f in FIELDS)},
+        last_at = now()
+"""
+RECENT = f"SELECT {', '.join(COLUMNS)} FROM call_usage WHERE last_at >= now() - make_interval(hours => %s)"
+
+
+def load_prices(raw=None):
+    """PRICES with USAGE_PRICES_JSON laid over it"""
+    prices = dict(PRICES)
+    raw = os.getenv("USAGE_PRICES_JSON") if raw is None else raw
+    if not raw: return prices
+    try:
+        for key, spec in json.loads(raw).items():
+            base = prices.get(key, UNPRICED)
+            prices[key] = Price(spec.get("unit", base.unit), float(spec.get("usd", base.usd)), float(spec.get("usd_out", base.usd_out)))
+    except (ValueError, AttributeError, TypeError) as e:
+        logging.error("❌ USAGE_PRICES_JSON ignored: %s", e)
+    return prices
+
+
+def tokens(resp):
+    """(prompt, completion) tokens from an OpenAI response; (0, 0) when it has no usage"""
+    usage = getattr(resp, "usage", None)
+    return (getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0)
+
+
+def audio_seconds(audio, reported=None):
+    """Whisper bills by the second: the duration it reported, else an estimate from the size.
+    audio: a file path, bytes, or an OpenAI (filename, bytes, content_type) tuple."""
+    if reported: return float(reported)
+    if isinstance(audio, str):
+        size = os.path.getsize(audio) if os.path.exists(audio) else 0
+    elif isinstance(audio, tuple):
+        size = len(audio[1])
+    else:
+        size = len(audio or b"")
+    return round(size / WHISPER_BYTES_PER_SECOND, 1)
+
+
+def _row(row):
+    return dict(row) if isinstance(row, dict) else dict(zip(COLUMNS, row))  # RealDictCursor (main) or tuples (legacy)
+
+
+def summarize(rows, top=10):
+    """call_usage rows -> the /admin/usage report"""
+    items, calls = {}, {}
+    for row in map(_row, rows):
+        key = f"{row['vendor']}:{row['item']}"
+        item = items.setdefault(key, dict({f: 0 for f in FIELDS}, vendor=row["vendor"], item=row["item"], unit=row["unit"]))
+        call = calls.setdefault(row["call_key"], {"call_key": row["call_key"], "phone": row["phone"], "cost_usd": 0.0, "saved_usd": 0.0, "ms": 0, "events": 0})
+        for f in FIELDS: item[f] += float(row[f] or 0)
+        for f in ("cost_usd", "saved_usd", "ms", "events"): call[f] += float(row[f] or 0)
+        call["phone"] = call["phone"] or row["phone"]
+    for item in items.values():
+        billed = item["events"] - item["cached_events"]
+        item["avg_ms"] = round(item["ms"] / billed, 1) if billed else 0.0
+        item["cache_hit_rate"] = round(item["cached_events"] / item["events"], 3) if item["events"] else 0.0
+        for f in ("cost_usd", "saved_usd"): item[f] = round(item[f], 6)
+    cost = sum(i["cost_usd"] for i in items.values())
+    saved = sum(i["saved_usd"] for i in items.values())
+    by_cost = sorted(calls.values(), key=lambda c: c["cost_usd"], reverse=True)
+    for call in by_cost:
+        for f in ("cost_usd", "saved_usd"): call[f] = round(call[f], 6)
+    return {
+        "calls": len(calls),
+        "cost_usd": round(cost, 6),
+        "saved_usd": round(saved, 6),
+        "cost_per_call_usd": round(cost / len(calls), 6) if calls else 0.0,
+        "vendor_ms": sum(int(i["ms"]) for i in items.values()),
+        "items": sorted(items.values(), key=lambda i: i["cost_usd"], reverse=True),
+        "top_calls": by_cost[:top],
+    }
+
+
+class Meter:
+    """What metered() hands the block: set quantity / quantity_out (or .tokens(resp)) before it ends"""
+
+    def __init__(self, quantity):
+        self.quantity = quantity
+        self.quantity_out = 0
+
+    def tokens(self, resp):
+        self.quantity, self.quantity_out = tokens(resp)
+        return resp
+
+
+class UsageLedger:
+    """Per-call usage totals in memory, flushed to call_usage by one background thread"""
+
+    def __init__(self, connect=None, release=None, interval=USAGE_FLUSH_SECONDS, max_calls=USAGE_MAX_CALLS,
+                 enabled=USAGE_LEDGER_ENABLED, prices=None, name="usage-ledger"):
+        self.connect = connect  # () -> DB connection (None: memory only)
+        self.release = release  # (conn) -> None
+        self.interval = interval
+        self.max_calls = max_calls
+        self.enabled = enabled
+        self.prices = prices or load_prices()
+        self.name = name
+        self.calls = OrderedDict()  # call_key -> {(vendor, item): row}, most recent last
+        self.pending = OrderedDict()  # (call_key, vendor, item) -> unflushed delta
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stats = Counter()
+
+    def price(self, vendor, item):
+        return self.prices.get(f"{vendor}:{item}") or self.prices.get(f"{vendor}:*") or UNPRICED
+
+    def record(self, vendor, item, quantity=1, quantity_out=0, ms=0, cached=False, call_sid=None, phone=None):
+        """One billable call (or a cache hit that avoided one); returns what it cost in USD"""
+        if not self.enabled: return 0.0
+        bound = structured_log.bound()
+        call_sid = call_sid or bound.get("call_sid")
+        phone = phone or bound.get("phone")
+        call_key = call_sid or phone or "unattributed"
+        price = self.price(vendor, item)
+        usd = quantity * price.usd + quantity_out * price.usd_out
+        delta = {"events": 1, "cached_events": 1 if cached else 0, "quantity": quantity, "quantity_out": quantity_out,
+                 "ms": int(ms), "cost_usd": 0.0 if cached else usd, "saved_usd": usd if cached else 0.0}
+        with self.lock:
+            if price is UNPRICED: self.stats["unpriced"] += 1
+            self.stats["cached" if cached else "recorded"] += 1
+            call = self.calls.pop(call_key, None) or {}
+            self.calls[call_key] = call
+            if len(self.calls) > self.max_calls: self.calls.popitem(last=False)
+            for rows, key in ((call, (vendor, item)), (self.pending, (call_key, vendor, item))):
+                row = rows.setdefault(key, dict({f: 0 for f in FIELDS}, call_key=call_key, phone=phone, vendor=vendor, item=item, unit=price.unit))
+                row["phone"] = row["phone"] or phone
+                for f in FIELDS: row[f] += delta[f]
+            self._trim_pending()
+        return delta["cost_usd"]
+
+    @contextmanager
+    def metered(self, vendor, item, quantity=1):
+        """Time the block and record it; a block that raised is recorded with nothing billed"""
+        meter = Meter(quantity)
+        started = time.perf_counter()
+        try:
+            yield meter
+        except BaseException:
+            meter.quantity = meter.quantity_out = 0
+            raise
+        finally:
+            self.record(vendor, item, meter.quantity, meter.quantity_out, (time.perf_counter() - started) * 1000)
+
+    def _trim_pending(self):
+        while len(self.pending) > MAX_PENDING:
+            self.pending.popitem(last=False)
+            self.stats["dropped"] += 1
+
+    def flush(self):
+        """Upsert everything recorded since the last flush; returns how many rows were written"""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, OrderedDict()
+            if not batch or not self.connect: return 0
+            conn = None
+            try:
+                conn = self.connect()
+                if not conn:
+                    self.stats["no_db"] += 1  # nowhere to keep it; memory totals still serve the report
+                    return 0
+                with tracing.span("usage_flush", "postgres"):
+                    cur = conn.cursor()
+                    for row in batch.values():
+                        cur.execute(UPSERT, tuple(row[c] for c in COLUMNS))
+                    conn.commit()
+                self.stats["flushed"] += len(batch)
+                return len(batch)
+            except Exception as e:
+                if conn is not None:
+                    try: conn.rollback()
+                    except Exception: pass
+                self._merge_back(batch)
+                self.stats["flush_errors"] += 1
+                logging.error("❌ Usage flush failed, %s rows kept for the next one: %s", len(batch), e)
+                return 0
+            finally:
+                if conn is not None and self.release: self.release(conn)
+
+    def _merge_back(self, batch):
+        with self.lock:
+            for key, row in self.pending.items():  # recorded while the flush was failing: newer, so after
+                mine = batch.get(key)
+                if mine is None:
+                    batch[key] = row
+                    continue
+                for f in FIELDS: mine[f] += row[f]
+            self.pending = batch
+            self._trim_pending()
+
+    def report(self, hours=24, top=10):
+        """Usage over the last `hours` from call_usage, or from memory without a database"""
+        if self.connect:
+            self.flush()
+            conn = None
+            try:
+                conn = self.connect()
+                if conn:
+                    cur = conn.cursor()
+                    cur.execute(RECENT, (hours,))
+                    return dict(summarize(cur.fetchall(), top), source="database", hours=hours)
+            except Exception as e:
+                logging.error("❌ Usage report fell back to memory: %s", e)
+            finally:
+                if conn is not None and self.release: self.release(conn)
+        with self.lock:
+            rows = [dict(row) for call in self.calls.values() for row in call.values()]
+        return dict(summarize(rows, top), source="memory", hours=None)
+
+    def call(self, call_key):
+        """One call's usage from memory, per vendor item"""
+        with self.lock:
+            return {f"{v}:{i}": dict(row) for (v, i), row in self.calls.get(call_key, {}).items()}
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        """Start the flush thread once per process (no-op when disabled, memory-only or already running)"""
+        with self.lock:
+            if not self.enabled or not self.connect or self.thread: return False
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self.thread.start()
+        logging.info("[USAGE] ✅ Usage ledger flushing every %.0fs", self.interval)
+        return True
+
+    def stop(self, timeout=10.0):
+        self.stop_event.set()
+        thread, self.thread = self.thread, None
+        if thread: thread.join(timeout)
+        self.flush()  # what this worker recorded since the last pass
+
+    def snapshot(self):
+        """The ledger's own health for the public /metrics gauge - no dollars, no call counts"""
+        with self.lock:
+            return dict(self.stats, running=bool(self.thread), pending=len(self.pending))
@@ -0,0 +1,537 @@
+# ✅ VENDOR STUBS - Deterministic local stand-ins for every external service
+#
+# Used by bench_conversations.py and load_test.py to run the Flask apps
+# in-process with no network: OpenAI, Google Maps, the Star Skyline backend,
+# Resend (HTTP + SMTP), ElevenLabs, Twilio REST and Postgres are all
+# replaced. Each vendor gets a latency distribution so timings look like
+# production, and every call is counted per vendor.
+#
+#   stubs = VendorStubs(seed=7, latency={"openai": "lognormal:600,0.35"})
+#   with stubs.installed(main):
+#       main.app.test_client().post("/handle", data={...})
+#   print(stubs.counts())
+#
+# Installing on asgi_app swaps its shared httpx/OpenAI clients for async
+# fakes that share the same routing and counters.
+import re
+import sys
+import copy
+import asyncio
+import json
+import math
+import time
+import types
+import zlib
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+
+import usage_ledger
+
+DEFAULT_LATENCY = {
+    "openai": "lognormal:650,0.35",
+    "google_maps": "uniform:60-180",
+    "backend": "uniform:40-160",
+    "resend": "uniform:100-250",
+    "elevenlabs": "uniform:250-500",
+    "twilio": "uniform:80-200",
+    "postgres": "uniform:1-4",
+}
+
+
+class Latency:
+    """Latency distribution from a spec string (all values in ms):
+    fixed:50 | uniform:20-80 | lognormal:median,sigma | none"""
+
+    def __init__(self, spec):
+        self.spec = spec or "none"
+        kind, _, args = self.spec.partition(":")
+        self.kind = kind.strip().lower()
+        if self.kind == "fixed":
+            self.args = (float(args),)
+        elif self.kind == "uniform":
+            lo, hi = args.split("-")
+            self.args = (float(lo), float(hi))
+        elif self.kind == "lognormal":
+            median, sigma = args.split(",")
+            self.args = (math.log(float(median)), float(sigma))
+        elif self.kind in ("none", "zero", "0"):
+            self.kind, self.args = "none", ()
+        else:
+            raise ValueError(f"Unknown latency spec: {spec}")
+
+    def sample_ms(self, rng):
+        if self.kind == "fixed": return self.args[0]
+        if self.kind == "uniform": return rng.uniform(*self.args)
+        if self.kind == "lognormal": return rng.lognormvariate(*self.args)
+        return 0.0
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, content=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.content = content if content is not None else json.dumps(payload or {}).encode()
+        self.text = self.content.decode("utf-8", "replace") if isinstance(self.content, bytes) else str(self.content)
+        self.ok = status_code < 400
+        self.headers = {"Content-Type": "application/json" if payload is not None else "audio/mpeg"}
+
+    def json(self):
+        if self._payload is None: raise ValueError("No JSON body")
+        return self._payload
+
+    def raise_for_status(self):
+        if not self.ok: raise requests.HTTPError(f"{self.status_code} stub error", response=self)
+
+    def iter_content(self, chunk_size=8192):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+# ✅ SCRIPTED LLM
+MAIN_SLOT_ORDER = [
+    ("customer_name", lambda text: text[:40]),
+    ("pickup_location", lambda text: text[:60]),
+    ("dropoff_location", lambda text: text[:60]),
+    ("pickup_time", lambda text: "Tomorrow at 4pm"),
+    ("passengers_count", lambda text: 2),
+    ("luggage_count", lambda text: 1),
+]
+
+
+def scripted_llm(messages, response_format=None, **kwargs):
+    """Fills main.py's slots two per turn, then walks pitch -> ask_reqs -> finalize.
+    Other JSON prompts (legacy NLU) get a valid, high-confidence reply; plain-text
+    prompts (e.g. pickup extraction) get the user's text back."""
+    system = messages[0]["content"] if messages else ""
+    users = [m["content"] for m in messages if m.get("role") == "user"]
+    text = users[-1] if users else ""
+    if not response_format:
+        return text.split("\n")[0].strip().strip("'\"")[:80]
+    if '"new_slots"' in system:
+        m = re.search(r"Current Info: (\{.*\})", system)
+        slots = json.loads(m.group(1)) if m else {}
+        last_bot = next((m["content"] for m in reversed(messages[1:]) if m.get("role") == "assistant"), "")
+        new = {}
+        for key, fn in MAIN_SLOT_ORDER:
+            if not slots.get(key) and len(new) < 2:
+                new[key] = fn(text)
+        if new:
+            return {"response": "Noted. Could you please provide the next detail?", "new_slots": new, "action": "continue"}
+        if "other requirements" in last_bot:
+            return {"response": "Booking now.", "new_slots": {"extra_details": text[:80]}, "action": "finalize"}
+        if slots.get("preferred_vehicle") or "Which option" in last_bot:
+            return {"response": "Great choice.", "new_slots": {"preferred_vehicle": slots.get("preferred_vehicle") or "Executive"}, "action": "ask_reqs"}
+        return {"response": "Let me check options.", "new_slots": {}, "action": "confirm_pitch"}
+    return {
+        "intent": "booking", "confidence": 0.85, "response_text": "Perfect, noted! What else can I help with?",
+        "next_flow_step": "dropoff", "updated_locked_slots": {}, "pickup": "", "dropoff": "",
+        "datetime": "", "passengers": -1, "luggage": -1, "full_name": "", "email": "", "trigger_email": False,
+    }
+
+
+class _Completions:
+    def __init__(self, stubs):
+        self.stubs = stubs
+
+    def create(self, model=None, messages=None, response_format=None, **kwargs):
+        self.stubs._hit("openai")
+        return self._reply(model, messages, response_format, **kwargs)
+
+    def _reply(self, model=None, messages=None, response_format=None, **kwargs):
+        result = self.stubs.llm(messages or [], model=model, response_format=response_format, **kwargs)
+        content = json.dumps(result) if not isinstance(result, str) else result
+        message = types.SimpleNamespace(content=content, role="assistant")
+        usage = types.SimpleNamespace(prompt_tokens=sum(len(str(m.get("content", ""))) // 4 for m in messages or []),
+                                      completion_tokens=len(content) // 4)
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason="stop")], usage=usage, model=model)
+
+
+class _Transcriptions:
+    def __init__(self, stubs):
+        self.stubs = stubs
+
+    def create(self, model=None, file=None, **kwargs):
+        self.stubs._hit("openai")
+        text = "I need a ride from Dubai Marina to the airport tomorrow"
+        return text if kwargs.get("response_format") == "text" else types.SimpleNamespace(text=text)
+
+
+class FakeOpenAI:
+    def __init__(self, stubs):
+        self.chat = types.SimpleNamespace(completions=_Completions(stubs))
+        self.audio = types.SimpleNamespace(transcriptions=_Transcriptions(stubs))
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model=None, messages=None, response_format=None, **kwargs):
+        await self.stubs._ahit("openai")
+        return self._reply(model, messages, response_format, **kwargs)
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, stubs):
+        self.chat = types.SimpleNamespace(completions=_AsyncCompletions(stubs))
+
+
+class FakeTwilioClient:
+    def __init__(self, stubs):
+        self.stubs = stubs
+        self.messages = types.SimpleNamespace(create=self._create_message)
+
+    def _create_message(self, **kwargs):
+        self.stubs._hit("twilio")
+        return types.SimpleNamespace(sid=f"SM{self.stubs._next_id():032d}", status="queued")
+
+
+class FakeSMTP:
+    def __init__(self, stubs):
+        self.stubs = stubs
+
+    def login(self, *a, **k): pass
+    def ehlo(self, *a, **k): pass
+    def starttls(self, *a, **k): pass
+    def send_message(self, *a, **k): self.stubs._hit("resend")
+    def sendmail(self, *a, **k): self.stubs._hit("resend")
+    def quit(self): pass
+    def close(self): pass
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+# ✅ FAKE POSTGRES (just enough SQL for migrations, call_state, held turns, WhatsApp deliveries, transcripts, the booking and usage ledgers)
+class FakeDB:
+    def __init__(self, stubs):
+        self.stubs = stubs
+        self.call_state = {}
+        self.bookings = []
+        self.transcripts = {}  # transcript_id -> {seq: row}
+        self.migrations = {}  # version -> name; DDL itself is accepted and ignored
+        self.effects = set()  # (idempotency_key, effect) claimed through booking_ledger
+        self.settled = {}  # idempotency_key -> booking_status
+        self.call_usage = {}  # (call_key, vendor, item) -> summed usage_ledger row
+        self.held_turns = {}  # call_sid -> {"twiml", "held_at" (time.time())}
+        self.deliveries = {}  # whatsapp delivery_id -> seen_at (time.time())
+        self.lock = threading.Lock()
+        self.open_connections = 0
+        self.peak_connections = 0
+        self.total_connections = 0
+
+    def connect(self, *args, **kwargs):
+        with self.lock:
+            self.open_connections += 1
+            self.total_connections += 1
+            self.peak_connections = max(self.peak_connections, self.open_connections)
+        return FakeConnection(self)
+
+    def release(self, conn=None, *args, **kwargs):
+        if conn is not None: conn.close()
+
+    def usage(self):
+        return {"open": self.open_connections, "peak": self.peak_connections, "total": self.total_connections}
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.closed = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self.db, self)
+
+    def commit(self): pass
+    def rollback(self): pass
+
+    def close(self):
+        if self.closed: return
+        self.closed = True
+        with self.db.lock:
+            self.db.open_connections -= 1
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+class FakeCursor:
+    def __init__(self, db, connection=None):
+        self.db = db
+        self.rows = []
+        self.rowcount = 0
+        self.connection = connection
+
+    def execute(self, sql, params=()):
+        self.db.stubs._hit("postgres")
+        q = " ".join(sql.split()).lower()
+        params = tuple(params or ())
+        self.rows = []
+        with self.db.lock:
+            if q.startswith("select data from call_state"):
+                data = self.db.call_state.get(params[0])
+                self.rows = [{"data": copy.deepcopy(data)}] if data is not None else []
+            elif q.startswith("insert into call_state") or q.startswith("update call_state"):
+                if q.startswith("insert"): sid, data = params[0], params[1]
+                else: data, sid = params[0], params[1]
+                data = json.loads(data) if isinstance(data, str) else data
+                if q.endswith("do nothing"): self.db.call_state.setdefault(sid, data)
+                else: self.db.call_state[sid] = data
+            elif q.startswith("delete from held_turns where held_at"):
+                for sid in [sid for sid, row in self.db.held_turns.items() if row["held_at"] < time.time() - params[0]]:
+                    del self.db.held_turns[sid]
+            elif q.startswith("insert into whatsapp_deliveries"):
+                first = params[0] not in self.db.deliveries
+                self.db.deliveries.setdefault(params[0], time.time())
+                self.rows = [{"delivery_id": params[0]}] if first else []
+            elif q.startswith("delete from whatsapp_deliveries where seen_at"):
+                for key in [key for key, at in self.db.deliveries.items() if at < time.time() - params[0]]:
+                    del self.db.deliveries[key]
+            elif q.startswith("delete from whatsapp_deliveries"):
+                self.db.deliveries.pop(params[0], None)
+            elif q.startswith("insert into held_turns"):
+                self.db.held_turns[params[0]] = {"twiml": None, "held_at": time.time()}
+            elif q.startswith("update held_turns"):
+                if params[1] in self.db.held_turns: self.db.held_turns[params[1]]["twiml"] = params[0]
+            elif q.startswith("select twiml"):
+                row = self.db.held_turns.get(params[1])
+                self.rows = [{"twiml": row["twiml"], "running": row["held_at"] > time.time() - params[0]}] if row else []
+            elif q.startswith("delete from held_turns"):
+                self.db.held_turns.pop(params[0], None)
+            elif q.startswith("insert into transcript_segments"):
+                tid, seq, sid, codec, body = params
+                self.db.transcripts.setdefault(tid, {}).setdefault(seq, {"seq": seq, "call_sid": sid, "codec": codec, "body": body})
+            elif q.startswith("select seq, codec, body from transcript_segments"):
+                segments = self.db.transcripts.get(params[0], {})
+                self.rows = [dict(segments[seq]) for seq in sorted(segments)]
+            elif q.startswith("select version from schema_migrations"):
+                self.rows = [{"version": v} for v in sorted(self.db.migrations)]
+            elif q.startswith("insert into schema_migrations"):
+                self.db.migrations[params[0]] = params[1]
+            elif q.startswith("insert into bookings"):
+                # booking_ledger.RECORD: one row per idempotency key
+                first = next((row for row in self.db.bookings if row[0] == params[0]), None)
+                if first is None: self.db.bookings.append(params)
+                self.rows = [{"booking_reference": (first or params)[1], "created": first is None}]
+            elif q.startswith("insert into booking_effects"):
+                if params not in self.db.effects:
+                    self.db.effects.add(params)
+                    self.rows = [{"effect": params[1]}]
+            elif q.startswith("delete from booking_effects"):
+                self.db.effects.discard(params)
+            elif q.startswith("update bookings set booking_status"):
+                self.db.settled[params[1]] = params[0]
+            elif q.startswith("insert into call_usage"):
+                # usage_ledger.UPSERT: summed per (call_key, vendor, item)
+                fresh = dict(zip(usage_ledger.COLUMNS, params))
+                row = self.db.call_usage.setdefault((fresh["call_key"], fresh["vendor"], fresh["item"]), dict(fresh, **{f: 0 for f in usage_ledger.FIELDS}))
+                for f in usage_ledger.FIELDS: row[f] += fresh[f]
+            elif q.startswith("select call_key"):
+                self.rows = [dict(row) for row in self.db.call_usage.values()]
+        self.rowcount = len(self.rows) or 1
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self): pass
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+
+# ✅ HTTP ROUTING (requests.get / requests.post)
+def _backend_response(method, path, kwargs):
+    if path.endswith("/auth/login"):
+        return FakeResponse(200, {"token": "stub-jwt"})
+    if "suggest-vehicles" in path:
+        return FakeResponse(200, {"suggested_vehicles": [
+            {"vehicle_type": "classic", "model": "Lexus ES", "base_fare": 50, "per_km_rate": 3.5, "max_passengers": 4},
+            {"vehicle_type": "executive", "model": "Mercedes E Class", "base_fare": 80, "per_km_rate": 4.5, "max_passengers": 4},
+            {"vehicle_type": "suv", "model": "GMC Yukon", "base_fare": 100, "per_km_rate": 5.0, "max_passengers": 6},
+        ]})
+    if "vehicles" in path:
+        return FakeResponse(200, {"data": [{"vehicle_type": "classic", "model": "Lexus ES", "max_passengers": 4}]})
+    if "calculate-fare" in path:
+        body = kwargs.get("json") or {}
+        fare = 50 + float(body.get("distance_km") or 20) * 3.5
+        return FakeResponse(200, {"fare_aed": round(fare)})
+    if method == "POST":
+        return FakeResponse(201, {"success": True, "booking_id": "STUB-1"})
+    return FakeResponse(200, {"success": True, "data": []})
+
+
+def _maps_response(path, params):
+    if "distancematrix" in path:
+        return FakeResponse(200, {"status": "OK", "rows": [{"elements": [{"status": "OK", "distance": {"value": 23400, "text": "23.4 km"}, "duration": {"value": 1560, "text": "26 mins"}}]}]})
+    query = (params or {}).get("input") or (params or {}).get("address") or "Dubai"
+    place = {"place_id": f"stub-{zlib.crc32(str(query).encode()):08x}", "name": str(query).split(",")[0].title(),
+             "formatted_address": f"{query}", "geometry": {"location": {"lat": 25.2, "lng": 55.27}}}
+    return FakeResponse(200, {"status": "OK", "candidates": [place], "results": [place], "predictions": [{"description": query, "place_id": place["place_id"]}]})
+
+
+class VendorStubs:
+    def __init__(self, seed=0, latency=None, sleep=True, llm=None):
+        specs = dict(DEFAULT_LATENCY)
+        specs.update(latency or {})
+        self.latency = {k: Latency(v) for k, v in specs.items()}
+        self.sleep = sleep
+        self.llm = llm or scripted_llm
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self._counts = Counter()
+        self._counts_lock = threading.Lock()
+        self._ids = 0
+        self.db = FakeDB(self)
+        self.openai = FakeOpenAI(self)
+        self._saved = []
+        self._drains = []
+
+    # ---- accounting ----
+    def _hit(self, vendor):
+        with self._counts_lock:
+            self._counts[vendor] += 1
+        dist = self.latency.get(vendor)
+        if dist and self.sleep:
+            with self.rng_lock:
+                ms = dist.sample_ms(self.rng)
+            if ms > 0: time.sleep(ms / 1000.0)
+
+    async def _ahit(self, vendor):
+        """_hit for the async path: waits on the event loop instead of blocking it"""
+        with self._counts_lock:
+            self._counts[vendor] += 1
+        dist = self.latency.get(vendor)
+        if dist and self.sleep:
+            with self.rng_lock:
+                ms = dist.sample_ms(self.rng)
+            if ms > 0: await asyncio.sleep(ms / 1000.0)
+
+    def _next_id(self):
+        with self._counts_lock:
+            self._ids += 1
+            return self._ids
+
+    def counts(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def reset_counts(self):
+        with self._counts_lock:
+            self._counts.clear()
+
+    # ---- HTTP ----
+    def _route(self, method, url, params=None, **kwargs):
+        """(vendor, response) for an outbound HTTP call"""
+        host = urlparse(url).netloc
+        path = urlparse(url).path
+        if "googleapis.com" in host:
+            return "google_maps", _maps_response(path, params)
+        if "resend.com" in host:
+            return "resend", FakeResponse(200, {"id": f"email-{self._next_id()}"})
+        if "elevenlabs.io" in host:
+            return "elevenlabs", FakeResponse(200, None, content=b"ID3" + b"\x00" * 2048)
+        if "twilio.com" in host:
+            return "twilio", FakeResponse(200, None, content=b"OggS" + b"\x00" * 4096)
+        return "backend", _backend_response(method.upper(), path, kwargs)
+
+    def request(self, method, url, params=None, **kwargs):
+        vendor, resp = self._route(method, url, params, **kwargs)
+        self._hit(vendor)
+        return resp
+
+    def _get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def _post(self, url, data=None, json=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def httpx_transport(self):
+        """httpx.MockTransport answering like request(), for the async serving path"""
+        import httpx
+
+        async def handler(req):
+            body = None
+            if req.content:
+                try: body = json.loads(req.content)
+                except ValueError: pass
+            vendor, resp = self._route(req.method, str(req.url), dict(req.url.params), json=body)
+            await self._ahit(vendor)
+            return httpx.Response(resp.status_code, content=resp.content, headers=resp.headers)
+        return httpx.MockTransport(handler)
+
+    # ---- install / uninstall ----
+    def _patch(self, obj, name, value):
+        if obj is requests or hasattr(obj, name):
+            self._saved.append((obj, name, getattr(obj, name, None)))
+            setattr(obj, name, value)
+
+    def install(self, *modules):
+        """Patch requests globally and the vendor clients/keys on each app module"""
+        self._patch(requests, "get", self._get)
+        self._patch(requests, "post", self._post)
+        self._patch(requests, "request", self.request)
+        smtp = types.SimpleNamespace(SMTP_SSL=lambda *a, **k: FakeSMTP(self), SMTP=lambda *a, **k: FakeSMTP(self))
+        for mod in modules:
+            self._patch(mod, "client", self.openai)
+            self._patch(mod, "OPENAI_CLIENT", self.openai)
+            self._patch(mod, "TwilioClient", lambda *a, **k: FakeTwilioClient(self))
+            self._patch(mod, "smtplib", smtp)
+            # main.py opens a connection per request; the legacy app uses a pool
+            self._patch(mod, "get_db", self.db.connect)
+            self._patch(mod, "get_db_conn", self.db.connect)
+            self._patch(mod, "return_db_conn", self.db.release)
+            self._patch(mod, "init_db_pool", lambda: None)
+            for key in ("GOOGLE_MAPS_API_KEY", "ELEVENLABS_API_KEY", "RESEND_API_KEY", "DATABASE_URL"):
+                self._patch(mod, key, "stub")
+            self._patch(mod, "CACHED_TOKEN", None)
+            self._patch(mod, "CACHED_JWT_TOKEN", None)
+            # asgi_app.py: async clients; the DB falls back to the (stubbed) sync get_db
+            if hasattr(mod, "_http"):
+                import httpx
+                self._patch(mod, "_http", httpx.AsyncClient(transport=self.httpx_transport()))
+                self._patch(mod, "_openai", FakeAsyncOpenAI(self))
+                self._patch(mod, "_db_pool", False)
+        # twilio_sender owns the shared REST client; drop the cached one so ours is built
+        sender = sys.modules.get("twilio_sender")
+        if sender:
+            self._patch(sender, "TwilioClient", lambda *a, **k: FakeTwilioClient(self))
+            self._patch(sender, "_client", None)
+            # drained last: whatever the pools below still queue is sent through FakeTwilioClient
+            self._drains.append(sender.outbox.drain)
+        # speculative work started under the stubs has to finish under them too
+        for mod in modules:
+            # pooled SMTP connections from before the stubs (or from other stubs) aren't reused
+            if hasattr(mod, "TEAM_SMTP"):
+                mod.TEAM_SMTP.close()
+                self._drains.append(lambda timeout, smtp=mod.TEAM_SMTP: smtp.close())
+        self._drains += [getattr(mod, pool).drain for mod in modules for pool in ("PREFETCH", "CALL_SETUP", "TRANSCRIPTS", "TEAM_NOTIFIER", "whatsapp_queue") if hasattr(mod, pool)]
+        return self
+
+    def uninstall(self):
+        while self._drains:
+            self._drains.pop()(30)
+        while self._saved:
+            obj, name, value = self._saved.pop()
+            setattr(obj, name, value)
+
+    @contextmanager
+    def installed(self, *modules):
+        self.install(*modules)
+        try:
+            yield self
+        finally:
+            self.uninstall()
+
+
+def parse_latency_args(items):
+    """['openai=fixed:500', 'backend=none'] -> {'openai': 'fixed:500', 'backend': 'none'}"""
+    out = {}
+    for item in items or []:
+        vendor, _, spec = item.partition("=")
+        Latency(spec)  # validate early
+        out[vendor.strip()] = spec.strip()
+    return out
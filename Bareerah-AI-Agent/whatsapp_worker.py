@@ -0,0 +1,190 @@
+# ✅ WHATSAPP WORKER POOL - Acknowledge the webhook now, reply later
+#
+# Twilio gives the WhatsApp webhook ~15s and retries when it times out, but a
+# voice note (download + ffmpeg + Whisper + up to two LLM calls + REST send)
+# can take longer than that. The webhook now only snapshots the form fields
+# and submits them here; a fixed pool of worker threads processes them and
+# the reply goes out through the Twilio REST API.
+#
+# Each sender is hashed to one worker, and each worker drains its own FIFO
+# queue, so a customer's messages are always handled one at a time and in the
+# order they arrived, while different customers run in parallel.
+#
+# Customers often type a booking as a burst ("from marina", "to airport",
+# "tomorrow 5pm"). With coalescing on, a sender's messages are held until
+# they have been quiet for WHATSAPP_COALESCE_SECONDS (never longer than
+# WHATSAPP_COALESCE_MAX_SECONDS after the first one) and handed to the worker
+# as one {"parts": [...]} batch: one NLU pass and one reply for the burst.
+#
+#   WHATSAPP_WORKERS               worker threads (default 8)
+#   WHATSAPP_QUEUE_MAX             messages waiting per worker - queued or held in a
+#                                  burst - before we push back (200)
+#   WHATSAPP_COALESCE_SECONDS      quiet window per sender, 0 disables (1.5)
+#   WHATSAPP_COALESCE_MAX_SECONDS  longest a burst is held (5)
+#   WHATSAPP_ASYNC=false           process inside the webhook again (local debugging)
+import os
+import time
+import zlib
+import queue
+import logging
+import threading
+from collections import deque
+
+import tracing
+
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "8"))
+WHATSAPP_QUEUE_MAX = int(os.getenv("WHATSAPP_QUEUE_MAX", "200"))
+WHATSAPP_COALESCE_SECONDS = float(os.getenv("WHATSAPP_COALESCE_SECONDS", "1.5"))
+WHATSAPP_COALESCE_MAX_SECONDS = float(os.getenv("WHATSAPP_COALESCE_MAX_SECONDS", "5"))
+WHATSAPP_ASYNC = os.getenv("WHATSAPP_ASYNC", "true").lower() != "false"
+
+
+class WorkerPool:
+    """Sender-sharded worker threads: strict per-sender order, parallel across senders"""
+
+    def __init__(self, handler, workers=WHATSAPP_WORKERS, queue_max=WHATSAPP_QUEUE_MAX, name="whatsapp",
+                 coalesce=0.0, coalesce_max=WHATSAPP_COALESCE_MAX_SECONDS):
+        self.handler = handler
+        self.name = name
+        self.coalesce = coalesce
+        self.coalesce_max = max(coalesce, coalesce_max)
+        self.queues = [queue.Queue(maxsize=queue_max) for _ in range(max(1, workers))]
+        self.threads = []
+        self.lock = threading.Lock()
+        self.stats = {"enqueued": 0, "processed": 0, "failed": 0, "rejected": 0, "max_depth": 0,
+                      "batches": 0, "coalesced": 0, "deferred": 0}
+        self.wait_ms = deque(maxlen=1024)  # recent queue waits
+        self.idle = threading.Condition(self.lock)
+        self.wakeup = threading.Condition(self.lock)
+        self.buffers = {}  # sender -> {"messages": [...], "first": t, "due": t} while coalescing
+        self.buffered = [0] * len(self.queues)  # messages held in buffers, per worker
+        self.in_flight = 0  # messages submitted but not yet handled (buffered, queued or running)
+
+    def _start(self):
+        with self.lock:
+            if self.threads: return
+            for i, q in enumerate(self.queues):
+                t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self.threads.append(t)
+            if self.coalesce > 0:
+                t = threading.Thread(target=self._flush_loop, name=f"{self.name}-coalesce", daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def shard(self, sender):
+        return zlib.crc32(str(sender).encode()) % len(self.queues)
+
+    def submit(self, sender, message):
+        """Queue message for sender; False when that sender's worker is backed up"""
+        self._start()
+        shard = self.shard(sender)
+        q = self.queues[shard]
+        now = time.monotonic()
+        with self.lock:
+            if q.qsize() + self.buffered[shard] >= q.maxsize > 0:  # a held burst counts against its worker too
+                return self._reject(sender, 1)
+            self.in_flight += 1
+            self.stats["enqueued"] += 1
+            if self.coalesce > 0:
+                self._hold(sender, [message], now, now + self.coalesce)
+                return True
+        if self._dispatch(sender, [message], now): return True
+        with self.lock:
+            self.in_flight -= 1
+            self.stats["enqueued"] -= 1
+            return self._reject(sender, 1)
+
+    def _reject(self, sender, count):
+        self.stats["rejected"] += count
+        logging.warning("⚠️ %s queue full for %s; asking Twilio to retry", self.name, sender)
+        return False
+
+    # ---- coalescing ----
+    def _hold(self, sender, messages, first, due, front=False):
+        """Buffer messages for sender (lock held); a deferred batch goes back in front of newer ones"""
+        buf = self.buffers.setdefault(sender, {"messages": [], "first": first})
+        buf["messages"] = messages + buf["messages"] if front else buf["messages"] + messages
+        buf["first"] = min(buf["first"], first)
+        buf["due"] = due if front else min(due, buf["first"] + self.coalesce_max)
+        self.buffered[self.shard(sender)] += len(messages)
+        self.wakeup.notify()
+
+    def _take_due(self, now, everything=False):
+        due = [s for s, b in self.buffers.items() if everything or b["due"] <= now]
+        taken = [(s, self.buffers.pop(s)) for s in due]
+        for s, buf in taken:
+            self.buffered[self.shard(s)] -= len(buf["messages"])
+        return taken
+
+    def _flush_loop(self):
+        while True:
+            with self.lock:
+                ready = self._take_due(time.monotonic())
+                while not ready:
+                    next_due = min((b["due"] for b in self.buffers.values()), default=None)
+                    self.wakeup.wait(None if next_due is None else max(0.0, next_due - time.monotonic()))
+                    ready = self._take_due(time.monotonic())
+            for sender, buf in ready:
+                if not self._dispatch(sender, buf["messages"], buf["first"]):
+                    # that worker is backed up: hold the burst a little longer, never block the other shards
+                    with self.lock:
+                        self.stats["deferred"] += 1
+                        self._hold(sender, buf["messages"], buf["first"], time.monotonic() + self.coalesce, front=True)
+
+    def _dispatch(self, sender, messages, queued_at, block=False):
+        """Hand a batch to its worker; False if its queue is full (only drain() waits for room)"""
+        message = messages[0] if len(messages) == 1 else {"parts": messages}
+        try:
+            self.queues[self.shard(sender)].put((queued_at, message, len(messages)), block=block)
+        except queue.Full:
+            return False
+        with self.lock:
+            self.stats["batches"] += 1
+            self.stats["coalesced"] += len(messages) - 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], self.depth())
+        return True
+
+    def _run(self, q):
+        while True:
+            queued_at, message, count = q.get()
+            waited = (time.monotonic() - queued_at) * 1000
+            ok = True
+            try:
+                self.handler(message)
+            except Exception as e:
+                ok = False
+                logging.error("❌ %s worker failed: %s", self.name, e)
+            finally:
+                q.task_done()
+                with self.lock:
+                    self.wait_ms.append(waited)
+                    self.stats["processed" if ok else "failed"] += count
+                    self.in_flight -= count
+                    if self.in_flight == 0: self.idle.notify_all()
+
+    def depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def snapshot(self):
+        """Queue-depth gauge for /metrics"""
+        with self.lock:
+            waits = sorted(self.wait_ms)
+            return dict(self.stats, depth=self.depth(), in_flight=self.in_flight,
+                        buffered_senders=len(self.buffers),
+                        depth_per_worker=[q.qsize() for q in self.queues],
+                        queue_wait_p95_ms=tracing.percentile(waits, 95))
+
+    def drain(self, timeout=30.0):
+        """Flush any held bursts and wait until every message has been handled (tests, shutdown)"""
+        with self.lock:
+            ready = self._take_due(0, everything=True)
+        for sender, buf in ready:
+            self._dispatch(sender, buf["messages"], buf["first"], block=True)
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.in_flight:
+                left = deadline - time.monotonic()
+                if left <= 0: return False
+                self.idle.wait(left)
+        return True